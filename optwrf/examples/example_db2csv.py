@@ -3,10 +3,13 @@ Write Contents of SQL Datatbase to CSV
 ======================================
 
 This example shows how to dump the contents of the SQL optwrf database (optwrf.db)
-to a CSV file, so it can be easily read.
+to a CSV file, so it can be easily read. If pyarrow is installed, the database
+is also written to a typed Parquet file (dates as timestamps and runtimes in seconds),
+which loads much faster, e.g., with pandas.read_parquet or optwrf.export.read_dataset.
 
 """
 import optwrf.optimize_wrf_physics as owp
+from optwrf import export
 
 
 # Name of the csv file and optwrf database
@@ -14,6 +17,7 @@ import optwrf.optimize_wrf_physics as owp
 csv_outfile = '6mp3lw3sw1lsm1pbl1cu_2011_database.csv'
 #sql_database = 'optwrf.db'
 sql_database = '6mp3lw3sw1lsm1pbl1cu_2011.db'
+parquet_outfile = '6mp3lw3sw1lsm1pbl1cu_2011_database.parquet'
 
 # Connect to the sql database
 db_conn = owp.conn_to_db(sql_database)
@@ -23,3 +27,10 @@ owp.sql_to_csv(csv_outfile, db_conn)
 
 # Close connection to the sql database
 owp.close_conn_to_db(db_conn)
+
+# Write the database contents to Parquet
+if export.pa is not None:
+    export.sql_to_parquet(parquet_outfile, sql_database)
+
+# Several campaign databases can be merged into one dataset that is partitioned by campaign and year
+# export.merge_databases(['campaign_2011.db', 'campaign_2012.db'], 'optwrf_campaigns/')
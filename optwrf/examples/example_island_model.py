@@ -0,0 +1,19 @@
+"""
+Island-Model Optimization of WRF Model Physics
+==============================================
+
+This example runs one island of an island-model genetic algorithm. Several islands (e.g., one per
+cluster partition, submitted with run_optwrf_islands.csh) evolve their own populations independently,
+and every few generations they exchange their best individuals through a migration directory on a
+shared file system. The island id is read from the command line or from SLURM_ARRAY_TASK_ID, and each
+island writes its own checkpoint, so a single island can be resumed (resume=True) without the others.
+"""
+import os
+import sys
+
+import optwrf.optimize_wrf_physics as owp
+from optwrf.migration import MigrationStore
+
+island = int(sys.argv[1]) if len(sys.argv) > 1 else int(os.environ.get('SLURM_ARRAY_TASK_ID', 0))
+owp.run_simplega(pop_size=20, n_generations=10, island=island,
+                 migration_store=MigrationStore('./optwrf_migration/'), migration_interval=2, n_migrants=2)
@@ -0,0 +1,35 @@
+"""
+Re-score the Fitness of Past Simulations
+========================================
+
+This example shows how to recompute the fitness of every simulation in the SQL optwrf
+database (optwrf.db) under a different fitness method, correction factor, or weighting of
+the hours, without regridding the wrfout files again. It uses the domain-summed GHI and WPD
+errors of each hour, which get_wrf_fitness returns (and run_simplega stores) for every
+completed simulation.
+
+"""
+import numpy as np
+
+import optwrf.optimize_wrf_physics as owp
+
+
+sql_database = 'optwrf.db'
+
+# Connect to the sql database
+db_conn = owp.conn_to_db(sql_database)
+
+# Only count the GHI error between 12 and 22 UTC (roughly daylight in the eastern US),
+# instead of scaling the daily GHI error by the daylight fraction
+ghi_hour_weights = [1.0 if 12 <= hour < 22 else 0.0 for hour in range(24)]
+scores = owp.rescore_fitness(db_conn, method='both', daylight=False, ghi_hour_weights=ghi_hour_weights)
+
+# Print the ten best simulations under the new weighting
+for ii in np.argsort(scores['fitness'])[0:10]:
+    print(f"{scores['start_date'][ii]} {scores['genes'][ii].tolist()} fitness: {scores['fitness'][ii]}")
+
+# Pass update=True to replace the fitness in the simulations table with the new fitness
+# owp.rescore_fitness(db_conn, method='both', daylight=False, ghi_hour_weights=ghi_hour_weights, update=True)
+
+# Close connection to the sql database
+owp.close_conn_to_db(db_conn)
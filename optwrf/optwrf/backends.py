@@ -0,0 +1,293 @@
+"""
+Interchangeable backends used to evaluate fitness functions (or whole WRF runs) in parallel.
+Every backend is a concurrent.futures.Executor, so the genetic algorithm submits work and collects
+results from the returned futures in the same way no matter where the work actually runs:
+
+    - ThreadBackend runs evaluations in threads of the supervising Python process (the default).
+    - LocalProcessBackend runs evaluations in a pool of local processes.
+    - SlurmBackend submits evaluations as SLURM array jobs, and collects their results from files,
+    so that the search can scale across nodes instead of being capped by one supervising process.
+    - InProcessBackend runs each evaluation immediately when it is submitted (for testing).
+
+Functions and arguments submitted to LocalProcessBackend and SlurmBackend must be picklable
+(i.e., module-level functions), and they cannot share memory with the supervising process.
+
+
+Known Issues/Wishlist:
+- SlurmBackend assumes that job_dir is on a file system shared by the login and compute nodes.
+
+"""
+
+import concurrent.futures
+import os
+import pickle
+import re
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+
+class ThreadBackend(concurrent.futures.ThreadPoolExecutor):
+    """
+    Runs evaluations in threads of the supervising Python process.
+    """
+    shares_memory = True
+
+    def __init__(self, max_workers=None):
+        if max_workers is None:
+            max_workers = min(32, (os.cpu_count() or 1) + 4)
+        super().__init__(max_workers=max_workers)
+        self.max_workers = max_workers
+
+
+class LocalProcessBackend(concurrent.futures.ProcessPoolExecutor):
+    """
+    Runs evaluations in a pool of local processes, so that they do not compete for the
+    global interpreter lock of the supervising Python process.
+    """
+    shares_memory = False
+
+    def __init__(self, max_workers=None):
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        super().__init__(max_workers=max_workers)
+        self.max_workers = max_workers
+
+
+class InProcessBackend(concurrent.futures.Executor):
+    """
+    Runs each evaluation immediately (and sequentially) when it is submitted, and returns a
+    future that is already done. This makes runs deterministic and easy to debug in tests.
+    """
+    shares_memory = True
+
+    def __init__(self, max_workers=1):
+        self.max_workers = max_workers
+
+    def submit(self, fn, *args, **kwargs):
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class SlurmBackend(concurrent.futures.Executor):
+    """
+    Submits evaluations to SLURM as array jobs. Each submitted function call is pickled to a job spec
+    file in job_dir; submissions that arrive close together are grouped into one array job, and each
+    array task runs one spec (python -m optwrf.backends <manifest> <task id>) and pickles its result
+    (or exception) next to it. One poller thread submits the arrays and collects the result files,
+    so the supervising process never blocks on individual simulations.
+
+    :param job_dir: string (default = './optwrf_jobs/')
+        directory, shared with the compute nodes, where job specs, results, and logs are written.
+    :param max_workers: integer (default = 32)
+        number of evaluations that the genetic algorithm will keep in the queue at once.
+    :param sbatch_options: list of strings (default = None)
+        extra options passed to sbatch (e.g., ['--partition=default_partition', '--time=08:00:00']).
+    :param python: string (default = sys.executable)
+        python interpreter that runs each array task.
+    :param poll_interval: float (default = 30)
+        seconds between checks for new results.
+    :param batch_window: float (default = 5)
+        seconds to wait after a submission for others that can join the same array job.
+
+    """
+    shares_memory = False
+
+    def __init__(self, job_dir='./optwrf_jobs/', max_workers=32, sbatch_options=None, python=sys.executable,
+                 poll_interval=30, batch_window=5):
+        self.job_dir = os.path.abspath(job_dir) + '/'
+        self.max_workers = max_workers
+        self.sbatch_options = sbatch_options if sbatch_options is not None else []
+        self.python = python
+        self.poll_interval = poll_interval
+        self.batch_window = batch_window
+        os.makedirs(self.job_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._shutdown = False
+        self._cancelled = False
+        self._n_specs = 0
+        self._n_arrays = 0
+        # Specs waiting to be submitted, specs that sbatch is submitting, and specs (with their SLURM job id)
+        # that are running
+        self._queued = []
+        self._submitting = []
+        self._running = {}
+        self._poller = threading.Thread(target=self._poll, daemon=True)
+        self._poller.start()
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('cannot submit to a SlurmBackend after shutdown')
+            spec_file = f'{self.job_dir}spec_{self._n_specs:06d}.pkl'
+            self._n_specs += 1
+            with open(spec_file, 'wb') as spec:
+                pickle.dump((fn, args, kwargs), spec)
+            future = concurrent.futures.Future()
+            self._queued.append((spec_file, future))
+        self._wakeup.set()
+        return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        job_ids = set()
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                self._cancelled = True
+                for _, future in self._queued:
+                    future.cancel()
+                self._queued = []
+                job_ids = set(job_id for job_id, _ in self._running.values())
+                # The array job that sbatch is submitting is cancelled by the poller once its job id is known
+                for _, future in self._submitting + list(self._running.values()):
+                    future.set_exception(concurrent.futures.CancelledError('the SLURM job was cancelled'))
+                self._running = {}
+        for job_id in job_ids:
+            subprocess.run(['scancel', job_id])
+        self._wakeup.set()
+        if wait:
+            self._poller.join()
+
+    def _submit_array(self, queued):
+        """
+        Submits the queued specs as one SLURM array job, and returns its job id.
+        """
+        manifest_file = f'{self.job_dir}array_{self._n_arrays:06d}.txt'
+        script_file = f'{self.job_dir}array_{self._n_arrays:06d}.sh'
+        self._n_arrays += 1
+        with open(manifest_file, 'w') as manifest:
+            manifest.write('\n'.join([spec_file for spec_file, _ in queued]) + '\n')
+        with open(script_file, 'w') as script:
+            script.write('#!/bin/bash\n')
+            script.write(f'#SBATCH --output={self.job_dir}slurm_%A_%a.out\n')
+            script.write(f'{self.python} -m optwrf.backends {manifest_file} $SLURM_ARRAY_TASK_ID\n')
+        cmd = ['sbatch', '--parsable', f'--array=0-{len(queued) - 1}'] + self.sbatch_options + [script_file]
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        job_id = re.match(r'\d+', result.stdout.strip())
+        if result.returncode != 0 or job_id is None:
+            raise RuntimeError(f'sbatch failed: {result.stdout.strip()}')
+        return job_id.group(0)
+
+    def _active_jobs(self):
+        """
+        Returns the SLURM job ids that are still pending or running, or None if squeue failed.
+        """
+        result = subprocess.run(['squeue', '--noheader', '--format=%F', '--user', os.environ.get('USER', '')],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+        if result.returncode != 0:
+            return None
+        return set(result.stdout.split())
+
+    def _poll(self):
+        while True:
+            self._wakeup.wait(timeout=self.poll_interval)
+            if self._wakeup.is_set():
+                # Give other submissions a chance to join the same array job
+                time.sleep(self.batch_window)
+                self._wakeup.clear()
+            with self._lock:
+                queued = [(spec_file, future) for spec_file, future in self._queued
+                          if future.set_running_or_notify_cancel()]
+                self._queued = []
+                self._submitting = queued
+            if len(queued) > 0:
+                try:
+                    job_id = self._submit_array(queued)
+                except (OSError, RuntimeError) as e:
+                    job_id, error = None, e
+                # If shutdown(cancel_futures=True) ran while sbatch did, it has already failed the futures
+                with self._lock:
+                    self._submitting = []
+                    cancelled = self._cancelled
+                    if not cancelled and job_id is not None:
+                        for spec_file, future in queued:
+                            self._running[spec_file] = (job_id, future)
+                if cancelled and job_id is not None:
+                    subprocess.run(['scancel', job_id])
+                elif not cancelled and job_id is None:
+                    for _, future in queued:
+                        future.set_exception(error)
+            self._collect()
+            with self._lock:
+                if self._shutdown and len(self._queued) == 0 and len(self._running) == 0:
+                    return
+
+    def _collect(self):
+        """
+        Sets the result of every future whose result file has been written. Futures whose array job is
+        no longer in the SLURM queue but never wrote a result (e.g., the job was cancelled or timed out)
+        fail with a RuntimeError.
+        """
+        with self._lock:
+            running = list(self._running.items())
+        if len(running) == 0:
+            return
+        active_jobs = None
+        for spec_file, (job_id, future) in running:
+            result_file = spec_file.replace('.pkl', '.result.pkl')
+            if os.path.exists(result_file):
+                try:
+                    with open(result_file, 'rb') as result:
+                        succeeded, value = pickle.load(result)
+                except (EOFError, pickle.UnpicklingError):
+                    # The result is still being written
+                    continue
+            else:
+                if active_jobs is None:
+                    active_jobs = self._active_jobs()
+                if active_jobs is None or job_id in active_jobs:
+                    continue
+                # Check once more in case the result was written just before the job left the queue
+                if os.path.exists(result_file):
+                    continue
+                succeeded, value = False, RuntimeError(f'SLURM job {job_id} ended without writing {result_file}')
+            # The entry is removed before its future is set, so that shutdown(cancel_futures=True),
+            # which fails the futures that are still running, never sets the same future
+            with self._lock:
+                if self._running.pop(spec_file, None) is None:
+                    continue
+            if succeeded:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+
+def run_spec(spec_file):
+    """
+    Runs one pickled job spec written by SlurmBackend, and pickles its result, or the exception it raised,
+    next to it. The result is written to a temporary file and then renamed so that it appears atomically.
+
+    :param spec_file: string
+        path to the pickled (function, args, kwargs) tuple.
+
+    """
+    with open(spec_file, 'rb') as spec:
+        fn, args, kwargs = pickle.load(spec)
+    try:
+        outcome = (True, fn(*args, **kwargs))
+    except Exception as e:
+        traceback.print_exc()
+        outcome = (False, e)
+    result_file = spec_file.replace('.pkl', '.result.pkl')
+    with open(result_file + '.tmp', 'wb') as result:
+        try:
+            pickle.dump(outcome, result)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            result.seek(0)
+            result.truncate()
+            pickle.dump((False, RuntimeError(f'result could not be pickled: {e}')), result)
+    os.replace(result_file + '.tmp', result_file)
+
+
+if __name__ == '__main__':
+    # Entry point of each SLURM array task: python -m optwrf.backends <manifest> <task id>
+    with open(sys.argv[1]) as manifest_file:
+        spec_files = manifest_file.read().split()
+    run_spec(spec_files[int(sys.argv[2])])
@@ -0,0 +1,354 @@
+"""
+An offline benchmark harness for tuning the genetic algorithm without running WRF. A GA run
+(see optimize_wrf_physics.run_simplega) is replayed against a recorded simulations database:
+
+    - ReplayFitness returns the stored fitness of each (physics parameters, start date) pair that was
+    simulated before, and falls back to a synthetic fitness landscape (see synthetic_landscape, or any
+    function with the same arguments) for pairs that were never simulated.
+    - VirtualClockBackend runs each evaluation on a virtual clock, where it takes its recorded (or synthetic)
+    runtime, so that a GA run that would take weeks of WRF time is replayed in seconds.
+    - run_benchmark replays the GA with different population sizes, elite percentages, schedulers, and
+    date policies, and reports the virtual time-to-best, the core-hours consumed, the idle fraction of the
+    evaluation slots, and the cache hit rates of each configuration.
+
+The benchmark can be run from the command line: python -m optwrf.benchmark [optwrf.db]
+
+
+Known Issues/Wishlist:
+- Racing (race_dates > 1) replays every date separately, but the virtual runtime of a race
+is the sum of the runtimes of its dates even if the dates would have run in parallel.
+
+"""
+
+import concurrent.futures
+import contextlib
+import datetime
+import heapq
+import io
+import itertools
+import random
+import sqlite3
+import sys
+
+import optwrf.helper_functions as hf
+import optwrf.simplega as simplega
+from optwrf.optimize_wrf_physics import calculate_fitness, run_simplega
+
+
+def synthetic_landscape(param_ids, start_date, seed=0):
+    """
+    A deterministic synthetic fitness landscape for simulations that are not in the recorded database.
+    Each physics parameter option has a fixed (pseudo-random) effect on the GHI and WPD errors and on
+    the runtime, and the errors change with the season, so that the genetic algorithm has something to find.
+
+    :param param_ids: list of integers
+        corresponding to each WRF physics parameterization.
+    :param start_date: string
+        specifying the simulation start date.
+    :param seed: integer (default = 0)
+        that selects a different landscape.
+    :return ghi_error: float
+        synthetic GHI error.
+    :return wpd_error: float
+        synthetic wind power density error.
+    :return runtime_seconds: float
+        synthetic WRF runtime.
+
+    """
+    ghi_error = 0.0
+    wpd_error = 0.0
+    runtime_seconds = 3600.0
+    for ii, gene in enumerate(param_ids):
+        effects = random.Random(f'{seed}-{ii}-{int(gene)}')
+        ghi_error += effects.uniform(0, 4000)
+        wpd_error += effects.uniform(0, 1e7)
+        runtime_seconds *= effects.uniform(0.8, 1.5)
+    season = hf.date2season(hf.format_date(start_date))
+    season_effects = random.Random(f'{seed}-{season}')
+    ghi_error *= season_effects.uniform(0.7, 1.3)
+    wpd_error *= season_effects.uniform(0.7, 1.3)
+    return ghi_error, wpd_error, runtime_seconds
+
+
+class ReplayFitness:
+    """
+    This class replaces get_wrf_fitness (see run_simplega) when a GA run is replayed: it returns the
+    recorded results of simulations that are in the database, and the results of the synthetic landscape
+    for the others. The first simulation on a date whose inputs are not staged yet (i.e., the date is not
+    in the database and was not simulated earlier in the replay) also pays staging_seconds, so that
+    the date policies (see simplega.DatePolicy) can be compared.
+
+    :param records: dictionary (default = None)
+        mapping (start_date, genes tuple) to (fitness, ghi_error, wpd_error, runtime string, status).
+    :param landscape: function (default = synthetic_landscape)
+        that takes param_ids and start_date and returns (ghi_error, wpd_error, runtime_seconds).
+    :param staging_seconds: float (default = 1800)
+        time needed to stage the boundary condition data, WPS output, and ERA5 data of a new date.
+    :param correction_factor: float (default = 0.0004218304553577255)
+        used to calculate the fitness of synthetic simulations (see optimize_wrf_physics.calculate_fitness).
+
+    """
+    def __init__(self, records=None, landscape=synthetic_landscape, staging_seconds=1800,
+                 correction_factor=0.0004218304553577255):
+        self.records = records if records is not None else {}
+        self.landscape = landscape
+        self.staging_seconds = staging_seconds
+        self.correction_factor = correction_factor
+        self.staged_dates = set(start_date for start_date, _ in self.records)
+        self.n_replayed = 0
+        self.n_synthetic = 0
+
+    @staticmethod
+    def key(param_ids, start_date):
+        return hf.format_date(start_date).strftime('%b %d %Y'), tuple(int(gene) for gene in param_ids)
+
+    @classmethod
+    def from_db(cls, db_name, **kwargs):
+        """
+        Reads the recorded simulations from an SQL simulation database (see optimize_wrf_physics.conn_to_db).
+        Simulations that were pruned are skipped, because their fitness is only partial.
+        The keyword arguments are passed to ReplayFitness.
+        """
+        db_conn = sqlite3.connect(db_name)
+        c = db_conn.cursor()
+        c.execute("""PRAGMA table_info(simulations)""")
+        has_status = 'status' in [column[1] for column in c.fetchall()]
+        c.execute(f"""SELECT start_date, mp_physics, ra_lw_physics, ra_sw_physics, sf_surface_physics,
+                    bl_pbl_physics, cu_physics, sf_sfclay_physics, fitness, ghi_error, wpd_error, runtime,
+                    {'status' if has_status else 'NULL'} FROM simulations""")
+        records = {}
+        for row in c.fetchall():
+            if row[8] is None or row[12] == 'pruned':
+                continue
+            records[cls.key(row[1:8], row[0])] = tuple(row[8:13])
+        db_conn.close()
+        return cls(records, **kwargs)
+
+    def is_cached(self, start_date, end_date):
+        """
+        Returns True if the inputs of this date are staged (for simplega.DatePolicy).
+        """
+        return self.key([], start_date)[0] in self.staged_dates
+
+    def __call__(self, param_ids, start_date='Jan 15 2011', end_date='Jan 16 2011', method='both',
+                 return_status=False, **kwargs):
+        key = self.key(param_ids, start_date)
+        if key in self.records:
+            self.n_replayed += 1
+            fitness, ghi_error, wpd_error, runtime, status = self.records[key]
+            runtime_seconds = hf.strpdelta(runtime).total_seconds() if runtime is not None else 0
+        else:
+            self.n_synthetic += 1
+            ghi_error, wpd_error, runtime_seconds = self.landscape(param_ids, start_date)
+            fitness = calculate_fitness(ghi_error, wpd_error, start_date, method, self.correction_factor)
+            status = 'complete'
+        if key[0] not in self.staged_dates:
+            self.staged_dates.add(key[0])
+            runtime_seconds += self.staging_seconds
+        runtime = hf.strfdelta(datetime.timedelta(seconds=runtime_seconds))
+        if return_status:
+            return fitness, ghi_error, wpd_error, runtime, status
+        return fitness, ghi_error, wpd_error, runtime
+
+
+class VirtualClockFuture(concurrent.futures.Future):
+    """
+    A future that advances its VirtualClockBackend until it is done when its result is requested.
+    """
+    def __init__(self, backend):
+        super().__init__()
+        self.backend = backend
+
+    def result(self, timeout=None):
+        while not self.done():
+            self.backend.advance()
+        return super().result(timeout)
+
+    def exception(self, timeout=None):
+        while not self.done():
+            self.backend.advance()
+        return super().exception(timeout)
+
+
+class VirtualClockBackend(concurrent.futures.Executor):
+    """
+    Runs evaluations on a virtual clock with max_workers evaluation slots. Each submitted function is called
+    immediately, but its future is only finished when the virtual clock reaches the end of its runtime, which
+    is read from the runtime string that the fitness function returns (see optimize_wrf_physics.timed_fitness).
+    Evaluations that are submitted while every slot is busy wait for the first slot to free up. The clock only
+    advances when the genetic algorithm waits for a result, so the GA itself takes no virtual time.
+
+    :param max_workers: integer (default = 4)
+        number of evaluation slots.
+    :param cores_per_sim: integer (default = 1)
+        number of cores used by each evaluation (to calculate the core-hours).
+
+    """
+    shares_memory = True
+
+    def __init__(self, max_workers=4, cores_per_sim=1):
+        self.max_workers = max_workers
+        self.cores_per_sim = cores_per_sim
+        self.clock = 0.0
+        self.busy_seconds = 0.0
+        self.n_evaluations = 0
+        # Completed evaluations as (virtual end time, results)
+        self.trace = []
+        self._seq = itertools.count()
+        self._running = []
+        self._queued = []
+
+    def submit(self, fn, *args, **kwargs):
+        future = VirtualClockFuture(self)
+        try:
+            results = fn(*args, **kwargs)
+        except Exception as e:
+            future.set_exception(e)
+            return future
+        # timed_fitness returns the results and the (real) busy seconds, which are replaced by the virtual runtime
+        if isinstance(results, tuple) and len(results) == 2 and isinstance(results[0], tuple):
+            results = results[0]
+        runtime_seconds = hf.strpdelta(results[3]).total_seconds() if results[3] is not None else 0
+        self._queued.append((future, results, runtime_seconds))
+        self._start_queued()
+        return future
+
+    def _start_queued(self):
+        while len(self._queued) > 0 and len(self._running) < self.max_workers:
+            future, results, runtime_seconds = self._queued.pop(0)
+            heapq.heappush(self._running, (self.clock + runtime_seconds, next(self._seq),
+                                           future, results, runtime_seconds))
+
+    def advance(self):
+        """
+        Advances the virtual clock to the end of the next evaluation, and finishes its future.
+        """
+        if len(self._running) == 0:
+            raise RuntimeError('the virtual clock cannot advance because no evaluations are running')
+        end_time, _, future, results, runtime_seconds = heapq.heappop(self._running)
+        self.clock = end_time
+        self.busy_seconds += runtime_seconds
+        self.n_evaluations += 1
+        self.trace.append((end_time, results))
+        future.set_result((results, runtime_seconds))
+        self._start_queued()
+
+    def wait(self, fs, timeout=None, return_when=concurrent.futures.ALL_COMPLETED):
+        """
+        Replaces concurrent.futures.wait: advances the virtual clock until the condition is met.
+        """
+        fs = list(fs)
+        if return_when == concurrent.futures.ALL_COMPLETED:
+            while not all(future.done() for future in fs):
+                self.advance()
+        else:
+            while not any(future.done() for future in fs):
+                self.advance()
+        return concurrent.futures.wait(fs, timeout=0, return_when=return_when)
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        while wait and len(self._running) + len(self._queued) > 0:
+            self.advance()
+
+    def stats(self):
+        """
+        Returns the virtual makespan, the busy and idle slot time, the core-hours, and the time-to-best.
+
+        :return stats: dictionary
+            with the keys wall_hours, busy_hours, idle_frac, core_hours, best_fitness, time_to_best_hours,
+            and n_evaluations.
+
+        """
+        reserved_seconds = self.max_workers * self.clock
+        fitness_trace = [(end_time, results[0]) for end_time, results in self.trace if results[0] is not None]
+        best_fitness = min([fitness for _, fitness in fitness_trace]) if len(fitness_trace) > 0 else None
+        time_to_best = min([end_time for end_time, fitness in fitness_trace if fitness == best_fitness]) \
+            if best_fitness is not None else None
+        return {'wall_hours': self.clock / 3600,
+                'busy_hours': self.busy_seconds / 3600,
+                'idle_frac': 1 - self.busy_seconds / reserved_seconds if reserved_seconds > 0 else 0.0,
+                'core_hours': self.busy_seconds * self.cores_per_sim / 3600,
+                'best_fitness': best_fitness,
+                'time_to_best_hours': time_to_best / 3600 if time_to_best is not None else None,
+                'n_evaluations': self.n_evaluations}
+
+
+def run_benchmark(configs, db_name=None, n_generations=5, n_slots=8, cores_per_sim=1, staging_seconds=1800,
+                  landscape=synthetic_landscape, seed=0, verbose=False):
+    """
+    Replays the genetic algorithm with each configuration against the recorded simulations database,
+    on a virtual clock, and collects its throughput statistics.
+
+    :param configs: list of dictionaries
+        with keyword arguments for run_simplega (e.g., pop_size, elite_pct, scheduler). The date_policy
+        can be given as the name of a simplega.DatePolicy policy; its cache is the replayed database.
+        Every configuration must include pop_size.
+    :param db_name: string (default = None)
+        recorded SQL simulation database; if None, only the synthetic landscape is used.
+    :param n_generations: int (default = 5)
+        number of generations (unless a configuration specifies its own n_generations).
+    :param n_slots: int (default = 8)
+        number of evaluation slots (unless a configuration specifies its own n_slots).
+    :param cores_per_sim: int (default = 1)
+        number of cores used by each simulation (to calculate the core-hours).
+    :param staging_seconds: float (default = 1800)
+        time needed to stage the inputs of a date that is not staged yet (see ReplayFitness).
+    :param landscape: function (default = synthetic_landscape)
+        synthetic fitness landscape used for simulations that are not in the database.
+    :param seed: int (default = 0)
+        random seed used for every configuration, so that they start from the same population.
+    :param verbose: boolean (default = False)
+        if False, the output of run_simplega is suppressed.
+    :return results: list of dictionaries
+        with the configuration and its statistics (see VirtualClockBackend.stats), the fraction of
+        evaluations replayed from the database (replay_hit_rate), and the fraction of start dates whose
+        inputs were already staged (date_hit_rate).
+
+    """
+    results = []
+    for config in configs:
+        config = dict(config)
+        if db_name is not None:
+            replay = ReplayFitness.from_db(db_name, landscape=landscape, staging_seconds=staging_seconds)
+        else:
+            replay = ReplayFitness(landscape=landscape, staging_seconds=staging_seconds)
+        policy = config.pop('date_policy', 'random')
+        date_policy = simplega.DatePolicy(policy, is_cached=replay.is_cached, staging_seconds=staging_seconds) \
+            if isinstance(policy, str) else policy
+        backend = VirtualClockBackend(max_workers=config.pop('n_slots', n_slots), cores_per_sim=cores_per_sim)
+        random.seed(seed)
+        output = sys.stdout if verbose else io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_simplega(n_generations=config.pop('n_generations', n_generations), restart_file=False,
+                         backend=backend, fitness_fn=replay, date_policy=date_policy, db_name=':memory:',
+                         **config)
+        n_drawn = sum([stats['n_drawn'] for stats in date_policy.history])
+        n_hits = sum([stats['n_hits'] for stats in date_policy.history])
+        result = {'policy': date_policy.policy, **config, **backend.stats(),
+                  'replay_hit_rate': replay.n_replayed / max(replay.n_replayed + replay.n_synthetic, 1),
+                  'date_hit_rate': n_hits / n_drawn if n_drawn > 0 else float('nan')}
+        results.append(result)
+    return results
+
+
+def print_benchmark(results):
+    """
+    Prints the benchmark results (see run_benchmark) as a table.
+    """
+    print(f'{"pop":>5} {"elite":>6} {"scheduler":>13} {"dates":>9} {"evals":>6} {"best":>10} '
+          f'{"t_best[h]":>10} {"wall[h]":>9} {"core-h":>9} {"idle":>6} {"replay":>7} {"date hit":>9}')
+    for result in results:
+        print(f'{result["pop_size"]:>5} {result.get("elite_pct", 0.08):>6.2f} '
+              f'{result.get("scheduler", "generational"):>13} {result["policy"]:>9} {result["n_evaluations"]:>6} '
+              f'{result["best_fitness"]:>10.4g} {result["time_to_best_hours"]:>10.1f} {result["wall_hours"]:>9.1f} '
+              f'{result["core_hours"]:>9.1f} {result["idle_frac"]:>6.1%} {result["replay_hit_rate"]:>7.1%} '
+              f'{result["date_hit_rate"]:>9.1%}')
+
+
+if __name__ == '__main__':
+    # Compare the schedulers and date policies on the recorded database (or on the synthetic landscape)
+    benchmark_configs = [{'pop_size': pop_size, 'scheduler': scheduler, 'date_policy': policy}
+                         for pop_size in [10, 20]
+                         for scheduler in ['generational', 'steady_state']
+                         for policy in ['random', 'common', 'cached']]
+    print_benchmark(run_benchmark(benchmark_configs, db_name=sys.argv[1] if len(sys.argv) > 1 else None))
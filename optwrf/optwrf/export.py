@@ -0,0 +1,282 @@
+"""
+A set of functions that export the SQL simulation database (see optimize_wrf_physics.conn_to_db)
+to typed, columnar files for analysis. The simulations are streamed from the database in chunks
+(fetchmany), so multi-year campaign databases are exported without holding the table in memory,
+and the columns are written with proper dtypes:
+
+    - start_date is a timestamp (instead of a string such as 'Jan 15 2011'),
+    - the physics parameters are 16-bit integers, and fitness, ghi_error, and wpd_error are floats,
+    - runtime is written as runtime_seconds, a float (instead of a string such as '01h 02m 03s').
+
+sql_to_parquet writes one database to a Parquet file (or an Arrow IPC/Feather file), and merge_databases
+merges several databases into one Parquet dataset that is partitioned by campaign (the database file name)
+and year, so that analysis notebooks can load (or filter) every campaign in seconds with read_dataset,
+pandas.read_parquet, or pyarrow.dataset.
+
+The functions that write files require pyarrow.
+
+
+Known Issues/Wishlist:
+- merge_databases keeps every row of every database; a simulation that is in several databases
+appears once per campaign.
+
+"""
+
+import functools
+import os
+import sqlite3
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ModuleNotFoundError as err:
+    print(err)
+    pa = None
+
+import optwrf.helper_functions as hf
+from optwrf.optimize_wrf_physics import sim_columns
+
+# Columns of the exported tables, in order (the runtime is converted to seconds)
+export_columns = sim_columns[0:11] + ['runtime_seconds', 'status']
+# Columns that merge_databases adds to partition the dataset
+partition_columns = ['campaign', 'year']
+
+
+def arrow_schema(partitioned=False):
+    """
+    Builds the pyarrow schema of the exported simulations.
+
+    :param partitioned: boolean (default = False)
+        adds the campaign and year columns that merge_databases partitions the dataset by.
+    :return schema: pyarrow.Schema
+
+    """
+    _require_pyarrow()
+    fields = [pa.field('start_date', pa.timestamp('s'))]
+    fields += [pa.field(column, pa.int16()) for column in sim_columns[1:8]]
+    fields += [pa.field(column, pa.float64()) for column in ['fitness', 'ghi_error', 'wpd_error', 'runtime_seconds']]
+    fields += [pa.field('status', pa.string())]
+    if partitioned:
+        fields += [pa.field('campaign', pa.string()), pa.field('year', pa.int16())]
+    return pa.schema(fields)
+
+
+def _require_pyarrow():
+    if pa is None:
+        print('OptWRFError: pyarrow is required to export the simulation database '
+              '(e.g., conda install pyarrow); use optimize_wrf_physics.sql_to_csv otherwise.')
+        raise ModuleNotFoundError('pyarrow')
+
+
+@functools.lru_cache(maxsize=None)
+def _parse_date(start_date):
+    # There are few distinct start dates, so each one is only parsed once
+    try:
+        return hf.format_date(start_date)
+    except (TypeError, ValueError):
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def _parse_runtime(runtime):
+    try:
+        return hf.strpdelta(runtime).total_seconds()
+    except ValueError:
+        return None
+
+
+def convert_rows(rows):
+    """
+    Converts rows read from the simulations table to typed columns.
+    Start dates and runtimes that cannot be parsed (e.g., missing values) become None.
+
+    :param rows: list of tuples
+        with the values of sim_columns (in order) for each simulation.
+    :return columns: dictionary
+        mapping each of export_columns to a list with one value per row.
+
+    """
+    columns = {column: [] for column in export_columns}
+    for row in rows:
+        columns['start_date'].append(_parse_date(row[0]))
+        for ii, column in enumerate(sim_columns[1:8], start=1):
+            columns[column].append(None if row[ii] is None else int(row[ii]))
+        for ii, column in enumerate(['fitness', 'ghi_error', 'wpd_error'], start=8):
+            columns[column].append(None if row[ii] is None else float(row[ii]))
+        columns['runtime_seconds'].append(None if row[11] in (None, '') else _parse_runtime(row[11]))
+        columns['status'].append(row[12])
+    return columns
+
+
+def _connect(db):
+    """
+    Returns a connection to the database and whether it should be closed by the caller.
+    Database files are opened read-only, so exporting never migrates or locks them for writing.
+    """
+    if not isinstance(db, str):
+        return db, False
+    if not os.path.exists(db):
+        print(f'OptWRFError: the simulation database {db} does not exist.')
+        raise ValueError
+    return sqlite3.connect(f'file:{os.path.abspath(db)}?mode=ro', uri=True), True
+
+
+def iter_rows(db, chunk_size=50000):
+    """
+    Streams the simulations from the SQL database in chunks. Columns that are missing from
+    older databases (e.g., status) are read as NULL.
+
+    :param db: string or database connection object
+        path to the SQL database, or a connection created using optimize_wrf_physics.conn_to_db().
+    :param chunk_size: integer (default = 50000)
+        number of rows fetched from the database at a time.
+    :return: generator of lists of tuples
+        with the values of sim_columns (in order) for each simulation.
+
+    """
+    db_conn, owned = _connect(db)
+    try:
+        c = db_conn.cursor()
+        c.execute("""PRAGMA table_info(simulations)""")
+        columns = [column[1] for column in c.fetchall()]
+        c.execute(f"""SELECT {', '.join([column if column in columns else 'NULL' for column in sim_columns])}
+                    FROM simulations""")
+        while True:
+            rows = c.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        if owned:
+            db_conn.close()
+
+
+def iter_record_batches(db, chunk_size=50000, campaign=None):
+    """
+    Streams the simulations from the SQL database as typed pyarrow record batches.
+
+    :param db: string or database connection object
+        path to the SQL database, or a connection created using optimize_wrf_physics.conn_to_db().
+    :param chunk_size: integer (default = 50000)
+        number of rows in each record batch.
+    :param campaign: string (default = None)
+        if given, the campaign and year partition columns are added to each record batch.
+    :return: generator of pyarrow.RecordBatch
+
+    """
+    schema = arrow_schema(partitioned=campaign is not None)
+    for rows in iter_rows(db, chunk_size):
+        columns = convert_rows(rows)
+        if campaign is not None:
+            columns['campaign'] = [campaign] * len(rows)
+            columns['year'] = [None if date is None else date.year for date in columns['start_date']]
+        yield pa.RecordBatch.from_arrays([pa.array(columns[field.name], type=field.type) for field in schema],
+                                         schema=schema)
+
+
+def sql_to_parquet(out_path, db, chunk_size=50000, file_format='parquet', compression='zstd'):
+    """
+    Writes the contents of a SQL simulation database to a typed Parquet (or Arrow IPC/Feather) file,
+    one chunk at a time.
+
+    :param out_path: string
+        path of the output file, e.g., 'optwrf.parquet' or 'optwrf.feather'.
+    :param db: string or database connection object
+        path to the SQL database, or a connection created using optimize_wrf_physics.conn_to_db().
+    :param chunk_size: integer (default = 50000)
+        number of rows fetched from the database and written at a time (i.e., the Parquet row group size).
+    :param file_format: string (default = 'parquet')
+        'parquet', or 'feather' (equivalently 'arrow') for an Arrow IPC file.
+    :param compression: string (default = 'zstd')
+        compression codec, or None for uncompressed files.
+    :return n_rows: integer
+        number of simulations written.
+
+    """
+    _require_pyarrow()
+    if file_format not in ['parquet', 'feather', 'arrow']:
+        print(f'OptWRFError: {file_format} is not a valid file format; use parquet, feather, or arrow.')
+        raise ValueError
+    schema = arrow_schema()
+    n_rows = 0
+    if file_format == 'parquet':
+        writer = pq.ParquetWriter(out_path, schema, compression=compression or 'none')
+    else:
+        writer = ipc.new_file(out_path, schema, options=ipc.IpcWriteOptions(compression=compression))
+    with writer:
+        for batch in iter_record_batches(db, chunk_size):
+            writer.write_batch(batch)
+            n_rows += batch.num_rows
+    return n_rows
+
+
+def merge_databases(db_names, out_dir, chunk_size=50000, partition_by=('campaign', 'year'), compression='zstd'):
+    """
+    Merges several SQL simulation databases into one Parquet dataset (a directory of Parquet files)
+    that is partitioned with hive-style directories (e.g., out_dir/campaign=optwrf_2011/year=2011/).
+    Each database is a campaign, which is named after its file (without the extension).
+    The databases are streamed one chunk at a time. If out_dir already holds a dataset, the partitions
+    that are written are replaced and the others are kept, so that a campaign can be re-exported alone.
+
+    :param db_names: list of strings
+        paths to the SQL databases.
+    :param out_dir: string
+        directory where the dataset is written.
+    :param chunk_size: integer (default = 50000)
+        number of rows fetched from each database at a time.
+    :param partition_by: list of strings (default = ('campaign', 'year'))
+        columns that the dataset is partitioned by (any of partition_columns, or none).
+    :param compression: string (default = 'zstd')
+        compression codec, or None for uncompressed files.
+    :return n_rows: integer
+        number of simulations written.
+
+    """
+    _require_pyarrow()
+    campaigns = [os.path.splitext(os.path.basename(db_name))[0] for db_name in db_names]
+    if len(set(campaigns)) < len(campaigns):
+        print(f'OptWRFError: the databases {db_names} must have different file names, which name the campaigns.')
+        raise ValueError
+    for column in partition_by:
+        if column not in partition_columns:
+            print(f'OptWRFError: {column} is not a valid partition column; use any of {partition_columns}.')
+            raise ValueError
+    schema = arrow_schema(partitioned=True)
+    n_rows = [0]
+
+    def fn_batches():
+        for db_name, campaign in zip(db_names, campaigns):
+            for batch in iter_record_batches(db_name, chunk_size, campaign=campaign):
+                n_rows[0] += batch.num_rows
+                yield batch
+
+    partitioning = None
+    if len(partition_by) > 0:
+        partitioning = ds.partitioning(pa.schema([schema.field(column) for column in partition_by]), flavor='hive')
+    ds.write_dataset(fn_batches(), out_dir, schema=schema, format='parquet', partitioning=partitioning,
+                     file_options=ds.ParquetFileFormat().make_write_options(compression=compression or 'none'),
+                     existing_data_behavior='delete_matching')
+    return n_rows[0]
+
+
+def read_dataset(path, columns=None, filter=None):
+    """
+    Reads an exported Parquet file, Arrow IPC/Feather file, or partitioned dataset into a pandas DataFrame.
+
+    :param path: string
+        file written by sql_to_parquet or directory written by merge_databases.
+    :param columns: list of strings (default = None)
+        columns to read; every column is read if None.
+    :param filter: pyarrow.dataset.Expression (default = None)
+        rows to read, e.g., (pyarrow.dataset.field('year') == 2011) & (pyarrow.dataset.field('status') == 'complete').
+    :return df: pandas.DataFrame
+
+    """
+    _require_pyarrow()
+    if os.path.isdir(path):
+        dataset = ds.dataset(path, format='parquet', partitioning='hive')
+    else:
+        dataset = ds.dataset(path, format='parquet' if path.endswith('.parquet') else 'ipc')
+    return dataset.to_table(columns=columns, filter=filter).to_pandas()
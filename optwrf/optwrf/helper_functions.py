@@ -6,10 +6,13 @@ Known Issues/Wishlist:
 
 """
 
+import contextlib
 import csv
 import datetime
+import fcntl
 import math
 import os
+import re
 import sys
 from shutil import rmtree
 import string
@@ -90,6 +93,26 @@ def strfdelta(tdelta, fmt='{H:02}h {M:02}m {S:02}s', inputtype='timedelta'):
     return f.format(fmt, **values)
 
 
+def strpdelta(tdelta_str):
+    """
+    Converts a string created by strfdelta (e.g., '05h 12m 33s' or '01d 02h 03m 04s')
+    back to a datetime.timedelta object. Fields that are missing from the string are taken to be zero.
+
+    :param tdelta_str: string
+        formatted with any of the W, D, H, M, and S fields followed by w, d, h, m, and s.
+    :return tdelta: datetime.timedelta object
+        corresponding to the input string.
+
+    """
+    constants = {'w': 604800, 'd': 86400, 'h': 3600, 'm': 60, 's': 1}
+    fields = re.findall(r'(\d+)\s*([wdhms])', str(tdelta_str).lower())
+    if len(fields) == 0:
+        print(f'{tdelta_str} does not contain any time fields (e.g., 05h 12m 33s).')
+        raise ValueError
+    seconds = sum([int(value) * constants[unit] for value, unit in fields])
+    return datetime.timedelta(seconds=seconds)
+
+
 def date2season(date):
     """
     Takes a timestamp and returns the corresponding season. Seasons are
@@ -195,6 +218,25 @@ def format_date(in_date):
     raise ValueError('No valid date format found; please use a common US format (e.g., Jan 01, 2011 00)')
 
 
+@contextlib.contextmanager
+def file_lock(lock_file):
+    """
+    Context manager that holds an exclusive lock on lock_file (created if it does not exist).
+    The lock is taken with flock, so it works across threads, processes,
+    and (on most shared file systems) compute nodes.
+
+    :param lock_file: string
+        complete path to the lock file.
+
+    """
+    with open(lock_file, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
 def determine_computer():
     """
     Determines which computer you are currently working on.
@@ -0,0 +1,131 @@
+"""
+A shared store through which the islands of an island-model genetic algorithm (see
+optimize_wrf_physics.run_simplega) exchange their best individuals. Each island is an independent
+run_simplega process (e.g., one SLURM job per partition) that evolves its own sub-population, and
+every few generations it emigrates copies of its best Chromosomes to the store and immigrates the
+best Chromosomes that the other islands have emigrated.
+
+The store is a directory of JSON migration files, one per island and generation, on a file system
+shared by all of the islands. Each file is written to a temporary file and then renamed, so readers
+never see a partial file and no locks are needed (unlike SQLite, whose locking is not reliable on
+network file systems). Reading the latest file of each island is idempotent, so an island that is
+restarted from its checkpoint simply immigrates again.
+
+
+Known Issues/Wishlist:
+- Migration is all-to-all; a ring or other topology could preserve more diversity between islands.
+
+"""
+
+import glob
+import json
+import os
+import re
+
+from optwrf.simplega import Chromosome
+
+
+class MigrationStore:
+    """
+    Directory of migration files shared by the islands of an island-model genetic algorithm.
+
+    :param store_dir: string (default = './optwrf_migration/')
+        directory, shared by every island, where the migration files are written.
+    :param n_keep: integer (default = 3)
+        number of migration files that are kept for each island; older files are removed.
+
+    """
+    def __init__(self, store_dir='./optwrf_migration/', n_keep=3):
+        self.store_dir = os.path.abspath(store_dir) + '/'
+        self.n_keep = n_keep
+        os.makedirs(self.store_dir, exist_ok=True)
+
+    def _file(self, island, gen):
+        return f'{self.store_dir}island_{island:03d}_gen_{gen:06d}.json'
+
+    def _files(self):
+        """
+        Returns a dictionary mapping each island to its migration files, ordered by generation.
+        """
+        files = {}
+        for migration_file in sorted(glob.glob(f'{self.store_dir}island_*_gen_*.json')):
+            match = re.search(r'island_(\d+)_gen_(\d+)\.json$', migration_file)
+            if match is not None:
+                files.setdefault(int(match.group(1)), []).append(migration_file)
+        return files
+
+    def islands(self):
+        """
+        Returns the (sorted) ids of the islands that have emigrated individuals.
+        """
+        return sorted(self._files().keys())
+
+    def emigrate(self, island, gen, migrants):
+        """
+        Writes copies of an island's best individuals to the store.
+
+        :param island: integer
+            id of the island that the migrants leave.
+        :param gen: integer
+            generation of the island when the migrants leave.
+        :param migrants: list of simplega.Chromosome
+            evaluated individuals that are emigrated.
+
+        """
+        migration_file = self._file(island, gen)
+        with open(migration_file + '.tmp', 'w') as json_file:
+            json.dump({'island': island, 'gen': gen,
+                       'migrants': [migrant.to_dict() for migrant in migrants]}, json_file, indent=1)
+        os.replace(migration_file + '.tmp', migration_file)
+        # Remove the old migration files of this island
+        for old_file in self._files().get(island, [])[0:-self.n_keep]:
+            try:
+                os.remove(old_file)
+            except FileNotFoundError:
+                pass
+
+    def latest(self, island):
+        """
+        Reads the individuals that an island emigrated most recently.
+
+        :param island: integer
+            id of the island.
+        :return gen: integer
+            generation in which the individuals were emigrated, or None if the island has not emigrated.
+        :return migrants: list of simplega.Chromosome
+
+        """
+        for migration_file in reversed(self._files().get(island, [])):
+            try:
+                with open(migration_file) as json_file:
+                    migration = json.load(json_file)
+            except FileNotFoundError:
+                # The file was removed by its island after the directory was listed
+                continue
+            return migration['gen'], [Chromosome.from_dict(migrant) for migrant in migration['migrants']]
+        return None, []
+
+    def immigrate(self, island, n_migrants, key=None):
+        """
+        Reads the best individuals that the other islands emigrated most recently.
+
+        :param island: integer
+            id of the island that the migrants arrive at; its own migrants are skipped.
+        :param n_migrants: integer
+            maximum number of migrants returned (or None to return every migrant).
+        :param key: function (default = None)
+            that ranks the migrants (lower is better). If None, the migrants are ranked by their fitness.
+        :return migrants: list of simplega.Chromosome
+            the best migrants, without duplicates (i.e., the same genes and start date).
+
+        """
+        candidates = {}
+        for other in self.islands():
+            if other == island:
+                continue
+            for migrant in self.latest(other)[1]:
+                if migrant.Fitness is not None:
+                    candidates.setdefault((tuple(migrant.Genes), migrant.Start_date), migrant)
+        if key is None:
+            key = lambda migrant: migrant.Fitness
+        return sorted(candidates.values(), key=key)[0:n_migrants]
@@ -7,19 +7,31 @@ Known Issues/Wishlist:
 
 """
 
+import collections
 import concurrent.futures
 import csv
 import datetime
+import functools
+import itertools
+import json
+import math
 import os
+import queue
 import random
 import sqlite3
 import sys
+import threading
 import time
 
+import numpy as np
+
 import optwrf.helper_functions as hf
-from optwrf.runwrf import WRFModel
+from optwrf.backends import ThreadBackend
+from optwrf.migration import MigrationStore
+from optwrf.runwrf import WRFModel, stages
 import optwrf.simplega as simplega
 from optwrf.simplega import Chromosome
+from optwrf.surrogate import FitnessSurrogate, rank_correlation
 import optwrf.wrfparams as wrfparams
 
 
@@ -31,19 +43,52 @@ import optwrf.wrfparams as wrfparams
 #         self.TotalError < other.TotalError
 
 
-def conn_to_db(db_name='optwrf.db'):
+# Columns of the simulations table, in order
+sim_columns = ['start_date', 'mp_physics', 'ra_lw_physics', 'ra_sw_physics', 'sf_surface_physics',
+               'bl_pbl_physics', 'cu_physics', 'sf_sfclay_physics', 'fitness', 'ghi_error', 'wpd_error',
+               'runtime', 'status']
+# Columns that uniquely identify a simulation (the start date and the seven physics parameters)
+sim_key_columns = sim_columns[0:8]
+# Inserts a simulation, or updates its results if it is already in the database (UPSERT)
+insert_sim_sql = f"""INSERT INTO simulations ({', '.join(sim_columns)})
+                    VALUES ({', '.join([':' + column for column in sim_columns])})
+                    ON CONFLICT ({', '.join(sim_key_columns)}) DO UPDATE SET
+                    {', '.join([f'{column} = excluded.{column}' for column in sim_columns[8:]])}"""
+# Columns of the simulation_errors table, which holds the domain-summed errors of each hour of a simulation
+# (see insert_hourly_errors) as arrays of little-endian float64 values
+error_columns = sim_key_columns + ['hours', 'ghi_errors', 'wpd_errors']
+insert_errors_sql = f"""INSERT INTO simulation_errors ({', '.join(error_columns)})
+                    VALUES ({', '.join([':' + column for column in error_columns])})
+                    ON CONFLICT ({', '.join(sim_key_columns)}) DO UPDATE SET
+                    {', '.join([f'{column} = excluded.{column}' for column in error_columns[8:]])}"""
+# Columns of the simulation_timings table, which holds the runtime accounting of a simulation (see insert_timings)
+timing_columns = sim_key_columns + [f'{stage}_seconds' for stage in stages] + \
+                 ['wall_seconds', 'mpi_ranks', 'peak_rss_mb', 'cache_hit']
+insert_timings_sql = f"""INSERT INTO simulation_timings ({', '.join(timing_columns)})
+                    VALUES ({', '.join([':' + column for column in timing_columns])})
+                    ON CONFLICT ({', '.join(sim_key_columns)}) DO UPDATE SET
+                    {', '.join([f'{column} = excluded.{column}' for column in timing_columns[8:]])}"""
+
+
+def conn_to_db(db_name='optwrf.db', timeout=60):
     """
-        Opens the connection to a SQL database.
+        Opens the connection to a SQL database. Databases written to a file are switched to
+        write-ahead logging (WAL), so that readers do not block the writer or each other.
+        Databases created by older versions of OptWRF are migrated in place (see migrate_db).
 
         :param db_name: SQL database name (string).
             Can be ':memory:' if you only want the database to be held in memory.
-            Otherwise, it will take the form <database_name>.db.
+            Otherwise, it will take the form <database_name>.db (or of an SQLite URI starting with file:).
+        :param timeout: float (default = 60)
+            seconds to wait for a lock held by another connection before raising an error.
         :returns db_conn: database connection object
             that allows for additional interactions with the SQL database when referenced.
 
     """
-    db_conn = sqlite3.connect(db_name)
+    db_conn = sqlite3.connect(db_name, timeout=timeout, uri=db_name.startswith('file:'), check_same_thread=False)
     c = db_conn.cursor()
+    if db_name != ':memory:' and not db_name.startswith('file:'):
+        c.execute("""PRAGMA journal_mode = WAL""")
     with db_conn:
         c.execute("""CREATE TABLE IF NOT EXISTS simulations (
                         start_date DATE,
@@ -57,14 +102,73 @@ def conn_to_db(db_name='optwrf.db'):
                         fitness FLOAT,
                         ghi_error FLOAT,
                         wpd_error FLOAT,
-                        runtime FLOAT 
+                        runtime FLOAT,
+                        status TEXT
                         )""")
+    migrate_db(db_conn)
     return db_conn
 
 
+def migrate_db(db_conn):
+    """
+    Brings the schema of a simulation database created by an older version of OptWRF up to date, in place:
+        1. Adds the status column.
+        2. Makes the start date and the seven physics parameters a unique composite key (a unique index,
+        which is also what the UPSERT in insert_sim relies on). If a simulation was stored more than once,
+        only its most recent copy is kept.
+        3. Adds covering indexes for looking up simulations by their genes only or by their date only.
+        4. Adds the simulation_errors table, which holds the domain-summed errors of each hour of a simulation
+        (see insert_hourly_errors), keyed like the simulations table.
+        5. Adds the simulation_timings table, which holds the wall seconds of each stage, the MPI ranks,
+        the peak memory, and the cache-hit flag of a simulation (see insert_timings), keyed like the simulations table.
+    Each step is skipped if it has already been done.
+
+    :param db_conn: database connection object
+        created using the conn_to_db() function.
+
+    """
+    c = db_conn.cursor()
+    with db_conn:
+        # Add the status column to databases created before it existed
+        c.execute("""PRAGMA table_info(simulations)""")
+        if 'status' not in [column[1] for column in c.fetchall()]:
+            c.execute("""ALTER TABLE simulations ADD COLUMN status TEXT""")
+        c.execute("""SELECT name FROM sqlite_master WHERE type = 'index' AND name = 'simulations_key'""")
+        if c.fetchone() is None:
+            c.execute(f"""DELETE FROM simulations WHERE rowid NOT IN
+                        (SELECT MAX(rowid) FROM simulations GROUP BY {', '.join(sim_key_columns)})""")
+            if c.rowcount > 0:
+                print(f'--> Removed {c.rowcount} duplicate simulations (the most recent copy of each was kept)')
+            c.execute(f"""CREATE UNIQUE INDEX simulations_key ON simulations ({', '.join(sim_key_columns)})""")
+        c.execute(f"""CREATE INDEX IF NOT EXISTS simulations_genes
+                    ON simulations ({', '.join(sim_key_columns[1:])}, start_date, fitness, ghi_error, wpd_error)""")
+        c.execute("""CREATE INDEX IF NOT EXISTS simulations_date
+                    ON simulations (start_date, fitness, ghi_error, wpd_error)""")
+        c.execute(f"""CREATE TABLE IF NOT EXISTS simulation_errors (
+                        start_date DATE,
+                        {' INTEGER, '.join(sim_key_columns[1:])} INTEGER,
+                        hours BLOB,
+                        ghi_errors BLOB,
+                        wpd_errors BLOB
+                        )""")
+        c.execute(f"""CREATE UNIQUE INDEX IF NOT EXISTS simulation_errors_key
+                    ON simulation_errors ({', '.join(sim_key_columns)})""")
+        c.execute(f"""CREATE TABLE IF NOT EXISTS simulation_timings (
+                        start_date DATE,
+                        {' INTEGER, '.join(sim_key_columns[1:])} INTEGER,
+                        {' FLOAT, '.join(timing_columns[8:-3])} FLOAT,
+                        mpi_ranks INTEGER,
+                        peak_rss_mb FLOAT,
+                        cache_hit INTEGER
+                        )""")
+        c.execute(f"""CREATE UNIQUE INDEX IF NOT EXISTS simulation_timings_key
+                    ON simulation_timings ({', '.join(sim_key_columns)})""")
+
+
 def insert_sim(individual, db_conn, verbose=False):
     """
     Inserts a simulation into the SQL database held in memory or written to a .db file.
+    If the simulation (i.e., the same start date and genes) is already in the database, its results are updated.
 
     :param individual: simplega.Chromosome instance
         describing the simulation that you would like to add to the SQL simulation database.
@@ -78,50 +182,255 @@ def insert_sim(individual, db_conn, verbose=False):
         print(f'...Adding {individual.Genes} to the simulation database...')
     c = db_conn.cursor()
     with db_conn:
-        c.execute("""INSERT INTO simulations VALUES (
-                    :start_date, :mp_physics, :ra_lw_physics, :ra_sw_physics, :sf_surface_physics, 
-                    :bl_pbl_physics, :cu_physics, :sf_sfclay_physics, :fitness, :ghi_error, :wpd_error, :runtime)""",
-                  {'start_date': individual.Start_date, 'mp_physics': individual.Genes[0],
-                   'ra_lw_physics': individual.Genes[1],
-                   'ra_sw_physics': individual.Genes[2], 'sf_surface_physics': individual.Genes[3],
-                   'bl_pbl_physics': individual.Genes[4], 'cu_physics': individual.Genes[5],
-                   'sf_sfclay_physics': individual.Genes[6],
-                   'fitness': individual.Fitness, 'ghi_error': individual.GHI_error,
-                   'wpd_error': individual.WPD_error, 'runtime': individual.Runtime})
+        c.execute(insert_sim_sql, sim_params(individual))
+
+
+def sim_params(individual):
+    """
+    Builds the named SQL parameters of a simulation (one per column of the simulations table).
+
+    :param individual: simplega.Chromosome instance
+    :return params: dictionary
+        mapping each column name to its value.
+
+    """
+    params = {'start_date': individual.Start_date, 'fitness': individual.Fitness,
+              'ghi_error': individual.GHI_error, 'wpd_error': individual.WPD_error,
+              'runtime': individual.Runtime, 'status': individual.Status}
+    for column, gene in zip(sim_columns[1:8], individual.Genes):
+        params[column] = int(gene)
+    return params
 
 
 def update_sim(individual, db_conn):
     """
-    Inserts a simulation into the SQL database held in memory or written to a .db file.
+    Updates the results of a simulation (identified by its start date and genes)
+    in the SQL database held in memory or written to a .db file.
 
     :param individual: simplega.Chromosome instance
         describing the simulation that you would like to update in the SQL simulation database.
     :param db_conn: database connection object
         created using the conn_to_db() function.
+    :return n_updated: int
+        number of simulations updated (0 if the simulation is not in the database).
 
     """
     print(f'...Updating {individual.Genes} in the simulation database...')
     c = db_conn.cursor()
     with db_conn:
-        c.execute("""UPDATE simulations 
-                    SET start_date = :start_date, 
-                    fitness = :fitness,
-                    ghi_error = :ghi_error,
-                    wpd_error = :wpd_error, 
-                    runtime = :runtime
-                    WHERE mp_physics = :mp_physics
-                    AND ra_lw_physics = :ra_lw_physics
-                    AND ra_sw_physics = :ra_sw_physics
-                    AND sf_surface_physics = :sf_surface_physics
-                    AND bl_pbl_physics = :bl_pbl_physics
-                    AND cu_physics = :cu_physics
-                    AND sf_sfclay_physics = :sf_sfclay_physics""",
-                  {'start_date': individual.Start_date, 'fitness': individual.Fitness,
-                   'ghi_error': individual.GHI_error, 'wpd_error': individual.WPD_error,
-                   'runtime': individual.Runtime, 'mp_physics': individual.Genes[0],
-                   'ra_lw_physics': individual.Genes[1], 'ra_sw_physics': individual.Genes[2],
-                   'sf_surface_physics': individual.Genes[3], 'bl_pbl_physics': individual.Genes[4],
-                   'cu_physics': individual.Genes[5], 'sf_sfclay_physics': individual.Genes[6]})
+        c.execute(f"""UPDATE simulations
+                    SET {', '.join([f'{column} = :{column}' for column in sim_columns[8:]])}
+                    WHERE {' AND '.join([f'{column} = :{column}' for column in sim_key_columns])}""",
+                  sim_params(individual))
+    return c.rowcount
+
+
+def hourly_error_params(individual, hourly_errors):
+    """
+    Builds the named SQL parameters of the hourly errors of a simulation (one per column of the
+    simulation_errors table).
+
+    :param individual: simplega.Chromosome instance
+    :param hourly_errors: tuple
+        of (hours since the start date, GHI errors, WPD errors) arrays, e.g., returned by
+        get_wrf_fitness with return_hourly=True.
+    :return params: dictionary
+        mapping each column name to its value.
+
+    """
+    params = {column: value for column, value in sim_params(individual).items() if column in sim_key_columns}
+    for column, values in zip(error_columns[8:], hourly_errors):
+        params[column] = np.asarray(values, dtype='<f8').tobytes()
+    return params
+
+
+def insert_hourly_errors(individual, hourly_errors, db_conn):
+    """
+    Inserts (or replaces) the domain-summed GHI and WPD errors of each hour of a simulation, so that
+    the fitness of every simulation can be re-scored under a different weighting (see rescore_fitness)
+    without regridding the wrfout files again.
+
+    :param individual: simplega.Chromosome instance
+        describing the simulation (its start date and genes).
+    :param hourly_errors: tuple
+        of (hours since the start date, GHI errors, WPD errors) arrays, e.g., returned by
+        get_wrf_fitness with return_hourly=True.
+    :param db_conn: database connection object
+        created using the conn_to_db() function.
+
+    """
+    c = db_conn.cursor()
+    with db_conn:
+        c.execute(insert_errors_sql, hourly_error_params(individual, hourly_errors))
+
+
+def read_hourly_errors(db_conn):
+    """
+    Reads the hourly errors of every simulation in the simulation_errors table into padded arrays.
+
+    :param db_conn: database connection object
+        created using the conn_to_db() function.
+    :return hourly: dictionary
+        with the start_date (list of strings) and genes (integer array with one row per simulation)
+        of each simulation, and its hours, ghi_errors, and wpd_errors (float arrays with one row per
+        simulation and one column per wrfout frame, padded with NaN).
+
+    """
+    c = db_conn.cursor()
+    c.execute(f"""SELECT {', '.join(error_columns)} FROM simulation_errors""")
+    rows = c.fetchall()
+    arrays = [[np.frombuffer(row[ii], dtype='<f8') for row in rows] for ii in range(8, 11)]
+    n_hours = max([len(values) for values in arrays[0]], default=0)
+    hourly = {'start_date': [row[0] for row in rows],
+              'genes': np.array([row[1:8] for row in rows], dtype=int).reshape(len(rows), 7)}
+    for column, values in zip(error_columns[8:], arrays):
+        padded = np.full((len(rows), n_hours), np.nan)
+        for ii, row_values in enumerate(values):
+            padded[ii, 0:len(row_values)] = row_values
+        hourly[column] = padded
+    return hourly
+
+
+def rescore_fitness(db_conn, method='both', correction_factor=0.0004218304553577255, daylight=True,
+                    ghi_hour_weights=None, wpd_hour_weights=None, update=False):
+    """
+    Recomputes the fitness of every simulation with hourly errors in the database (see insert_hourly_errors)
+    under a new fitness method, correction factor, or weighting of the hours, in one vectorized pass and
+    without regridding. With the default arguments, the fitness is computed as in calculate_fitness.
+
+    :param db_conn: database connection object
+        created using the conn_to_db() function.
+    :param method: string
+        specifying what the fitness function judges -- wind_only, solar_only, or both.
+    :param correction_factor: float
+        capuring the relationship between GHI and wind power density (WPD) errors (see get_wrf_fitness).
+    :param daylight: boolean (default = True)
+        if True, the GHI error is scaled by the daylight fraction of the start date (see hf.daylight_frac).
+    :param ghi_hour_weights: list of 24 floats (default = None)
+        weight of the GHI error of each hour of the day (UTC); if None, every hour has a weight of one.
+    :param wpd_hour_weights: list of 24 floats (default = None)
+        weight of the WPD error of each hour of the day (UTC); if None, every hour has a weight of one.
+    :param update: boolean (default = False)
+        if True, the fitness in the simulations table is replaced by the new fitness.
+    :return scores: dictionary
+        with the start_date and genes of each simulation (see read_hourly_errors), and its new
+        fitness, ghi_error, and wpd_error (the weighted sums of the hourly errors).
+
+    """
+    if method not in ['both', 'solar_only', 'wind_only']:
+        print('Only "both", "solar_only", or "wind_only" are currently supportted.')
+        raise ValueError
+    hourly = read_hourly_errors(db_conn)
+    # The start date is at 00 UTC, so the hour of the day follows from the hours since the start
+    hour_of_day = np.nan_to_num(hourly['hours'], nan=0).astype(int) % 24
+    errors = []
+    for column, hour_weights in [('ghi_errors', ghi_hour_weights), ('wpd_errors', wpd_hour_weights)]:
+        weighted = hourly[column]
+        if hour_weights is not None:
+            weighted = weighted * np.asarray(hour_weights, dtype=float)[hour_of_day]
+        errors.append(np.nansum(weighted, axis=1))
+    ghi_error, wpd_error = errors
+    if daylight:
+        start_dates, date_index = np.unique(np.array(hourly['start_date'], dtype=str), return_inverse=True)
+        daylight_factor = np.array([hf.daylight_frac(str(start_date)) for start_date in start_dates])[date_index]
+    else:
+        daylight_factor = np.ones(len(ghi_error))
+    if method == 'both':
+        fitness = daylight_factor * ghi_error + correction_factor * wpd_error
+    elif method == 'solar_only':
+        fitness = daylight_factor * ghi_error
+    else:
+        fitness = wpd_error
+    if update:
+        c = db_conn.cursor()
+        with db_conn:
+            c.executemany(f"""UPDATE simulations SET fitness = ?
+                            WHERE {' AND '.join([f'{column} = ?' for column in sim_key_columns])}""",
+                          [(float(fitness[ii]), hourly['start_date'][ii]) + tuple(int(gene) for gene in genes)
+                           for ii, genes in enumerate(hourly['genes'])])
+    return {'start_date': hourly['start_date'], 'genes': hourly['genes'],
+            'fitness': fitness, 'ghi_error': ghi_error, 'wpd_error': wpd_error}
+
+
+def timing_params(individual, timings):
+    """
+    Builds the named SQL parameters of the runtime accounting of a simulation (one per column of the
+    simulation_timings table). Missing values are stored as NULL.
+
+    :param individual: simplega.Chromosome instance
+    :param timings: dictionary
+        returned by WRFModel.timings (with wall_seconds), e.g., by get_wrf_fitness with return_timings=True.
+    :return params: dictionary
+        mapping each column name to its value.
+
+    """
+    params = {column: value for column, value in sim_params(individual).items() if column in sim_key_columns}
+    for column in timing_columns[8:]:
+        value = timings.get(column)
+        if value is not None:
+            value = int(value) if column in ['mpi_ranks', 'cache_hit'] else float(value)
+        params[column] = value
+    return params
+
+
+def insert_timings(individual, timings, db_conn):
+    """
+    Inserts (or replaces) the runtime accounting of a simulation: the wall seconds spent in each stage
+    (see runwrf.stages), the total wall seconds, the MPI ranks that ran wrf.exe, the peak resident set size,
+    and whether the inputs or outputs of the simulation were already cached.
+
+    :param individual: simplega.Chromosome instance
+        describing the simulation (its start date and genes).
+    :param timings: dictionary
+        returned by WRFModel.timings (with wall_seconds), e.g., by get_wrf_fitness with return_timings=True.
+    :param db_conn: database connection object
+        created using the conn_to_db() function.
+
+    """
+    c = db_conn.cursor()
+    with db_conn:
+        c.execute(insert_timings_sql, timing_params(individual, timings))
+
+
+def read_timings(db_conn):
+    """
+    Reads the runtime accounting of every simulation in the simulation_timings table.
+
+    :param db_conn: database connection object
+        created using the conn_to_db() function.
+    :return timings: list of dictionaries
+        mapping each column of the simulation_timings table to its value, one per simulation.
+
+    """
+    c = db_conn.cursor()
+    c.execute(f"""SELECT {', '.join(timing_columns)} FROM simulation_timings""")
+    return [dict(zip(timing_columns, row)) for row in c.fetchall()]
+
+
+def print_stage_timings(timings):
+    """
+    Prints where the wall time of a set of simulations went: the hours spent in each stage
+    (see runwrf.stages), the cache hits, the MPI ranks, and the peak memory.
+
+    :param timings: list of dictionaries
+        returned by WRFModel.timings (with wall_seconds) or read_timings, one per simulation.
+
+    """
+    if len(timings) == 0:
+        return
+    stage_hours = {stage: sum([timing.get(f'{stage}_seconds') or 0.0 for timing in timings]) / 3600
+                   for stage in stages}
+    wall_hours = sum([timing.get('wall_seconds') or 0.0 for timing in timings]) / 3600
+    print(f'Runtime accounting of {len(timings)} simulations: {wall_hours:.2f} wall hours')
+    for stage, hours in sorted(stage_hours.items(), key=lambda item: -item[1]):
+        if hours > 0:
+            print(f'\t{stage}: {hours:.2f} h ({hours / wall_hours * 100 if wall_hours > 0 else 0:.1f}%)')
+    n_hits = len([timing for timing in timings if timing.get('cache_hit')])
+    mpi_ranks = [timing['mpi_ranks'] for timing in timings if timing.get('mpi_ranks') is not None]
+    peak_rss = [timing['peak_rss_mb'] for timing in timings if timing.get('peak_rss_mb') is not None]
+    print(f'\tCache hits: {n_hits} of {len(timings)}'
+          + (f'; MPI ranks per simulation: {sum(mpi_ranks) / len(mpi_ranks):.1f}' if len(mpi_ranks) > 0 else '')
+          + (f'; peak memory: {max(peak_rss):.0f} MB' if len(peak_rss) > 0 else ''))
 
 
 def get_individual_by_genes(individual, db_conn):
@@ -157,17 +466,203 @@ def get_individual_by_genes(individual, db_conn):
                'sf_sfclay_physics': individual.Genes[6]})
     sim_data = c.fetchone()
     if sim_data is not None:
-        param_ids = list(sim_data[1:-2])
+        param_ids = list(sim_data[1:8])
         s_date = sim_data[0]
         s_date, e_date = simplega.generate_random_dates(input_start_date=s_date)
-        fitness = sim_data[-2]
-        runtime = sim_data[-1]
-        past_sim = Chromosome(param_ids, s_date, e_date, fitness, runtime)
+        fitness, ghi_error, wpd_error, runtime, status = sim_data[8:13]
+        past_sim = Chromosome(param_ids, s_date, e_date, fitness, ghi_error, wpd_error, runtime, status)
     else:
         return None
     return past_sim
 
 
+class FitnessCache:
+    """
+    A bounded, least-recently-used (LRU) cache of simulation results that sits in front of the
+    SQL simulation database. Entries are keyed on the start date and the seven physics parameter ids,
+    so a population can be resolved from memory, and any individuals that are not in memory are
+    looked up in the database with one batched query instead of one query per individual.
+
+    The number of individuals found in (hits) and missing from (misses) memory are counted
+    so that the effectiveness of the cache can be judged.
+
+    Pruned simulations are never cached or read back from the database, because their fitness
+    is only a partial (underestimated) value; they are simulated again when they are needed.
+    """
+    # Columns that make up the cache key, in the order of the simulations table
+    key_columns = sim_key_columns
+    # Simulations whose results can be reused (i.e., that were not pruned)
+    reusable_sql = "(status IS NULL OR status IN ('complete', 'failed'))"
+    # Number of individuals looked up in each batched query (keeps below the SQLite variable limit)
+    batch_size = 100
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(individual):
+        """
+        Builds the cache key, (start_date, 7 genes), for a simplega.Chromosome instance.
+        """
+        return tuple([individual.Start_date] + [int(gene) for gene in individual.Genes])
+
+    def get(self, individual):
+        """
+        Returns the (fitness, ghi_error, wpd_error, runtime) tuple for an individual,
+        or None if the individual is not held in memory.
+        """
+        key = self.key(individual)
+        with self._lock:
+            values = self._entries.get(key)
+            if values is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return values
+
+    def put(self, individual):
+        """
+        Adds an evaluated individual to the cache, evicting the least recently used entry if necessary.
+        Pruned individuals are not added.
+        """
+        if individual.Status == 'pruned':
+            return
+        self._put(self.key(individual),
+                  (individual.Fitness, individual.GHI_error, individual.WPD_error, individual.Runtime))
+
+    def _put(self, key, values):
+        with self._lock:
+            self._entries[key] = values
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def warm(self, db_conn):
+        """
+        Fills the cache with (up to max_size of) the most recent simulations in the SQL database.
+
+        :param db_conn: database connection object
+            created using the conn_to_db() function.
+
+        """
+        c = db_conn.cursor()
+        c.execute(f"""SELECT {', '.join(self.key_columns)}, fitness, ghi_error, wpd_error, runtime 
+                    FROM simulations WHERE {self.reusable_sql} ORDER BY rowid DESC LIMIT ?""", (self.max_size,))
+        rows = c.fetchall()
+        for row in reversed(rows):
+            self._put(tuple(row[0:8]), tuple(row[8:]))
+
+    def resolve(self, population, db_conn):
+        """
+        Attaches the fitness, errors, and runtime of every individual in the population
+        that has been simulated before. Individuals are first looked up in memory, and those that
+        are missing are then looked up in the SQL database using batched queries.
+
+        :param population: list of simplega.Chromosome instances
+            whose fitness may not have been calculated yet.
+        :param db_conn: database connection object
+            created using the conn_to_db() function.
+        :return unresolved: list of simplega.Chromosome instances
+            whose fitness still needs to be calculated.
+
+        """
+        missing = {}
+        for individual in population:
+            if individual.Fitness is not None:
+                continue
+            values = self.get(individual)
+            if values is None:
+                missing.setdefault(self.key(individual), []).append(individual)
+            else:
+                individual.Fitness, individual.GHI_error, individual.WPD_error, individual.Runtime = values
+
+        # Look up all the individuals that were not in memory with as few queries as possible
+        missing_keys = list(missing.keys())
+        c = db_conn.cursor()
+        for ii in range(0, len(missing_keys), self.batch_size):
+            batch = missing_keys[ii:ii + self.batch_size]
+            placeholders = ', '.join(['(?, ?, ?, ?, ?, ?, ?, ?)'] * len(batch))
+            c.execute(f"""SELECT {', '.join(self.key_columns)}, fitness, ghi_error, wpd_error, runtime 
+                        FROM simulations WHERE ({', '.join(self.key_columns)}) IN (VALUES {placeholders})
+                        AND {self.reusable_sql}""",
+                      [value for key in batch for value in key])
+            for row in c.fetchall():
+                key = tuple(row[0:8])
+                self._put(key, tuple(row[8:]))
+                for individual in missing.pop(key, []):
+                    individual.Fitness, individual.GHI_error, individual.WPD_error, individual.Runtime = row[8:]
+
+        unresolved = [individual for individuals in missing.values() for individual in individuals]
+        return unresolved
+
+
+class SingleFlight:
+    """
+    A registry of in-flight fitness evaluations that maps each (start_date, genes) pair to one shared future.
+    The crossover and mutate operators often produce offspring with identical genes; without this registry,
+    two identical individuals would launch two WRF simulations that race on the same DIR_WRFOUT directory.
+    Instead, duplicates attach to the evaluation that is already running.
+
+    Entries are released by the caller (see release()) once the results have been stored,
+    so that a finished evaluation is never resubmitted before it reaches the fitness cache.
+    """
+    def __init__(self):
+        self.n_shared = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._in_flight)
+
+    @staticmethod
+    def key(individual):
+        """
+        Builds the registry key, (start_date, 7 genes), for a simplega.Chromosome instance.
+        """
+        return tuple([individual.Start_date] + [int(gene) for gene in individual.Genes])
+
+    def submit(self, individual, submit_fn):
+        """
+        Returns the future of the running evaluation of this individual,
+        or starts a new evaluation if none is running.
+
+        :param individual: simplega.Chromosome instance
+            whose fitness should be calculated.
+        :param submit_fn: function
+            taking no arguments that submits the fitness evaluation and returns its future.
+        :return future: concurrent.futures.Future
+            shared by every individual with the same start date and genes.
+        :return is_new: boolean
+            True if a new evaluation was started, and False if the individual
+            was attached to an evaluation that is already running.
+
+        """
+        key = self.key(individual)
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.n_shared += 1
+                return future, False
+            future = submit_fn()
+            self._in_flight[key] = future
+        return future, True
+
+    def release(self, individual):
+        """
+        Removes the evaluation of this individual from the registry.
+        """
+        with self._lock:
+            self._in_flight.pop(self.key(individual), None)
+
+
 def print_database(db_conn):
     """
     Prints the entire SQLite simulation database.
@@ -186,25 +681,60 @@ def print_database(db_conn):
         print(entry)
 
 
-def sql_to_csv(csv_file_path, db_conn):
+def sql_to_csv(csv_file_path, db_conn, chunk_size=10000):
     """
     Writes the contents of a SQL database to a CSV file. The SQL database must
-    be in the directory that you are running this function from.
+    be in the directory that you are running this function from. The rows are
+    streamed in chunks, so the table never has to fit in memory
+    (see optwrf.export for typed Parquet and Arrow exports).
 
     :param csv_file_path: string
         Exact path to where you would like to csv to be saved ending with the file name.
         e.g., csv_file_path = '/home/jas983/data/test.csv'
     :param db_conn: database connection object
         created using the conn_to_db() function.
+    :param chunk_size: integer (default = 10000)
+        number of rows fetched from the database at a time.
+    :return n_rows: integer
+        number of simulations written to the CSV file.
 
     """
     c = db_conn.cursor()
     c.execute("""SELECT * FROM simulations""")
     header = [i[0] for i in c.description]
-    csv_writer = csv.writer(open(csv_file_path, "w"))
-    csv_data = c.fetchall()
-    csv_writer.writerow(header)
-    csv_writer.writerows(csv_data)
+    n_rows = 0
+    with open(csv_file_path, 'w', newline='') as csv_file:
+        csv_writer = csv.writer(csv_file)
+        csv_writer.writerow(header)
+        while True:
+            csv_data = c.fetchmany(chunk_size)
+            if not csv_data:
+                break
+            csv_writer.writerows(csv_data)
+            n_rows += len(csv_data)
+    return n_rows
+
+
+def get_pareto_front(db_conn):
+    """
+    Reads every completed simulation in the SQL database and returns the ones on the GHI/WPD Pareto front
+    (see simplega.pareto_front), so that any weighting of the two errors can be applied afterwards
+    (see choose_from_front) without running WRF again.
+
+    :param db_conn: database connection object
+        created using the conn_to_db() function.
+    :return front: list of simplega.Chromosome instances
+        ordered by their GHI error.
+
+    """
+    c = db_conn.cursor()
+    c.execute("""SELECT start_date, mp_physics, ra_lw_physics, ra_sw_physics, sf_surface_physics,
+                bl_pbl_physics, cu_physics, sf_sfclay_physics, fitness, ghi_error, wpd_error, runtime, status
+                FROM simulations WHERE ghi_error < :failed AND wpd_error < :failed
+                AND (status IS NULL OR status = 'complete')""", {'failed': 6.022 * 10 ** 23})
+    sims = [Chromosome(list(row[1:8]), row[0], None, row[8], row[9], row[10], row[11], row[12])
+            for row in c.fetchall()]
+    return simplega.pareto_front(sims)
 
 
 def close_conn_to_db(db_conn):
@@ -218,6 +748,231 @@ def close_conn_to_db(db_conn):
     db_conn.close()
 
 
+class SimulationDatabase:
+    """
+    A thread- and process-safe layer over the SQL simulation database. The database uses write-ahead
+    logging (WAL), and all writes go through a queue to one dedicated writer thread, which groups the writes
+    that arrive within flush_interval seconds (up to batch_size rows) into one transaction. Consecutive writes
+    with the same SQL statement are sent with executemany. Each reading thread gets its own read-only
+    connection (see connection()), so readers never wait for the writer. Writers in other processes
+    (e.g., other islands) are handled by the busy timeout, and locked transactions are retried.
+
+    Writes are asynchronous: call flush() before reading rows that were just written from another connection.
+
+    :param db_name: string (default = 'optwrf.db')
+        SQL database name; ':memory:' creates an in-memory database shared by the writer and the readers.
+    :param batch_size: int (default = 1000)
+        maximum number of rows written in one transaction.
+    :param flush_interval: float (default = 0.05)
+        seconds the writer waits for more writes to group into a transaction.
+    :param timeout: float (default = 60)
+        seconds to wait for a lock held by another process before retrying.
+
+    """
+    _n_memory = itertools.count()
+
+    def __init__(self, db_name='optwrf.db', batch_size=1000, flush_interval=0.05, timeout=60):
+        if db_name == ':memory:':
+            # A named, shared-cache in-memory database can be opened by more than one connection
+            db_name = f'file:optwrf_memory_{next(self._n_memory)}?mode=memory&cache=shared'
+        self.db_name = db_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.n_rows = 0
+        self.n_transactions = 0
+        self.error = None
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        self._closed = False
+        self._writer_conn = conn_to_db(db_name, timeout)
+        if not db_name.startswith('file:'):
+            self._writer_conn.execute("""PRAGMA synchronous = NORMAL""")
+        self._writer = threading.Thread(target=self._write, daemon=True)
+        self._writer.start()
+
+    def _write(self):
+        """
+        Writer thread: takes the queued writes, groups them into transactions, and commits them.
+        """
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            n_rows = len(batch[0][1]) if batch[0] is not None else 0
+            deadline = time.time() + self.flush_interval
+            while n_rows < self.batch_size and batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.time(), 0)))
+                except queue.Empty:
+                    break
+                n_rows += len(batch[-1][1]) if batch[-1] is not None else 0
+            stop = batch[-1] is None
+            # Merge consecutive writes with the same statement so that they can be sent with executemany
+            statements = []
+            for item in batch:
+                if item is None:
+                    continue
+                if len(statements) > 0 and statements[-1][0] == item[0]:
+                    statements[-1][1].extend(item[1])
+                else:
+                    statements.append((item[0], list(item[1])))
+            if len(statements) > 0:
+                self._commit(statements)
+            for _ in batch:
+                self._queue.task_done()
+        self._writer_conn.close()
+
+    def _commit(self, statements):
+        for attempt in range(0, 10):
+            try:
+                with self._writer_conn:
+                    for sql, rows in statements:
+                        self._writer_conn.executemany(sql, rows)
+                self.n_rows += sum([len(rows) for _, rows in statements])
+                self.n_transactions += 1
+                return
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e) and 'busy' not in str(e):
+                    self.error = e
+                    print(f'OptWRFWarning in SimulationDatabase: the writes could not be committed ({e}).')
+                    return
+                time.sleep(0.1 * 2 ** attempt)
+        self.error = sqlite3.OperationalError(f'{self.db_name} stayed locked')
+        print(f'OptWRFWarning in SimulationDatabase: {self.db_name} stayed locked; the writes were dropped.')
+
+    def execute(self, sql, rows):
+        """
+        Queues a write, which the writer thread sends with executemany.
+
+        :param sql: string
+            SQL statement with named or positional parameters.
+        :param rows: list
+            of parameter dictionaries (or tuples), one per row.
+
+        """
+        if self._closed:
+            print('SimulationDatabase is closed; nothing can be written to it.')
+            raise RuntimeError
+        rows = list(rows)
+        for ii in range(0, len(rows), self.batch_size):
+            self._queue.put((sql, rows[ii:ii + self.batch_size]))
+
+    def insert(self, individual):
+        """
+        Queues a simplega.Chromosome instance to be inserted into (or updated in) the simulations table.
+        """
+        self.execute(insert_sim_sql, [sim_params(individual)])
+
+    def insert_many(self, individuals):
+        """
+        Queues many simplega.Chromosome instances to be inserted into the simulations table with executemany.
+        """
+        self.execute(insert_sim_sql, [sim_params(individual) for individual in individuals])
+
+    def insert_errors(self, individual, hourly_errors):
+        """
+        Queues the hourly errors of a simulation to be inserted into the simulation_errors table
+        (see insert_hourly_errors).
+        """
+        self.execute(insert_errors_sql, [hourly_error_params(individual, hourly_errors)])
+
+    def insert_timings(self, individual, timings):
+        """
+        Queues the runtime accounting of a simulation to be inserted into the simulation_timings table
+        (see insert_timings).
+        """
+        self.execute(insert_timings_sql, [timing_params(individual, timings)])
+
+    def import_csv(self, csv_file):
+        """
+        Queues the simulations in a CSV file (e.g., written by sql_to_csv) to be inserted with executemany.
+        Columns that are missing from the file are left empty.
+
+        :param csv_file: string
+            path to the CSV file, whose first line holds the column names.
+        :return n_rows: int
+            number of simulations queued.
+
+        """
+        with open(csv_file, newline='') as csv_data:
+            rows = [{column: (row.get(column) if row.get(column) != '' else None) for column in sim_columns}
+                    for row in csv.DictReader(csv_data)]
+        self.execute(insert_sim_sql, rows)
+        return len(rows)
+
+    def import_db(self, other_db_name):
+        """
+        Queues the simulations in another SQL simulation database to be inserted with executemany.
+
+        :param other_db_name: string
+            name of the other SQL database.
+        :return n_rows: int
+            number of simulations queued.
+
+        """
+        other_conn = sqlite3.connect(f'file:{other_db_name}?mode=ro', uri=True)
+        c = other_conn.cursor()
+        c.execute("""PRAGMA table_info(simulations)""")
+        other_columns = [column[1] for column in c.fetchall()]
+        c.execute(f"""SELECT {', '.join([column if column in other_columns else 'NULL' for column in sim_columns])}
+                    FROM simulations""")
+        rows = c.fetchall()
+        other_conn.close()
+        self.execute(insert_sim_sql, [dict(zip(sim_columns, row)) for row in rows])
+        return len(rows)
+
+    def flush(self):
+        """
+        Waits until every queued write has been committed.
+        """
+        self._queue.join()
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def connection(self):
+        """
+        Returns the read-only connection of the calling thread (opened the first time it is requested).
+        """
+        db_conn = getattr(self._local, 'db_conn', None)
+        if db_conn is None:
+            # Autocommit, so that a read never holds on to an old snapshot of the database
+            db_conn = sqlite3.connect(self.db_name, timeout=self.timeout, uri=self.db_name.startswith('file:'),
+                                      check_same_thread=False, isolation_level=None)
+            db_conn.execute("""PRAGMA query_only = ON""")
+            if self.db_name.startswith('file:'):
+                # Don't take table locks on the shared-cache in-memory database
+                db_conn.execute("""PRAGMA read_uncommitted = ON""")
+            self._local.db_conn = db_conn
+            with self._readers_lock:
+                self._readers.append(db_conn)
+        return db_conn
+
+    def close(self):
+        """
+        Commits the queued writes, stops the writer thread, and closes every connection.
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._writer.join()
+        with self._readers_lock:
+            for db_conn in self._readers:
+                db_conn.close()
+            self._readers = []
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 def seed_initial_population(input_csv):
     """
     Reads the input csv file, which contains the dates and/or parameter combinations
@@ -270,6 +1025,99 @@ def seed_initial_population(input_csv):
     return initial_population
 
 
+def write_checkpoint(checkpoint_file, scheduler, gen, population, offspring=None, elites=None,
+                     n_submitted=None, shared_race_dates=None, testing=False):
+    """
+    Writes the complete state of the genetic algorithm to a JSON checkpoint file, so that a run
+    can be resumed exactly where it stopped (see read_checkpoint and run_simplega). The checkpoint
+    is written to a temporary file and then renamed, so a crash never leaves a partial checkpoint behind.
+
+    :param checkpoint_file: string
+        path to the JSON checkpoint file.
+    :param scheduler: string
+        scheduler used by the genetic algorithm ('generational' or 'steady_state').
+    :param gen: int
+        generation that is being evaluated (0 for the initial population).
+    :param population: list of simplega.Chromosome
+        evaluated population (i.e., the parents of the offspring).
+    :param offspring: list of simplega.Chromosome (default = None)
+        individuals that are being (or will be) evaluated, including the elites.
+        Individuals without a fitness value are recorded as in flight.
+    :param elites: list of simplega.Chromosome (default = None)
+        elites copied into the offspring population.
+    :param n_submitted: int (default = None)
+        number of evaluations submitted so far by the steady-state scheduler.
+    :param shared_race_dates: list of strings (default = None)
+        dates shared by every individual when racing.
+    :param testing: boolean (default = False)
+        if True, the WRF directories of the simulations in flight are not recorded.
+
+    """
+    offspring = offspring if offspring is not None else []
+    in_flight = []
+    for individual in offspring:
+        if individual.Fitness is None:
+            simulation = individual.to_dict()
+            if not testing:
+                wrf_sim = WRFModel(individual.Genes, individual.Start_date, individual.End_date, verbose=False)
+                simulation['wrfout_dir'] = wrf_sim.DIR_WRFOUT
+            in_flight.append(simulation)
+    random_state = random.getstate()
+    checkpoint = {'scheduler': scheduler,
+                  'gen': gen,
+                  'random_state': [random_state[0], list(random_state[1]), random_state[2]],
+                  'population': [individual.to_dict() for individual in population],
+                  'offspring': [individual.to_dict() for individual in offspring],
+                  'elites': [individual.to_dict() for individual in elites] if elites is not None else [],
+                  'in_flight': in_flight,
+                  'n_submitted': n_submitted,
+                  'shared_race_dates': shared_race_dates if shared_race_dates is not None else []}
+    with open(checkpoint_file + '.tmp', 'w') as json_file:
+        json.dump(checkpoint, json_file, indent=1)
+    os.replace(checkpoint_file + '.tmp', checkpoint_file)
+
+
+def island_checkpoint_file(checkpoint_file, island):
+    """
+    Adds an island id to a checkpoint file name, so that each island of an
+    island-model genetic algorithm (see run_simplega) writes its own checkpoint.
+
+    :param checkpoint_file: string
+        path to the JSON checkpoint file (e.g., 'optwrf_checkpoint.json').
+    :param island: int
+        island id.
+    :return checkpoint_file: string
+        path to the island's checkpoint file (e.g., 'optwrf_checkpoint_island003.json').
+
+    """
+    root, ext = os.path.splitext(checkpoint_file)
+    return f'{root}_island{island:03d}{ext}'
+
+
+def read_checkpoint(checkpoint_file):
+    """
+    Reads a JSON checkpoint file written by write_checkpoint().
+
+    :param checkpoint_file: string
+        path to the JSON checkpoint file.
+    :return checkpoint: dictionary
+        with the same keys as the checkpoint file. The population, offspring, elites, and in_flight
+        entries are lists of simplega.Chromosome, and random_state can be passed to random.setstate().
+
+    """
+    try:
+        with open(checkpoint_file) as json_file:
+            checkpoint = json.load(json_file)
+    except FileNotFoundError:
+        print(f'The checkpoint file {checkpoint_file} does not exist; there is nothing to resume.')
+        raise
+    random_state = checkpoint['random_state']
+    checkpoint['random_state'] = (random_state[0], tuple(random_state[1]), random_state[2])
+    for key in ['population', 'offspring', 'elites', 'in_flight']:
+        checkpoint[key] = [Chromosome.from_dict(individual) for individual in checkpoint[key]]
+    return checkpoint
+
+
 def get_fitness(param_ids, verbose=False):
     """
     This function produces a random fitness value between 0 - 100
@@ -293,12 +1141,69 @@ def get_fitness(param_ids, verbose=False):
     return fitness, error1, error2, runtime
 
 
+def calculate_fitness(ghi_total_error, wpd_total_error, start_date, method='both',
+                      correction_factor=0.0004218304553577255):
+    """
+    Combines the total GHI and WPD errors of a simulation into a single fitness value.
+
+    :param ghi_total_error: float
+        total GHI error between WRF and ERA5.
+    :param wpd_total_error: float
+        total WPD error between WRF and ERA5.
+    :param start_date: string
+        specifying the simulation start date (used to compute the daylight fraction).
+    :param method: string
+        specifying what the fitness function judges -- wind_only, solar_only, or both.
+    :param correction_factor: float
+        capuring the relationship between GHI and wind power density (WPD) errors (see get_wrf_fitness).
+    :return fitness: float
+        Fitness is a measure of accumlated error, so a lower value is better.
+
+    """
+    if method == 'both':
+        daylight_factor = hf.daylight_frac(start_date)  # daylight fraction
+        fitness = daylight_factor * ghi_total_error + correction_factor * wpd_total_error
+    elif method == 'solar_only':
+        daylight_factor = hf.daylight_frac(start_date)  # daylight fraction
+        fitness = daylight_factor * ghi_total_error
+    elif method == 'wind_only':
+        fitness = wpd_total_error
+    else:
+        print('Only "both", "solar_only", or "wind_only" are currently supportted.')
+        raise ValueError
+    return fitness
+
+
+def choose_from_front(front, method='both', correction_factor=0.0004218304553577255):
+    """
+    Chooses the individual on a Pareto front (see simplega.pareto_front) that has the best fitness
+    for the given weighting of the GHI and WPD errors (see calculate_fitness).
+
+    :param front: list of simplega.Chromosome instances
+        with GHI_error and WPD_error values.
+    :param method: string
+        specifying what the fitness function judges -- wind_only, solar_only, or both.
+    :param correction_factor: float
+        capuring the relationship between GHI and wind power density (WPD) errors (see get_wrf_fitness).
+    :return best: simplega.Chromosome instance
+
+    """
+    return min(front, key=lambda individual: calculate_fitness(individual.GHI_error, individual.WPD_error,
+                                                               individual.Start_date, method=method,
+                                                               correction_factor=correction_factor))
+
+
 def get_wrf_fitness(param_ids, start_date='Jan 15 2011', end_date='Jan 16 2011', method='both',
                     bc_data='ERA', n_domains=1, correction_factor=0.0004218304553577255,
-                    setup_yaml='dirpath.yml', wfp=False, disable_timeout=False, verbose=False):
+                    setup_yaml='dirpath.yml', wfp=False, disable_timeout=False, prune_fitness=None,
+                    return_status=False, return_hourly=False, return_timings=False, regrid_method='ncl',
+                    kill_stalled=False, verbose=False):
     """
     Using the input physics parameters, date, boundary condition, and domain data,
     this function runs the WRF model and computes the error between WRF and ERA5.
+    If WRF was already submitted for this simulation (e.g., before the genetic algorithm was restarted),
+    the running job is re-attached to instead of being resubmitted. The boundary condition data, WPS output,
+    and processed ERA5 data are shared by all simulations with the same dates (see stage_wrf_inputs).
 
     :param param_ids: list of integers
         corresponding to each WRF physics parameterization.
@@ -321,6 +1226,26 @@ def get_wrf_fitness(param_ids, start_date='Jan 15 2011', end_date='Jan 16 2011',
         defining the path to the yaml file where input directory paths are specified.
     :param disable_timeout: boolean (default = False)
         telling runwrf if subprogram timeouts are allowed or not.
+    :param prune_fitness: float (default = None)
+        if specified, the wrfout frames are scored against ERA5 while WRF is running, and WRF is
+        cancelled as soon as the partial fitness exceeds this value (e.g., the fitness of the worst elite).
+        The frames are regridded with regrid_method, like the final errors, which accumulate over time,
+        so a pruned simulation could never have beaten this value.
+        The partial fitness and errors of a pruned simulation are returned.
+    :param return_status: boolean (default = False)
+        if True, the status of the simulation ('complete', 'failed', or 'pruned') is also returned.
+    :param return_hourly: boolean (default = False)
+        if True, the domain-summed GHI and WPD errors of each hour are also returned (after the status),
+        as a tuple of (hours since the start date, GHI errors, WPD errors) arrays, or None if the simulation
+        did not complete. They can be stored with insert_hourly_errors to re-score the fitness later.
+    :param return_timings: boolean (default = False)
+        if True, the runtime accounting of the simulation (see WRFModel.timings) is also returned (last),
+        with the total wall seconds spent in this function (wall_seconds). It can be stored with insert_timings.
+    :param regrid_method: string (default = 'ncl')
+        method used to regrid WRF to the ERA5 grid (see WRFModel.wrf_era5_diff).
+    :param kill_stalled: boolean (default = False)
+        if True, WRF is cancelled as soon as it stops making progress (see WRFModel.run_wrf),
+        and the simulation fails, instead of waiting for the timeout.
     :param verbose: boolean (default = False)
         instructing the program to print everything or just key information to the screen.
     :return fitness: float
@@ -328,6 +1253,37 @@ def get_wrf_fitness(param_ids, start_date='Jan 15 2011', end_date='Jan 16 2011',
         Fitness is a measure of accumlated error, so a lower value is better.
 
     """
+    def fn_prune(sim, n_frames):
+        """
+        Scores the wrfout frames written so far, and returns True if the simulation should be cancelled.
+        If the frames cannot be scored (e.g., the regridding package is not installed), pruning is switched off
+        for this simulation, which then runs to completion.
+        """
+        if prune_disabled:
+            return False
+        try:
+            partial_error = sim.partial_wrf_era5_diff(method=regrid_method)
+        except Exception as e:
+            print(f'OptWRFWarning in get_wrf_fitness: could not score the partial wrfout frames of {param_ids} '
+                  f'with {regrid_method}, so it will not be pruned\n\t{e!r}')
+            prune_disabled.append(True)
+            return False
+        if partial_error is None:
+            return False
+        partial_fitness = calculate_fitness(partial_error[1], partial_error[2], start_date,
+                                            method=method, correction_factor=correction_factor)
+        if verbose:
+            print(f'Partial fitness of {param_ids} after {n_frames} frames: {partial_fitness}')
+        if partial_fitness > prune_fitness:
+            partial_results.extend([partial_fitness, partial_error[1], partial_error[2]])
+            return True
+        return False
+
+    partial_results = []
+    prune_disabled = []
+    hourly_errors = None
+    start_time = time.time()
+
     if verbose:
         print('- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -')
         print('\nCalculating fitness for: {}'.format(param_ids))
@@ -343,19 +1299,32 @@ def get_wrf_fitness(param_ids, start_date='Jan 15 2011', end_date='Jan 16 2011',
                        + wrf_sim.forecast_start.strftime('%Y') + '-' \
                        + wrf_sim.forecast_start.strftime('%m') + '-' \
                        + wrf_sim.forecast_start.strftime('%d') + '_00:00:00'
-    if [os.path.exists(file) for file in [wrfout_file_path, orig_wrfout_file_path]].count(True) is 0:
-        # Next, get boundary condition data for the simulation
+    outputs_exist = [os.path.exists(file) for file in [wrfout_file_path, orig_wrfout_file_path]].count(True) > 0
+    wrf_sim.cache_hit = outputs_exist or wrf_sim.inputs_exist()
+    if wrf_sim.reattach_wrf():
+        # WRF was already submitted before the genetic algorithm was restarted, so wait for it to finish
+        if prune_fitness is not None:
+            wrf_sim.process_era5_data()
+        success, runtime = wrf_sim.wait_wrf(disable_timeout,
+                                            monitor_fn=fn_prune if prune_fitness is not None else None,
+                                            kill_stalled=kill_stalled)
+        if verbose:
+            print(f'WRF ran successfully? {success}')
+    elif not outputs_exist:
+        # Next, get boundary condition data and run WPS for the simulation dates,
+        # unless another simulation with the same dates has already done so.
         # ERA is the only supported data type right now.
-        vtable_sfx = wrf_sim.get_bc_data()
+        success = stage_wrf_inputs(wrf_sim, disable_timeout)
 
         # Setup the working directory to run the simulation
-        success = wrf_sim.wrfdir_setup(vtable_sfx)
+        if success:
+            success = wrf_sim.wrfdir_setup(wrf_sim.vtable_sfx())
 
         # Prepare the namelists
         if success:
             success = wrf_sim.prepare_namelists()
 
-        # Run WPS
+        # Run WPS (this only links the staged geo_em and met_em files)
         if success:
             success = wrf_sim.run_wps(disable_timeout)
             if verbose:
@@ -369,7 +1338,12 @@ def get_wrf_fitness(param_ids, start_date='Jan 15 2011', end_date='Jan 16 2011',
 
         # RUN WRF
         if success:
-            success, runtime = wrf_sim.run_wrf(disable_timeout)
+            if prune_fitness is not None:
+                # ERA5 data is needed to score the wrfout frames while WRF is running
+                wrf_sim.process_era5_data()
+            success, runtime = wrf_sim.run_wrf(disable_timeout,
+                                               monitor_fn=fn_prune if prune_fitness is not None else None,
+                                               kill_stalled=kill_stalled)
             if verbose:
                 print(f'WRF ran successfully? {success}')
         else:
@@ -389,34 +1363,336 @@ def get_wrf_fitness(param_ids, start_date='Jan 15 2011', end_date='Jan 16 2011',
 
     # Compute the error between WRF run and ERA5 dataset and return fitness
     if success:
-        mae = wrf_sim.wrf_era5_diff()
+        mae, hourly_errors = wrf_sim.wrf_era5_diff(method=regrid_method, return_hourly=True)
         ghi_total_error = mae[1]
         wpd_total_error = mae[2]
-        if method == 'both':
-            daylight_factor = hf.daylight_frac(start_date)  # daylight fraction
-            fitness = daylight_factor * ghi_total_error + correction_factor * wpd_total_error
-        elif method == 'solar_only':
-            daylight_factor = hf.daylight_frac(start_date)  # daylight fraction
-            fitness = daylight_factor * ghi_total_error
-        elif method == 'wind_only':
-            fitness = wpd_total_error
-        else:
-            print('Only "both", "solar_only", or "wind_only" are currently supportted.')
-            raise ValueError
+        fitness = calculate_fitness(ghi_total_error, wpd_total_error, start_date,
+                                    method=method, correction_factor=correction_factor)
+        status = 'complete'
 
         if verbose:
             print(f'!!! Physics options set {param_ids} has fitness {fitness}')
 
+    elif wrf_sim.wrf_status == 'pruned':
+        fitness, ghi_total_error, wpd_total_error = partial_results
+        status = 'pruned'
+
     else:
         ghi_total_error = 6.022 * 10 ** 23
         wpd_total_error = 6.022 * 10 ** 23
         fitness = 6.022 * 10 ** 23
+        status = 'failed'
+
+    results = (fitness, ghi_total_error, wpd_total_error, runtime)
+    if return_status:
+        results += (status,)
+    if return_hourly:
+        results += (hourly_errors,)
+    if return_timings:
+        results += (dict(wrf_sim.timings(), wall_seconds=time.time() - start_time),)
+    return results
+
 
-    return fitness, ghi_total_error, wpd_total_error, runtime
+def read_wrf_progress(param_ids, start_date, end_date, bc_data='ERA', n_domains=1, setup_yaml='dirpath.yml'):
+    """
+    Reads the progress of a running WRF simulation (see WRFModel.write_progress), which can be
+    run by any backend, e.g., so that the genetic algorithm can report on the simulations it is waiting for.
+
+    The parameters are the same as for get_wrf_fitness.
+    :return progress: dictionary
+        with the model_time, fraction, seconds_per_model_hour, eta, stalled, updated, and status keys,
+        or None if WRF has not written its progress (e.g., it has not started yet).
+
+    """
+    wrf_sim = WRFModel(param_ids, start_date, end_date, bc_data=bc_data, n_domains=n_domains,
+                       setup_yaml=setup_yaml, verbose=False)
+    return wrf_sim.read_progress()
+
+
+def stage_wrf_inputs(wrf_sim, disable_timeout=False):
+    """
+    Prepares the inputs that are shared by all simulations with the same dates and domains:
+    the boundary condition data and the WPS output (geo_em and met_em files, see WRFModel.archive_wps),
+    and the processed ERA5 data for the month (see WRFModel.process_era5_data). The work is done by
+    the first simulation that needs it while holding a lock file, so simulations on the same dates
+    (in other threads, processes, or jobs) wait for it instead of repeating it.
+
+    :param wrf_sim: WRFModel instance
+        whose working directory is used to run WPS if the WPS output does not exist yet.
+    :param disable_timeout: boolean (default = False)
+        telling runwrf if subprogram timeouts are allowed or not.
+    :return success: boolean (True/False)
+        True if the shared inputs are ready.
+
+    """
+    met_em_dir = wrf_sim.DIR_DATA + 'met_em/'
+    os.makedirs(met_em_dir, exist_ok=True)
+    stage_lock = f'{met_em_dir}.optwrf_stage_{wrf_sim.forecast_start.strftime("%Y-%m-%d")}_' \
+                 f'{wrf_sim.forecast_end.strftime("%Y-%m-%d")}_d{wrf_sim.n_domains:02d}.lock'
+    with hf.file_lock(stage_lock):
+        if not wrf_sim.wps_files_exist():
+            if wrf_sim.verbose:
+                print(f'Staging boundary condition data and WPS output for {wrf_sim.forecast_start}...')
+            vtable_sfx = wrf_sim.get_bc_data()
+            success = wrf_sim.wrfdir_setup(vtable_sfx)
+            if success:
+                success = wrf_sim.prepare_namelists()
+            if success:
+                success = wrf_sim.run_wps(disable_timeout)
+            if not success:
+                print(f'OptWRFWarning in stage_wrf_inputs: WPS failed for {wrf_sim.forecast_start}.')
+                return False
+            wrf_sim.archive_wps()
+    os.makedirs(wrf_sim.DIR_ERA5_ROOT, exist_ok=True)
+    with hf.file_lock(f'{wrf_sim.DIR_ERA5_ROOT}.optwrf_era5_{wrf_sim.forecast_start.strftime("%Y-%m")}.lock'):
+        wrf_sim.process_era5_data()
+    return True
+
+
+def prepare_wrf_inputs(param_ids, start_date, end_date, bc_data='ERA', n_domains=1, setup_yaml='dirpath.yml',
+                       wfp=False, disable_timeout=False, verbose=False):
+    """
+    Stages the inputs shared by all simulations with the given dates (see stage_wrf_inputs), using the
+    working directory of the simulation with the given physics parameters. If that simulation still
+    has a WRF job running (see WRFModel.reattach_wrf), its directory is left alone.
+
+    The parameters are the same as for get_wrf_fitness.
+    :return success: boolean (True/False)
+        True if the shared inputs are ready.
+
+    """
+    wrf_sim = WRFModel(param_ids, start_date, end_date, bc_data=bc_data, n_domains=n_domains,
+                       setup_yaml=setup_yaml, wfp=wfp, verbose=verbose)
+    if wrf_sim.reattach_wrf():
+        return True
+    return stage_wrf_inputs(wrf_sim, disable_timeout)
+
+
+def get_wrf_fitness_batch(requests, method='both', bc_data='ERA', n_domains=1,
+                          correction_factor=0.0004218304553577255, setup_yaml='dirpath.yml', wfp=False,
+                          disable_timeout=False, regrid_method='ncl', backend=None, verbose=False):
+    """
+    Calculates the WRF fitness of many (physics parameters, date) pairs at once. Requests are grouped
+    by their dates: the inputs shared by each group (boundary condition data, WPS output, and the
+    processed ERA5 month) are staged once (see stage_wrf_inputs), with the groups staged in parallel,
+    and as soon as a group is staged, real.exe, wrf.exe, and post-processing are run for each of
+    its members. Identical requests are only simulated once. The time spent preparing inputs
+    therefore scales with the number of unique dates rather than with the number of requests.
+
+    :param requests: list of tuples
+        of (param_ids, start_date) or (param_ids, start_date, end_date). If no end date is given,
+        the simulation runs for one day.
+    :param backend: concurrent.futures.Executor (default = None)
+        used to stage the inputs and run the simulations (see optwrf.backends).
+        If None, a ThreadBackend is used.
+    The remaining parameters are the same as for get_wrf_fitness.
+    :return results: list
+        of (fitness, ghi_error, wpd_error, runtime, status) tuples in the same order as requests.
+
+    """
+    # Group the unique requests by their dates
+    groups = collections.OrderedDict()
+    keys = []
+    for request in requests:
+        param_ids, start_date = request[0:2]
+        if len(request) > 2:
+            end_date = request[2]
+        else:
+            end_date = (hf.format_date(start_date) + datetime.timedelta(days=1)).strftime('%b %d %Y')
+        dates = (hf.format_date(start_date), hf.format_date(end_date))
+        key = (dates, tuple(param_ids))
+        keys.append(key)
+        group = groups.setdefault(dates, collections.OrderedDict())
+        group.setdefault(tuple(param_ids), (param_ids, start_date, end_date))
+    if verbose:
+        print(f'Calculating the fitness of {len(requests)} requests ({sum([len(g) for g in groups.values()])} '
+              f'unique simulations on {len(groups)} unique dates)')
+
+    own_backend = backend is None
+    if own_backend:
+        backend = ThreadBackend()
+    try:
+        # Stage the inputs for each date using the working directory of its first simulation
+        staging = {}
+        for dates, group in groups.items():
+            param_ids, start_date, end_date = next(iter(group.values()))
+            staging[backend.submit(prepare_wrf_inputs, param_ids, start_date, end_date, bc_data=bc_data,
+                                   n_domains=n_domains, setup_yaml=setup_yaml, wfp=wfp,
+                                   disable_timeout=disable_timeout, verbose=verbose)] = dates
+        # Fan out the physics-dependent work of each group as soon as its inputs are ready
+        futures = {}
+        for staged in concurrent.futures.as_completed(staging):
+            dates = staging[staged]
+            if staged.exception() is not None or not staged.result():
+                # Each member would only stage the inputs again, so the whole group fails instead
+                reason = f'\n\t{staged.exception()}' if staged.exception() is not None else ''
+                print(f'OptWRFWarning in get_wrf_fitness_batch: staging failed for {dates[0]}, so its '
+                      f'{len(groups[dates])} simulations failed{reason}')
+                failed = concurrent.futures.Future()
+                failed.set_result((6.022 * 10 ** 23, 6.022 * 10 ** 23, 6.022 * 10 ** 23, '00h 00m 00s', 'failed'))
+                for param_key in groups[dates]:
+                    futures[(dates, param_key)] = failed
+                continue
+            for param_key, (param_ids, start_date, end_date) in groups[dates].items():
+                futures[(dates, param_key)] = backend.submit(get_wrf_fitness, param_ids, start_date, end_date,
+                                                             method=method, bc_data=bc_data, n_domains=n_domains,
+                                                             correction_factor=correction_factor,
+                                                             setup_yaml=setup_yaml, wfp=wfp,
+                                                             disable_timeout=disable_timeout, return_status=True,
+                                                             regrid_method=regrid_method, verbose=verbose)
+        return [futures[key].result() for key in keys]
+    finally:
+        if own_backend:
+            backend.shutdown()
+
+
+def get_racing_fitness(param_ids, dates, elite_fitness=None, fitness_fn=None, lookup=None, record=None,
+                       z_score=1.645, min_dates=2, verbose=False, **fitness_kwargs):
+    """
+    Scores one set of physics parameters on a sequence of dates, and stops early (races)
+    once the parameters are statistically unable to beat the current elites. Fitness on a single
+    day is noisy, so the fitness returned is the mean across all the dates that were scored.
+
+    After at least min_dates dates have been scored, the evaluation stops if the lower confidence
+    bound of the mean fitness, mean - z_score * std / sqrt(n_dates), is worse (higher) than elite_fitness.
+
+    :param param_ids: list of integers
+        corresponding to each WRF physics parameterization.
+    :param dates: list of strings
+        specifying the start dates that the parameters are scored on, in order.
+        Each simulation runs for one day.
+    :param elite_fitness: float (default = None)
+        fitness that must be beaten to join the elites (i.e., the fitness of the worst elite).
+        If None, every date is scored.
+    :param fitness_fn: function (default = None)
+        with the same arguments and return values as get_wrf_fitness, which is used if None.
+    :param lookup: function (default = None)
+        taking (param_ids, start_date) and returning (fitness, ghi_error, wpd_error, runtime) for
+        dates that were scored previously, or None. This allows previous simulations to be reused.
+    :param record: function (default = None)
+        taking (param_ids, start_date, end_date, fitness, ghi_error, wpd_error, runtime). It is called
+        as soon as each new date is scored, so that partial work is never lost.
+    :param z_score: float (default = 1.645)
+        width of the one-sided confidence bound (1.645 corresponds to 95% confidence).
+    :param min_dates: int (default = 2)
+        minimum number of dates that must be scored before the evaluation may stop early.
+    :param verbose: boolean (default = False)
+        instructing the program to print everything or just key information to the screen.
+    :param fitness_kwargs: keyword arguments passed to fitness_fn (e.g., method).
+    :return fitness: float
+        mean fitness across the scored dates.
+    :return ghi_error: float
+        mean GHI error across the scored dates.
+    :return wpd_error: float
+        mean WPD error across the scored dates.
+    :return runtime: string
+        total WRF runtime across the scored dates.
+
+    """
+    if fitness_fn is None:
+        fitness_fn = get_wrf_fitness
+    fitness_values = []
+    ghi_error_values = []
+    wpd_error_values = []
+    total_runtime = datetime.timedelta(0)
+    for start_date in dates:
+        start_date, end_date = simplega.generate_random_dates(input_start_date=start_date)
+        past_results = lookup(param_ids, start_date) if lookup is not None else None
+        if past_results is not None:
+            fitness, ghi_error, wpd_error, runtime = past_results
+        else:
+            fitness, ghi_error, wpd_error, runtime = fitness_fn(param_ids, start_date, end_date, **fitness_kwargs)
+            if record is not None:
+                record(param_ids, start_date, end_date, fitness, ghi_error, wpd_error, runtime)
+        fitness_values.append(fitness)
+        ghi_error_values.append(ghi_error)
+        wpd_error_values.append(wpd_error)
+        if runtime is not None:
+            total_runtime += hf.strpdelta(runtime)
+
+        # Stop if these parameters can no longer beat the elites
+        n_dates = len(fitness_values)
+        if elite_fitness is not None and max(min_dates, 2) <= n_dates < len(dates):
+            mean_fitness = sum(fitness_values) / n_dates
+            std_fitness = math.sqrt(sum([(f - mean_fitness) ** 2 for f in fitness_values]) / (n_dates - 1))
+            lower_bound = mean_fitness - z_score * std_fitness / math.sqrt(n_dates)
+            if lower_bound > elite_fitness:
+                if verbose:
+                    print(f'Stopping {param_ids} after {n_dates} of {len(dates)} dates: '
+                          f'fitness lower bound {lower_bound} is worse than the elites ({elite_fitness})')
+                break
+
+    n_dates = len(fitness_values)
+    fitness = sum(fitness_values) / n_dates
+    ghi_error = sum(ghi_error_values) / n_dates
+    wpd_error = sum(wpd_error_values) / n_dates
+    runtime = hf.strfdelta(total_runtime)
+    return fitness, ghi_error, wpd_error, runtime
+
+
+def timed_fitness(fitness_fn, *args, **kwargs):
+    """
+    Calls a fitness function and measures how long the evaluation slot was busy.
+
+    :param fitness_fn: function
+        fitness function to be called (e.g., get_wrf_fitness or get_fitness).
+    :param args: positional arguments passed to fitness_fn.
+    :param kwargs: keyword arguments passed to fitness_fn.
+    :return results: tuple
+        returned by fitness_fn, i.e., (fitness, ghi_error, wpd_error, runtime).
+    :return busy_seconds: float
+        wall-clock seconds spent inside fitness_fn.
+
+    """
+    start_time = time.time()
+    results = fitness_fn(*args, **kwargs)
+    busy_seconds = time.time() - start_time
+    return results, busy_seconds
+
+
+def core_idle_time(n_slots, wall_seconds, busy_seconds):
+    """
+    Computes the time that evaluation slots spent waiting rather than running a fitness evaluation.
+
+    :param n_slots: integer
+        number of evaluation slots (i.e., concurrent simulations) reserved for the genetic algorithm.
+    :param wall_seconds: float
+        wall-clock seconds over which the slots were reserved.
+    :param busy_seconds: float
+        sum of the seconds that each slot spent running a fitness evaluation.
+    :return idle_seconds: float
+        slot-seconds that were reserved but not used.
+
+    """
+    idle_seconds = n_slots * wall_seconds - busy_seconds
+    return max(idle_seconds, 0.0)
+
+
+def print_scheduler_stats(sched_stats):
+    """
+    Prints the slot usage collected while running the genetic algorithm so that
+    the generational and steady-state schedulers can be compared.
+
+    :param sched_stats: dictionary
+        with the keys scheduler, n_slots, wall_seconds, and busy_seconds.
+
+    """
+    idle_seconds = core_idle_time(sched_stats['n_slots'], sched_stats['wall_seconds'], sched_stats['busy_seconds'])
+    reserved_seconds = sched_stats['n_slots'] * sched_stats['wall_seconds']
+    idle_frac = idle_seconds / reserved_seconds if reserved_seconds > 0 else 0.0
+    print(f'Scheduler: {sched_stats["scheduler"]} with {sched_stats["n_slots"]} evaluation slots')
+    print(f'\tBusy slot time: {hf.strfdelta(datetime.timedelta(seconds=sched_stats["busy_seconds"]))}')
+    print(f'\tCore-idle time: {hf.strfdelta(datetime.timedelta(seconds=idle_seconds))} '
+          f'({idle_frac * 100:.1f}% of the reserved slot time)')
 
 
 def run_simplega(pop_size, n_generations, fitness_method='both', run_wfp=False,
-                 elite_pct=0.08, testing=False, initial_pop_file=None, restart_file=True, verbose=False):
+                 elite_pct=0.08, testing=False, initial_pop_file=None, restart_file=True,
+                 checkpoint_file='optwrf_checkpoint.json', resume=False,
+                 scheduler='generational', n_slots=None, surrogate=False, screen_frac=0.5, race_dates=1,
+                 prune=False, backend=None, pareto=False, island=None, migration_store=None,
+                 migration_interval=5, n_migrants=2, date_policy=None, fitness_fn=None, db_name='optwrf.db',
+                 progress_interval=None, verbose=False):
     """
     Runs the simple genetic algorithm specified in simplega either
     to optimize the WRF model physics or with a test fitness function
@@ -434,12 +1710,83 @@ def run_simplega(pop_size, n_generations, fitness_method='both', run_wfp=False,
     :param initial_pop_file: string (default = None)
         of a csv file path containing the populaition you would like to begin the simulation with.
     :param restart_file: boolean (default = True)
-        determining whether restart CSV files will be written before the fitness is calculated
-        for each generation.
+        determining whether a checkpoint (see write_checkpoint) will be written before the fitness
+        is calculated for each generation (or, for the steady-state scheduler, after each evaluation).
+    :param checkpoint_file: string (default = 'optwrf_checkpoint.json')
+        path to the JSON checkpoint file that is written, and read when resuming.
+    :param resume: boolean (default = False)
+        if True, the run picks up exactly where the checkpoint left off: the generation, the random
+        number generator state, and the populations are restored, and WRF jobs that are still running
+        are re-attached to instead of being resubmitted. The scheduler must match the checkpoint.
+    :param scheduler: string (default = 'generational')
+        defining how fitness evaluations are scheduled. 'generational' waits for the entire
+        population to be evaluated before breeding the next generation. 'steady_state' keeps
+        every evaluation slot full: as soon as one evaluation finishes, a replacement is selected,
+        crossed over, mutated, and submitted, and it replaces the worst member of the population
+        if it is fitter. Both schedulers spend the same number of fitness evaluations.
+    :param n_slots: int (default = None)
+        number of fitness evaluations that may run concurrently. If None, the
+        max_workers of the backend is used.
+    :param surrogate: boolean (default = False)
+        if True, a surrogate model (surrogate.FitnessSurrogate) is trained on the simulation database
+        and used to predict the fitness of offspring before any WRF simulations are launched.
+        The surrogate is retrained after each generation.
+    :param screen_frac: float (default = 0.5)
+        value between 0 - 1 defining the fraction of surrogate-screened candidate offspring
+        that are sent to WRF; the remaining candidates are discarded and replaced.
+    :param race_dates: int (default = 1)
+        number of dates that each individual is scored on. If greater than one, the fitness of each
+        individual is its mean fitness across its own start date and race_dates - 1 dates shared by
+        the whole run, and evaluations stop early (see get_racing_fitness) once an individual cannot
+        beat the current elites. Every date that is scored is added to the simulation database.
+    :param prune: boolean (default = False)
+        if True, WRF simulations are scored while they run and cancelled as soon as their partial
+        fitness is worse than the worst elite (see get_wrf_fitness). Pruned simulations are stored
+        in the simulation database with the status 'pruned' and their partial fitness.
+        Not used when racing or testing.
+    :param backend: backends instance (default = None)
+        that evaluates the fitness functions (e.g., backends.LocalProcessBackend or backends.SlurmBackend).
+        If None, a backends.ThreadBackend with n_slots workers is used. Backends that are passed in
+        are not shut down, so they can be reused. Racing requires a backend that shares memory
+        with this process (ThreadBackend or InProcessBackend).
+    :param pareto: boolean (default = False)
+        if True, the GHI and WPD errors are optimized as separate objectives with NSGA-II (non-dominated
+        sorting and crowding distance; see simplega.pareto_selection and simplega.pareto_survivors) instead
+        of a single fitness value, and the whole Pareto front is returned. A weighting of the two errors
+        can then be chosen afterwards (see choose_from_front and get_pareto_front). Only the generational
+        scheduler is supported, without racing, pruning, or the surrogate model.
+    :param island: int (default = None)
+        id of this run when it is one island of an island-model genetic algorithm. Each island is an
+        independent run_simplega process (e.g., one SLURM job per partition) that evolves its own population
+        with its own backend, and periodically exchanges its best individuals with the other islands through
+        the migration store. The island id is added to the checkpoint file name (see island_checkpoint_file),
+        so each island can be resumed on its own. Only the generational scheduler is supported, without racing.
+    :param migration_store: migration.MigrationStore instance (default = None)
+        shared by all of the islands. If None, a migration.MigrationStore in the working directory is used.
+    :param migration_interval: int (default = 5)
+        number of generations between migrations.
+    :param n_migrants: int (default = 2)
+        number of individuals that leave and join the population in each migration.
+    :param date_policy: simplega.DatePolicy instance (default = None)
+        that chooses the start dates of new individuals, e.g., simplega.DatePolicy('common') so that the
+        offspring of each generation share a few dates and reuse their boundary condition data, WPS output,
+        and ERA5 data. If None, a random day in 2011 is drawn for each individual. The cache-hit rate
+        and the preprocessing time saved are reported after each generation.
+    :param fitness_fn: function (default = None)
+        with the same arguments and return values as get_wrf_fitness, which it replaces
+        (e.g., benchmark.ReplayFitness, which replays the simulations in a recorded database).
+        If None, get_wrf_fitness is used. Not used when testing.
+    :param db_name: string (default = 'optwrf.db')
+        name of the SQL simulation database (see conn_to_db).
+    :param progress_interval: float (default = None)
+        if given, the progress of the WRF simulations that are still running (their model time,
+        seconds per model hour, projected finish time, and whether they have stalled; see read_wrf_progress)
+        is printed every progress_interval seconds while the genetic algorithm waits for them.
     :param verbose: boolean (default = False)
         instructing the program to print everything or just key information to the screen.
     :return WRFga_winner: simplega.Chromosome instance
-        corresponding to the simulation preforming the best in the genetic algorithm.
+        corresponding to the simulation preforming the best in the genetic algorithm,
+        or, if pareto is True, a list of simplega.Chromosome instances on the Pareto front.
 
     """
     def fn_display(creature):
@@ -454,6 +1801,168 @@ def run_simplega(pop_size, n_generations, fitness_method='both', run_wfp=False,
         """
         simplega.display_pop(pop, fn_display)
 
+    def fn_submit_fitness(creature):
+        """
+        Submits the fitness calculation for an individual Chromosome to the backend, unless an
+        identical individual is already being evaluated, in which case its future is shared.
+        """
+        def fn_submit():
+            if race_dates > 1:
+                racing_fitness = functools.partial(get_racing_fitness,
+                                                   fitness_fn=wrf_fitness if not testing else fn_test_fitness,
+                                                   lookup=fn_lookup, record=fn_record)
+                return backend.submit(timed_fitness, racing_fitness, creature.Genes,
+                                      [creature.Start_date] + shared_race_dates, elite_threshold,
+                                      method=fitness_method, wfp=run_wfp)
+            elif not testing:
+                return backend.submit(timed_fitness, wrf_fitness, creature.Genes,
+                                      creature.Start_date, creature.End_date,
+                                      method=fitness_method, wfp=run_wfp,
+                                      prune_fitness=elite_threshold if prune else None, return_status=True,
+                                      return_hourly=True, return_timings=True)
+            else:
+                return backend.submit(timed_fitness, get_fitness, creature.Genes)
+        future, _ = single_flight.submit(creature, fn_submit)
+        return future
+
+    def fn_attach_results(creature, results):
+        """
+        Attaches the results of a fitness evaluation (with or without a status) to an individual Chromosome.
+        """
+        creature.Fitness, creature.GHI_error, creature.WPD_error, creature.Runtime = results[0:4]
+        if len(results) > 4:
+            creature.Status = results[4]
+        if len(results) > 5 and results[5] is not None:
+            hourly_errors[(tuple(creature.Genes), creature.Start_date)] = results[5]
+        if len(results) > 6 and results[6] is not None:
+            sim_timings[(tuple(creature.Genes), creature.Start_date)] = results[6]
+
+    def fn_result(future, creature):
+        """
+        Returns the results and busy seconds of a finished evaluation. If the evaluation raised an exception
+        (e.g., its SLURM array task left the queue without a result, or it was cancelled), the individual
+        gets the results of a failed simulation instead, so that one failed evaluation never aborts the search.
+        """
+        try:
+            return future.result()
+        except Exception as e:
+            print(f'OptWRFWarning in run_simplega: the evaluation of {creature.Genes} on {creature.Start_date} '
+                  f'failed\n\t{e!r}')
+            return (6.022 * 10 ** 23, 6.022 * 10 ** 23, 6.022 * 10 ** 23, '00h 00m 00s', 'failed'), 0.0
+
+    def fn_interrupt(futures):
+        """
+        Cancels the evaluations when the genetic algorithm is interrupted (e.g., with Ctrl-C). Shutting the
+        backend down also cancels the evaluations that are already running (e.g., SLURM array jobs), so no
+        more can be submitted, and the simulation database is closed before the interruption is raised again.
+        """
+        # cancel() returns False if it's already done and True if was able to cancel it;
+        # we don't need that return value, so we ignore it with the underscore.
+        for future in futures:
+            if future is not None:
+                _ = future.cancel()
+        backend.shutdown(wait=False, cancel_futures=True)
+        sim_db.close()
+
+    def fn_test_fitness(param_ids, start_date, end_date, **kwargs):
+        """
+        Wrapper function that gives the test fitness function the same arguments as get_wrf_fitness.
+        """
+        return get_fitness(param_ids)
+
+    def fn_lookup(param_ids, start_date):
+        """
+        Looks up a previously scored date in the fitness cache (used when racing).
+        """
+        return fitness_cache.get(Chromosome(param_ids, start_date, None))
+
+    def fn_record(*date_results):
+        """
+        Queues a newly scored date so that it can be added to the simulation database
+        by the main thread (used when racing).
+        """
+        race_records.put(date_results)
+
+    def fn_store_results(creature):
+        """
+        Adds a newly evaluated individual to the simulation database and the fitness cache,
+        and releases it from the single-flight registry. When racing, each date that was scored
+        is added to the simulation database instead of the individual's mean fitness.
+        """
+        if race_dates > 1:
+            while not race_records.empty():
+                param_ids, start_date, end_date, fitness, ghi_error, wpd_error, runtime = race_records.get()
+                date_sim = Chromosome(list(param_ids), start_date, end_date, fitness, ghi_error, wpd_error, runtime)
+                sim_db.insert(date_sim)
+                fitness_cache.put(date_sim)
+        else:
+            sim_db.insert(creature)
+            fitness_cache.put(creature)
+            if (tuple(creature.Genes), creature.Start_date) in hourly_errors:
+                sim_db.insert_errors(creature, hourly_errors.pop((tuple(creature.Genes), creature.Start_date)))
+            if (tuple(creature.Genes), creature.Start_date) in sim_timings:
+                timings = sim_timings.pop((tuple(creature.Genes), creature.Start_date))
+                sim_db.insert_timings(creature, timings)
+                generation_timings.append(timings)
+        if creature.Status == 'pruned':
+            prune_stats['n_pruned'] += 1
+            prune_stats['runtime'] += hf.strpdelta(creature.Runtime)
+        single_flight.release(creature)
+        new_evaluations.append(creature)
+
+    def fn_report_generation():
+        """
+        Prints the date cache statistics and the runtime accounting of the generation that was just evaluated.
+        """
+        date_policy.report()
+        print_stage_timings(generation_timings)
+        generation_timings.clear()
+
+    def fn_report_progress(creatures):
+        """
+        Prints the progress of the WRF simulations of individuals that are still being evaluated.
+        """
+        if testing:
+            return
+        print(f'Progress of the {len(creatures)} running simulations at {datetime.datetime.now()}:')
+        for creature in creatures:
+            progress = read_wrf_progress(creature.Genes, creature.Start_date, creature.End_date)
+            if progress is None or progress['fraction'] is None:
+                print(f'\t{creature.Genes} on {creature.Start_date}: WRF has not started integrating')
+                continue
+            spmh = progress['seconds_per_model_hour']
+            print(f'\t{creature.Genes} on {creature.Start_date}: {100 * progress["fraction"]:.0f}% '
+                  f'(model time {progress["model_time"]}), '
+                  f'{"?" if spmh is None else f"{spmh:.0f}"} s per model hour, ETA {progress["eta"]}'
+                  f'{" -- STALLED" if progress["stalled"] else ""}')
+
+    def fn_wait(running, return_when=concurrent.futures.FIRST_COMPLETED):
+        """
+        Waits for fitness evaluations to finish (in the same way as concurrent.futures.wait), and prints
+        the progress of the running simulations every progress_interval seconds.
+
+        :param running: dictionary
+            mapping each future to the individual Chromosome that it evaluates.
+        :param return_when: concurrent.futures.FIRST_COMPLETED or concurrent.futures.ALL_COMPLETED
+        :return done: set of futures that finished.
+
+        """
+        while True:
+            done, not_done = wait(list(running.keys()), timeout=progress_interval, return_when=return_when)
+            if progress_interval is None or len(not_done) == 0 \
+                    or (return_when == concurrent.futures.FIRST_COMPLETED and len(done) > 0):
+                return done
+            fn_report_progress([running[future] for future in not_done])
+
+    def fn_elite_threshold(pop):
+        """
+        Returns the fitness of the worst elite in the population, which a raced or pruned individual must beat.
+        """
+        if not (race_dates > 1 or prune) or len(pop) < n_elites:
+            return None
+        elites = simplega.find_elites(pop, n_elites, fn_display_pop)
+        return max([elite.Fitness for elite in elites])
+
     def fn_get_pop_fitness(pop):
         """
         Calculates the fitness for each member of the population using multithreadding,
@@ -464,136 +1973,487 @@ def run_simplega(pop_size, n_generations, fitness_method='both', run_wfp=False,
             The fitness is added as an attribute to the individual instances.
 
         """
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            # Start running all the fitness functions that need to be calculated
-            try:
-                fitness_threads = []
-                for creature in pop:
-                    if creature.Fitness is None:
-                        # Check to see if this individual already exists in the simulation database
-                        past_individual = get_individual_by_genes(creature, db_conn)
-                        # If not, execute a new thread to calculate the fitness
-                        if past_individual is None:
-                            if not testing:
-                                fitness_threads.append(executor.submit(get_wrf_fitness, creature.Genes,
-                                                                       creature.Start_date, creature.End_date,
-                                                                       method=fitness_method, wfp=run_wfp))
-                            else:
-                                fitness_threads.append(executor.submit(get_fitness, creature.Genes))
-                        else:
-                            creature.Fitness = past_individual.Fitness
-                            fitness_threads.append(None)
-                    else:
-                        fitness_threads.append(None)
-                # Get the results from the thread pool executor
-                fitness_matrix = []
-                ghi_error_matrix = []
-                wpd_error_matrix = []
-                runtime_matrix = []
-                for thread in fitness_threads:
-                    try:
-                        fitness_value, ghi_error_value, wpd_error_value, runtime_value = thread.result()
-                    except AttributeError:
-                        fitness_value = None
-                        runtime_value = None
-                        ghi_error_value = None
-                        wpd_error_value = None
-                    fitness_matrix.append(fitness_value)
-                    ghi_error_matrix.append(ghi_error_value)
-                    wpd_error_matrix.append(wpd_error_value)
-                    runtime_matrix.append(runtime_value)
-                # Attach fitness and runtime values generated by the thread pool to their Chromosome
-                ii = 0
-                for creature in pop:
-                    if creature.Fitness is None:
-                        creature.Fitness = fitness_matrix[ii]
-                        creature.GHI_error = ghi_error_matrix[ii]
-                        creature.WPD_error = wpd_error_matrix[ii]
-                        creature.Runtime = runtime_matrix[ii]
-                        insert_sim(creature, db_conn)
-                    ii += 1
-            except KeyboardInterrupt:
-                # cancel() returns False if it's already done and True if was able to cancel it;
-                # we don't need that return value, so we ignore it with the underscore.
-                for future in fitness_threads:
-                    _ = future.cancel()
+        pop_start_time = time.time()
+        fitness_threads = []
+        # Start running all the fitness functions that need to be calculated
+        try:
+            # Check to see if these individuals already exist in the simulation database
+            # (when racing, previously scored dates are looked up by get_racing_fitness instead)
+            if race_dates == 1:
+                fitness_cache.resolve(pop, db_conn)
+            counted_threads = set()
+            recorded_threads = set()
+            for creature in pop:
+                # If not, execute a new thread to calculate the fitness
+                if creature.Fitness is None:
+                    fitness_threads.append(fn_submit_fitness(creature))
+                else:
+                    fitness_threads.append(None)
+            # Get the results from the backend
+            if progress_interval is not None:
+                fn_wait({thread: creature for thread, creature in zip(fitness_threads, pop) if thread is not None},
+                        return_when=concurrent.futures.ALL_COMPLETED)
+            results_matrix = []
+            for thread, creature in zip(fitness_threads, pop):
+                if thread is None:
+                    results_matrix.append(None)
+                    continue
+                results, busy_seconds = fn_result(thread, creature)
+                # Futures shared by identical individuals are only counted once
+                if thread not in counted_threads:
+                    counted_threads.add(thread)
+                    sched_stats['busy_seconds'] += busy_seconds
+                results_matrix.append(results)
+            # Attach fitness and runtime values generated by the thread pool to their Chromosome
+            ii = 0
+            for creature in pop:
+                if creature.Fitness is None:
+                    fn_attach_results(creature, results_matrix[ii])
+                    # Only add one copy of identical individuals to the simulation database
+                    if fitness_threads[ii] not in recorded_threads:
+                        recorded_threads.add(fitness_threads[ii])
+                        fn_store_results(creature)
+                ii += 1
+        except KeyboardInterrupt:
+            fn_interrupt(fitness_threads)
+            raise
+        sched_stats['wall_seconds'] += time.time() - pop_start_time
         fn_display_pop(pop)
 
-    # ------> BEGINNING OF SIMPLEGA <------ #
-    # Connect to the simulation database
-    db_conn = conn_to_db()
+    def fn_breed(pop):
+        """
+        Creates two new offspring from the evaluated population using the
+        simplega selection, crossover, and mutation operators.
 
-    # Record the start time, and calculate the number of elites
-    start_time = datetime.datetime.now()
-    n_elites = int(elite_pct * pop_size) if int(elite_pct * pop_size) > 0 else 1
-    if verbose:
-        print(f'The elite percentage is {elite_pct*100}%; the number of elites is {n_elites}')
+        :param pop: list of simplega.Chromosome
+            individuals whose fitness has already been calculated.
+        :return offspring: list of simplega.Chromosome
+            new individuals whose fitness has not been calculated.
 
-    # Create an initial population
-    if initial_pop_file is not None:
-        initial_pop = seed_initial_population(initial_pop_file)
-    else:
-        initial_pop = None
-    population = simplega.generate_population(pop_size, initial_pop)
-
-    # Calculate the fitness of the initial population
-    print('--> Calculating the fitness of the initial population...')
-    fn_get_pop_fitness(population)
-    sys.stdout.flush()
-
-    # Until the specified generation number is reached,
-    gen = 1
-    while gen <= n_generations:
-        print('\n------ Starting generation {} ------'.format(gen))
-        # Select the mating population
-        mating_pop = simplega.selection(population, pop_size)
+        """
+        # The selection and crossover operators need at least two parents in the mating population
+        if len(pop) < 4:
+            return simplega.generate_population(2, date_policy=date_policy)
+        mating_pop = simplega.selection(pop, len(pop))
+        n_candidates = 2 if fitness_surrogate is None else math.ceil(2 / screen_frac)
+        offspring = []
+        while len(offspring) < n_candidates:
+            children = simplega.crossover(mating_pop, date_policy)
+            if children is not None:
+                offspring.extend(children)
+        offspring = simplega.mutate(offspring)
+        if fitness_surrogate is not None:
+            offspring = fn_screen(offspring, 2)
+        return offspring
+
+    def fn_screen(candidates, n_keep):
+        """
+        Uses the surrogate model to keep only the most promising candidates,
+        and remembers each prediction so that it can be compared with the realised fitness.
+        """
+        kept, predictions = fitness_surrogate.screen(candidates, n_keep)
+        if fitness_surrogate.trained:
+            for creature, prediction in zip(kept, predictions):
+                surrogate_predictions[id(creature)] = (creature, prediction)
+        return kept
+
+    def fn_update_surrogate():
+        """
+        Reports the rank correlation between the predicted and realised fitness of the newly
+        evaluated individuals, and retrains the surrogate with them.
+        """
+        predicted = []
+        realised = []
+        for creature in new_evaluations:
+            if id(creature) in surrogate_predictions:
+                predicted.append(surrogate_predictions.pop(id(creature))[1])
+                realised.append(creature.Fitness)
+        if len(predicted) > 0:
+            rho = rank_correlation(predicted, realised)
+            surrogate_stats['predicted'].extend(predicted)
+            surrogate_stats['realised'].extend(realised)
+            print(f'Surrogate rank correlation with the realised fitness of '
+                  f'{len(predicted)} offspring: {rho:.3f}')
+        fitness_surrogate.update_from_population(new_evaluations)
+        new_evaluations.clear()
+
+    def fn_accept(pop, creature):
+        """
+        Adds an evaluated individual to the steady-state population. Until the population
+        is full, every individual is added; afterwards, the new individual replaces the
+        worst member of the population if it is fitter.
+        """
+        if len(pop) < pop_size:
+            pop.append(creature)
+        else:
+            worst_idx = max(range(0, len(pop)), key=lambda i: pop[i].Fitness)
+            if creature.Fitness < pop[worst_idx].Fitness:
+                pop[worst_idx] = creature
         if verbose:
-            print('The mating population is:')
-            fn_display_pop(mating_pop)
-        # Carry out crossover
+            fn_display(creature)
+
+    def fn_run_steady_state(initial_population, n_evaluations, pop=None, n_submitted=0):
+        """
+        Runs the steady-state (asynchronous) genetic algorithm, which keeps every evaluation slot full
+        instead of waiting for the slowest simulation in each generation to finish.
+
+        :param initial_population: list of simplega.Chromosome
+            individuals that are evaluated first.
+        :param n_evaluations: int
+            total number of individuals (including the initial population) that will be evaluated.
+        :param pop: list of simplega.Chromosome (default = None)
+            evaluated population to start from (when resuming from a checkpoint).
+        :param n_submitted: int (default = 0)
+            number of evaluations that have already been submitted (when resuming from a checkpoint).
+        :return pop: list of simplega.Chromosome
+            the final steady-state population.
+
+        """
+        nonlocal elite_threshold
+        pop = pop if pop is not None else []
+        to_submit = list(initial_population)
+        # Check to see if these individuals already exist in the simulation database, one batch at a time
+        # (when racing, previously scored dates are looked up by get_racing_fitness instead)
+        if race_dates == 1:
+            fitness_cache.resolve(to_submit, db_conn)
+        pending = {}
+        pop_start_time = time.time()
+        try:
+            while True:
+                # Keep every evaluation slot full until the evaluation budget is spent
+                while len(pending) < n_slots and n_submitted < n_evaluations:
+                    if len(to_submit) == 0:
+                        to_submit.extend(fn_breed(pop))
+                        if race_dates == 1:
+                            fitness_cache.resolve(to_submit, db_conn)
+                    creature = to_submit.pop(0)
+                    n_submitted += 1
+                    # Start a new generation of dates after every pop_size - n_elites evaluations
+                    if n_submitted > pop_size and (n_submitted - pop_size) % max(pop_size - n_elites, 1) == 0:
+                        fn_report_generation()
+                        date_policy.new_generation()
+                    if race_dates > 1 or creature.Fitness is None:
+                        elite_threshold = fn_elite_threshold(pop)
+                        # Identical individuals share one future (and one evaluation slot)
+                        pending.setdefault(fn_submit_fitness(creature), []).append(creature)
+                        continue
+                    fn_accept(pop, creature)
+                if len(pending) == 0:
+                    break
+                # Wait for the first evaluation to finish, and then refill its slot
+                done = fn_wait({future: creatures[0] for future, creatures in pending.items()})
+                for future in done:
+                    creatures = pending.pop(future)
+                    results, busy_seconds = fn_result(future, creatures[0])
+                    sched_stats['busy_seconds'] += busy_seconds
+                    for creature in creatures:
+                        fn_attach_results(creature, results)
+                        fn_accept(pop, creature)
+                    fn_store_results(creatures[0])
+                    if fitness_surrogate is not None and len(new_evaluations) >= pop_size - n_elites:
+                        fn_update_surrogate()
+                # Record the evaluations still running, followed by the bred individuals not yet submitted
+                if restart_file:
+                    in_flight = [creature for creatures in pending.values() for creature in creatures]
+                    write_checkpoint(checkpoint_file, scheduler, 0, pop, offspring=in_flight + to_submit,
+                                     n_submitted=n_submitted - len(in_flight),
+                                     shared_race_dates=shared_race_dates, testing=testing)
+        except KeyboardInterrupt:
+            fn_interrupt(pending)
+            raise
+        sched_stats['wall_seconds'] += time.time() - pop_start_time
+        fn_display_pop(pop)
+        return pop
+
+    def fn_pareto_generation(pop, gen):
+        """
+        Runs one NSGA-II generation: pop_size offspring are bred from parents chosen by Pareto rank and
+        crowding distance, evaluated, and then compete with their parents for a place in the next population.
+
+        :param pop: list of simplega.Chromosome
+            evaluated population.
+        :param gen: int
+            generation number.
+        :return pop: list of simplega.Chromosome
+            the next population.
+
+        """
+        mating_pop = simplega.pareto_selection(pop, max(int(0.5 * pop_size), 2))
         offspring_pop = []
-        while len(offspring_pop) < pop_size - n_elites:
-            offspring = simplega.crossover(mating_pop)
+        while len(offspring_pop) < pop_size:
+            offspring = simplega.crossover(mating_pop, date_policy)
             if offspring is not None:
                 offspring_pop.extend(offspring)
-        if verbose:
-            print('The offspring population is:')
-            fn_display_pop(offspring_pop)
-        # Give a chance for mutation on each member of the offspring population
-        offspring_pop = simplega.mutate(offspring_pop)
+        offspring_pop = simplega.mutate(offspring_pop[0:pop_size])
         if verbose:
             print('The offspring population after mutation is:')
             fn_display_pop(offspring_pop)
-        # Copy the elites into the offspring population
-        elites = simplega.find_elites(population, n_elites, fn_display_pop)
-        if elites is not None:
-            offspring_pop.extend(elites)
-            print('The offspring population after adding the elites is:')
-            fn_display_pop(offspring_pop)
-        # Write the populaiton to a csv file for restart purposes
         if restart_file:
-            csv_name = f'optwrf_restart_g{str(gen).zfill(3)}.csv'
-            with open(csv_name, "w") as csvfile:
-                csv_writer = csv.writer(csvfile)
-                header = ['start_date', 'mp_physics', 'ra_lw_physics', 'ra_sw_physics',
-                          'sf_surface_physics', 'bl_pbl_physics', 'cu_physics', 'sfclay_physics']
-                csv_writer.writerow(header)
-                for individual in offspring_pop:
-                    csv_data = [individual.Start_date] + individual.Genes
-                    csv_writer.writerow(csv_data)
-        # Calculate the fitness of the population
+            write_checkpoint(checkpoint_file, scheduler, gen, pop, offspring=offspring_pop,
+                             shared_race_dates=shared_race_dates, testing=testing)
         print('Calculating the fitness of the generation {} population...'.format(gen))
         sys.stdout.flush()
         fn_get_pop_fitness(offspring_pop)
-        # Initialize the next generation
-        population = offspring_pop
-        gen += 1
+        fn_report_generation()
+        pop = simplega.pareto_survivors(pop + offspring_pop, pop_size)
+        print(f'{len(simplega.pareto_front(pop))} individuals are on the Pareto front after generation {gen}')
+        return pop
+
+    def fn_migrate(pop, gen):
+        """
+        Emigrates copies of the best individuals of this island to the migration store, and replaces
+        the worst individuals with the best immigrants from the other islands. The immigrants have already
+        been evaluated, so they are added to the fitness cache instead of being evaluated again.
+
+        :param pop: list of simplega.Chromosome
+            evaluated population.
+        :param gen: int
+            generation number.
+        :return pop: list of simplega.Chromosome
+            the population after migration.
+
+        """
+        if pareto:
+            migration_store.emigrate(island, gen, simplega.pareto_survivors(pop, n_migrants))
+            immigrants = migration_store.immigrate(island, None)
+            if len(immigrants) > n_migrants:
+                immigrants = simplega.pareto_survivors(immigrants, n_migrants)
+        else:
+            migration_store.emigrate(island, gen, sorted(pop, key=lambda creature: creature.Fitness)[0:n_migrants])
+            immigrants = migration_store.immigrate(island, n_migrants)
+        residents = set((tuple(creature.Genes), creature.Start_date) for creature in pop)
+        immigrants = [immigrant for immigrant in immigrants
+                      if (tuple(immigrant.Genes), immigrant.Start_date) not in residents]
+        for immigrant in immigrants:
+            fitness_cache.put(immigrant)
+        print(f'--> Island {island}: {len(immigrants)} individuals immigrated from islands '
+              f'{[other for other in migration_store.islands() if other != island]}')
+        if pareto:
+            return simplega.pareto_survivors(pop + immigrants, len(pop))
+        pop = sorted(pop, key=lambda creature: creature.Fitness)
+        return pop[0:len(pop) - len(immigrants)] + immigrants
+
+    # ------> BEGINNING OF SIMPLEGA <------ #
+    if island is not None:
+        if scheduler != 'generational' or race_dates > 1:
+            print('The island model only supports the generational scheduler, without racing.')
+            raise ValueError
+        if migration_store is None:
+            migration_store = MigrationStore()
+        checkpoint_file = island_checkpoint_file(checkpoint_file, island)
+    if pareto and (scheduler != 'generational' or race_dates > 1 or prune or surrogate):
+        print('The Pareto mode only supports the generational scheduler, without racing, pruning, or the surrogate.')
+        raise ValueError
+    if scheduler not in ['generational', 'steady_state']:
+        print(f'Scheduler {scheduler} is not supported; please use generational or steady_state.')
+        raise ValueError
+    if race_dates > 1 and backend is not None and not backend.shares_memory:
+        print(f'Racing requires a backend that shares memory with the genetic algorithm, '
+              f'not {type(backend).__name__}.')
+        raise ValueError
+
+    # Read the checkpoint to resume from
+    if resume:
+        checkpoint = read_checkpoint(checkpoint_file)
+        if checkpoint['scheduler'] != scheduler:
+            print(f'The checkpoint {checkpoint_file} was written by the {checkpoint["scheduler"]} scheduler, '
+                  f'not the {scheduler} scheduler.')
+            raise ValueError
+        print(f'--> Resuming from {checkpoint_file}: {len(checkpoint["in_flight"])} simulations were in flight')
+
+    # Connect to the simulation database (only after the arguments are validated, since it starts a writer thread),
+    # and load past simulations into the fitness cache
+    # (writes go through the writer thread of the database; db_conn is this thread's read-only connection)
+    sim_db = SimulationDatabase(db_name)
+    db_conn = sim_db.connection()
+    fitness_cache = FitnessCache()
+    fitness_cache.warm(db_conn)
+    # Keep track of the fitness evaluations that are running so that duplicates are not resubmitted
+    single_flight = SingleFlight()
+    wrf_fitness = fitness_fn if fitness_fn is not None else get_wrf_fitness
+
+    # Draw the dates that every individual is raced on in addition to its own start date
+    if resume:
+        shared_race_dates = checkpoint['shared_race_dates']
+    else:
+        shared_race_dates = [simplega.generate_random_dates()[0] for _ in range(race_dates - 1)]
+    elite_threshold = None
+    race_records = queue.Queue()
+    # Hourly errors and runtime accounting of the evaluated individuals that have not been added to the
+    # simulation database yet, and the runtime accounting of the simulations run in the current generation
+    hourly_errors = {}
+    sim_timings = {}
+    generation_timings = []
+    prune_stats = {'n_pruned': 0, 'runtime': datetime.timedelta(0)}
+
+    # Record the start time, and calculate the number of elites
+    start_time = datetime.datetime.now()
+    n_elites = int(elite_pct * pop_size) if int(elite_pct * pop_size) > 0 else 1
+    if verbose:
+        print(f'The elite percentage is {elite_pct*100}%; the number of elites is {n_elites}')
+
+    # Set up the backend, determine the number of evaluation slots, and start tracking how they are used
+    own_backend = backend is None
+    if own_backend:
+        backend = ThreadBackend(max_workers=n_slots)
+    if n_slots is None:
+        n_slots = backend.max_workers
+    # Backends that run on a virtual clock (see benchmark.VirtualClockBackend) decide when evaluations finish
+    wait = getattr(backend, 'wait', concurrent.futures.wait)
+    sched_stats = {'scheduler': scheduler, 'n_slots': n_slots, 'wall_seconds': 0.0, 'busy_seconds': 0.0}
+
+    # Train the surrogate model on the past simulations, if requested
+    new_evaluations = []
+    if surrogate:
+        fitness_surrogate = FitnessSurrogate()
+        n_trained = fitness_surrogate.train_from_db(db_conn)
+        print(f'--> Trained the surrogate model on {n_trained} past simulations')
+        surrogate_predictions = {}
+        surrogate_stats = {'predicted': [], 'realised': []}
+    else:
+        fitness_surrogate = None
+
+    # Create an initial population, choosing the start dates with the date policy
+    if date_policy is None:
+        date_policy = simplega.DatePolicy()
+    if resume:
+        random.setstate(checkpoint['random_state'])
+    else:
+        if initial_pop_file is not None:
+            initial_pop = seed_initial_population(initial_pop_file)
+        else:
+            initial_pop = None
+        population = simplega.generate_population(pop_size, initial_pop, date_policy)
+
+    if scheduler == 'steady_state':
+        # Spend the same number of evaluations as the generational scheduler would
+        n_evaluations = pop_size + n_generations * (pop_size - n_elites)
+        print(f'--> Running the steady-state genetic algorithm for {n_evaluations} evaluations...')
+        sys.stdout.flush()
+        if resume:
+            population = fn_run_steady_state(checkpoint['offspring'], n_evaluations,
+                                             pop=checkpoint['population'], n_submitted=checkpoint['n_submitted'])
+        else:
+            population = fn_run_steady_state(population, n_evaluations)
+    elif scheduler == 'generational':
+        if resume:
+            # Finish evaluating the generation that was running when the checkpoint was written
+            gen = checkpoint['gen']
+            population = checkpoint['population']
+            print(f'--> Calculating the fitness of the generation {gen} population...')
+            elite_threshold = fn_elite_threshold(population)
+            fn_get_pop_fitness(checkpoint['offspring'])
+            fn_report_generation()
+            if pareto:
+                population = simplega.pareto_survivors(population + checkpoint['offspring'], pop_size)
+            else:
+                population = checkpoint['offspring']
+        else:
+            # Calculate the fitness of the initial population
+            gen = 0
+            if restart_file:
+                write_checkpoint(checkpoint_file, scheduler, gen, [], offspring=population,
+                                 shared_race_dates=shared_race_dates, testing=testing)
+            print('--> Calculating the fitness of the initial population...')
+            fn_get_pop_fitness(population)
+            fn_report_generation()
+        if fitness_surrogate is not None:
+            fn_update_surrogate()
         sys.stdout.flush()
 
-    WRFga_winner = simplega.get_best(population)
+        # Until the specified generation number is reached,
+        gen += 1
+        while gen <= n_generations:
+            print('\n------ Starting generation {} ------'.format(gen))
+            date_policy.new_generation()
+            # Exchange individuals with the other islands
+            if island is not None and gen % migration_interval == 0:
+                population = fn_migrate(population, gen)
+            if pareto:
+                population = fn_pareto_generation(population, gen)
+                gen += 1
+                sys.stdout.flush()
+                continue
+            # Select the mating population
+            mating_pop = simplega.selection(population, pop_size)
+            if verbose:
+                print('The mating population is:')
+                fn_display_pop(mating_pop)
+            # Carry out crossover (creating extra candidates if the surrogate will screen them)
+            n_offspring = pop_size - n_elites
+            if fitness_surrogate is not None:
+                n_candidates = math.ceil(n_offspring / screen_frac)
+            else:
+                n_candidates = n_offspring
+            offspring_pop = []
+            while len(offspring_pop) < n_candidates:
+                offspring = simplega.crossover(mating_pop, date_policy)
+                if offspring is not None:
+                    offspring_pop.extend(offspring)
+            if verbose:
+                print('The offspring population is:')
+                fn_display_pop(offspring_pop)
+            # Give a chance for mutation on each member of the offspring population
+            offspring_pop = simplega.mutate(offspring_pop)
+            if verbose:
+                print('The offspring population after mutation is:')
+                fn_display_pop(offspring_pop)
+            # Only send the offspring that the surrogate predicts to be the most promising to WRF
+            if fitness_surrogate is not None:
+                offspring_pop = fn_screen(offspring_pop, n_offspring)
+                if verbose:
+                    print('The offspring population after surrogate screening is:')
+                    fn_display_pop(offspring_pop)
+            # Copy the elites into the offspring population
+            elites = simplega.find_elites(population, n_elites, fn_display_pop)
+            if elites is not None:
+                offspring_pop.extend(elites)
+                print('The offspring population after adding the elites is:')
+                fn_display_pop(offspring_pop)
+            # Write a checkpoint for restart purposes
+            if restart_file:
+                write_checkpoint(checkpoint_file, scheduler, gen, population, offspring=offspring_pop,
+                                 elites=elites, shared_race_dates=shared_race_dates, testing=testing)
+            # Calculate the fitness of the population
+            print('Calculating the fitness of the generation {} population...'.format(gen))
+            sys.stdout.flush()
+            elite_threshold = fn_elite_threshold(population)
+            fn_get_pop_fitness(offspring_pop)
+            fn_report_generation()
+            # Retrain the surrogate with the new simulations
+            if fitness_surrogate is not None:
+                fn_update_surrogate()
+            # Initialize the next generation
+            population = offspring_pop
+            gen += 1
+            sys.stdout.flush()
+
+    if pareto:
+        WRFga_winner = simplega.pareto_front(population)
+    else:
+        WRFga_winner = simplega.get_best(population)
     print(f'\nWRFga finished running in {datetime.datetime.now() - start_time}')
-    print(f'{WRFga_winner.Genes} is the best parameter combination; all simulations are below')
+    print_scheduler_stats(sched_stats)
+    print(f'Fitness cache: {fitness_cache.hits} hits and {fitness_cache.misses} misses')
+    print(f'Duplicate individuals attached to running evaluations: {single_flight.n_shared}')
+    if prune:
+        print(f'Pruned simulations: {prune_stats["n_pruned"]} '
+              f'(cancelled after running for {hf.strfdelta(prune_stats["runtime"])} in total)')
+    if fitness_surrogate is not None:
+        if len(new_evaluations) > 0:
+            fn_update_surrogate()
+        rho = rank_correlation(surrogate_stats['predicted'], surrogate_stats['realised'])
+        print(f'Surrogate rank correlation with the realised fitness over the whole run: {rho:.3f}')
+    if pareto:
+        print(f'{len(WRFga_winner)} parameter combinations are on the GHI/WPD Pareto front:')
+        fn_display_pop(WRFga_winner)
+        print('All simulations are below')
+    else:
+        print(f'{WRFga_winner.Genes} is the best parameter combination; all simulations are below')
+    sim_db.flush()
     print_database(db_conn)
-    close_conn_to_db(db_conn)
+    sim_db.close()
+    if own_backend:
+        backend.shutdown()
 
     return WRFga_winner
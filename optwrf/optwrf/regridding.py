@@ -6,7 +6,9 @@ using different methods.
 Known Issues/Wishlist:
 
 """
+import datetime
 import os
+import threading
 import time
 
 import numpy as np
@@ -20,14 +22,21 @@ import xesmf as xe
 
 from optwrf.helper_functions import read_last_3lines, print_last_3lines, read_last_line
 
+# Processed ERA5 months and pyresample neighbour information that have already been computed
+# (see wrf_era5_regrid_pyresample), so that simulations on the same grid and month can reuse them
+pyresample_cache = {}
+pyresample_cache_lock = threading.Lock()
+
 
 def wrf_era5_regrid_ncl(in_yr, in_mo, in_da, paramstr, wrfdir='./', eradir='/share/mzhang/jas983/wrf_data/data/ERA5/',
-                        recalculate=False):
+                        recalculate=False, wrffile='wrfout_processed_d01.nc'):
     """
     CONSIDER MOVING THIS WITHIN THE WRFModel METHOD?
 
     Converts (regrids) the WRF grid to the ERA5 grid and calculates the total absolute error
     between the global horizonal irradiance (GHI) and wind power density (WPD) in kW -m -2.
+    The processed ERA5 month and the nearest neighbours between the two grids are computed once
+    and reused by later calls (see load_era5_pyresample and pyresample_cache).
 
     This function is really just a python wrapper for the NCL script i.e., this function calls
     the NCL script wrf2era_error.ncl which calculates the errors in GHI and WPD using conservative
@@ -53,6 +62,8 @@ def wrf_era5_regrid_ncl(in_yr, in_mo, in_da, paramstr, wrfdir='./', eradir='/sha
         defining the location of the ERA5 data directory.
     :param recalculate: boolean (True/False)
         controling if the regridding function should be perfomed anew if the error_file already exists.
+    :param wrffile: string (default = 'wrfout_processed_d01.nc')
+        name of the processed wrfout file in wrfdir that is regridded.
     :return error: list
         Sum of the absolute error in GHI (index=1) and WPD (index=2) accumulated in each grid cell
         during all time periods in the WRF simulation. The zeroth index is a placeholder.
@@ -63,8 +74,8 @@ def wrf_era5_regrid_ncl(in_yr, in_mo, in_da, paramstr, wrfdir='./', eradir='/sha
     if not os.path.exists(error_file) or recalculate:
         # Run the NCL script that computes the error between the WRF run and the ERA5 surface analysis
         CMD_REGRID = 'ncl -Q in_yr=%s in_mo=%s in_da=%s \'WRFdir="%s"\' \'ERAdir="%s"\' \'paramstr="%s"\' ' \
-                     '%swrf2era_error.ncl' % \
-                     (in_yr, in_mo, in_da, wrfdir, eradir, paramstr, wrfdir)
+                     '\'WRFfile="%s"\' %swrf2era_error.ncl' % \
+                     (in_yr, in_mo, in_da, wrfdir, eradir, paramstr, wrffile, wrfdir)
         # Include a random amount of sleep time to ensure staggering of regridding tasks in a restart run.
         # I added this in an effort to subvert using too much memory on the Magma login node (only 30GB available).
         # time.sleep(random.randint(300, 1800))
@@ -103,6 +114,8 @@ def wrf_era5_regrid_xesmf(wrfdir='./', wrffile='wrfout_processed_d01_2011-12-13_
     """
     Converts (regrids) the WRF grid to the ERA5 grid and calculates the total absolute error
     between the global horizonal irradiance (GHI) and wind power density (WPD) in kW -m -2.
+    The processed ERA5 month and the nearest neighbours between the two grids are computed once
+    and reused by later calls (see load_era5_pyresample and pyresample_cache).
 
     :param wrfdir:
     :param wrffile:
@@ -173,29 +186,35 @@ def wrf_era5_regrid_xesmf(wrfdir='./', wrffile='wrfout_processed_d01_2011-12-13_
     return wrfdata, eradata
 
 
-def wrf_era5_regrid_pyresample(in_yr, in_mo, wrfdir='./', eradir='/share/mzhang/jas983/wrf_data/data/ERA5/'):
+def wrf_era5_regrid_pyresample(in_yr, in_mo, wrfdir='./', eradir='/share/mzhang/jas983/wrf_data/data/ERA5/',
+                               wrffile='wrfout_processed_d01.nc'):
     """
     CONSIDER MOVING THIS WITHIN THE WRFModel METHOD?
 
     Converts (regrids) the WRF grid to the ERA5 grid and calculates the total absolute error
     between the global horizonal irradiance (GHI) and wind power density (WPD) in kW -m -2.
+    The processed ERA5 month and the nearest neighbours between the two grids are computed once
+    and reused by later calls (see load_era5_pyresample and pyresample_cache).
 
     :param in_yr:
     :param in_mo:
     :param wrfdir:
     :param eradir:
+    :param wrffile: name of the processed wrfout file in wrfdir (default = 'wrfout_processed_d01.nc').
     :return:
 
     """
     #
-    def prs_nearest_regrid(data, var, source_def, target_def, target_lat, target_lon):
+    def prs_nearest_regrid(data, var, neighbour_info, target_shape, target_lat, target_lon):
         first = True
+        valid_input_index, valid_output_index, index_array = neighbour_info
         for timestr in data.Time:
             # Select the time slice from xarray
             data_slice = data[var].sel(Time=timestr.dt.strftime('%Y-%m-%d %H'))
             # Regrid with a nearest neighbor algorithm
-            regridded_data_slice = prs.kd_tree.resample_nearest(source_def, data_slice.values,
-                                                                target_def, radius_of_influence=25000, fill_value=None)
+            regridded_data_slice = prs.kd_tree.get_sample_from_neighbour_info('nn', target_shape, data_slice.values,
+                                                                              valid_input_index, valid_output_index,
+                                                                              index_array, fill_value=None)
             # Put result into an xarray DataArray
             regridded_data_slice_da = xr.DataArray(regridded_data_slice, dims=('lat', 'lon'),
                                                    coords={'lat': target_lat, 'lon': target_lon})
@@ -213,7 +232,6 @@ def wrf_era5_regrid_pyresample(in_yr, in_mo, wrfdir='./', eradir='/share/mzhang/
         return regridded_data
 
     # WRF file containing source grid
-    wrffile = 'wrfout_processed_d01.nc'
     try:
         wrfdata = xr.open_dataset(wrfdir + wrffile)
     except FileNotFoundError:
@@ -231,45 +249,37 @@ def wrf_era5_regrid_pyresample(in_yr, in_mo, wrfdir='./', eradir='/share/mzhang/
 
     # ERA data file(s)
     erafile = f'ERA5_EastUS_WPD-GHI_{str(in_yr).zfill(4)}-{str(in_mo).zfill(2)}.nc'
-    try:
-        eradata = xr.open_dataset(eradir + erafile)
-    except FileNotFoundError:
+    eradata = load_era5_pyresample(eradir + erafile)
+    if eradata is None:
         print(f'The wrfout file {eradir + erafile} does not exist. Check that your path.')
-        eradata = None
         return wrfdata, eradata
 
-    # Get variables to compare with regridded WRF variables.
-    eradata = eradata.rename({'longitude': 'lon', 'latitude': 'lat'})
-
-    # Read in ERA_GHI, convert from W m-2 to kW m-2
-    era_ghi = eradata.GHI
-    era_ghi = era_ghi / 1000
-
-    # Read in ERA_WPD, convert from W m-2 to kW m-2
-    era_wpd = eradata.WPD
-    era_wpd = era_wpd / 1000
-
-    # Write these back to the xarray dataset
-    eradata['ghi'] = era_ghi
-    eradata['wpd'] = era_wpd
-
-    # Sort the ERA data for pyresammple
-    eradata = eradata.sortby('lat', ascending=True)
-
     # Create grid definitions for pyresample
     # SwathDefinition() require that lons and lats be in a specific format (taken care of by check_and_wrap())
     # and that they have the same shape (taken care of by np.meshgrid())
     era_lon, era_lat = prs.utils.check_and_wrap(eradata.lon.values, eradata.lat.values)
-    era_lon2d, era_lat2d = np.meshgrid(era_lon, era_lat)
-    # Create the definition for the target (ERA5 lat/lon) grid
-    era_def = prs.geometry.SwathDefinition(lons=era_lon2d, lats=era_lat2d)
-    # Preprocess and create the definition for the source (WRF Lambert Conformal) grid
     wrf_lon, wrf_lat = prs.utils.check_and_wrap(wrfdata.lon.values, wrfdata.lat.values)
-    wrf_def = prs.geometry.SwathDefinition(lons=wrf_lon, lats=wrf_lat)
+
+    # Find the nearest neighbours once for each pair of grids (every simulation on the same domain has the same grid)
+    grid_key = ('neighbours', era_lon.tobytes(), era_lat.tobytes(), wrf_lon.tobytes(), wrf_lat.tobytes())
+    with pyresample_cache_lock:
+        neighbour_info = pyresample_cache.get(grid_key)
+    if neighbour_info is None:
+        era_lon2d, era_lat2d = np.meshgrid(era_lon, era_lat)
+        # Create the definition for the target (ERA5 lat/lon) grid
+        era_def = prs.geometry.SwathDefinition(lons=era_lon2d, lats=era_lat2d)
+        # Create the definition for the source (WRF Lambert Conformal) grid
+        wrf_def = prs.geometry.SwathDefinition(lons=wrf_lon, lats=wrf_lat)
+        valid_input_index, valid_output_index, index_array, _ = \
+            prs.kd_tree.get_neighbour_info(wrf_def, era_def, radius_of_influence=25000, neighbours=1)
+        neighbour_info = (valid_input_index, valid_output_index, index_array)
+        with pyresample_cache_lock:
+            pyresample_cache[grid_key] = neighbour_info
+    target_shape = (len(era_lat), len(era_lon))
 
     # Do the regridding
-    wrf_ghi_regrid = prs_nearest_regrid(wrfdata, 'ghi', wrf_def, era_def, era_lat, era_lon)
-    wrf_wpd_regrid = prs_nearest_regrid(wrfdata, 'wpd', wrf_def, era_def, era_lat, era_lon)
+    wrf_ghi_regrid = prs_nearest_regrid(wrfdata, 'ghi', neighbour_info, target_shape, era_lat, era_lon)
+    wrf_wpd_regrid = prs_nearest_regrid(wrfdata, 'wpd', neighbour_info, target_shape, era_lat, era_lon)
 
     # Add the regridded variables to the WRF xarray dataset
     wrfdata['ghi_regrid'] = wrf_ghi_regrid
@@ -278,6 +288,41 @@ def wrf_era5_regrid_pyresample(in_yr, in_mo, wrfdir='./', eradir='/share/mzhang/
     return wrfdata, eradata
 
 
+def load_era5_pyresample(era5_file):
+    """
+    Opens a processed ERA5 month (see WRFModel.process_era5_data), converts GHI and WPD to kW m-2,
+    and sorts it by latitude for pyresample. Each file is only prepared once (until it is modified);
+    afterwards a shallow copy of the cached dataset is returned.
+
+    :param era5_file: string
+        complete path to the processed ERA5 file.
+    :return eradata: xarray.DataSet
+        or None if the file does not exist.
+
+    """
+    try:
+        key = ('era5', era5_file, os.path.getmtime(era5_file))
+    except OSError:
+        return None
+    with pyresample_cache_lock:
+        eradata = pyresample_cache.get(key)
+    if eradata is None:
+        eradata = xr.open_dataset(era5_file)
+
+        # Get variables to compare with regridded WRF variables.
+        eradata = eradata.rename({'longitude': 'lon', 'latitude': 'lat'})
+
+        # Read in ERA_GHI and ERA_WPD, convert from W m-2 to kW m-2, and write these back to the xarray dataset
+        eradata['ghi'] = eradata.GHI / 1000
+        eradata['wpd'] = eradata.WPD / 1000
+
+        # Sort the ERA data for pyresammple
+        eradata = eradata.sortby('lat', ascending=True)
+        with pyresample_cache_lock:
+            pyresample_cache[key] = eradata
+    return eradata.copy(deep=False)
+
+
 def wrf_era5_error(wrfdata, eradata):
     """
 
@@ -301,4 +346,58 @@ def wrf_era5_error(wrfdata, eradata):
     total_wpd_error = wpd_error_nonan.sum(dim='Time')
     wrfdata['total_wpd_error'] = total_wpd_error.where(total_wpd_error > 0)
 
-    return wrfdata
\ No newline at end of file
+    return wrfdata
+
+def wrf_era5_hourly_error(wrfdata):
+    """
+    Sums the absolute GHI and WPD errors (see wrf_era5_error) across the domain separately for each hour,
+    so that the fitness can later be re-weighted by hour without regridding again.
+
+    :param wrfdata: xarray.DataSet
+        returned by wrf_era5_error.
+    :return times: numpy array of datetime64
+        time of each wrfout frame.
+    :return ghi_error: numpy array of floats
+        domain-summed absolute GHI error of each frame in kW m-2.
+    :return wpd_error: numpy array of floats
+        domain-summed absolute WPD error of each frame in kW m-2.
+
+    """
+    errors = []
+    for var in ['ghi_error', 'wpd_error']:
+        space_dims = [dim for dim in wrfdata[var].dims if dim != 'Time']
+        errors.append(wrfdata[var].sum(dim=space_dims, skipna=True).values.astype(float))
+    return wrfdata['Time'].values, errors[0], errors[1]
+
+
+def read_ncl_hourly_error(error_file):
+    """
+    Reads the domain-summed absolute GHI and WPD errors of each hour from the CSV file written by
+    wrf2era_error.ncl (see wrf_era5_regrid_ncl), which holds one line per wrfout frame before the totals.
+
+    :param error_file: string
+        path to the mae_wrfyera_<paramstr>.csv file.
+    :return times: list of datetime.datetime
+        time of each wrfout frame.
+    :return ghi_error: list of floats
+        domain-summed absolute GHI error of each frame in kW m-2.
+    :return wpd_error: list of floats
+        domain-summed absolute WPD error of each frame in kW m-2.
+
+    """
+    times, ghi_error, wpd_error = [], [], []
+    with open(error_file) as error_data:
+        for line in error_data:
+            fields = [field.strip().strip('"') for field in line.split(',')]
+            if len(fields) != 3:
+                continue
+            try:
+                time_stamp = datetime.datetime.strptime(fields[0], '%Y-%m-%d_%H:%M:%S')
+                errors = [float(fields[1]), float(fields[2])]
+            except ValueError:
+                # Header and total lines
+                continue
+            times.append(time_stamp)
+            ghi_error.append(errors[0])
+            wpd_error.append(errors[1])
+    return times, ghi_error, wpd_error
@@ -0,0 +1,256 @@
+"""
+In-process setup of WRF run directories (see WRFModel.wrfdir_setup).
+
+Every run directory links to the same WRF tables, data, and executables (in DIR_WRF/run), the same
+WPS executables, and copies the same namelist and submission script templates. Instead of forking a
+shell for each `ln -sf` and `cp` (and expanding their globs on every simulation), the list of files
+is resolved once into a manifest that is cached until one of the source directories changes, and
+the links and copies are made in-process with os.symlink, os.replace, and shutil.
+
+build_run_dir can also hardlink the read-only entries of the manifest from a skeleton directory that
+is built once per manifest (mode='hardlink'), or clone the copied files with reflinks on file systems
+that support them (mode='reflink', e.g., Btrfs or XFS). Files that are edited in place for each
+simulation (the namelists, see WRFModel.prepare_namelists) are always copied.
+
+
+Known Issues/Wishlist:
+- Skeleton directories of manifests that are no longer used are not removed.
+
+"""
+
+import fcntl
+import functools
+import glob
+import hashlib
+import os
+import shutil
+import time
+
+# Files in DIR_WRF/run that every run directory links to (the WRF tables, data, and executables)
+wrf_run_patterns = ['aerosol*', 'BROADBAND*', 'bulk*', 'CAM*', 'capacity*', 'CCN*', 'CLM*', 'co2*', 'coeff*',
+                    'constants*', 'create*', 'ETAMPNEW*', 'GENPARM*', 'grib2map*', 'gribmap*', 'HLC*', 'ishmael*',
+                    'kernels*', 'LANDUSE*', 'masses*', 'MPTABLE*', 'ozone*', 'p3_lookup*', 'RRTM*', 'SOILPARM*',
+                    'termvels*', 'tr*', 'URBPARM*', 'VEGPARM*', '*exe']
+# WPS directories and executables that every run directory links to
+wps_links = ['geogrid', 'geogrid.exe', 'ungrib.exe', 'metgrid', 'metgrid.exe']
+# Build modes of build_run_dir
+modes = ['symlink', 'hardlink', 'reflink']
+
+# ioctl that clones a file on Linux (FICLONE, see ioctl_ficlone(2))
+FICLONE = 0x40049409
+
+
+def _stamp(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def build_manifest(dir_wrf, dir_wps, dir_templates, dir_runwrf, vtable_sfx, wfp=False):
+    """
+    Lists the files that make up a WRF run directory. The manifest is cached, and it is only
+    rebuilt when one of the source directories is modified (e.g., WRF is recompiled).
+
+    :param dir_wrf: string
+        WRF directory (WRFModel.DIR_WRF), whose run/ directory holds the WRF tables, data, and executables.
+    :param dir_wps: string
+        WPS directory (WRFModel.DIR_WPS).
+    :param dir_templates: string
+        directory of the namelist and submission script templates (WRFModel.DIR_TEMPLATES).
+    :param dir_runwrf: string
+        optwrf package directory (WRFModel.DIR_RUNWRF), which holds the regridding script.
+    :param vtable_sfx: string
+        variable table suffix specific to the boundary condition data.
+    :param wfp: boolean (default = False)
+        also copy the wind farm parameterization tables.
+    :return manifest: tuple
+        of (kind, source, name) tuples, where kind is 'link' (symlinked), 'copy' (copied, and never edited),
+        or 'edit' (copied, and edited in place for each simulation), and name is the name in the run directory.
+
+    """
+    stamps = tuple(_stamp(path) for path in [dir_wrf + 'run/', dir_wps, dir_templates])
+    return _cached_manifest(dir_wrf, dir_wps, dir_templates, dir_runwrf, vtable_sfx, wfp, stamps)
+
+
+@functools.lru_cache(maxsize=32)
+def _cached_manifest(dir_wrf, dir_wps, dir_templates, dir_runwrf, vtable_sfx, wfp, stamps):
+    manifest = []
+    names = set()
+
+    def fn_add(kind, source, name):
+        if name not in names:
+            names.add(name)
+            manifest.append((kind, source, name))
+
+    for pattern in wrf_run_patterns:
+        for source in sorted(glob.glob(dir_wrf + 'run/' + pattern)):
+            fn_add('link', source, os.path.basename(source))
+    for name in wps_links:
+        fn_add('link', dir_wps + name, name)
+    fn_add('link', dir_wps + 'ungrib/Variable_Tables/Vtable.' + vtable_sfx, 'Vtable')
+    fn_add('link', dir_runwrf + 'wrf2era_error.ncl', 'wrf2era_error.ncl')
+    for name in ['namelist.wps', 'namelist.input']:
+        fn_add('edit', dir_templates + name, name)
+    for script in ['rungeogrid.csh', 'runungmetg.csh', 'runreal.csh', 'runwrf.csh']:
+        fn_add('copy', dir_templates + 'template_' + script, script)
+    if wfp:
+        fn_add('copy', dir_templates + 'wind-turbine-1.tbl', 'wind-turbine-1.tbl')
+        turbine_files = sorted(glob.glob(dir_templates + 'windturbines*'))
+        if len(turbine_files) > 0:
+            fn_add('copy', turbine_files[0], 'windturbines.txt')
+    return tuple(manifest)
+
+
+def force_symlink(source, link_name):
+    """
+    Creates a symbolic link in-process, replacing an existing file atomically (like `ln -sfn`).
+
+    :param source: string
+        path that the link points to (which, as with ln, does not need to exist).
+    :param link_name: string
+        path of the link, or an existing directory in which a link with the name of the source is created.
+
+    """
+    if os.path.isdir(link_name) and not os.path.islink(link_name):
+        link_name = os.path.join(link_name, os.path.basename(source.rstrip('/')))
+    try:
+        os.symlink(source, link_name)
+    except FileExistsError:
+        tmp_name = f'{link_name}.optwrf_tmp{os.getpid()}'
+        os.symlink(source, tmp_name)
+        os.replace(tmp_name, link_name)
+
+
+def copy_file(source, dest, reflink=False):
+    """
+    Copies a file (with its permissions), optionally as a copy-on-write clone.
+
+    :param source: string
+        path of the file.
+    :param dest: string
+        path of the copy.
+    :param reflink: boolean (default = False)
+        clone the file if the file system supports it (otherwise, it is copied).
+
+    """
+    if reflink:
+        try:
+            with open(source, 'rb') as src, open(dest, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            shutil.copymode(source, dest)
+            return
+        except OSError:
+            pass
+    shutil.copy(source, dest)
+
+
+def move_file(source, dest):
+    """
+    Moves a file in-process (like `mv`), replacing an existing file, across file systems if necessary.
+
+    :param source: string
+        path of the file.
+    :param dest: string
+        new path of the file, or an existing directory to move it to.
+    :return: boolean (True/False)
+        True if the file was moved.
+
+    """
+    if os.path.isdir(dest):
+        dest = os.path.join(dest, os.path.basename(source))
+    try:
+        os.replace(source, dest)
+    except OSError as err:
+        try:
+            shutil.move(source, dest)
+        except OSError:
+            print(f'OptWRFWarning in move_file: could not move {source} to {dest}: {err}')
+            return False
+    return True
+
+
+def build_skeleton(manifest, skeleton_root):
+    """
+    Builds (once) a skeleton run directory with the links and read-only copies of a manifest,
+    from which build_run_dir hardlinks. The skeleton is named after a hash of the manifest and of the
+    modification times of the copied files, so it is rebuilt when they change. It is built in a temporary
+    directory that is then renamed, so that simulations that build it at the same time never see a partial skeleton.
+
+    :param manifest: tuple
+        returned by build_manifest.
+    :param skeleton_root: string
+        directory where the skeletons are kept, on the same file system as the run directories.
+    :return skeleton_dir: string
+
+    """
+    key = hashlib.sha1(repr([(kind, source, name, _stamp(source) if kind != 'link' else None)
+                             for kind, source, name in manifest]).encode()).hexdigest()[0:16]
+    skeleton_dir = os.path.join(skeleton_root, f'skeleton_{key}') + '/'
+    if os.path.isdir(skeleton_dir):
+        return skeleton_dir
+    os.makedirs(skeleton_root, exist_ok=True)
+    tmp_dir = f'{skeleton_dir.rstrip("/")}.tmp{os.getpid()}/'
+    os.makedirs(tmp_dir)
+    for kind, source, name in manifest:
+        if kind == 'link':
+            os.symlink(source, tmp_dir + name)
+        elif kind == 'copy' and os.path.exists(source):
+            shutil.copy(source, tmp_dir + name)
+    try:
+        os.rename(tmp_dir, skeleton_dir)
+    except OSError:
+        # Another simulation built the same skeleton first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return skeleton_dir
+
+
+def build_run_dir(run_dir, manifest, mode='symlink', skeleton_root=None):
+    """
+    Creates the links and copies of a manifest in a run directory, in-process.
+
+    :param run_dir: string
+        existing run directory.
+    :param manifest: tuple
+        returned by build_manifest.
+    :param mode: string (default = 'symlink')
+        'symlink' creates each link and copies each file; 'hardlink' hardlinks the links and read-only copies
+        from a skeleton directory (see build_skeleton), falling back to 'symlink' for entries that cannot be
+        hardlinked (e.g., across file systems); 'reflink' clones the copied files where the file system supports it.
+        Files that are edited in place are always copied.
+    :param skeleton_root: string (default = None)
+        directory where the skeletons are kept (required by the 'hardlink' mode).
+    :return stats: dictionary
+        with the number of links and copies made (n_links and n_copies), the number of entries that were
+        hardlinked (n_hardlinks), and the wall seconds spent (seconds).
+
+    """
+    if mode not in modes:
+        print(f'OptWRFError: {mode} is not a valid run directory mode; use any of {modes}.')
+        raise ValueError
+    if mode == 'hardlink' and skeleton_root is None:
+        print('OptWRFError: skeleton_root is required to hardlink run directories.')
+        raise ValueError
+    start_time = time.time()
+    stats = {'n_links': 0, 'n_copies': 0, 'n_hardlinks': 0}
+    skeleton_dir = build_skeleton(manifest, skeleton_root) if mode == 'hardlink' else None
+    for kind, source, name in manifest:
+        dest = os.path.join(run_dir, name)
+        if skeleton_dir is not None and kind != 'edit' and os.path.lexists(skeleton_dir + name):
+            try:
+                os.link(skeleton_dir + name, dest, follow_symlinks=False)
+                stats['n_hardlinks'] += 1
+                stats['n_links' if kind == 'link' else 'n_copies'] += 1
+                continue
+            except OSError:
+                pass
+        if kind == 'link':
+            force_symlink(source, dest)
+            stats['n_links'] += 1
+        elif os.path.exists(source):
+            copy_file(source, dest, reflink=mode == 'reflink')
+            stats['n_copies'] += 1
+        else:
+            print(f'OptWRFWarning in build_run_dir: {source} does not exist, so it was not copied to {run_dir}.')
+    stats['seconds'] = time.time() - start_time
+    return stats
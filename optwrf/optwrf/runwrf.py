@@ -14,13 +14,18 @@ check_file_status() as well.
 
 """
 import calendar
-import concurrent.futures
 import datetime
 import dateutil
+import functools
+import glob
+import json
 import netCDF4
 import numpy as np
 import os
 import pandas as pd
+import re
+import signal
+import subprocess
 import sys
 import time
 import wrf
@@ -29,14 +34,104 @@ import yaml
 
 from pvlib.wrfcast import WRF
 import optwrf.helper_functions as hf
+import optwrf.rundir as rundir
 import optwrf.util as util
+from optwrf.backends import ThreadBackend
 from optwrf.helper_functions import determine_computer, read_last_line, print_last_3lines, \
     rda_download
-from optwrf.regridding import wrf_era5_regrid_ncl, wrf_era5_regrid_xesmf, wrf_era5_regrid_pyresample, wrf_era5_error
+from optwrf.regridding import wrf_era5_regrid_ncl, wrf_era5_regrid_xesmf, wrf_era5_regrid_pyresample, wrf_era5_error, \
+    wrf_era5_hourly_error, read_ncl_hourly_error
+from optwrf.watcher import CompletionWatcher, WRFProgress
 from optwrf.wrfparams import ids2str
 from optwrf.wrfparams import flexible_generate
 from optwrf.data.fetch_data import fetch_yaml
 
+# Stages of a simulation whose wall time is recorded in WRFModel.stage_seconds (see timed_stage)
+stages = ['get_bc_data', 'wrfdir_setup', 'prepare_namelists', 'geogrid', 'ungrib_metgrid', 'real', 'wrf',
+          'wrfout_processing', 'era5_processing', 'regrid_error']
+
+
+def timed_stage(stage):
+    """
+    Decorator that adds the wall time of a WRFModel method to the total of a stage in WRFModel.stage_seconds.
+
+    :param stage: string
+        one of stages.
+
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            start_time = time.time()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self.add_stage_seconds(stage, time.time() - start_time)
+        return wrapper
+    return decorator
+
+
+class WRFMonitor:
+    """
+    Follows a running wrf.exe for WRFModel.wait_wrf: the new lines of rsl.out.0000 update
+    wrf_sim.progress, which is written to wrf_sim.FILE_WRF_PROGRESS, and each wake-up of the watcher
+    checks whether WRF has stalled and (if monitor_fn is given) whether it wrote a new history frame.
+
+    :param wrf_sim: WRFModel
+        simulation whose WRF job is followed.
+    :param monitor_fn: function (default = None)
+        called with wrf_sim and the number of history frames each time WRF writes a new frame (see WRFModel.run_wrf).
+    :param kill_stalled: boolean (default = False)
+        if True, on_wake returns 'stalled' when WRF stalls; otherwise, a warning is printed once.
+
+    """
+    def __init__(self, wrf_sim, monitor_fn=None, kill_stalled=False):
+        self.wrf_sim = wrf_sim
+        self.monitor_fn = monitor_fn
+        self.kill_stalled = kill_stalled
+        self.n_frames = 0
+        self.wrfout_stat = None
+        self.stall_warned = False
+        wrf_sim.progress = WRFProgress(wrf_sim.forecast_start, wrf_sim.forecast_end,
+                                       stall_factor=wrf_sim.stall_factor,
+                                       min_stall_seconds=wrf_sim.min_stall_seconds)
+
+    def on_lines(self, log_file, lines):
+        if log_file == self.wrf_sim.DIR_WRFOUT + 'rsl.out.0000':
+            self.wrf_sim.progress.update(lines)
+
+    def on_wake(self):
+        """
+        Returns 'stalled' or 'pruned' if the WRF job should be cancelled, or None.
+        """
+        wrf_sim = self.wrf_sim
+        wrf_sim.write_progress()
+        if wrf_sim.progress.stalled():
+            if self.kill_stalled:
+                return 'stalled'
+            if not self.stall_warned:
+                print(f'OptWRFWarning in wait_wrf: WRF in {wrf_sim.DIR_WRFOUT} has not made progress since '
+                      f'{datetime.datetime.fromtimestamp(wrf_sim.progress.last_activity)} '
+                      f'(model time {wrf_sim.progress.model_time}).')
+                self.stall_warned = True
+        if self.monitor_fn is None:
+            return None
+        # Score the history frames that have been written so far; the wrfout file is only
+        # opened (to count its frames) when it has changed since the last wake-up
+        try:
+            stat = os.stat(wrf_sim.DIR_WRFOUT + wrf_sim.wrfout_file_name(domain=1))
+        except OSError:
+            return None
+        if (stat.st_size, stat.st_mtime_ns) == self.wrfout_stat:
+            return None
+        self.wrfout_stat = (stat.st_size, stat.st_mtime_ns)
+        frames = wrf_sim.count_wrfout_frames()
+        if frames > self.n_frames:
+            self.n_frames = frames
+            if self.monitor_fn(wrf_sim, self.n_frames):
+                return 'pruned'
+        return None
+
 
 class WRFModel:
     """
@@ -56,6 +151,27 @@ class WRFModel:
         self.rda_email = rda_email
         self.rda_pswd = rda_pswd
         self.verbose = verbose
+        # Job id (or local process) and final status ('complete', 'failed', or 'pruned') of wrf.exe
+        self.wrf_job = None
+        self.wrf_status = None
+        # Wall seconds spent in each stage (see timings), and whether the inputs or outputs of
+        # this simulation were already cached (set by the functions that run it)
+        self.stage_seconds = {stage: 0.0 for stage in stages}
+        self.cache_hit = None
+        # Waits for the WPS and WRF programs to finish (see wait_finish); replace it with a watcher that
+        # has a shorter max_poll_interval if the run directory is on a network file system
+        self.watcher = CompletionWatcher()
+        # Progress of wrf.exe parsed from its rsl.out.0000 timing lines (see wait_wrf); wrf.exe is stalled
+        # when no timing line appears for stall_factor times its typical step time (or min_stall_seconds)
+        self.progress = None
+        self.progress_written = 0
+        self.stall_factor = 20
+        self.min_stall_seconds = 600
+        # How often a WRF job is checked to still be queued or running while waiting for it to start (see job_alive)
+        self.job_check_seconds = 60
+        # How wrfdir_setup builds the run directory (see rundir.build_run_dir), and how long it took
+        self.rundir_mode = 'symlink'
+        self.rundir_stats = None
 
         # Format the forecast start/end and determine the total time.
         self.forecast_start = hf.format_date(start_date)
@@ -117,6 +233,11 @@ class WRFModel:
                                    + self.forecast_start.strftime('%m') + '-' \
                                    + self.forecast_start.strftime('%d') + '_00:00:00'
 
+        # File in self.DIR_WRFOUT holding the id of the running wrf.exe job
+        self.FILE_WRF_JOB = 'optwrf_wrf_job.txt'
+        # File in self.DIR_WRFOUT holding the progress of wrf.exe (see write_progress)
+        self.FILE_WRF_PROGRESS = 'optwrf_wrf_progress.json'
+
         # Define linux command aliai
         self.CMD_LN = 'ln -sf %s %s'
         self.CMD_CP = 'cp %s %s'
@@ -130,6 +251,7 @@ class WRFModel:
             self.CMD_UNGMETG = 'qsub ' + self.DIR_WRFOUT + 'runungmetg.csh'
             self.CMD_REAL = 'qsub ' + self.DIR_WRFOUT + 'runreal.csh'
             self.CMD_WRF = 'qsub ' + self.DIR_WRFOUT + 'runwrf.csh'
+            self.CMD_CANCEL = 'qdel %s'
         elif self.on_aws:
             self.CMD_GEOGRID = './rungeogrid.csh'
             self.CMD_UNGMETG = './runungmetg.csh'
@@ -140,6 +262,7 @@ class WRFModel:
             self.CMD_UNGMETG = 'sbatch --requeue ' + self.DIR_WRFOUT + 'runungmetg.csh ' + self.DIR_WRFOUT
             self.CMD_REAL = 'sbatch --requeue ' + self.DIR_WRFOUT + 'runreal.csh ' + self.DIR_WRFOUT
             self.CMD_WRF = 'sbatch --requeue ' + self.DIR_WRFOUT + 'runwrf.csh ' + self.DIR_WRFOUT
+            self.CMD_CANCEL = 'scancel %s'
 
     def runwrf_finish_check(self, program, nprocs=8):
         """
@@ -158,33 +281,15 @@ class WRFModel:
             Run status of the program.
 
         """
-        if program == 'geogrid':
-            msg = read_last_line(self.DIR_WRFOUT + 'geogrid.log')
-            complete = 'Successful completion of program geogrid' in msg
-            # Not sure what the correct failure message should be!
-            failed = False
-        elif program == 'metgrid':
-            msg = read_last_line(self.DIR_WRFOUT + 'metgrid.log')
-            complete = 'Successful completion of program metgrid' in msg
-            # Not sure what the correct failure message should be!
-            failed = False
-        elif program == 'real':
-            msg = read_last_line(self.DIR_WRFOUT + 'rsl.out.0000')
-            complete = 'SUCCESS COMPLETE REAL' in msg
-            failed = '-------------------------------------------' in msg
-            if not complete and not failed:
-                msg = read_last_line(self.DIR_WRFOUT + 'rsl.out.00' + str(nprocs - 1).zfill(2))
-                failed = '-------------------------------------------' in msg
-        elif program == 'wrf':
-            msg = read_last_line(self.DIR_WRFOUT + 'rsl.out.0000')
-            complete = 'SUCCESS COMPLETE WRF' in msg
-            failed = '-------------------------------------------' in msg
-            if not complete and not failed:
-                msg = read_last_line(self.DIR_WRFOUT + 'rsl.out.00' + str(nprocs - 1).zfill(2))
-                failed = '-------------------------------------------' in msg
-        else:
-            complete = False
-            failed = False
+        status = None
+        msg = ''
+        for log_file, markers in self.finish_checks(program, nprocs).items():
+            msg = read_last_line(log_file)
+            status = next((marker_status for marker, marker_status in markers if marker in msg), None)
+            if status is not None:
+                break
+        failed = status == 'failed'
+        complete = status == 'complete'
         if failed:
             print(f'\nRunwrfError: {program} has failed. Last message was:\n{msg}')
             return 'failed'
@@ -193,6 +298,190 @@ class WRFModel:
         else:
             return 'running'
 
+    def finish_checks(self, program, nprocs=8):
+        """
+        Returns the log files that show whether a WRF or WPS subprogram has finished, and the
+        markers that are looked for in their last lines (see runwrf_finish_check and wait_finish).
+
+        :param program: string
+            WRF or WPS subprogram name ('geogrid', 'metgrid', 'real', or 'wrf').
+        :param nprocs: integer
+            Number of processors that you are using to run real.exe and wrf.exe.
+        :return checks: dictionary
+            mapping the path of each log file to a list of (marker, status) tuples, in the order they are checked.
+
+        """
+        if program in ['geogrid', 'metgrid']:
+            # Not sure what the correct failure message should be!
+            return {self.DIR_WRFOUT + program + '.log': [(f'Successful completion of program {program}', 'complete')]}
+        elif program in ['real', 'wrf']:
+            failure = '-------------------------------------------'
+            checks = {self.DIR_WRFOUT + 'rsl.out.0000': [(f'SUCCESS COMPLETE {program.upper()}', 'complete'),
+                                                          (failure, 'failed')]}
+            if nprocs > 1:
+                checks[self.DIR_WRFOUT + 'rsl.out.00' + str(nprocs - 1).zfill(2)] = [(failure, 'failed')]
+            return checks
+        return {}
+
+    def wait_finish(self, program, timeout=None, nprocs=8, on_lines=None, on_wake=None):
+        """
+        Waits for a WRF or WPS subprogram to finish, using self.watcher to wake up as soon as its
+        log files show that it has completed or failed (instead of polling with runwrf_finish_check).
+
+        :param program: string
+            WRF or WPS subprogram name ('geogrid', 'metgrid', 'real', or 'wrf').
+        :param timeout: float (default = None)
+            maximum seconds to wait, or None to wait until the program finishes.
+        :param nprocs: integer
+            Number of processors that you are using to run real.exe and wrf.exe.
+        :param on_lines: function (default = None)
+            called with the path of a log file and its new lines each time they are appended (see CompletionWatcher.wait).
+        :param on_wake: function (default = None)
+            called each time the watcher wakes up; if it returns a status, the wait ends with that status.
+        :return: 'complete', 'failed', 'timeout', or a status returned by on_wake
+            Run status of the program.
+
+        """
+        checks = self.finish_checks(program, nprocs)
+        if len(checks) == 0:
+            print(f'OptWRFError: cannot wait for {program}; use geogrid, metgrid, real, or wrf.')
+            raise ValueError
+        status, msg = self.watcher.wait(checks, timeout=timeout, on_lines=on_lines, on_wake=on_wake)
+        if status == 'failed':
+            print(f'\nRunwrfError: {program} has failed. Last message was:\n{msg}')
+        return status
+
+    def submit_job(self, cmd):
+        """
+        Submits a job and keeps a handle on it so that it can be cancelled before it finishes.
+        On AWS, jobs run as local processes (in their own process group); on Cheyenne (qsub)
+        and SLURM clusters (sbatch), the job id is read from the output of the submission command.
+
+        :param cmd: string
+            command used to submit the job (e.g., self.CMD_WRF).
+        :return job: subprocess.Popen or string
+            local process or batch job id (None if the job id could not be determined).
+
+        """
+        if self.on_aws:
+            return subprocess.Popen(cmd, shell=True, start_new_session=True)
+        result = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, universal_newlines=True)
+        return self.parse_job_id(result.stdout)
+
+    def parse_job_id(self, output):
+        """
+        Reads the job id from the output of a batch submission command (qsub or sbatch).
+
+        :param output: string
+            output of the submission command.
+        :return job_id: string
+            batch job id, or None if it could not be determined.
+
+        """
+        if self.verbose:
+            print(output.strip())
+        job_id = re.search(r'\d+', output)
+        if job_id is None:
+            print(f'OptWRFWarning in submit_job: could not find a job id in "{output.strip()}"')
+            return None
+        return job_id.group(0)
+
+    def cancel_job(self, job):
+        """
+        Cancels a job submitted with submit_job() using scancel, qdel, or by killing the local process group.
+
+        :param job: subprocess.Popen, asyncio.subprocess.Process, or string
+            local process (or process id) or batch job id returned by submit_job().
+
+        """
+        if job is None:
+            return
+        if self.verbose:
+            print(f'Cancelling job {job} in {self.DIR_WRFOUT}')
+        if hasattr(job, 'pid') or self.on_aws:
+            # Local jobs re-attached to by reattach_wrf() are identified by their process id,
+            # which is only killed if it still belongs to the job (see job_alive)
+            if not hasattr(job, 'pid') and not self.job_alive(job):
+                return
+            pid = job.pid if hasattr(job, 'pid') else int(job)
+            try:
+                os.killpg(os.getpgid(pid), signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        else:
+            os.system(self.CMD_CANCEL % job)
+
+    def reap_job(self, job):
+        """
+        Reaps a local job (see submit_job) if it has exited, without blocking. Its resource usage, which covers
+        the job and every descendant it waited for (e.g., the MPI ranks of wrf.exe), is kept in job.rusage.
+
+        :param job: subprocess.Popen
+            local process returned by submit_job().
+        :return: boolean (True/False)
+            True if the job has exited.
+
+        """
+        if job.returncode is not None:
+            return True
+        try:
+            pid, status, rusage = os.wait4(job.pid, os.WNOHANG)
+        except ChildProcessError:
+            # The job was already reaped (e.g., by subprocess.Popen.wait), so its resource usage is lost
+            return job.poll() is not None
+        if pid == 0:
+            return False
+        job.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        job.rusage = rusage
+        return True
+
+    def job_alive(self, job):
+        """
+        Checks whether a job submitted with submit_job() is still queued or running. Batch jobs are looked up
+        with qstat or squeue. Local jobs re-attached to by reattach_wrf() are identified by their process id,
+        which must lead a process group that was started before self.FILE_WRF_JOB was written, so that a
+        process id that was reused by another process is not mistaken for the job.
+
+        :param job: subprocess.Popen, asyncio.subprocess.Process, or string
+            local process (or process id) or batch job id returned by submit_job().
+        :return: boolean (True/False)
+            True if the job is alive, or if the batch system could not tell.
+
+        """
+        if job is None:
+            return False
+        if isinstance(job, subprocess.Popen):
+            return not self.reap_job(job)
+        if hasattr(job, 'returncode'):
+            return job.returncode is None
+        if self.on_aws:
+            try:
+                with open(f'/proc/{int(job)}/stat') as stat_file:
+                    stat = stat_file.read()
+                with open('/proc/stat') as stat_file:
+                    boot_time = next(int(line.split()[1]) for line in stat_file if line.startswith('btime'))
+                submit_time = os.path.getmtime(self.DIR_WRFOUT + self.FILE_WRF_JOB)
+            except (OSError, ValueError, StopIteration):
+                return False
+            # The fields after the command name are the state, the parent process id, the process group, ...;
+            # the 20th is the start time of the process in clock ticks after boot
+            fields = stat[stat.rindex(')') + 2:].split()
+            start_time = boot_time + int(fields[19]) / os.sysconf('SC_CLK_TCK')
+            return fields[0] != 'Z' and int(fields[2]) == int(job) and start_time <= submit_time + 5
+        cmd = ['qstat', str(job)] if self.on_cheyenne else ['squeue', '-h', '-j', str(job)]
+        try:
+            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        except OSError as error:
+            print(f'OptWRFWarning in job_alive: could not check job {job} ({error})')
+            return True
+        if result.returncode == 0:
+            return result.stdout.strip() != ''
+        if re.search(r'invalid job id|unknown job id|job has finished', result.stderr, re.IGNORECASE):
+            return False
+        print(f'OptWRFWarning in job_alive: could not check job {job} ({result.stderr.strip()})')
+        return True
+
+    @timed_stage('get_bc_data')
     def get_bc_data(self):
         """
         Downloads boundary condition data from the RDA or uses the CDS API
@@ -335,12 +624,11 @@ class WRFModel:
             for date in date_list:
                 year_mo = date.strftime('%Y') + date.strftime('%m')
                 year_mo_day = date.strftime('%Y') + date.strftime('%m') + date.strftime('%d')
-                cmd = self.CMD_CP % (DATA_ROOT1 + year_mo + '/' + datpfx1 + year_mo_day + '*', self.DIR_DATA_TMP)
-                cmd = cmd + '; ' + self.CMD_CP % (DATA_ROOT1 + year_mo + '/'
-                                                  + datpfx2 + year_mo_day + '*', self.DIR_DATA_TMP)
-                cmd = cmd + '; ' + self.CMD_CP % (DATA_ROOT2 + year_mo + '/'
-                                                  + datpfx3 + year_mo_day + '*', self.DIR_DATA_TMP)
-                os.system(cmd)
+                for pattern in [DATA_ROOT1 + year_mo + '/' + datpfx1 + year_mo_day + '*',
+                                DATA_ROOT1 + year_mo + '/' + datpfx2 + year_mo_day + '*',
+                                DATA_ROOT2 + year_mo + '/' + datpfx3 + year_mo_day + '*']:
+                    for file in glob.glob(pattern):
+                        rundir.copy_file(file, self.DIR_DATA_TMP + os.path.basename(file))
         else:
             # Build the complete path to required files (filelist(s)),
             # and a list of the file names themselves (file_check)
@@ -432,15 +720,15 @@ class WRFModel:
 
                 # Move the data files to the data directory
                 for file in file_check:
-                    os.system(self.CMD_MV % (file, self.DIR_DATA))
+                    rundir.move_file(file, self.DIR_DATA)
 
             # Link files in the data directory to the temporary data directory
             for file in file_check:
-                cmd = self.CMD_LN % (self.DIR_DATA + file, self.DIR_DATA_TMP)
-                os.system(cmd)
+                rundir.force_symlink(self.DIR_DATA + file, self.DIR_DATA_TMP)
 
         return vtable_sfx
 
+    @timed_stage('wrfdir_setup')
     def wrfdir_setup(self, vtable_sfx):
         """
         Sets up the WRF run directory by copying scripts, data files, and executables.
@@ -459,73 +747,19 @@ class WRFModel:
             print(f'\t{e}')
             return False
 
-        # Link WRF tables, data, and executables.
-        cmd = self.CMD_LN % (self.DIR_WRF + 'run/aerosol*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/BROADBAND*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/bulk*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/CAM*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/capacity*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/CCN*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/CLM*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/co2*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/coeff*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/constants*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/create*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/ETAMPNEW*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/GENPARM*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/grib2map*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/gribmap*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/HLC*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/ishmael*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/kernels*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/LANDUSE*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/masses*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/MPTABLE*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/ozone*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/p3_lookup*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/RRTM*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/SOILPARM*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/termvels*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/tr*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/URBPARM*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/VEGPARM*', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WRF + 'run/*exe', self.DIR_WRFOUT)
-        os.system(cmd)
+        # Link WRF tables, data, and executables, the WPS executables, the variable table for the BC/IC data,
+        # and the regridding script, and copy over the namelists and submission scripts
+        manifest = rundir.build_manifest(self.DIR_WRF, self.DIR_WPS, self.DIR_TEMPLATES, self.DIR_RUNWRF, vtable_sfx,
+                                         wfp=self.wfp)
+        self.rundir_stats = rundir.build_run_dir(self.DIR_WRFOUT, manifest, mode=self.rundir_mode,
+                                                 skeleton_root=self.DIR_MET4ENE + 'wrfout/.optwrf_skeletons/')
         if self.verbose:
             print(f'--> WRFOUT Directory:\n{self.DIR_WRFOUT}')
-
-        # Copy over namelists and submission scripts
-        cmd = self.CMD_CP % (self.DIR_TEMPLATES + 'namelist.wps', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_CP % (self.DIR_TEMPLATES + 'namelist.input', self.DIR_WRFOUT )
-        cmd = cmd + '; ' + self.CMD_CP % (self.DIR_TEMPLATES + 'template_rungeogrid.csh',
-                                          self.DIR_WRFOUT + 'rungeogrid.csh')
-        cmd = cmd + '; ' + self.CMD_CP % (self.DIR_TEMPLATES + 'template_runungmetg.csh',
-                                          self.DIR_WRFOUT + 'runungmetg.csh')
-        cmd = cmd + '; ' + self.CMD_CP % (self.DIR_TEMPLATES + 'template_runreal.csh',
-                                          self.DIR_WRFOUT + 'runreal.csh')
-        cmd = cmd + '; ' + self.CMD_CP % (self.DIR_TEMPLATES + 'template_runwrf.csh',
-                                          self.DIR_WRFOUT + 'runwrf.csh')
-        if self.wfp:
-            cmd = cmd + '; ' + self.CMD_CP % (self.DIR_TEMPLATES + 'wind-turbine-1.tbl', self.DIR_WRFOUT)
-            cmd = cmd + '; ' + self.CMD_CP % (self.DIR_TEMPLATES + 'windturbines*',
-                                              self.DIR_WRFOUT + 'windturbines.txt')
-        os.system(cmd)
-
-        # Link the metgrid and geogrid dirs and executables as well as the correct variable table for the BC/IC data.
-        cmd = self.CMD_LN % (self.DIR_WPS + 'geogrid', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WPS + 'geogrid.exe', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WPS + 'ungrib.exe', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WPS + 'metgrid', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WPS + 'metgrid.exe', self.DIR_WRFOUT)
-        cmd = cmd + '; ' + self.CMD_LN % (self.DIR_WPS + 'ungrib/Variable_Tables/Vtable.'
-                                          + vtable_sfx, self.DIR_WRFOUT + 'Vtable')
-        os.system(cmd)
-
-        # Link the regridding script
-        cmd = self.CMD_LN % (self.DIR_RUNWRF + 'wrf2era_error.ncl', self.DIR_WRFOUT)
-        os.system(cmd)
+            print(f'Made {self.rundir_stats["n_links"]} links and {self.rundir_stats["n_copies"]} copies '
+                  f'({self.rundir_mode}) in {self.rundir_stats["seconds"]:.3f} s')
         return True
 
+    @timed_stage('prepare_namelists')
     def prepare_namelists(self):
         """
         Writes dates, the geographical data path, number of domains, runtime duration,
@@ -685,38 +919,48 @@ class WRFModel:
             If runwrf_finish_check for geogrid and metgrid
             returns 'complete' ('failed'), this function returns True (False).
 
+        """
+        if not self.run_geogrid(disable_timeout):
+            return False
+        if not self.run_ungrib_metgrid(disable_timeout):
+            return False
+
+        # Remove the temporary data directory after WPS has run
+        hf.remove_dir(self.DIR_DATA_TMP)
+        return True
+
+    @timed_stage('geogrid')
+    def run_geogrid(self, disable_timeout=False):
+        """
+        Runs geogrid.exe, unless the geo_em files were archived before (see archive_wps),
+        in which case they are linked to the run directory.
+
+        :return: boolean (True/False)
+            If runwrf_finish_check for geogrid returns 'complete' ('failed'), this function returns True (False).
+
         """
         # Run geogrid if necessary
         # Build the list of geogrid files
-        geogridfiles = [f'geo_em.d{str(domain).zfill(2)}.nc' for domain in range(1, self.n_domains + 1)]
+        geogridfiles = self.geo_em_files()
         # Check to see if the geogrid files exist in the expected directory
         geogridfilesexist = [os.path.exists(self.DIR_DATA_ROOT + 'data/domain/' + file) for file in geogridfiles]
         if geogridfilesexist.count(False) != 0:
             # Run geogrid
             os.system(self.CMD_GEOGRID)
-            # Sleep until the geogrid.log file exists
-            while not os.path.exists(self.DIR_WRFOUT + 'geogrid.log'):
-                time.sleep(1)
+            # Wait until the geogrid.log file exists
+            self.watcher.wait_for_file(self.DIR_WRFOUT + 'geogrid.log')
             # Begin geogrid simulation clock
             startTime = datetime.datetime.now()
-            startTimeInt = int(time.time())
             if self.verbose:
                 print('Starting Geogrid at: ' + str(startTime))
                 sys.stdout.flush()
-            geogrid_sim = self.runwrf_finish_check('geogrid')
-            while geogrid_sim != 'complete':
-                if geogrid_sim == 'failed':
-                    print_last_3lines(self.DIR_WRFOUT + 'geogrid.log')
-                    return False
-                elif (int(time.time()) - startTimeInt) < 600:
-                    time.sleep(2)
-                    geogrid_sim = self.runwrf_finish_check('geogrid')
-                elif disable_timeout is True:
-                    time.sleep(2)
-                    geogrid_sim = self.runwrf_finish_check('geogrid')
-                else:
-                    print('TimeoutError in run_wps: Geogrid took more than 10min to run... exiting.')
-                    return False
+            geogrid_sim = self.wait_finish('geogrid', timeout=None if disable_timeout else 600)
+            if geogrid_sim == 'failed':
+                print_last_3lines(self.DIR_WRFOUT + 'geogrid.log')
+                return False
+            elif geogrid_sim == 'timeout':
+                print('TimeoutError in run_wps: Geogrid took more than 10min to run... exiting.')
+                return False
             elapsed = datetime.datetime.now() - startTime
             if self.verbose:
                 print('Geogrid ran in: ' + hf.strfdelta(elapsed))
@@ -725,52 +969,41 @@ class WRFModel:
             if self.verbose:
                 print('Geogrid was run previously. Linking geogrid file(s)...')
             for file in geogridfiles:
-                os.system(self.CMD_LN % (self.DIR_DATA_ROOT + 'data/domain/' + file, self.DIR_WRFOUT + '.'))
+                rundir.force_symlink(self.DIR_DATA_ROOT + 'data/domain/' + file, self.DIR_WRFOUT + file)
+        return True
 
+    @timed_stage('ungrib_metgrid')
+    def run_ungrib_metgrid(self, disable_timeout=False):
+        """
+        Runs ungrib.exe and metgrid.exe, unless the met_em files were archived before (see archive_wps),
+        in which case they are linked to the run directory.
+
+        :return: boolean (True/False)
+            If runwrf_finish_check for metgrid returns 'complete' ('failed'), this function returns True (False).
+
+        """
         # Run ungrib and metgrid if necessary; start by checking for required met_em files
-        hrs = ['00', '03', '06', '09', '12', '15', '18', '21']
-        # Determine the forecast duration
-        forecast_duration = self.forecast_end - self.forecast_start
-        # Build the list of required met_em files
-        metfilelist = []
-        for ii in range(forecast_duration.days + 1):
-            day = self.forecast_start + datetime.timedelta(days=ii)
-            for jj in range(1, self.n_domains + 1):
-                domain = str(jj).zfill(2)
-                if day == self.forecast_end:
-                    metfilelist.append(f'met_em.d{domain}.{day.strftime("%Y-%m-%d")}_00:00:00.nc')
-                else:
-                    for hr in hrs:
-                        metfilelist.append(f'met_em.d{domain}.{day.strftime("%Y-%m-%d")}_{hr}:00:00.nc')
+        metfilelist = self.met_em_files()
         metfileexist = [os.path.exists(self.DIR_DATA + 'met_em/' + file) for file in metfilelist]
         if metfileexist.count(False) != 0:
             # Run ungrib and metgrid; start by linking the grib files
             sys.stdout.flush()
             os.system(self.CMD_LINK_GRIB)
             os.system(self.CMD_UNGMETG)
-            # Sleep until the metgrid.log file exists
-            while not os.path.exists(self.DIR_WRFOUT + 'metgrid.log'):
-                time.sleep(1)
+            # Wait until the metgrid.log file exists
+            self.watcher.wait_for_file(self.DIR_WRFOUT + 'metgrid.log')
             # Begin geogrid simulation clock
             startTime = datetime.datetime.now()
-            startTimeInt = int(time.time())
             if self.verbose:
                 print('Starting Ungrib and Metgrid at: ' + str(startTime))
                 sys.stdout.flush()
-            metgrid_sim = self.runwrf_finish_check('metgrid')
-            while metgrid_sim != 'complete':
-                if metgrid_sim == 'failed':
-                    print_last_3lines(self.DIR_WRFOUT + 'metgrid.log')
-                    return False
-                elif (int(time.time()) - startTimeInt) < 600:
-                    time.sleep(2)
-                    metgrid_sim = self.runwrf_finish_check('metgrid')
-                elif disable_timeout is True:
-                    time.sleep(2)
-                    metgrid_sim = self.runwrf_finish_check('metgrid')
-                else:
-                    print('TimeoutError in run_wps: Ungrib and Metgrid took more than 10min to run... exiting.')
-                    return False
+            metgrid_sim = self.wait_finish('metgrid', timeout=None if disable_timeout else 600)
+            if metgrid_sim == 'failed':
+                print_last_3lines(self.DIR_WRFOUT + 'metgrid.log')
+                return False
+            elif metgrid_sim == 'timeout':
+                print('TimeoutError in run_wps: Ungrib and Metgrid took more than 10min to run... exiting.')
+                return False
             elapsed = datetime.datetime.now() - startTime
             if self.verbose:
                 print('Ungrib and Metgrid ran in: ' + hf.strfdelta(elapsed))
@@ -779,12 +1012,78 @@ class WRFModel:
             if self.verbose:
                 print('Metgrid was run previously. Linking met_em files...')
             for file in metfilelist:
-                os.system(self.CMD_LN % (self.DIR_DATA + 'met_em/' + file, self.DIR_WRFOUT + '.'))
-
-        # Remove the temporary data directory after WPS has run
-        hf.remove_dir(self.DIR_DATA_TMP)
+                rundir.force_symlink(self.DIR_DATA + 'met_em/' + file, self.DIR_WRFOUT + file)
         return True
 
+    def geo_em_files(self):
+        """
+        Returns the names of the geogrid files (geo_em) required by this simulation.
+        """
+        return [f'geo_em.d{str(domain).zfill(2)}.nc' for domain in range(1, self.n_domains + 1)]
+
+    def met_em_files(self):
+        """
+        Returns the names of the metgrid files (met_em) required by this simulation.
+        """
+        hrs = ['00', '03', '06', '09', '12', '15', '18', '21']
+        # Determine the forecast duration
+        forecast_duration = self.forecast_end - self.forecast_start
+        # Build the list of required met_em files
+        metfilelist = []
+        for ii in range(forecast_duration.days + 1):
+            day = self.forecast_start + datetime.timedelta(days=ii)
+            for jj in range(1, self.n_domains + 1):
+                domain = str(jj).zfill(2)
+                if day == self.forecast_end:
+                    metfilelist.append(f'met_em.d{domain}.{day.strftime("%Y-%m-%d")}_00:00:00.nc')
+                else:
+                    for hr in hrs:
+                        metfilelist.append(f'met_em.d{domain}.{day.strftime("%Y-%m-%d")}_{hr}:00:00.nc')
+        return metfilelist
+
+    def wps_files_exist(self):
+        """
+        Checks whether the geo_em and met_em files required by this simulation were already
+        archived (see archive_wps), in which case run_wps only links them and no boundary
+        condition data is needed.
+
+        :return: boolean (True/False)
+
+        """
+        geogridfilesexist = [os.path.exists(self.DIR_DATA_ROOT + 'data/domain/' + file)
+                             for file in self.geo_em_files()]
+        metfileexist = [os.path.exists(self.DIR_DATA + 'met_em/' + file) for file in self.met_em_files()]
+        return geogridfilesexist.count(False) == 0 and metfileexist.count(False) == 0
+
+    def era5_file(self):
+        """
+        Returns the path of the processed monthly ERA5 file used to score this simulation (see process_era5_data).
+        """
+        return self.DIR_ERA5_ROOT + 'ERA5_EastUS_WPD-GHI_' \
+            + self.forecast_start.strftime('%Y') + '-' \
+            + self.forecast_start.strftime('%m') + '.nc'
+
+    def inputs_exist(self):
+        """
+        Checks whether all the inputs shared by simulations on the same dates (the archived WPS output
+        and the processed ERA5 month) already exist, so that the simulation can skip preprocessing.
+
+        :return: boolean (True/False)
+
+        """
+        return self.wps_files_exist() and os.path.exists(self.era5_file())
+
+    def vtable_sfx(self):
+        """
+        Returns the WPS variable table suffix of the boundary condition data (see get_bc_data),
+        without downloading or linking any data.
+        """
+        if self.bc_data in ['ERA', 'ERA5']:
+            return 'ERA-interim.pl'
+        print(f'Currently {self.bc_data} is not supported; please use ERA or ERA5 for boundary condition data.')
+        raise ValueError
+
+    @timed_stage('real')
     def run_real(self, disable_timeout=False):
         """
         Runs real.exe and checks to see if it was successful.
@@ -795,29 +1094,20 @@ class WRFModel:
 
         """
         os.system(self.CMD_REAL)
-        # Sleep until rsl.out.0000 file exists
-        while not os.path.exists(self.DIR_WRFOUT + 'rsl.out.0000'):
-            time.sleep(1)
-        # Begin geogrid simulation clock
+        # Wait until rsl.out.0000 file exists
+        self.watcher.wait_for_file(self.DIR_WRFOUT + 'rsl.out.0000')
+        # Begin real simulation clock
         startTime = datetime.datetime.now()
-        startTimeInt = int(time.time())
         if self.verbose:
             print('Starting Real at: ' + str(startTime))
             sys.stdout.flush()
-        real_sim = self.runwrf_finish_check('real')
-        while real_sim != 'complete':
-            if real_sim == 'failed':
-                print_last_3lines(self.DIR_WRFOUT + 'rsl.out.0000')
-                return False
-            elif (int(time.time()) - startTimeInt) < 600:
-                time.sleep(2)
-                real_sim = self.runwrf_finish_check('real')
-            elif disable_timeout is True:
-                time.sleep(2)
-                real_sim = self.runwrf_finish_check('real')
-            else:
-                print('TimeoutError in run_real: Real took more than 10min to run... exiting.')
-                return False
+        real_sim = self.wait_finish('real', timeout=None if disable_timeout else 600)
+        if real_sim == 'failed':
+            print_last_3lines(self.DIR_WRFOUT + 'rsl.out.0000')
+            return False
+        elif real_sim == 'timeout':
+            print('TimeoutError in run_real: Real took more than 10min to run... exiting.')
+            return False
         elapsed = datetime.datetime.now() - startTime
         if self.verbose:
             print('Real ran in: ' + hf.strfdelta(elapsed) + ' seconds')
@@ -825,7 +1115,8 @@ class WRFModel:
         os.system(self.CMD_RM % (self.DIR_WRFOUT + 'rsl.*'))
         return True
 
-    def run_wrf(self, disable_timeout=False, timeout_hours=8, save_wps_files=True):
+    def run_wrf(self, disable_timeout=False, timeout_hours=8, save_wps_files=True, monitor_fn=None,
+                kill_stalled=False):
         """
         Runs wrf.exe and checks to see if it was successful.
 
@@ -842,6 +1133,14 @@ class WRFModel:
             default because it only needs to be done once per domain, per
             boundary conditions, per date and is best done before
             optimize_wrf_physics is run.
+        :param monitor_fn: function (default = None)
+            called with this WRFModel instance and the number of history frames in the wrfout file
+            each time WRF writes a new frame. If it returns True, the WRF job is cancelled,
+            self.wrf_status is set to 'pruned', and this method returns a failure (False) flag.
+        :param kill_stalled: boolean (default = False)
+            if True, the WRF job is cancelled as soon as it stops making progress (see watcher.WRFProgress.stalled),
+            self.wrf_status is set to 'stalled', and this method returns a failure (False) flag.
+            Otherwise, a warning is printed and the job keeps running until the timeout.
         :return: boolean (True/False)
             If runwrf_finish_check for wrf returns 'complete' ('failed'),
             this function returns True (False).
@@ -849,35 +1148,189 @@ class WRFModel:
             specifying the amount of time it took for the WRF simulation to run.
 
         """
-        wrf_runtime = 3600 * timeout_hours
-        os.system(self.CMD_WRF)
-        # Sleep until rsl.out.0000 file exists
-        while not os.path.exists(self.DIR_WRFOUT + 'rsl.out.0000'):
-            time.sleep(5)
-        # Begin wrf simulation clock
-        startTime = datetime.datetime.now()
-        startTimeInt = int(time.time())
+        self.submit_wrf()
+        return self.wait_wrf(disable_timeout=disable_timeout, timeout_hours=timeout_hours,
+                             save_wps_files=save_wps_files, monitor_fn=monitor_fn, kill_stalled=kill_stalled)
+
+    def submit_wrf(self):
+        """
+        Submits wrf.exe without waiting for it to finish, and writes the job id (or local process id)
+        to self.FILE_WRF_JOB so that the job can be re-attached to (see reattach_wrf) if the
+        supervising process is restarted.
+
+        """
+        self.record_wrf_job(self.submit_job(self.CMD_WRF))
+
+    def record_wrf_job(self, job):
+        """
+        Keeps a handle on a submitted WRF job and writes its job id (or local process id) to self.FILE_WRF_JOB.
+
+        :param job: subprocess.Popen, asyncio.subprocess.Process, or string
+            local process or batch job id returned by submit_job() (or supervisor.submit_job()).
+
+        """
+        self.wrf_job = job
+        job_id = job.pid if hasattr(job, 'pid') else job
+        with open(self.DIR_WRFOUT + self.FILE_WRF_JOB, 'w') as job_file:
+            job_file.write(f'{job_id}\n')
+
+    def reattach_wrf(self):
+        """
+        Re-attaches to a wrf.exe job that was submitted (by submit_wrf) before the supervising process
+        was restarted, so that it can be waited for with wait_wrf instead of being resubmitted.
+        If the job is no longer alive (see job_alive) and WRF did not finish, the job is forgotten
+        so that it is resubmitted.
+
+        :return: boolean (True/False)
+            True if a WRF job was submitted for this simulation and has not been waited for yet.
+
+        """
+        job_file_path = self.DIR_WRFOUT + self.FILE_WRF_JOB
+        if not os.path.exists(job_file_path):
+            return False
+        with open(job_file_path) as job_file:
+            job_id = job_file.read().strip()
+        self.wrf_job = job_id if job_id not in ('', 'None') else None
+        if self.runwrf_finish_check('wrf') == 'running' and not self.job_alive(self.wrf_job):
+            print(f'OptWRFWarning in reattach_wrf: WRF job {self.wrf_job} in {self.DIR_WRFOUT} is no longer running, '
+                  f'so it will be resubmitted.')
+            os.remove(job_file_path)
+            self.wrf_job = None
+            return False
+        if self.verbose:
+            print(f'Re-attaching to WRF job {self.wrf_job} in {self.DIR_WRFOUT}')
+        return True
+
+    def wait_wrf(self, disable_timeout=False, timeout_hours=8, save_wps_files=True, monitor_fn=None,
+                 kill_stalled=False):
+        """
+        Waits for a wrf.exe job submitted by submit_wrf() (or re-attached to by reattach_wrf()) to finish.
+        The arguments and return values are the same as for run_wrf(). The runtime is measured from the
+        time that the job was submitted. While WRF runs, its progress is tracked in self.progress and
+        written to self.FILE_WRF_PROGRESS (see write_progress).
+
+        """
+        monitor = WRFMonitor(self, monitor_fn=monitor_fn, kill_stalled=kill_stalled)
+        timeout = self.wrf_timeout(disable_timeout, timeout_hours)
+        deadline = None if timeout is None else time.time() + timeout
+        wrf_sim = self.wait_wrf_start(timeout)
+        if wrf_sim is None:
+            timeout = None if deadline is None else max(0, deadline - time.time())
+            wrf_sim = self.wait_finish('wrf', timeout=timeout, on_lines=monitor.on_lines, on_wake=monitor.on_wake)
+        if wrf_sim in ['pruned', 'stalled', 'timeout']:
+            self.cancel_job(self.wrf_job)
+        return self.end_wrf_wait(wrf_sim, monitor, timeout_hours=timeout_hours, save_wps_files=save_wps_files)
+
+    def wait_wrf_start(self, timeout=None):
+        """
+        Waits until wrf.exe has written rsl.out.0000, checking every self.job_check_seconds
+        that its job is still queued or running (see job_alive).
+
+        :param timeout: float (default = None)
+            maximum seconds to wait, or None to wait for as long as the job is alive.
+        :return: string
+            None if WRF started, 'failed' if its job ended before WRF started, or 'timeout'.
+
+        """
+        rsl_file = self.DIR_WRFOUT + 'rsl.out.0000'
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            wait_seconds = self.job_check_seconds
+            if deadline is not None:
+                wait_seconds = min(wait_seconds, max(0, deadline - time.time()))
+            if self.watcher.wait_for_file(rsl_file, timeout=wait_seconds):
+                return None
+            status = self.wrf_start_status(deadline)
+            if status is not None:
+                return status
+
+    def wrf_start_status(self, deadline):
+        """
+        Returns why waiting for wrf.exe to write rsl.out.0000 should end (see wait_wrf_start):
+        'failed' if its job is no longer alive, 'timeout' if the deadline passed, or None to keep waiting.
+        A job whose id is not known is assumed to be alive.
+
+        """
+        if self.wrf_job is not None and not self.job_alive(self.wrf_job) \
+                and not os.path.exists(self.DIR_WRFOUT + 'rsl.out.0000'):
+            print(f'OptWRFWarning in wait_wrf: WRF job {self.wrf_job} in {self.DIR_WRFOUT} ended before WRF started.')
+            return 'failed'
+        if deadline is not None and time.time() >= deadline:
+            return 'timeout'
+        return None
+
+    def wrf_timeout(self, disable_timeout=False, timeout_hours=8):
+        """
+        Returns the seconds left before a WRF job submitted by submit_wrf() times out (see wait_wrf),
+        or None if the timeout is disabled. The runtime is measured from the time that the job was submitted.
+
+        """
+        startTime = datetime.datetime.fromtimestamp(os.path.getmtime(self.DIR_WRFOUT + self.FILE_WRF_JOB))
         if self.verbose:
             print('Starting WRF at: ' + str(startTime))
             sys.stdout.flush()
-        wrf_sim = self.runwrf_finish_check('wrf')
-        while wrf_sim != 'complete':
-            if wrf_sim == 'failed':
-                print_last_3lines(self.DIR_WRFOUT + 'rsl.out.0000')
-                elapsed = datetime.datetime.now() - startTime
-                return False, hf.strfdelta(elapsed)
-            elif (int(time.time()) - startTimeInt) < wrf_runtime:
-                time.sleep(10)
-                wrf_sim = self.runwrf_finish_check('wrf')
-            elif disable_timeout is True:
-                time.sleep(10)
-                wrf_sim = self.runwrf_finish_check('wrf')
-            else:
-                print(f'TimeoutError in run_wrf at {datetime.datetime.now()}: '
-                      f'WRF took more than {timeout_hours} hrs to run... exiting.')
-                elapsed = datetime.datetime.now() - startTime
-                return False, hf.strfdelta(elapsed)
-        elapsed = datetime.datetime.now() - startTime
+        if disable_timeout:
+            return None
+        return max(0, startTime.timestamp() + 3600 * timeout_hours - time.time())
+
+    def end_wrf_wait(self, wrf_sim, monitor, timeout_hours=8, save_wps_files=True):
+        """
+        Records the outcome of waiting for a WRF job (see wait_wrf), after a pruned or stalled job was cancelled.
+
+        :param wrf_sim: string
+            status returned by wait_finish for wrf ('complete', 'failed', 'timeout', 'pruned', or 'stalled').
+        :param monitor: WRFMonitor
+            that followed the job.
+        :param timeout_hours: integer
+            timeout of the wait, which is only used to report a timeout.
+        :param save_wps_files: boolean (True/False)
+            whether the geo_em and met_em files are archived after WRF completes (see archive_wps).
+        :return: boolean (True/False)
+            True if WRF completed.
+        :return elapsed: string
+            specifying the amount of time it took for the WRF simulation to run.
+
+        """
+        job_file_path = self.DIR_WRFOUT + self.FILE_WRF_JOB
+        startTime = datetime.datetime.fromtimestamp(os.path.getmtime(job_file_path))
+
+        def fn_elapsed():
+            # Time since the job was submitted, which is also recorded as the wall time of the wrf stage
+            elapsed = datetime.datetime.now() - startTime
+            self.add_stage_seconds('wrf', elapsed.total_seconds())
+            self.write_progress(force=True)
+            return elapsed
+
+        if wrf_sim == 'failed':
+            print_last_3lines(self.DIR_WRFOUT + 'rsl.out.0000')
+            self.wrf_status = 'failed'
+            os.remove(job_file_path)
+            elapsed = fn_elapsed()
+            return False, hf.strfdelta(elapsed)
+        elif wrf_sim == 'pruned':
+            self.wrf_status = 'pruned'
+            os.remove(job_file_path)
+            elapsed = fn_elapsed()
+            print(f'Pruned WRF in {self.DIR_WRFOUT} after {monitor.n_frames} history frames '
+                  f'({hf.strfdelta(elapsed)})')
+            return False, hf.strfdelta(elapsed)
+        elif wrf_sim == 'stalled':
+            self.wrf_status = 'stalled'
+            os.remove(job_file_path)
+            elapsed = fn_elapsed()
+            print(f'Cancelled WRF in {self.DIR_WRFOUT} because it stalled at model time {self.progress.model_time} '
+                  f'({hf.strfdelta(elapsed)})')
+            return False, hf.strfdelta(elapsed)
+        elif wrf_sim == 'timeout':
+            print(f'TimeoutError in run_wrf at {datetime.datetime.now()}: '
+                  f'WRF took more than {timeout_hours} hrs to run... exiting.')
+            self.wrf_status = 'failed'
+            os.remove(job_file_path)
+            elapsed = fn_elapsed()
+            return False, hf.strfdelta(elapsed)
+        self.wrf_status = 'complete'
+        os.remove(job_file_path)
+        elapsed = fn_elapsed()
         if self.verbose:
             print('WRF finished running at: ' + str(datetime.datetime.now()))
             print('WRF ran in: ' + hf.strfdelta(elapsed))
@@ -895,7 +1348,203 @@ class WRFModel:
 
         return True, hf.strfdelta(elapsed)
 
-    def process_wrfout_data(self, domain=3):
+    def write_progress(self, force=False, min_interval=30):
+        """
+        Writes the progress of wrf.exe (see watcher.WRFProgress.to_dict) to self.FILE_WRF_PROGRESS,
+        so that it can be read from other processes (see read_progress) while WRF runs.
+        The file is written to a temporary file and then renamed, so readers never see a partial file.
+
+        :param force: boolean (default = False)
+            write the file even if it was written less than min_interval seconds ago.
+        :param min_interval: float (default = 30)
+            minimum seconds between writes.
+
+        """
+        if self.progress is None:
+            return
+        now = time.time()
+        if not force and now - self.progress_written < min_interval:
+            return
+        self.progress_written = now
+        progress_file_path = self.DIR_WRFOUT + self.FILE_WRF_PROGRESS
+        progress = dict(self.progress.to_dict(now), status=self.wrf_status or 'running')
+        try:
+            with open(progress_file_path + '.tmp', 'w') as progress_file:
+                json.dump(progress, progress_file)
+            os.replace(progress_file_path + '.tmp', progress_file_path)
+        except OSError as err:
+            print(f'OptWRFWarning in write_progress: {err}')
+
+    def read_progress(self):
+        """
+        Reads the progress of wrf.exe written by write_progress (possibly in another process).
+
+        :return progress: dictionary
+            with the keys of watcher.WRFProgress.to_dict and the status of wrf.exe,
+            or None if no progress has been written.
+
+        """
+        try:
+            with open(self.DIR_WRFOUT + self.FILE_WRF_PROGRESS) as progress_file:
+                return json.load(progress_file)
+        except (OSError, ValueError):
+            return None
+
+    def add_stage_seconds(self, stage, seconds):
+        """
+        Adds wall time to the total of a stage in self.stage_seconds.
+
+        :param stage: string
+            one of stages.
+        :param seconds: float
+            wall seconds spent in the stage.
+
+        """
+        self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+    def count_mpi_ranks(self):
+        """
+        Counts the MPI ranks that ran wrf.exe from the rsl.out.* files that each rank writes.
+
+        :return n_ranks: integer
+            number of MPI ranks, or None if WRF has not written its rsl files in the run directory.
+
+        """
+        n_ranks = len(glob.glob(self.DIR_WRFOUT + 'rsl.out.[0-9]*'))
+        return n_ranks if n_ranks > 0 else None
+
+    def peak_rss_mb(self):
+        """
+        Returns the peak resident set size of the job that ran wrf.exe: as reported by sacct for SLURM jobs
+        or by qstat -x for PBS jobs (on Cheyenne), or from the resource usage of a local job once it has
+        exited (see reap_job). The supervising process runs many simulations, so its own resource usage
+        says nothing about this one.
+
+        :return peak_rss: float
+            peak resident set size in MB, or None if it could not be measured (e.g., WRF was not run, the job
+            was re-attached to by reattach_wrf or run by the supervisor, or the accounting is not available).
+
+        """
+        if isinstance(self.wrf_job, subprocess.Popen):
+            if not self.reap_job(self.wrf_job) or getattr(self.wrf_job, 'rusage', None) is None:
+                return None
+            # ru_maxrss is in kilobytes on Linux, but in bytes on macOS
+            return self.wrf_job.rusage.ru_maxrss / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+        if not isinstance(self.wrf_job, str) or self.on_aws:
+            return None
+        if self.on_cheyenne:
+            # e.g., resources_used.mem = 1843200kb
+            cmd, pattern = ['qstat', '-x', '-f', self.wrf_job], r'resources_used\.mem = ([\d.]+)([kmgt]?)b'
+            units = {'': 1 / 1024 ** 2, 'k': 1 / 1024, 'm': 1, 'g': 1024, 't': 1024 ** 2}
+        else:
+            # One MaxRSS per job step, e.g., 1843200K
+            cmd, pattern = ['sacct', '-n', '-P', '-j', self.wrf_job, '--format=MaxRSS'], r'([\d.]+)([KMGT]?)'
+            units = {'': 1 / 1024, 'K': 1 / 1024, 'M': 1, 'G': 1024, 'T': 1024 ** 2}
+        try:
+            accounting = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        except (OSError, subprocess.SubprocessError):
+            return None
+        peak_rss = [float(value) * units[unit] for value, unit in re.findall(pattern, accounting.stdout)]
+        return max(peak_rss) if len(peak_rss) > 0 else None
+
+    def timings(self):
+        """
+        Returns the runtime accounting of this simulation.
+
+        :return timings: dictionary
+            with the wall seconds spent in each stage (<stage>_seconds for each of stages), the number of
+            MPI ranks that ran wrf.exe (mpi_ranks), the peak resident set size in MB (peak_rss_mb), and
+            whether the inputs or outputs of the simulation were already cached (cache_hit).
+
+        """
+        timings = {f'{stage}_seconds': self.stage_seconds.get(stage, 0.0) for stage in stages}
+        timings['mpi_ranks'] = self.count_mpi_ranks()
+        timings['peak_rss_mb'] = self.peak_rss_mb()
+        timings['cache_hit'] = self.cache_hit
+        return timings
+
+    def count_wrfout_frames(self, domain=1):
+        """
+        Counts the history frames that WRF has written to the wrfout file so far.
+
+        :param domain: integer (default = 1)
+            domain of the wrfout file.
+        :return n_frames: integer
+            number of frames (times) in the wrfout file, or 0 if it cannot be read yet.
+
+        """
+        datapath = self.DIR_WRFOUT + self.wrfout_file_name(domain=domain)
+        try:
+            with netCDF4.Dataset(datapath) as netcdf_data:
+                return len(netcdf_data.dimensions['Time'])
+        except (OSError, KeyError):
+            return 0
+
+    def partial_wrf_era5_diff(self, domain=1, method='ncl'):
+        """
+        Computes the error between the wrfout frames that have been written so far and ERA5 while
+        WRF is still running. The last frame is dropped (see process_wrfout_data) in case it is
+        incomplete. The frames are regridded with the same method as the final error (see wrf_era5_diff),
+        so that, because the error is accumulated over time, the partial error is a lower bound on the
+        error of the completed simulation. ERA5 data must already be processed (see process_era5_data).
+
+        :param domain: integer (default = 1)
+            domain of the wrfout file.
+        :param method: str (default = 'ncl')
+            regridding method ('ncl', 'xesmf', or 'pyresample'); use the method of the final error.
+        :return error: list
+            in the same format as wrf_era5_diff(), or None if the frames could not be read yet.
+            Errors raised while regridding (e.g., if the regridding package is not installed) are not caught,
+            and a RuntimeError is raised if NCL failed.
+
+        """
+        if method not in ['ncl', 'xesmf', 'pyresample']:
+            print(f'Invalid regridding method: {method}. Use ncl, xesmf, or pyresample.')
+            raise NameError
+        partial_file = 'wrfout_partial_d01.nc'
+        # At least one complete frame must remain after the last frame is dropped
+        if self.count_wrfout_frames(domain=domain) < 2:
+            return None
+        try:
+            if not self._process_wrfout_data(domain=domain, outfile=partial_file):
+                return None
+        except (OSError, RuntimeError, ValueError) as e:
+            # WRF may be part way through writing a frame
+            print(f'OptWRFWarning in partial_wrf_era5_diff: could not read the wrfout frames yet\n\t{e}')
+            return None
+        input_year = self.forecast_start.strftime('%Y')
+        input_month = self.forecast_start.strftime('%m')
+        input_day = self.forecast_start.strftime('%d')
+        try:
+            if method == 'ncl':
+                # The partial errors are written to their own file, so the final error file is never reused
+                partial_paramstr = self.paramstr + '_partial'
+                error = wrf_era5_regrid_ncl(input_year, input_month, input_day, partial_paramstr,
+                                            wrfdir=self.DIR_WRFOUT, eradir=self.DIR_ERA5_ROOT, recalculate=True,
+                                            wrffile=partial_file)
+                error_file = self.DIR_WRFOUT + 'mae_wrfyera_' + partial_paramstr + '.csv'
+                if os.path.exists(error_file):
+                    os.remove(error_file)
+                if error[1] >= 6.022 * 10 ** 23:
+                    raise RuntimeError('NCL could not regrid the partial wrfout file')
+                return error
+            if method == 'xesmf':
+                wrfdata, eradata = wrf_era5_regrid_xesmf(wrfdir=self.DIR_WRFOUT, wrffile=partial_file,
+                                                         eradir=self.DIR_ERA5_ROOT,
+                                                         erafile=os.path.basename(self.era5_file()))
+            else:
+                wrfdata, eradata = wrf_era5_regrid_pyresample(input_year, input_month, wrfdir=self.DIR_WRFOUT,
+                                                              eradir=self.DIR_ERA5_ROOT, wrffile=partial_file)
+        finally:
+            if os.path.exists(self.DIR_WRFOUT + partial_file):
+                os.remove(self.DIR_WRFOUT + partial_file)
+        if wrfdata is None or eradata is None:
+            return None
+        wrfdata = wrf_era5_error(wrfdata, eradata)
+        return [0, float(wrfdata['total_ghi_error'].sum().values), float(wrfdata['total_wpd_error'].sum().values)]
+
+    @timed_stage('wrfout_processing')
+    def process_wrfout_data(self, domain=3, outfile='wrfout_processed_d01.nc'):
         """
         Processes the wrfout file -- calculates GHI and wind power denity (WPD) and writes these variables
         to wrfout_processed_d01.nc data file to be used by the regridding script (wrf2era_error.ncl) in
@@ -912,6 +1561,19 @@ class WRFModel:
         With the help of these two packages, the remaineder of the methods claculates the WPD, formats the
         data to be easily compatible with other methods, and writes the data to a NetCDF file.
 
+        :param domain: integer (default = 3)
+            domain of the wrfout file.
+        :param outfile: string (default = 'wrfout_processed_d01.nc')
+            name of the processed NetCDF file written to self.DIR_WRFOUT.
+
+        """
+        return self._process_wrfout_data(domain=domain, outfile=outfile)
+
+    def _process_wrfout_data(self, domain=3, outfile='wrfout_processed_d01.nc'):
+        """
+        Same as process_wrfout_data, but without recording its wall time, so that partial_wrf_era5_diff,
+        which runs while wrf.exe does (and is therefore counted in the wrf stage), does not count it twice.
+
         """
         # Absolute path to wrfout data file
         wrfout_file = self.wrfout_file_name(domain=domain)
@@ -1021,7 +1683,7 @@ class WRFModel:
         met_data = met_data.isel(Time=slice(0, -1))
 
         # Write the processed data to a wrfout NetCDF file
-        new_filename = self.DIR_WRFOUT + 'wrfout_processed_d01.nc'
+        new_filename = self.DIR_WRFOUT + outfile
         try:
             met_data.to_netcdf(path=new_filename)
         except KeyError as e:
@@ -1098,6 +1760,7 @@ class WRFModel:
 
         return wrf_ds
 
+    @timed_stage('era5_processing')
     def process_era5_data(self):
         """
         Downloads ERA5 data from the Research Data Archive if it doesn't already exist in self.DIR_ERA5_ROOT,
@@ -1132,9 +1795,7 @@ class WRFModel:
 
         """
         # Process the ERA5 data file unless it already exists in wrfsim.DIR_ERA5_ROOT
-        processed_era_file = self.DIR_ERA5_ROOT + 'ERA5_EastUS_WPD-GHI_' \
-                             + self.forecast_start.strftime('%Y') + '-' \
-                             + self.forecast_start.strftime('%m') + '.nc'
+        processed_era_file = self.era5_file()
         if not os.path.exists(processed_era_file):
             if self.verbose:
                 print(f'Processing ERA5 data for {self.forecast_start.strftime("%m")} '
@@ -1306,7 +1967,8 @@ class WRFModel:
             # Write the processed data back to a NetCDF file
             era_out.to_netcdf(path=processed_era_file)
 
-    def wrf_era5_diff(self, method='ncl'):
+    @timed_stage('regrid_error')
+    def wrf_era5_diff(self, method='ncl', return_hourly=False):
         """
         Computes the difference between the wrf simulation and ERA5
         reanalysis using NCL, xESMF, or PyResample.
@@ -1318,16 +1980,24 @@ class WRFModel:
 
         :param method: str
             Identifying the regridding method ('ncl', 'xesmf', and 'pyresample' are supported).
+        :param return_hourly: boolean (default = False)
+            if True, the domain-summed errors of each hour are also returned.
         :return error: list
             Sum of the absolute error accumulated in each grid cell
             during all time periods in the WRF simulation.
+        :return hourly_error: tuple of numpy arrays
+            (hours since the forecast start, GHI error, WPD error) with one value per wrfout frame,
+            or None if the hourly errors could not be read. Only returned if return_hourly is True.
 
         """
+        hourly_error = []
 
         # Create a wrapper function to calculate the error for the non-NCL methods
         def calculate_error_wrapper(wrfdat, eradat):
             # Calculate the error between the WRF simulation and the ERA5 reanalysis
             wrfdat = wrf_era5_error(wrfdat, eradat)
+            if return_hourly:
+                hourly_error.extend(wrf_era5_hourly_error(wrfdat))
             # Calculate the total error
             return [0, float(wrfdat['total_ghi_error'].sum().values), float(wrfdat['total_wpd_error'].sum().values)]
 
@@ -1338,9 +2008,13 @@ class WRFModel:
         if method == 'ncl':
             error = wrf_era5_regrid_ncl(input_year, input_month, input_day, self.paramstr,
                                         wrfdir=self.DIR_WRFOUT, eradir=self.DIR_ERA5_ROOT)
+            error_file = self.DIR_WRFOUT + 'mae_wrfyera_' + self.paramstr + '.csv'
+            if return_hourly and os.path.exists(error_file):
+                hourly_error.extend(read_ncl_hourly_error(error_file))
         elif method == 'xesmf':
-            wrfdata, eradata = wrf_era5_regrid_xesmf(input_year, input_month,
-                                                     wrfdir=self.DIR_WRFOUT, eradir=self.DIR_ERA5_ROOT)
+            wrfdata, eradata = wrf_era5_regrid_xesmf(wrfdir=self.DIR_WRFOUT, wrffile='wrfout_processed_d01.nc',
+                                                     eradir=self.DIR_ERA5_ROOT,
+                                                     erafile=os.path.basename(self.era5_file()))
             error = calculate_error_wrapper(wrfdata, eradata)
         elif method == 'pyresample':
             wrfdata, eradata = wrf_era5_regrid_pyresample(input_year, input_month,
@@ -1354,14 +2028,29 @@ class WRFModel:
             print(f'!!! Physics options set {self.paramstr} has total\n'
                   f'\tghi error {error[1]} and wpd error {error[2]} kW m-2 day-1')
 
+        if return_hourly:
+            if len(hourly_error) == 0 or len(hourly_error[0]) == 0 or error[1] >= 6.022 * 10 ** 23:
+                return error, None
+            times, ghi_error, wpd_error = hourly_error
+            hours = (np.array(times, dtype='datetime64[s]') - np.datetime64(self.forecast_start, 's')) \
+                / np.timedelta64(1, 'h')
+            return error, (hours, np.array(ghi_error, dtype=float), np.array(wpd_error, dtype=float))
         return error
 
     def archive_wps(self):
-        # Move the geo_em file(s) to a permanent location
-        os.system(self.CMD_MV % (self.DIR_WRFOUT + 'geo_em.*', self.DIR_DATA_ROOT + 'data/domain/'))
+        """
+        Moves the geo_em and met_em files written by WPS to a permanent location so that other
+        simulations with the same dates and domains can use them. Files that were only linked
+        from the permanent location (see run_wps) are left alone.
 
-        # Move the met_em files to a permanent location
-        os.system(self.CMD_MV % (self.DIR_WRFOUT + 'met_em.*', self.DIR_DATA + 'met_em/'))
+        """
+        for pattern, archive_dir in [('geo_em.*', self.DIR_DATA_ROOT + 'data/domain/'),
+                                     ('met_em.*', self.DIR_DATA + 'met_em/')]:
+            wps_files = [file for file in glob.glob(self.DIR_WRFOUT + pattern) if not os.path.islink(file)]
+            if len(wps_files) > 0:
+                os.makedirs(archive_dir, exist_ok=True)
+                for file in wps_files:
+                    rundir.move_file(file, archive_dir)
 
     def wrfout_file_name(self, domain=1):
         """
@@ -1383,7 +2072,7 @@ class WRFModel:
         return wrfout_file
 
 
-def run_all(wrf_sim, disable_timeout=True, verbose=False, save_wps_files=False):
+def run_all(wrf_sim, disable_timeout=True, verbose=False, save_wps_files=False, return_timings=False):
     """
     Using the input physics parameters, date, boundary condition, and domain data,
     this function runs the WRF model.
@@ -1394,9 +2083,13 @@ def run_all(wrf_sim, disable_timeout=True, verbose=False, save_wps_files=False):
         telling runwrf if subprogram timeouts are allowed or not.
     :param verbose: boolean (default = False)
         instructing the program to print everything or just key information to the screen.
+    :param return_timings: boolean (default = False)
+        if True, the runtime accounting of the simulation (see WRFModel.timings) is also returned,
+        with the total wall seconds spent in this function (wall_seconds).
     :return success, runtime: bool, str
         indicating if the simulation finished running successfully and how long it took.
     """
+    start_time = time.time()
     if verbose:
         print('- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -')
         print(f'\nRunning: {wrf_sim.param_ids} from {wrf_sim.forecast_start} to {wrf_sim.forecast_end}')
@@ -1408,6 +2101,7 @@ def run_all(wrf_sim, disable_timeout=True, verbose=False, save_wps_files=False):
                        + wrf_sim.forecast_start.strftime('%m') + '-' \
                        + wrf_sim.forecast_start.strftime('%d') + '_00:00:00'
     if [os.path.exists(file) for file in [wrfout_file_path, orig_wrfout_file_path]].count(True) == 0:
+        wrf_sim.cache_hit = wrf_sim.wps_files_exist()
         # Next, get boundary condition data for the simulation
         # ERA is the only supported data type right now.
         vtable_sfx = wrf_sim.get_bc_data()
@@ -1439,13 +2133,16 @@ def run_all(wrf_sim, disable_timeout=True, verbose=False, save_wps_files=False):
         else:
             runtime = '00h 00m 00s'
     else:
+        wrf_sim.cache_hit = True
         success = True
         runtime = '00h 00m 00s'
-    
+
+    if return_timings:
+        return success, runtime, dict(wrf_sim.timings(), wall_seconds=time.time() - start_time)
     return success, runtime
 
 
-def run_multiple(wrf_sims, disable_timeout=True, verbose=False, save_wps_files=False):
+def run_multiple(wrf_sims, disable_timeout=True, verbose=False, save_wps_files=False, backend=None):
     """
     Runs the simulations specified by the wrf_sims argument.
 
@@ -1455,33 +2152,40 @@ def run_multiple(wrf_sims, disable_timeout=True, verbose=False, save_wps_files=F
         telling runwrf if subprogram timeouts are allowed or not.
     :param verbose: boolean (default = False)
         instructing the program to print everything or just key information to the screen.
+    :param backend: backends instance (default = None)
+        that runs the simulations (e.g., backends.SlurmBackend). If None, a backends.ThreadBackend is used.
 
     """
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        # Start running all the fitness functions that need to be calculated
-        try:
-            sim_threads = []
-            for sim in wrf_sims:
-                # Execute a new thread to run the WRF simulation
-                sim_threads.append(executor.submit(run_all, sim, disable_timeout=disable_timeout,
-                                   verbose=verbose, save_wps_files=save_wps_files))
-
-            # Get the results from the thread pool executor
-            success_matrix = []
-            runtime_matrix = []
-            for thread in sim_threads:
-                try:
-                    success_value, runtime_value = thread.result()
-                except AttributeError:
-                    success_value = None
-                    runtime_value = None
-                success_matrix.append(success_value)
-                runtime_matrix.append(runtime_value)
-
-        except KeyboardInterrupt:
-            # cancel() returns False if it's already done and True if was able to cancel it;
-            # we don't need that return value, so we ignore it with the underscore.
-            for future in sim_threads:
-                _ = future.cancel()
+    own_backend = backend is None
+    if own_backend:
+        backend = ThreadBackend()
+    # Start running all the fitness functions that need to be calculated
+    try:
+        sim_threads = []
+        for sim in wrf_sims:
+            # Execute a new thread to run the WRF simulation
+            sim_threads.append(backend.submit(run_all, sim, disable_timeout=disable_timeout,
+                               verbose=verbose, save_wps_files=save_wps_files))
+
+        # Get the results from the thread pool executor
+        success_matrix = []
+        runtime_matrix = []
+        for thread in sim_threads:
+            try:
+                success_value, runtime_value = thread.result()
+            except AttributeError:
+                success_value = None
+                runtime_value = None
+            success_matrix.append(success_value)
+            runtime_matrix.append(runtime_value)
+
+    except KeyboardInterrupt:
+        # cancel() returns False if it's already done and True if was able to cancel it;
+        # we don't need that return value, so we ignore it with the underscore.
+        for future in sim_threads:
+            _ = future.cancel()
+    finally:
+        if own_backend:
+            backend.shutdown()
     for ii in range(0, len(success_matrix)):
         print(f'Success: {success_matrix[ii]}, Runtime: {runtime_matrix[ii]}')
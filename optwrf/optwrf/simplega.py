@@ -9,6 +9,8 @@ Known Issues/Wishlist:
 import datetime
 import random
 
+import numpy as np
+
 import optwrf.helper_functions as hf
 import optwrf.wrfparams as wrfparams
 import optwrf.runwrf as runwrf
@@ -25,8 +27,11 @@ class Chromosome:
         2. A start date defining when the WRF forecast will begin running.
         3. An end date defining when the WRF forecast will finish running.
         4. A fitness value that will be used to determine how well each instance preforms.
+        5. A status describing how the simulation ended ('complete', 'failed', or 'pruned'
+        if it was cancelled early because it could not beat the elites).
     """
-    def __init__(self, genes, start_date, end_date, fitness=None, ghi_error=None, wpd_error=None, runtime=None):
+    def __init__(self, genes, start_date, end_date, fitness=None, ghi_error=None, wpd_error=None, runtime=None,
+                 status=None):
         self.Genes = genes
         self.Start_date = start_date
         self.End_date = end_date
@@ -34,6 +39,24 @@ class Chromosome:
         self.GHI_error = ghi_error
         self.WPD_error = wpd_error
         self.Runtime = runtime
+        self.Status = status
+
+    def to_dict(self):
+        """
+        Returns every attribute of the Chromosome in a dictionary (e.g., to write to a JSON checkpoint).
+        """
+        return {'genes': [int(gene) for gene in self.Genes], 'start_date': self.Start_date,
+                'end_date': self.End_date, 'fitness': self.Fitness, 'ghi_error': self.GHI_error,
+                'wpd_error': self.WPD_error, 'runtime': self.Runtime, 'status': self.Status}
+
+    @classmethod
+    def from_dict(cls, attributes):
+        """
+        Creates a Chromosome from a dictionary created by to_dict().
+        """
+        return cls(list(attributes['genes']), attributes['start_date'], attributes['end_date'],
+                   attributes['fitness'], attributes['ghi_error'], attributes['wpd_error'],
+                   attributes['runtime'], attributes.get('status'))
 
 
 def display(individual, start_time):
@@ -67,14 +90,15 @@ def display_pop(population, fn_display):
 
 def generate_genes():
     """
-    Generates genes for a new individual to be placed within a population.
+    Generates genes for a new individual to be placed within a population,
+    drawn uniformly from the valid physics parameter combinations (see wrfparams.ValidCombinations).
 
     :return:
     new individual: list
         list of WRF model physics parameters
 
     """
-    new_individual = wrfparams.flexible_generate()
+    new_individual = wrfparams.load_valid_combinations().sample()
     return new_individual
 
 
@@ -119,7 +143,163 @@ def generate_random_dates(year=2011, n_days=1, input_start_date=None):
     return random_start_date, random_end_date
 
 
-def generate_population(pop_size, initial_population=None):
+class DatePolicy:
+    """
+    This class chooses the start dates of new individuals (see generate_population and crossover).
+    Simulations that share a start date share their boundary condition data, WPS output, and processed
+    ERA5 month (see optimize_wrf_physics.stage_wrf_inputs), so reusing dates saves the preprocessing time.
+    Four policies are available:
+        1. 'random' draws a random day of the year for every individual (the original behavior).
+        2. 'common' draws n_common random dates at the start of each generation, and every new
+        individual gets one of them, so each date is staged once per generation.
+        3. 'seasonal' is like 'common', but the common dates are drawn from each season in turn,
+        so that every generation covers the whole year.
+        4. 'cached' prefers dates whose inputs already exist on disk (or that were already drawn in the
+        same generation); a fraction explore_frac of the individuals still get a random date, so that
+        the temporal coverage keeps growing.
+    The policy also counts how many of the dates it draws hit the cache, and estimates the time saved.
+
+    :param policy: string (default = 'random')
+        'random', 'common', 'seasonal', or 'cached'.
+    :param year: integer (default = 2011)
+        year within which dates are drawn.
+    :param n_days: integer (default = 1)
+        number of days between the start and the end dates of each simulation.
+    :param n_common: integer (default = 4)
+        number of dates drawn for each generation by the 'common' and 'seasonal' policies.
+    :param explore_frac: float (default = 0.25)
+        value between 0 - 1 defining the fraction of random dates drawn by the 'cached' policy.
+    :param staging_seconds: float (default = 1800)
+        estimated time needed to stage the inputs of one date that is not in the cache.
+    :param is_cached: function (default = None)
+        that takes a start date and an end date (strings) and returns True if their inputs exist on disk.
+        If None, runwrf.WRFModel.inputs_exist is used with the directories in setup_yaml.
+    :param setup_yaml: string (default = 'dirpath.yml')
+        directory file used by the default is_cached function.
+
+    """
+    policies = ['random', 'common', 'seasonal', 'cached']
+    seasons = ['winter', 'spring', 'summer', 'fall']
+
+    def __init__(self, policy='random', year=2011, n_days=1, n_common=4, explore_frac=0.25,
+                 staging_seconds=1800, is_cached=None, setup_yaml='dirpath.yml'):
+        if policy not in self.policies:
+            print(f'Date policy {policy} is not supported; please use one of {self.policies}.')
+            raise ValueError
+        self.policy = policy
+        self.year = year
+        self.n_days = n_days
+        self.n_common = n_common
+        self.explore_frac = explore_frac
+        self.staging_seconds = staging_seconds
+        self.is_cached = is_cached if is_cached is not None else self._inputs_exist
+        self.setup_yaml = setup_yaml
+        # Every day of the year, grouped by season
+        first_day = datetime.date(year, 1, 1)
+        self.days = [first_day + datetime.timedelta(days=ii)
+                     for ii in range((datetime.date(year, 12, 31) - first_day).days)]
+        self.season_days = {season: [day for day in self.days if hf.date2season(day) == season]
+                            for season in self.seasons}
+        self.gen = -1
+        self.common_dates = []
+        self.cached_dates = set()
+        self.drawn_dates = set()
+        self.history = []
+        self.new_generation()
+
+    def _inputs_exist(self, start_date, end_date):
+        try:
+            wrf_sim = runwrf.WRFModel([10, 1, 1, 2, 2, 3, 2], start_date, end_date,
+                                      setup_yaml=self.setup_yaml, verbose=False)
+            return wrf_sim.inputs_exist()
+        except (OSError, TypeError, AttributeError):
+            # The directories are not set up on this computer
+            return False
+
+    def _format(self, day):
+        return day.strftime('%b %d %Y'), (day + datetime.timedelta(days=self.n_days)).strftime('%b %d %Y')
+
+    def new_generation(self):
+        """
+        Starts a new generation: draws the common dates (for the 'common' and 'seasonal' policies)
+        or finds the cached dates (for the 'cached' policy), and starts counting the cache hits of the generation.
+        """
+        self.gen += 1
+        self.drawn_dates = set()
+        self.history.append({'gen': self.gen, 'n_drawn': 0, 'n_hits': 0})
+        if self.policy == 'common':
+            self.common_dates = random.sample(self.days, min(self.n_common, len(self.days)))
+        elif self.policy == 'seasonal':
+            # Rotate the first season, so that every season is covered even if n_common < 4
+            self.common_dates = [random.choice(self.season_days[self.seasons[(self.gen + ii) % 4]])
+                                 for ii in range(0, self.n_common)]
+        elif self.policy == 'cached':
+            self.refresh_cache()
+
+    def refresh_cache(self):
+        """
+        Finds the dates whose inputs already exist on disk (used by the 'cached' policy).
+        Every day of the year is checked, so this should be called at most once per generation.
+        """
+        self.cached_dates = set(day for day in self.days
+                                if day in self.cached_dates or self.is_cached(*self._format(day)))
+
+    def draw(self):
+        """
+        Draws the start and end dates of a new individual.
+
+        :return start_date: string
+            specifying the simulation start date.
+        :return end_date: string
+            specifying the simulation end date.
+
+        """
+        if self.policy in ['common', 'seasonal']:
+            day = random.choice(self.common_dates)
+        elif self.policy == 'cached' and random.random() >= self.explore_frac \
+                and len(self.cached_dates | self.drawn_dates) > 0:
+            day = random.choice(sorted(self.cached_dates | self.drawn_dates))
+        else:
+            day = random.choice(self.days)
+        start_date, end_date = self._format(day)
+        # Dates drawn earlier in the generation are staged once, and shared with this individual
+        stats = self.history[-1]
+        stats['n_drawn'] += 1
+        if day in self.drawn_dates or day in self.cached_dates or self.is_cached(start_date, end_date):
+            stats['n_hits'] += 1
+            self.cached_dates.add(day)
+        self.drawn_dates.add(day)
+        return start_date, end_date
+
+    def stats(self, gen=None):
+        """
+        Returns the cache statistics of a generation.
+
+        :param gen: integer (default = None)
+            generation number; if None, the current generation is used.
+        :return stats: dictionary
+            with the number of dates drawn (n_drawn), the number of cache hits (n_hits), the hit rate
+            (hit_rate), and the estimated preprocessing time saved in seconds (seconds_saved).
+
+        """
+        stats = dict(self.history[-1] if gen is None else self.history[gen])
+        stats['hit_rate'] = stats['n_hits'] / stats['n_drawn'] if stats['n_drawn'] > 0 else float('nan')
+        stats['seconds_saved'] = stats['n_hits'] * self.staging_seconds
+        return stats
+
+    def report(self, gen=None):
+        """
+        Prints the cache statistics of a generation (see stats).
+        """
+        stats = self.stats(gen)
+        if stats['n_drawn'] == 0:
+            return
+        print(f'Date policy {self.policy}: {stats["n_hits"]} of {stats["n_drawn"]} start dates '
+              f'reused staged inputs ({stats["hit_rate"] * 100:.1f}%), saving about '
+              f'{hf.strfdelta(datetime.timedelta(seconds=stats["seconds_saved"]))} of preprocessing')
+
+
+def generate_population(pop_size, initial_population=None, date_policy=None):
     """
     This method provides a way to randomly generate an initial population for the GA.
 
@@ -130,6 +310,8 @@ def generate_population(pop_size, initial_population=None):
         parameter combinations and start/end dates. If more inidividuals than
         the population size are specified, the ones listed first will be placed
         into the population.
+    :param date_policy: DatePolicy instance (default = None)
+        that chooses the start dates; if None, a random day in 2011 is drawn for each individual.
     :return: population: list of Chromosome instances
 
     """
@@ -142,7 +324,7 @@ def generate_population(pop_size, initial_population=None):
             population = initial_population[0:pop_size - 1]
     while len(population) < pop_size:
         new_genes = generate_genes()
-        start_date, end_date = generate_random_dates()
+        start_date, end_date = date_policy.draw() if date_policy is not None else generate_random_dates()
         new_individual = Chromosome(new_genes, start_date, end_date)
         population.append(new_individual)
     return population
@@ -181,13 +363,17 @@ def selection(population, pop_size):
     return mating_population
 
 
-def crossover(mating_population):
+def crossover(mating_population, date_policy=None):
     """
     The crossover operator takes in the genes of two parent individuals
     and randomly exchanges one gene between the two producing two offspring.
+    The surface layer scheme is exchanged together with the PBL scheme, and only
+    genes that can be exchanged without producing an invalid combination are chosen.
 
     :param mating_population: list of Chromosome instances
         population of individuals that have been deemed fit enough by the selection operator.
+    :param date_policy: DatePolicy instance (default = None)
+        that chooses the start dates; if None, a random day in 2011 is drawn for each child.
     :return: offspring_population: list of Chromosome instances
         population of individuals created from the genes of mating population.
 
@@ -198,10 +384,13 @@ def crossover(mating_population):
         child1_genes = parent1_genes
         parent2_genes = mating_population[parent_idxs[1]].Genes[:]
         child2_genes = parent2_genes
-        gene_idx = random.randint(0, len(parent1_genes) - 1)
+        gene_idx = random.choice(swappable_genes(parent1_genes, parent2_genes))
         child1_genes[gene_idx], child2_genes[gene_idx] = parent2_genes[gene_idx], parent1_genes[gene_idx]
-        child1_start_date, child1_end_date = generate_random_dates()
-        child2_start_date, child2_end_date = generate_random_dates()
+        if gene_idx == 4:
+            child1_genes[6], child2_genes[6] = parent2_genes[6], parent1_genes[6]
+        draw_dates = date_policy.draw if date_policy is not None else generate_random_dates
+        child1_start_date, child1_end_date = draw_dates()
+        child2_start_date, child2_end_date = draw_dates()
         offspring_population = [Chromosome(child1_genes, child1_start_date, child1_end_date),
                                 Chromosome(child2_genes, child2_start_date, child2_end_date)]
     else:
@@ -209,10 +398,38 @@ def crossover(mating_population):
     return offspring_population
 
 
+def swappable_genes(genes1, genes2):
+    """
+    Finds the core genes (0 - 5) that can be exchanged between two individuals such that both
+    children are valid combinations (exchanging gene 4, the PBL scheme, also exchanges gene 6).
+    If no gene can be exchanged, the genes that are identical in both parents are returned,
+    or all the core genes if there are none (i.e., the parents were not valid combinations).
+
+    :param genes1: list of integers
+    :param genes2: list of integers
+    :return gene_idxs: list of integers
+
+    """
+    combinations = wrfparams.load_valid_combinations()
+    children = []
+    for gene_idx in range(6):
+        child1, child2 = list(genes1), list(genes2)
+        child1[gene_idx], child2[gene_idx] = genes2[gene_idx], genes1[gene_idx]
+        if gene_idx == 4:
+            child1[6], child2[6] = genes2[6], genes1[6]
+        children.extend([child1, child2])
+    valid = combinations.is_valid(children).reshape(6, 2).all(axis=1)
+    gene_idxs = [gene_idx for gene_idx in range(6) if valid[gene_idx] and genes1[gene_idx] != genes2[gene_idx]]
+    if len(gene_idxs) == 0:
+        gene_idxs = [gene_idx for gene_idx in range(6) if genes1[gene_idx] == genes2[gene_idx]]
+    return gene_idxs if len(gene_idxs) > 0 else list(range(6))
+
+
 def mutate(offspring_population, mutation_rate=0.02, verbose=False):
     """
     The mutate operator takes in the genes of one offspring
-    and randomly replaces one of the genes from the set of choices.
+    and randomly replaces one of the genes from the set of choices
+    that keep the offspring a valid combination (see wrfparams.ValidCombinations).
 
     :param offspring_population: list of Chromosome instances
         population of individuals created from the genes of mating population.
@@ -228,11 +445,14 @@ def mutate(offspring_population, mutation_rate=0.02, verbose=False):
     mutation_int = int(1/mutation_rate)
     for child in offspring_population:
         if random.randint(1, mutation_int) is 1:
-            new_child = generate_genes()
-            gene_idx = random.randint(0, len(new_child) - 1)
+            # Only the core genes are drawn (as in mutate_population); the surface layer scheme (gene 6)
+            # follows the PBL scheme (gene 4), so drawing it would mutate the PBL scheme twice as often
+            gene_idx = random.randrange(6)
             if verbose:
                 print('--> Mutating gene in position {} in child {}.'.format(gene_idx, child.Genes))
-            child.Genes[gene_idx] = new_child[gene_idx]
+            neighbours = wrfparams.load_valid_combinations().neighbours(child.Genes, gene_idx)
+            if len(neighbours) > 0:
+                child.Genes[:] = [int(gene) for gene in neighbours[random.randrange(len(neighbours))]]
     return offspring_population
 
 
@@ -280,3 +500,563 @@ def find_elites(population, n_elites, fn_display_pop, verbose=False):
         print('The elites moving to the next generation are: ')
         fn_display_pop(elites)
     return elites
+
+
+def objectives(individual):
+    """
+    Returns the objectives that are minimized in the multi-objective (Pareto) mode:
+    the total GHI error and the total WPD error.
+    """
+    return individual.GHI_error, individual.WPD_error
+
+
+def dominates(objectives1, objectives2):
+    """
+    Checks whether one set of objectives Pareto-dominates another, i.e., it is no worse
+    in every objective and strictly better in at least one (lower is better).
+
+    :param objectives1: tuple of floats
+    :param objectives2: tuple of floats
+    :return: boolean (True/False)
+
+    """
+    return all(o1 <= o2 for o1, o2 in zip(objectives1, objectives2)) and \
+        any(o1 < o2 for o1, o2 in zip(objectives1, objectives2))
+
+
+def non_dominated_sort(population):
+    """
+    Sorts the population into Pareto fronts with the fast non-dominated sort of NSGA-II
+    (Deb et al., 2002). The first front contains the individuals that no other individual dominates,
+    the second front those that are only dominated by the first front, and so on.
+
+    :param population: list of Chromosome instances
+        with GHI_error and WPD_error values.
+    :return fronts: list of lists of integers
+        indices into the population of the individuals in each front, from best to worst.
+
+    """
+    points = [objectives(individual) for individual in population]
+    dominated_by = [[] for _ in points]
+    n_dominating = [0 for _ in points]
+    for i in range(0, len(points)):
+        for j in range(i + 1, len(points)):
+            if dominates(points[i], points[j]):
+                dominated_by[i].append(j)
+                n_dominating[j] += 1
+            elif dominates(points[j], points[i]):
+                dominated_by[j].append(i)
+                n_dominating[i] += 1
+    fronts = [[i for i in range(0, len(points)) if n_dominating[i] == 0]]
+    while len(fronts[-1]) > 0:
+        next_front = []
+        for i in fronts[-1]:
+            for j in dominated_by[i]:
+                n_dominating[j] -= 1
+                if n_dominating[j] == 0:
+                    next_front.append(j)
+        fronts.append(sorted(next_front))
+    return fronts[0:-1]
+
+
+def crowding_distance(population, front):
+    """
+    Computes the NSGA-II crowding distance of each individual in a front: the sum over the objectives
+    of the (normalized) distance between its two neighbours. Individuals at the ends of the front get
+    an infinite distance so that the extremes of the trade-off are always kept.
+
+    :param population: list of Chromosome instances.
+    :param front: list of integers
+        indices into the population of the individuals in one front.
+    :return distances: dictionary
+        mapping each index in the front to its crowding distance.
+
+    """
+    distances = {i: 0.0 for i in front}
+    if len(front) <= 2:
+        return {i: float('inf') for i in front}
+    points = {i: objectives(population[i]) for i in front}
+    for m in range(0, len(points[front[0]])):
+        order = sorted(front, key=lambda i: points[i][m])
+        span = points[order[-1]][m] - points[order[0]][m]
+        distances[order[0]] = distances[order[-1]] = float('inf')
+        if span == 0:
+            continue
+        for k in range(1, len(order) - 1):
+            distances[order[k]] += (points[order[k + 1]][m] - points[order[k - 1]][m]) / span
+    return distances
+
+
+def pareto_ranking(population):
+    """
+    Ranks each individual by its Pareto front (0 is the best front) and its crowding distance.
+
+    :param population: list of Chromosome instances.
+    :return ranks: list of integers
+        front of each individual.
+    :return distances: list of floats
+        crowding distance of each individual within its front.
+
+    """
+    ranks = [0 for _ in population]
+    distances = [0.0 for _ in population]
+    for rank, front in enumerate(non_dominated_sort(population)):
+        for i, distance in crowding_distance(population, front).items():
+            ranks[i] = rank
+            distances[i] = distance
+    return ranks, distances
+
+
+def pareto_selection(population, n_selected):
+    """
+    The multi-objective selection operator: binary tournaments that prefer the individual in the better
+    Pareto front and, within the same front, the one in the less crowded part of the front.
+
+    :param population: list of Chromosome instances
+        with GHI_error and WPD_error values.
+    :param n_selected: integer
+        size of the mating population.
+    :return mating_population: list of Chromosome instances
+
+    """
+    ranks, distances = pareto_ranking(population)
+    mating_population = []
+    while len(mating_population) < n_selected:
+        i, j = random.sample(range(0, len(population)), 2) if len(population) > 1 else (0, 0)
+        if (ranks[j], -distances[j]) < (ranks[i], -distances[i]):
+            i = j
+        mating_population.append(population[i])
+    return mating_population
+
+
+def pareto_survivors(population, n_survivors):
+    """
+    NSGA-II environmental selection: fills the next population front by front, and breaks the tie in the
+    last front that does not fit completely by keeping its least crowded individuals. Because parents and
+    offspring compete together, the best trade-offs found so far are never lost.
+
+    :param population: list of Chromosome instances
+        (usually the parents and their offspring) with GHI_error and WPD_error values.
+    :param n_survivors: integer
+        size of the next population.
+    :return survivors: list of Chromosome instances
+
+    """
+    survivors = []
+    for front in non_dominated_sort(population):
+        if len(survivors) + len(front) <= n_survivors:
+            survivors.extend([population[i] for i in front])
+        else:
+            distances = crowding_distance(population, front)
+            order = sorted(front, key=lambda i: -distances[i])
+            survivors.extend([population[i] for i in order[0:n_survivors - len(survivors)]])
+        if len(survivors) >= n_survivors:
+            break
+    return survivors
+
+
+def pareto_front(population):
+    """
+    Returns the individuals in the first Pareto front (i.e., that no other individual dominates),
+    ordered by their GHI error. Duplicate individuals (same genes and start date) are only returned once.
+
+    :param population: list of Chromosome instances.
+    :return front: list of Chromosome instances
+
+    """
+    front = []
+    seen = set()
+    for i in non_dominated_sort(population)[0] if len(population) > 0 else []:
+        key = (tuple(population[i].Genes), population[i].Start_date)
+        if key not in seen:
+            seen.add(key)
+            front.append(population[i])
+    return sorted(front, key=lambda individual: objectives(individual))
+
+
+class ChromosomeView:
+    """
+    A thin view of one individual in a Population that provides the same attributes as a
+    Chromosome (Genes, Start_date, End_date, Fitness, GHI_error, WPD_error, Runtime, and Status).
+    Reading an attribute reads from the population arrays, and setting an attribute writes to them.
+    """
+    __slots__ = ['population', 'index']
+
+    def __init__(self, population, index):
+        self.population = population
+        self.index = index
+
+    @property
+    def Genes(self):
+        return [int(gene) for gene in self.population.genes[self.index]]
+
+    @Genes.setter
+    def Genes(self, genes):
+        self.population.genes[self.index] = genes
+
+    @property
+    def Start_date(self):
+        return self.population.start_date_str(self.index)
+
+    @property
+    def End_date(self):
+        return self.population.end_date_str(self.index)
+
+    @property
+    def Fitness(self):
+        return self.population.get_value('fitness', self.index)
+
+    @Fitness.setter
+    def Fitness(self, fitness):
+        self.population.fitness[self.index] = fitness if fitness is not None else np.nan
+
+    @property
+    def GHI_error(self):
+        return self.population.get_value('ghi_error', self.index)
+
+    @GHI_error.setter
+    def GHI_error(self, ghi_error):
+        self.population.ghi_error[self.index] = ghi_error if ghi_error is not None else np.nan
+
+    @property
+    def WPD_error(self):
+        return self.population.get_value('wpd_error', self.index)
+
+    @WPD_error.setter
+    def WPD_error(self, wpd_error):
+        self.population.wpd_error[self.index] = wpd_error if wpd_error is not None else np.nan
+
+    @property
+    def Runtime(self):
+        return self.population.runtime[self.index]
+
+    @Runtime.setter
+    def Runtime(self, runtime):
+        self.population.runtime[self.index] = runtime
+
+    @property
+    def Status(self):
+        return self.population.status[self.index]
+
+    @Status.setter
+    def Status(self, status):
+        self.population.status[self.index] = status
+
+
+class Population:
+    """
+    This class provides an array-backed population for the genetic algorithm, so that very large
+    populations (e.g., when the fitness is predicted by a surrogate model or by the test fitness function)
+    can be selected, crossed over, and mutated with vectorized operations instead of Python loops.
+    The genes of all individuals are held in an integer matrix (one row per individual, one column per
+    physics parameter), start dates are held as datetime64[D] values, and fitness values and errors are
+    held as floats (NaN means that the individual has not been evaluated yet).
+
+    Indexing a Population with an integer returns a ChromosomeView, so code written for a list of
+    Chromosome instances keeps working; indexing with an array or slice returns a new Population.
+    """
+    def __init__(self, genes, start_dates, n_days=1, fitness=None, ghi_error=None, wpd_error=None,
+                 runtime=None, status=None):
+        self.genes = np.asarray(genes, dtype=np.int64).reshape(len(genes), -1)
+        self.start_dates = np.asarray(start_dates, dtype='datetime64[D]')
+        self.n_days = n_days
+        n_individuals = len(self.genes)
+        self.fitness = self._floats(fitness, n_individuals)
+        self.ghi_error = self._floats(ghi_error, n_individuals)
+        self.wpd_error = self._floats(wpd_error, n_individuals)
+        self.runtime = self._objects(runtime, n_individuals)
+        self.status = self._objects(status, n_individuals)
+
+    @staticmethod
+    def _floats(values, n_individuals):
+        if values is None:
+            return np.full(n_individuals, np.nan)
+        return np.array([np.nan if value is None else value for value in values], dtype=float) \
+            if isinstance(values, list) else np.asarray(values, dtype=float).copy()
+
+    @staticmethod
+    def _objects(values, n_individuals):
+        array = np.empty(n_individuals, dtype=object)
+        if values is not None:
+            array[:] = values
+        return array
+
+    def __len__(self):
+        return len(self.genes)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError('population index out of range')
+            return ChromosomeView(self, int(index))
+        return Population(self.genes[index], self.start_dates[index], self.n_days, self.fitness[index],
+                          self.ghi_error[index], self.wpd_error[index], self.runtime[index], self.status[index])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield ChromosomeView(self, index)
+
+    def get_value(self, name, index):
+        """
+        Returns the fitness (or error) of one individual, or None if it has not been evaluated.
+        """
+        value = getattr(self, name)[index]
+        return None if np.isnan(value) else float(value)
+
+    def start_date_str(self, index):
+        return self.start_dates[index].astype(datetime.date).strftime('%b %d %Y')
+
+    def end_date_str(self, index):
+        end_date = self.start_dates[index] + np.timedelta64(self.n_days, 'D')
+        return end_date.astype(datetime.date).strftime('%b %d %Y')
+
+    @classmethod
+    def from_chromosomes(cls, population):
+        """
+        Creates a Population from a list of Chromosome instances.
+        """
+        start_dates = [hf.format_date(individual.Start_date).date() for individual in population]
+        population = list(population)
+        return cls([individual.Genes for individual in population], start_dates,
+                   fitness=[individual.Fitness for individual in population],
+                   ghi_error=[individual.GHI_error for individual in population],
+                   wpd_error=[individual.WPD_error for individual in population],
+                   runtime=[individual.Runtime for individual in population],
+                   status=[getattr(individual, 'Status', None) for individual in population])
+
+    def to_chromosomes(self):
+        """
+        Returns the individuals in the Population as a list of (independent) Chromosome instances.
+        """
+        return [Chromosome(view.Genes, view.Start_date, view.End_date, view.Fitness, view.GHI_error,
+                           view.WPD_error, view.Runtime, view.Status) for view in self]
+
+    @classmethod
+    def concatenate(cls, populations):
+        """
+        Joins several populations (with the same n_days) into one.
+        """
+        return cls(np.concatenate([pop.genes for pop in populations]),
+                   np.concatenate([pop.start_dates for pop in populations]), populations[0].n_days,
+                   np.concatenate([pop.fitness for pop in populations]),
+                   np.concatenate([pop.ghi_error for pop in populations]),
+                   np.concatenate([pop.wpd_error for pop in populations]),
+                   np.concatenate([pop.runtime for pop in populations]),
+                   np.concatenate([pop.status for pop in populations]))
+
+    def best(self):
+        """
+        Returns a view of the individual with the best (lowest) fitness.
+        """
+        return self[int(np.nanargmin(self.fitness))]
+
+    def elites(self, n_elites):
+        """
+        Returns the n_elites individuals with the best fitness as a new Population.
+        """
+        n_elites = min(n_elites, len(self))
+        order = np.argpartition(np.nan_to_num(self.fitness, nan=np.inf), n_elites - 1)[0:n_elites]
+        order = order[np.argsort(self.fitness[order], kind='stable')]
+        return self[order]
+
+
+def random_genes(n_individuals, combinations=None, rng=None):
+    """
+    Generates the genes of many individuals at once, drawn uniformly from the valid
+    physics parameter combinations (see wrfparams.ValidCombinations).
+
+    :param n_individuals: integer
+        number of sets of genes to generate.
+    :param combinations: wrfparams.ValidCombinations (default = None)
+        index of the valid combinations; loaded from params.yml if None.
+    :param rng: numpy.random.Generator (default = None)
+    :return genes: numpy array of integers
+        with one row per individual and one column per physics parameter.
+
+    """
+    combinations = combinations if combinations is not None else wrfparams.load_valid_combinations()
+    return combinations.sample(n_individuals, rng if rng is not None else np.random.default_rng())
+
+
+def random_start_dates(n_individuals, year=2011, rng=None):
+    """
+    Vectorized version of generate_random_dates: draws random start dates within the year.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    first_day = np.datetime64(f'{year}-01-01', 'D')
+    n_days = (np.datetime64(f'{year}-12-31', 'D') - first_day).astype(int)
+    return first_day + rng.integers(0, n_days, n_individuals).astype('timedelta64[D]')
+
+
+def random_population(pop_size, combinations=None, rng=None):
+    """
+    Vectorized version of generate_population: creates a Population of random individuals.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    return Population(random_genes(pop_size, combinations, rng), random_start_dates(pop_size, rng=rng))
+
+
+def tournament_selection(population, n_selected, tournament_size, rng=None):
+    """
+    Vectorized tournament selection: each of the n_selected tournaments draws tournament_size
+    individuals (with replacement, so that the memory used does not grow with the population size)
+    and keeps the fittest. Individuals that have not been evaluated never win a tournament
+    against individuals that have.
+
+    :param population: Population
+        with fitness values.
+    :param n_selected: integer
+        size of the mating population.
+    :param tournament_size: integer
+        number of individuals in each tournament.
+    :param rng: numpy.random.Generator (default = None)
+    :return mating_population: Population
+
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    contestants = rng.integers(0, len(population), (n_selected, tournament_size))
+    fitness = np.nan_to_num(population.fitness, nan=np.inf)[contestants]
+    winners = contestants[np.arange(n_selected), np.argmin(fitness, axis=1)]
+    return population[winners]
+
+
+def _breed(mating_population, n_offspring, rng, child_mask):
+    """
+    Pairs random parents from the mating population and creates two complementary children from
+    each pair: child 1 takes the genes of parent 1 where child_mask is True and of parent 2 elsewhere.
+    The surface layer scheme is always inherited with the PBL scheme, and children that are not valid
+    combinations (see wrfparams.ValidCombinations) are replaced by a copy of their first parent.
+    Children are given new random start dates (as in crossover).
+    """
+    n_pairs = (n_offspring + 1) // 2
+    parent1 = mating_population.genes[rng.integers(0, len(mating_population), n_pairs)]
+    parent2 = mating_population.genes[rng.integers(0, len(mating_population), n_pairs)]
+    mask = child_mask(n_pairs, parent1.shape[1])
+    mask[:, 6] = mask[:, 4]
+    parents = np.concatenate([parent1, parent2])
+    children = np.concatenate([np.where(mask, parent1, parent2), np.where(mask, parent2, parent1)])
+    valid = wrfparams.load_valid_combinations().is_valid(children)
+    children = np.where(valid[:, None], children, parents)[0:n_offspring]
+    return Population(children, random_start_dates(n_offspring, rng=rng), mating_population.n_days)
+
+
+def uniform_crossover(mating_population, n_offspring, swap_prob=0.5, rng=None):
+    """
+    Vectorized uniform crossover: each gene of each child is taken from either parent
+    with probability swap_prob.
+
+    :param mating_population: Population
+    :param n_offspring: integer
+        number of children to create.
+    :param swap_prob: float (default = 0.5)
+        probability that a gene is taken from the second parent.
+    :param rng: numpy.random.Generator (default = None)
+    :return offspring_population: Population
+        of children without fitness values.
+
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    return _breed(mating_population, n_offspring, rng,
+                  lambda n_pairs, n_genes: rng.random((n_pairs, n_genes)) >= swap_prob)
+
+
+def one_point_crossover(mating_population, n_offspring, rng=None):
+    """
+    Vectorized one-point crossover: the genes before a random cut point come from one parent,
+    and the genes after it come from the other.
+
+    :param mating_population: Population
+    :param n_offspring: integer
+        number of children to create.
+    :param rng: numpy.random.Generator (default = None)
+    :return offspring_population: Population
+        of children without fitness values.
+
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    return _breed(mating_population, n_offspring, rng,
+                  lambda n_pairs, n_genes: np.arange(n_genes) < rng.integers(1, n_genes, n_pairs)[:, None])
+
+
+def mutate_population(offspring_population, mutation_rate=0.02, combinations=None, rng=None):
+    """
+    Vectorized version of mutate: each child is mutated with probability mutation_rate by
+    replacing one randomly chosen core gene with the same gene from a random valid combination
+    (the surface layer scheme follows the PBL scheme). Mutations that would produce an invalid
+    combination are not applied.
+
+    :param offspring_population: Population
+        mutated in place.
+    :param mutation_rate: float (default = 0.02)
+    :param combinations: wrfparams.ValidCombinations (default = None)
+        index of the valid combinations; loaded from params.yml if None.
+    :param rng: numpy.random.Generator (default = None)
+    :return offspring_population: Population
+        mutated offspring population.
+
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    combinations = combinations if combinations is not None else wrfparams.load_valid_combinations()
+    mutants = np.flatnonzero(rng.random(len(offspring_population)) < mutation_rate)
+    if len(mutants) > 0:
+        new_genes = combinations.sample(len(mutants), rng)
+        gene_idx = rng.integers(0, 6, len(mutants))
+        mutated = offspring_population.genes[mutants].copy()
+        mutated[np.arange(len(mutants)), gene_idx] = new_genes[np.arange(len(mutants)), gene_idx]
+        mutated[:, 6] = combinations.sfclay_lookup[mutated[:, 4]]
+        valid = combinations.is_valid(mutated)
+        offspring_population.genes[mutants[valid]] = mutated[valid]
+    return offspring_population
+
+
+def evolve_population(population, fitness_fn, n_generations, elite_pct=0.08, mutation_rate=0.02,
+                      crossover='uniform', rng=None, verbose=False):
+    """
+    Runs the genetic algorithm on a Population with the vectorized operators. This is meant for
+    fitness functions that score a whole population at once, such as a surrogate model.
+
+    :param population: Population
+        initial population (evaluated or not).
+    :param fitness_fn: function
+        taking a Population and returning a numpy array with the fitness of each individual.
+    :param n_generations: integer
+        number of generations.
+    :param elite_pct: float (default = 0.08)
+        fraction of the population moved to the next generation unchanged.
+    :param mutation_rate: float (default = 0.02)
+    :param crossover: string (default = 'uniform')
+        crossover operator, 'uniform' or 'one_point'.
+    :param rng: numpy.random.Generator (default = None)
+    :param verbose: boolean (default=False)
+        determining whether or not to print lots of model information to the screen.
+    :return population: Population
+        final, evaluated population.
+
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    if crossover == 'uniform':
+        fn_crossover = uniform_crossover
+    elif crossover == 'one_point':
+        fn_crossover = one_point_crossover
+    else:
+        print(f'Crossover {crossover} is not supported; please use uniform or one_point.')
+        raise ValueError
+    combinations = wrfparams.load_valid_combinations()
+    pop_size = len(population)
+    n_elites = max(int(elite_pct * pop_size), 1)
+    tournament_size = max(int(0.5 * pop_size), 1) if pop_size < 30 else max(int(0.1 * pop_size), 1)
+    tournament_size = min(tournament_size, 32)
+    unevaluated = np.isnan(population.fitness)
+    if unevaluated.any():
+        population.fitness[unevaluated] = fitness_fn(population[unevaluated])
+    for gen in range(1, n_generations + 1):
+        mating_population = tournament_selection(population, max(pop_size // 2, 2), tournament_size, rng)
+        offspring = fn_crossover(mating_population, pop_size - n_elites, rng=rng)
+        offspring = mutate_population(offspring, mutation_rate, combinations, rng)
+        offspring.fitness[:] = fitness_fn(offspring)
+        population = Population.concatenate([offspring, population.elites(n_elites)])
+        if verbose:
+            print(f'Generation {gen}: best fitness {np.nanmin(population.fitness)}')
+    return population
@@ -0,0 +1,414 @@
+"""
+An asyncio supervisor that drives many WRF simulations (see runwrf.WRFModel) from one lightweight process.
+
+runwrf.run_multiple spends one thread per simulation, and each thread blocks for hours while it waits
+for WPS, real.exe, and wrf.exe. Here, each stage is a coroutine instead: jobs are submitted with
+asyncio.create_subprocess_exec, the waits for the log files (see watcher.CompletionWatcher.wait_async)
+sleep on the event loop, and only the short stages that do blocking file I/O (get_bc_data, wrfdir_setup,
+prepare_namelists, and archiving the WPS files) run in the loop's default executor. run_multiple bounds
+the number of simulations that run at once with a semaphore, so hundreds of simulations can be queued.
+
+Cancelling a simulation (e.g., with Ctrl-C in supervise, or by cancelling the task that runs it)
+cancels the batch job (scancel or qdel) or kills the local process group that runs the current stage,
+instead of leaving it running unattended.
+
+    results = supervisor.supervise(wrf_sims, max_concurrent=200, disable_timeout=False)
+
+
+Known Issues/Wishlist:
+- get_bc_data downloads run in the default executor, so at most a few of them run at the same time.
+- The fitness functions of optimize_wrf_physics still run each simulation in a thread of a backend
+(see backends), because scoring a simulation is CPU bound.
+
+"""
+
+import asyncio
+import datetime
+import functools
+import glob
+import os
+import shlex
+import sys
+import time
+
+import optwrf.helper_functions as hf
+import optwrf.rundir as rundir
+from optwrf.helper_functions import print_last_3lines
+from optwrf.runwrf import WRFMonitor
+
+
+def async_timed_stage(stage):
+    """
+    Decorator that adds the wall time of a coroutine function that runs a stage of wrf_sim (its first argument)
+    to the total of the stage in WRFModel.stage_seconds (the asyncio counterpart of runwrf.timed_stage).
+
+    :param stage: string
+        one of runwrf.stages.
+
+    """
+    def decorator(coroutine_fn):
+        @functools.wraps(coroutine_fn)
+        async def wrapper(wrf_sim, *args, **kwargs):
+            start_time = time.time()
+            try:
+                return await coroutine_fn(wrf_sim, *args, **kwargs)
+            finally:
+                wrf_sim.add_stage_seconds(stage, time.time() - start_time)
+        return wrapper
+    return decorator
+
+
+async def in_executor(fn, *args, **kwargs):
+    """
+    Runs a blocking function in the default executor of the running event loop and returns its result.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(fn, *args, **kwargs))
+
+
+async def run_command(cmd):
+    """
+    Runs a command (without a shell) to completion.
+
+    :param cmd: string
+        command, e.g., WRFModel.CMD_LINK_GRIB.
+    :return returncode: integer
+    :return output: string
+        standard output of the command.
+
+    """
+    proc = await asyncio.create_subprocess_exec(*shlex.split(cmd), stdout=asyncio.subprocess.PIPE)
+    try:
+        stdout, _ = await proc.communicate()
+    except asyncio.CancelledError:
+        if proc.returncode is None:
+            proc.kill()
+        raise
+    return proc.returncode, stdout.decode(errors='replace')
+
+
+async def submit_job(wrf_sim, cmd):
+    """
+    Submits a job without blocking the event loop (see WRFModel.submit_job). On AWS, the job runs
+    as a local process in its own process group; otherwise, the job id is read from the output of qsub or sbatch.
+
+    :param wrf_sim: WRFModel
+    :param cmd: string
+        command used to submit the job (e.g., wrf_sim.CMD_WRF).
+    :return job: asyncio.subprocess.Process or string
+        local process or batch job id (None if the job id could not be determined).
+
+    """
+    if wrf_sim.on_aws:
+        return await asyncio.create_subprocess_exec(*shlex.split(cmd), start_new_session=True)
+    _, output = await run_command(cmd)
+    return wrf_sim.parse_job_id(output)
+
+
+async def cancel_job(wrf_sim, job):
+    """
+    Cancels a job submitted with submit_job, and waits until the cancel command has run
+    (or the local process has exited).
+
+    :param wrf_sim: WRFModel
+    :param job: asyncio.subprocess.Process or string
+        local process (or process id) or batch job id returned by submit_job.
+
+    """
+    if job is None:
+        return
+    if hasattr(job, 'pid') or wrf_sim.on_aws:
+        # Killing the process group does not block
+        wrf_sim.cancel_job(job)
+        if isinstance(job, asyncio.subprocess.Process):
+            await job.wait()
+    else:
+        if wrf_sim.verbose:
+            print(f'Cancelling job {job} in {wrf_sim.DIR_WRFOUT}')
+        await run_command(wrf_sim.CMD_CANCEL % job)
+
+
+async def wait_finish(wrf_sim, program, timeout=None, nprocs=8, on_lines=None, on_wake=None):
+    """
+    Waits for a WRF or WPS subprogram to finish without blocking the event loop.
+    The arguments and return value are the same as for WRFModel.wait_finish.
+
+    """
+    checks = wrf_sim.finish_checks(program, nprocs)
+    if len(checks) == 0:
+        print(f'OptWRFError: cannot wait for {program}; use geogrid, metgrid, real, or wrf.')
+        raise ValueError
+    status, msg = await wrf_sim.watcher.wait_async(checks, timeout=timeout, on_lines=on_lines, on_wake=on_wake)
+    if status == 'failed':
+        print(f'\nRunwrfError: {program} has failed. Last message was:\n{msg}')
+    return status
+
+
+async def _run_job(wrf_sim, cmd, program, log_file, timeout):
+    """
+    Submits the job of a WPS program or real.exe and waits for it to finish.
+    If the wait is cancelled, the job is cancelled too.
+    """
+    job = await submit_job(wrf_sim, cmd)
+    try:
+        await wrf_sim.watcher.wait_for_file_async(log_file)
+        startTime = datetime.datetime.now()
+        if wrf_sim.verbose:
+            print(f'Starting {program} at: {startTime}')
+            sys.stdout.flush()
+        status = await wait_finish(wrf_sim, program, timeout=timeout)
+    except asyncio.CancelledError:
+        await asyncio.shield(cancel_job(wrf_sim, job))
+        raise
+    if status == 'failed':
+        print_last_3lines(log_file)
+    elif status == 'complete' and wrf_sim.verbose:
+        print(f'{program} ran in: {hf.strfdelta(datetime.datetime.now() - startTime)}')
+    return status
+
+
+async def run_wps(wrf_sim, disable_timeout=False):
+    """
+    Runs the WRF preprocessing executables (see WRFModel.run_wps).
+
+    :return: boolean (True/False)
+        True if geogrid and metgrid completed (or their output was linked from the archive).
+
+    """
+    if not await run_geogrid(wrf_sim, disable_timeout):
+        return False
+    if not await run_ungrib_metgrid(wrf_sim, disable_timeout):
+        return False
+
+    # Remove the temporary data directory after WPS has run
+    await in_executor(hf.remove_dir, wrf_sim.DIR_DATA_TMP)
+    return True
+
+
+@async_timed_stage('geogrid')
+async def run_geogrid(wrf_sim, disable_timeout=False):
+    """
+    Runs geogrid.exe, unless the geo_em files were archived before (see WRFModel.run_geogrid).
+
+    :return: boolean (True/False)
+
+    """
+    geogridfiles = wrf_sim.geo_em_files()
+    if all(os.path.exists(wrf_sim.DIR_DATA_ROOT + 'data/domain/' + file) for file in geogridfiles):
+        if wrf_sim.verbose:
+            print('Geogrid was run previously. Linking geogrid file(s)...')
+        for file in geogridfiles:
+            rundir.force_symlink(wrf_sim.DIR_DATA_ROOT + 'data/domain/' + file, wrf_sim.DIR_WRFOUT + file)
+        return True
+    geogrid_sim = await _run_job(wrf_sim, wrf_sim.CMD_GEOGRID, 'geogrid', wrf_sim.DIR_WRFOUT + 'geogrid.log',
+                                 timeout=None if disable_timeout else 600)
+    if geogrid_sim == 'timeout':
+        print('TimeoutError in run_wps: Geogrid took more than 10min to run... exiting.')
+    return geogrid_sim == 'complete'
+
+
+@async_timed_stage('ungrib_metgrid')
+async def run_ungrib_metgrid(wrf_sim, disable_timeout=False):
+    """
+    Runs ungrib.exe and metgrid.exe, unless the met_em files were archived before (see WRFModel.run_ungrib_metgrid).
+
+    :return: boolean (True/False)
+
+    """
+    metfilelist = wrf_sim.met_em_files()
+    if all(os.path.exists(wrf_sim.DIR_DATA + 'met_em/' + file) for file in metfilelist):
+        if wrf_sim.verbose:
+            print('Metgrid was run previously. Linking met_em files...')
+        for file in metfilelist:
+            rundir.force_symlink(wrf_sim.DIR_DATA + 'met_em/' + file, wrf_sim.DIR_WRFOUT + file)
+        return True
+    # Link the grib files
+    await run_command(wrf_sim.CMD_LINK_GRIB)
+    metgrid_sim = await _run_job(wrf_sim, wrf_sim.CMD_UNGMETG, 'metgrid', wrf_sim.DIR_WRFOUT + 'metgrid.log',
+                                 timeout=None if disable_timeout else 600)
+    if metgrid_sim == 'timeout':
+        print('TimeoutError in run_wps: Ungrib and Metgrid took more than 10min to run... exiting.')
+    return metgrid_sim == 'complete'
+
+
+@async_timed_stage('real')
+async def run_real(wrf_sim, disable_timeout=False):
+    """
+    Runs real.exe (see WRFModel.run_real).
+
+    :return: boolean (True/False)
+
+    """
+    real_sim = await _run_job(wrf_sim, wrf_sim.CMD_REAL, 'real', wrf_sim.DIR_WRFOUT + 'rsl.out.0000',
+                              timeout=None if disable_timeout else 600)
+    if real_sim == 'timeout':
+        print('TimeoutError in run_real: Real took more than 10min to run... exiting.')
+        return False
+    if real_sim != 'complete':
+        return False
+    # Remove rsl.* files
+    for rsl_file in glob.glob(wrf_sim.DIR_WRFOUT + 'rsl.*'):
+        os.remove(rsl_file)
+    return True
+
+
+async def run_wrf(wrf_sim, disable_timeout=False, timeout_hours=8, save_wps_files=True, monitor_fn=None,
+                  kill_stalled=False):
+    """
+    Runs wrf.exe and waits for it to finish. The arguments and return values are the same as for WRFModel.run_wrf.
+
+    """
+    wrf_sim.record_wrf_job(await submit_job(wrf_sim, wrf_sim.CMD_WRF))
+    return await wait_wrf(wrf_sim, disable_timeout=disable_timeout, timeout_hours=timeout_hours,
+                          save_wps_files=save_wps_files, monitor_fn=monitor_fn, kill_stalled=kill_stalled)
+
+
+async def wait_wrf(wrf_sim, disable_timeout=False, timeout_hours=8, save_wps_files=True, monitor_fn=None,
+                   kill_stalled=False):
+    """
+    Waits for a wrf.exe job submitted by run_wrf (or re-attached to by WRFModel.reattach_wrf) to finish,
+    without blocking the event loop (see WRFModel.wait_wrf). monitor_fn runs in the default executor,
+    because it usually reads the wrfout file. If the wait is cancelled, the WRF job is cancelled too.
+
+    """
+    monitor = WRFMonitor(wrf_sim, monitor_fn=monitor_fn, kill_stalled=kill_stalled)
+    on_wake = monitor.on_wake if monitor_fn is None else functools.partial(in_executor, monitor.on_wake)
+    try:
+        timeout = wrf_sim.wrf_timeout(disable_timeout, timeout_hours)
+        deadline = None if timeout is None else time.time() + timeout
+        wrf_sim_status = await wait_wrf_start(wrf_sim, timeout)
+        if wrf_sim_status is None:
+            timeout = None if deadline is None else max(0, deadline - time.time())
+            wrf_sim_status = await wait_finish(wrf_sim, 'wrf', timeout=timeout, on_lines=monitor.on_lines,
+                                               on_wake=on_wake)
+    except asyncio.CancelledError:
+        await asyncio.shield(cancel_job(wrf_sim, wrf_sim.wrf_job))
+        job_file_path = wrf_sim.DIR_WRFOUT + wrf_sim.FILE_WRF_JOB
+        if os.path.exists(job_file_path):
+            os.remove(job_file_path)
+        raise
+    if wrf_sim_status in ['pruned', 'stalled', 'timeout']:
+        await cancel_job(wrf_sim, wrf_sim.wrf_job)
+    return await in_executor(wrf_sim.end_wrf_wait, wrf_sim_status, monitor, timeout_hours=timeout_hours,
+                             save_wps_files=save_wps_files)
+
+
+async def wait_wrf_start(wrf_sim, timeout=None):
+    """
+    Same as WRFModel.wait_wrf_start, but waits without blocking the event loop.
+    """
+    rsl_file = wrf_sim.DIR_WRFOUT + 'rsl.out.0000'
+    deadline = None if timeout is None else time.time() + timeout
+    while True:
+        wait_seconds = wrf_sim.job_check_seconds
+        if deadline is not None:
+            wait_seconds = min(wait_seconds, max(0, deadline - time.time()))
+        if await wrf_sim.watcher.wait_for_file_async(rsl_file, timeout=wait_seconds):
+            return None
+        # Looking up a batch job runs qstat or squeue
+        status = await in_executor(wrf_sim.wrf_start_status, deadline)
+        if status is not None:
+            return status
+
+
+async def run_all(wrf_sim, disable_timeout=True, verbose=False, save_wps_files=False, return_timings=False):
+    """
+    Runs the WRF model for a simulation; the asyncio counterpart of runwrf.run_all,
+    with the same arguments and return values.
+
+    """
+    start_time = time.time()
+    if verbose:
+        print('- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -')
+        print(f'\nRunning: {wrf_sim.param_ids} from {wrf_sim.forecast_start} to {wrf_sim.forecast_end}')
+
+    # Check to see if WRFModel instance exists; if not, run the WRF model.
+    wrfout_file_path = wrf_sim.DIR_WRFOUT + 'wrfout_d01.nc'
+    orig_wrfout_file_path = wrf_sim.DIR_WRFOUT + wrf_sim.wrfout_file_name(domain=1)
+    if [os.path.exists(file) for file in [wrfout_file_path, orig_wrfout_file_path]].count(True) == 0:
+        wrf_sim.cache_hit = wrf_sim.wps_files_exist()
+        # Get boundary condition data, set up the working directory, and prepare the namelists
+        vtable_sfx = await in_executor(wrf_sim.get_bc_data)
+        success = await in_executor(wrf_sim.wrfdir_setup, vtable_sfx)
+        if success:
+            success = await in_executor(wrf_sim.prepare_namelists)
+
+        # Run WPS
+        if success:
+            success = await run_wps(wrf_sim, disable_timeout)
+            if verbose:
+                print(f'WPS ran successfully? {success}')
+
+        # Run REAL
+        if success:
+            success = await run_real(wrf_sim, disable_timeout)
+            if verbose:
+                print(f'Real ran successfully? {success}')
+
+        # RUN WRF
+        if success:
+            success, runtime = await run_wrf(wrf_sim, disable_timeout, save_wps_files=save_wps_files)
+            if verbose:
+                print(f'WRF ran successfully? {success}')
+        else:
+            runtime = '00h 00m 00s'
+    else:
+        wrf_sim.cache_hit = True
+        success = True
+        runtime = '00h 00m 00s'
+
+    if return_timings:
+        return success, runtime, dict(wrf_sim.timings(), wall_seconds=time.time() - start_time)
+    return success, runtime
+
+
+async def run_multiple(wrf_sims, max_concurrent=100, **kwargs):
+    """
+    Runs many simulations concurrently on the running event loop, at most max_concurrent at a time.
+    If this coroutine is cancelled, every simulation (and the job that it is running) is cancelled.
+
+    :param wrf_sims: list of WRFModel
+    :param max_concurrent: integer (default = 100)
+        maximum number of simulations that run at the same time; the others wait for a slot.
+    :param kwargs:
+        passed to run_all (e.g., disable_timeout, verbose, save_wps_files, return_timings).
+    :return results: list
+        result of run_all for each simulation, in order; a simulation that raised an
+        exception returns (None, None) and the exception is printed.
+
+    """
+    if max_concurrent < 1:
+        print(f'OptWRFError: max_concurrent must be at least 1 (not {max_concurrent}).')
+        raise ValueError
+    semaphore = asyncio.BoundedSemaphore(max_concurrent)
+
+    async def fn_run(wrf_sim):
+        async with semaphore:
+            try:
+                return await run_all(wrf_sim, **kwargs)
+            except Exception as err:
+                print(f'OptWRFWarning in run_multiple: the simulation in {wrf_sim.DIR_WRFOUT} failed: {err!r}')
+                return None, None
+
+    tasks = [asyncio.ensure_future(fn_run(wrf_sim)) for wrf_sim in wrf_sims]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        # Cancel the simulations that are still running, and wait until their jobs are cancelled
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def supervise(wrf_sims, max_concurrent=100, **kwargs):
+    """
+    Runs many simulations from this process with run_multiple, in a new event loop.
+    A KeyboardInterrupt cancels every simulation and the jobs that they are running.
+    The arguments and return value are the same as for run_multiple.
+
+    """
+    results = asyncio.run(run_multiple(wrf_sims, max_concurrent=max_concurrent, **kwargs))
+    for result in results:
+        print(f'Success: {result[0]}, Runtime: {result[1]}')
+    return results
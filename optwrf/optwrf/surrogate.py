@@ -0,0 +1,241 @@
+"""
+A cheap surrogate model of the WRF fitness function that is used to pre-screen offspring
+in the genetic algorithm before any WRF simulations are launched.
+
+
+Known Issues/Wishlist:
+- The surrogate is an additive (main effects only) model, so it cannot capture interactions
+between physics parameterizations. It only needs to rank offspring, not predict fitness exactly.
+
+"""
+
+import datetime
+import math
+
+import numpy as np
+from scipy import stats
+
+import optwrf.helper_functions as hf
+
+# Columns of the simulations table that hold the physics parameter ids
+gene_names = ['mp_physics', 'ra_lw_physics', 'ra_sw_physics', 'sf_surface_physics',
+              'bl_pbl_physics', 'cu_physics', 'sf_sfclay_physics']
+# Fitness value assigned to simulations that failed (see optimize_wrf_physics.get_wrf_fitness)
+failed_fitness = 6.022 * 10 ** 23
+
+
+class FitnessSurrogate:
+    """
+    This class provides a categorical ridge regression that predicts the fitness of a
+    simulation from its physics parameter ids (one-hot encoded), the season of the start date
+    (one-hot encoded using helper_functions.date2season), and the day of the year
+    (encoded as a sine and cosine pair so that Dec 31 and Jan 1 are neighbors).
+
+    The model is trained incrementally: the normal equations (X'X and X'y) are accumulated
+    as new simulations are added, so retraining after each generation only costs a
+    solve of a small linear system.
+    """
+    def __init__(self, ridge=1.0, min_samples=20):
+        self.ridge = ridge
+        self.min_samples = min_samples
+        self.n_samples = 0
+        self.feature_index = {'bias': 0}
+        self.xtx = np.zeros((1, 1))
+        self.xty = np.zeros(1)
+        self.coefs = None
+
+    @property
+    def trained(self):
+        """
+        True if the surrogate has seen enough simulations to be used for screening.
+        """
+        return self.coefs is not None and self.n_samples >= self.min_samples
+
+    @staticmethod
+    def features(genes, start_date):
+        """
+        Builds the (sparse) features of one simulation.
+
+        :param genes: list of integers
+            corresponding to each WRF physics parameterization.
+        :param start_date: string
+            specifying the simulation start date.
+        :return features: dictionary
+            mapping each feature name to its value.
+
+        """
+        date = hf.format_date(start_date)
+        doy = date.timetuple().tm_yday
+        features = {'bias': 1.0,
+                    ('season', hf.date2season(date)): 1.0,
+                    'doy_sin': math.sin(2 * math.pi * doy / 365.25),
+                    'doy_cos': math.cos(2 * math.pi * doy / 365.25)}
+        for name, gene in zip(gene_names, genes):
+            features[(name, int(gene))] = 1.0
+        return features
+
+    def _add_feature(self, name):
+        self.feature_index[name] = len(self.feature_index)
+        n_features = len(self.feature_index)
+        xtx = np.zeros((n_features, n_features))
+        xtx[:-1, :-1] = self.xtx
+        self.xtx = xtx
+        self.xty = np.append(self.xty, 0.0)
+
+    def _vector(self, features, grow=False):
+        if grow:
+            for name in features:
+                if name not in self.feature_index:
+                    self._add_feature(name)
+        x = np.zeros(len(self.feature_index))
+        for name, value in features.items():
+            idx = self.feature_index.get(name)
+            if idx is not None:
+                x[idx] = value
+        return x
+
+    def update(self, records):
+        """
+        Adds simulations to the training data and refits the surrogate.
+        Simulations without a fitness value, or that failed, are skipped.
+
+        :param records: iterable
+            of (genes, start_date, fitness) tuples.
+        :return n_added: integer
+            number of simulations added to the training data.
+
+        """
+        n_added = 0
+        for genes, start_date, fitness in records:
+            if fitness is None or fitness >= failed_fitness:
+                continue
+            x = self._vector(self.features(genes, start_date), grow=True)
+            self.xtx += np.outer(x, x)
+            self.xty += x * fitness
+            n_added += 1
+        self.n_samples += n_added
+        if self.n_samples > 0:
+            penalty = self.ridge * np.eye(len(self.feature_index))
+            # Don't penalize the intercept
+            penalty[0, 0] = 0
+            self.coefs = np.linalg.lstsq(self.xtx + penalty, self.xty, rcond=None)[0]
+        return n_added
+
+    def update_from_population(self, population):
+        """
+        Adds evaluated simplega.Chromosome instances to the training data and refits the surrogate.
+        Pruned individuals are skipped, because their fitness is only a partial value.
+        """
+        return self.update([(individual.Genes, individual.Start_date, individual.Fitness)
+                            for individual in population if individual.Status != 'pruned'])
+
+    def train_from_db(self, db_conn):
+        """
+        Trains the surrogate on every simulation in the SQL simulation database that was not pruned.
+
+        :param db_conn: database connection object
+            created using optimize_wrf_physics.conn_to_db().
+        :return n_added: integer
+            number of simulations added to the training data.
+
+        """
+        c = db_conn.cursor()
+        c.execute(f"""SELECT start_date, {', '.join(gene_names)}, fitness FROM simulations
+                    WHERE status IS NULL OR status = 'complete'""")
+        return self.update([(row[1:8], row[0], row[8]) for row in c.fetchall()])
+
+    def predict(self, population):
+        """
+        Predicts the fitness of each individual in the population.
+
+        :param population: list of simplega.Chromosome instances.
+        :return predictions: numpy array of floats
+            predicted fitness (lower is better) of each individual.
+
+        """
+        if self.coefs is None:
+            return np.zeros(len(population))
+        if hasattr(population, 'genes'):
+            return self.predict_arrays(population.genes, population.start_dates)
+        x = np.array([self._vector(self.features(individual.Genes, individual.Start_date))
+                      for individual in population])
+        return x @ self.coefs
+
+    def predict_arrays(self, genes, start_dates):
+        """
+        Vectorized version of predict for an integer gene matrix (e.g., from simplega.Population),
+        so that the surrogate can score very large populations without building features one by one.
+
+        :param genes: numpy array of integers
+            with one row per individual and one column per physics parameter.
+        :param start_dates: numpy array of datetime64[D]
+            simulation start date of each individual.
+        :return predictions: numpy array of floats
+            predicted fitness (lower is better) of each individual.
+
+        """
+        genes = np.asarray(genes)
+        start_dates = np.asarray(start_dates, dtype='datetime64[D]')
+        if self.coefs is None:
+            return np.zeros(len(genes))
+        predictions = np.full(len(genes), self.coefs[0])
+        doy = (start_dates - start_dates.astype('datetime64[Y]')).astype(int) + 1
+        predictions += self._coef('doy_sin') * np.sin(2 * np.pi * doy / 365.25)
+        predictions += self._coef('doy_cos') * np.cos(2 * np.pi * doy / 365.25)
+        # Look up the coefficient of each season and gene value in a table indexed by the raw value
+        months = (start_dates.astype('datetime64[M]').astype(int) % 12) + 1
+        season_coefs = np.array([0.0] + [self._coef(('season', hf.date2season(datetime.date(2011, month, 1))))
+                                         for month in range(1, 13)])
+        predictions += season_coefs[months]
+        for ii, name in enumerate(gene_names):
+            table = np.zeros(genes[:, ii].max(initial=0) + 1)
+            for feature, idx in self.feature_index.items():
+                if isinstance(feature, tuple) and feature[0] == name and 0 <= feature[1] < len(table):
+                    table[feature[1]] = self.coefs[idx]
+            predictions += table[genes[:, ii]]
+        return predictions
+
+    def _coef(self, name):
+        idx = self.feature_index.get(name)
+        return self.coefs[idx] if idx is not None else 0.0
+
+    def screen(self, candidates, n_keep):
+        """
+        Keeps the n_keep candidates with the best (lowest) predicted fitness.
+        If the surrogate has not been trained yet, the first n_keep candidates are kept.
+
+        :param candidates: list of simplega.Chromosome instances.
+        :param n_keep: integer
+            number of candidates that will be passed on to WRF.
+        :return kept: list of simplega.Chromosome instances
+            promising candidates in order of their predicted fitness.
+        :return predictions: numpy array of floats
+            predicted fitness of the kept candidates.
+
+        """
+        if not self.trained:
+            return candidates[0:n_keep], self.predict(candidates[0:n_keep])
+        predictions = self.predict(candidates)
+        order = np.argsort(predictions, kind='stable')[0:n_keep]
+        kept = [candidates[i] for i in order]
+        return kept, predictions[order]
+
+
+def rank_correlation(predicted, realised):
+    """
+    Computes the Spearman rank correlation between the fitness predicted by the surrogate
+    and the fitness realised by WRF. Failed simulations are ignored.
+
+    :param predicted: list of floats
+        fitness values predicted by the surrogate.
+    :param realised: list of floats
+        fitness values calculated from the WRF simulations.
+    :return rho: float
+        Spearman rank correlation coefficient, or NaN if it cannot be computed.
+
+    """
+    pairs = [(p, r) for p, r in zip(predicted, realised) if r is not None and r < failed_fitness]
+    if len(pairs) < 3:
+        return float('nan')
+    rho, _ = stats.spearmanr([p for p, _ in pairs], [r for _, r in pairs])
+    return float(rho)
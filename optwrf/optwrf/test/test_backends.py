@@ -0,0 +1,168 @@
+"""
+Tests the backends used to evaluate fitness functions in parallel
+
+"""
+
+import concurrent.futures
+import glob
+import math
+import os
+import pickle
+import threading
+import time
+
+import pytest
+
+from optwrf.backends import InProcessBackend, LocalProcessBackend, SlurmBackend, ThreadBackend, run_spec
+from optwrf.optimize_wrf_physics import run_simplega
+
+
+def test_in_process_backend():
+    """Checks that the in-process backend returns completed futures with results or exceptions."""
+    backend = InProcessBackend()
+    future = backend.submit(math.sqrt, 16)
+    assert future.done()
+    assert future.result() == 4
+    future = backend.submit(math.sqrt, -1)
+    assert isinstance(future.exception(), ValueError)
+
+
+def test_process_and_thread_backends():
+    """Checks that the local process and thread backends run module-level functions."""
+    with LocalProcessBackend(max_workers=2) as backend:
+        futures = [backend.submit(math.sqrt, n ** 2) for n in range(4)]
+        assert [future.result() for future in futures] == [0, 1, 2, 3]
+    with ThreadBackend(max_workers=2) as backend:
+        assert backend.max_workers == 2
+        assert backend.submit(math.sqrt, 9).result() == 3
+
+
+def test_run_spec(tmp_path):
+    """Checks that a job spec written by SlurmBackend can be run, and that its result is written next to it."""
+    spec_file = str(tmp_path / 'spec_000000.pkl')
+    with open(spec_file, 'wb') as spec:
+        pickle.dump((math.sqrt, (25,), {}), spec)
+    run_spec(spec_file)
+    assert os.path.exists(spec_file.replace('.pkl', '.result.pkl'))
+    with open(spec_file.replace('.pkl', '.result.pkl'), 'rb') as result:
+        assert pickle.load(result) == (True, 5)
+
+
+def _fake_slurm(tmp_path, monkeypatch, skip_task='', sbatch_seconds=0):
+    """Puts fake sbatch, squeue, and scancel commands on the PATH. sbatch takes sbatch_seconds, runs every array
+    task right away (except skip_task, which leaves the queue without a result) and logs its arguments;
+    squeue lists no jobs."""
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    scripts = {'sbatch': '#!/bin/bash\n'
+                         'echo "$@" >> "$FAKE_SLURM_LOG"\n'
+                         'sleep "$FAKE_SLURM_SECONDS"\n'
+                         'for arg in "$@"; do case $arg in --array=0-*) n_tasks=${arg#--array=0-};; esac; '
+                         'script=$arg; done\n'
+                         'for task in $(seq 0 $n_tasks); do\n'
+                         '    if [ "$task" != "$FAKE_SLURM_SKIP" ]; then SLURM_ARRAY_TASK_ID=$task bash "$script"; fi\n'
+                         'done > /dev/null 2>&1\n'
+                         'echo 4242\n',
+               'squeue': '#!/bin/bash\nexit 0\n',
+               'scancel': '#!/bin/bash\necho "scancel $@" >> "$FAKE_SLURM_LOG"\n'}
+    for name, script in scripts.items():
+        (bin_dir / name).write_text(script)
+        os.chmod(str(bin_dir / name), 0o755)
+    monkeypatch.setenv('PATH', f'{bin_dir}:{os.environ["PATH"]}')
+    monkeypatch.setenv('FAKE_SLURM_LOG', str(tmp_path / 'slurm.log'))
+    monkeypatch.setenv('FAKE_SLURM_SKIP', str(skip_task))
+    monkeypatch.setenv('FAKE_SLURM_SECONDS', str(sbatch_seconds))
+    return str(tmp_path / 'slurm.log')
+
+
+def test_slurm_backend(tmp_path, monkeypatch):
+    """Checks that submissions close together are grouped into one array job, that the results are collected,
+    and that a future whose array task left the queue without a result fails."""
+    slurm_log = _fake_slurm(tmp_path, monkeypatch, skip_task=1)
+    job_dir = str(tmp_path / 'jobs')
+    backend = SlurmBackend(job_dir=job_dir, poll_interval=0.1, batch_window=0.5)
+    futures = [backend.submit(math.sqrt, 16), backend.submit(math.sqrt, 25), backend.submit(math.sqrt, -1)]
+    assert futures[0].result(timeout=60) == 4
+    with pytest.raises(RuntimeError, match='ended without writing'):
+        futures[1].result(timeout=60)
+    assert isinstance(futures[2].exception(timeout=60), ValueError)
+    backend.shutdown()
+    assert len(glob.glob(job_dir + '/array_*.txt')) == 1
+    with open(slurm_log) as log:
+        assert [line.split()[1] for line in log.readlines()] == ['--array=0-2']
+
+
+def test_slurm_backend_cancel_while_collecting(tmp_path, monkeypatch):
+    """Checks that collecting a future that shutdown(cancel_futures=True) has just failed does not set it twice."""
+    slurm_log = _fake_slurm(tmp_path, monkeypatch)
+    backend = SlurmBackend(job_dir=str(tmp_path / 'jobs'), poll_interval=60, batch_window=0)
+    future = concurrent.futures.Future()
+    future.set_running_or_notify_cancel()
+    backend._running[str(tmp_path / 'jobs' / 'spec_000000.pkl')] = ('4242', future)
+
+    def fn_active_jobs():
+        # The job leaves the queue without a result while the backend is shut down
+        backend.shutdown(wait=False, cancel_futures=True)
+        return set()
+
+    monkeypatch.setattr(backend, '_active_jobs', fn_active_jobs)
+    backend._collect()
+    assert isinstance(future.exception(), concurrent.futures.CancelledError)
+    backend._poller.join(timeout=10)
+    assert not backend._poller.is_alive()
+    with open(slurm_log) as log:
+        assert 'scancel 4242' in log.read()
+
+
+def test_slurm_backend_cancel_while_submitting(tmp_path, monkeypatch):
+    """Checks that an array job that sbatch was still submitting when the backend was shut down is cancelled."""
+    slurm_log = _fake_slurm(tmp_path, monkeypatch, sbatch_seconds=1)
+    backend = SlurmBackend(job_dir=str(tmp_path / 'jobs'), poll_interval=60, batch_window=0)
+    future = backend.submit(math.sqrt, 16)
+    start_time = time.time()
+    while len(backend._submitting) == 0 and time.time() - start_time < 10:
+        time.sleep(0.01)
+    backend.shutdown(wait=False, cancel_futures=True)
+    assert isinstance(future.exception(timeout=0), concurrent.futures.CancelledError)
+    backend._poller.join(timeout=10)
+    assert not backend._poller.is_alive() and len(backend._running) == 0
+    with open(slurm_log) as log:
+        assert 'scancel 4242' in log.read()
+
+
+def test_run_simplega_backends():
+    """Tests the genetic algorithm with the in-process and local process backends without running WRF."""
+    WRFga_winner = run_simplega(pop_size=10, n_generations=1, testing=True, backend=InProcessBackend())
+    assert WRFga_winner.Fitness >= 0
+    with LocalProcessBackend(max_workers=4) as backend:
+        WRFga_winner = run_simplega(pop_size=10, n_generations=1, testing=True, backend=backend,
+                                    scheduler='steady_state')
+        assert WRFga_winner.Fitness >= 0
+        # Racing shares the fitness cache with the running evaluations, so it needs threads; the arguments are
+        # rejected before the simulation database (and its writer thread) is opened
+        n_threads = threading.active_count()
+        with pytest.raises(ValueError):
+            run_simplega(pop_size=10, n_generations=1, testing=True, backend=backend, race_dates=2)
+        with pytest.raises(ValueError):
+            run_simplega(pop_size=10, n_generations=1, testing=True, scheduler='asynchronous')
+        assert threading.active_count() == n_threads
+
+
+def test_run_simplega_interrupted():
+    """Checks that interrupting the genetic algorithm shuts its backend down, cancelling the running evaluations."""
+    class InterruptedBackend(ThreadBackend):
+        shutdowns = []
+
+        def wait(self, fs, timeout=None, return_when=concurrent.futures.ALL_COMPLETED):
+            raise KeyboardInterrupt
+
+        def shutdown(self, wait=True, *, cancel_futures=False):
+            self.shutdowns.append(cancel_futures)
+            super().shutdown(wait=wait, cancel_futures=cancel_futures)
+
+    backend = InterruptedBackend(max_workers=2)
+    with pytest.raises(KeyboardInterrupt):
+        run_simplega(pop_size=4, n_generations=1, testing=True, backend=backend, scheduler='steady_state')
+    assert backend.shutdowns == [True]
+    with pytest.raises(RuntimeError):
+        backend.submit(math.sqrt, 4)
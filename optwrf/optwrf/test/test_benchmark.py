@@ -0,0 +1,71 @@
+"""
+Tests the offline benchmark harness that replays the genetic algorithm on a virtual clock
+
+"""
+
+import concurrent.futures
+
+from optwrf.benchmark import ReplayFitness, VirtualClockBackend, run_benchmark, synthetic_landscape
+from optwrf.optimize_wrf_physics import close_conn_to_db, conn_to_db, insert_sim, timed_fitness
+from optwrf.simplega import Chromosome
+
+
+def test_replay_fitness(tmp_path):
+    """Checks that recorded simulations are replayed, and that unseen simulations use the synthetic landscape."""
+    db_name = str(tmp_path / 'recorded.db')
+    db_conn = conn_to_db(db_name)
+    insert_sim(Chromosome([8, 7, 3, 1, 1, 10, 1], 'Dec 11 2011', 'Dec 12 2011', 12.5, 1.0, 2.0, '02h 00m 00s',
+                          'complete'), db_conn)
+    insert_sim(Chromosome([8, 7, 3, 1, 1, 10, 1], 'Dec 12 2011', 'Dec 13 2011', 1.0, 1.0, 2.0, '00h 10m 00s',
+                          'pruned'), db_conn)
+    close_conn_to_db(db_conn)
+    replay = ReplayFitness.from_db(db_name, staging_seconds=600)
+    assert replay(param_ids=[8, 7, 3, 1, 1, 10, 1], start_date='Dec 11  2011') == (12.5, 1.0, 2.0, '02h 00m 00s')
+    assert replay.is_cached('Dec 11 2011', 'Dec 12 2011')
+    # Pruned simulations only have a partial fitness, so they are not replayed
+    assert not replay.is_cached('Dec 12 2011', 'Dec 13 2011')
+    fitness, ghi_error, wpd_error, runtime, status = replay([8, 7, 3, 1, 1, 10, 1], 'Dec 12 2011',
+                                                            return_status=True)
+    assert (ghi_error, wpd_error) == synthetic_landscape([8, 7, 3, 1, 1, 10, 1], 'Dec 12 2011')[0:2]
+    assert status == 'complete'
+    assert replay.n_replayed == 1 and replay.n_synthetic == 1
+    assert replay.is_cached('Dec 12 2011', 'Dec 13 2011')
+
+
+def test_virtual_clock_backend():
+    """Checks that evaluations finish in the order of their runtimes on the virtual clock."""
+    backend = VirtualClockBackend(max_workers=2)
+    runtimes = ['03h 00m 00s', '01h 00m 00s', '01h 00m 00s']
+    futures = [backend.submit(timed_fitness, lambda ii: (ii, 0, 0, runtimes[ii]), ii) for ii in range(3)]
+    assert not any(future.done() for future in futures)
+    done, _ = backend.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+    assert done == {futures[1]}
+    assert backend.clock == 3600
+    # The third evaluation starts when the second one frees its slot
+    assert futures[0].result() == ((0, 0, 0, '03h 00m 00s'), 10800)
+    assert futures[2].done()
+    stats = backend.stats()
+    assert stats['wall_hours'] == 3 and stats['busy_hours'] == 5
+    assert stats['best_fitness'] == 0 and stats['time_to_best_hours'] == 3
+    assert abs(stats['idle_frac'] - 1 / 6) < 1e-9
+
+
+def test_run_benchmark(tmp_path):
+    """Replays the schedulers and date policies on a small recorded database."""
+    db_name = str(tmp_path / 'recorded.db')
+    db_conn = conn_to_db(db_name)
+    insert_sim(Chromosome([8, 7, 3, 1, 1, 10, 1], 'Jan 05 2011', 'Jan 06 2011', 5.0, 1.0, 2.0, '01h 00m 00s'),
+               db_conn)
+    close_conn_to_db(db_conn)
+    configs = [{'pop_size': 10, 'scheduler': 'generational', 'date_policy': 'random'},
+               {'pop_size': 10, 'scheduler': 'steady_state', 'date_policy': 'common', 'elite_pct': 0.2}]
+    results = run_benchmark(configs, db_name=db_name, n_generations=2, n_slots=4)
+    assert len(results) == 2
+    for result in results:
+        assert result['n_evaluations'] > 0
+        assert 0 <= result['idle_frac'] < 1
+        assert 0 < result['time_to_best_hours'] <= result['wall_hours']
+        assert result['core_hours'] == result['busy_hours']
+    assert results[1]['policy'] == 'common' and results[1]['date_hit_rate'] > results[0]['date_hit_rate']
+    # The steady-state scheduler keeps the slots busier than the generational scheduler
+    assert results[1]['idle_frac'] < results[0]['idle_frac']
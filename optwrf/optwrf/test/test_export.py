@@ -0,0 +1,73 @@
+"""
+Tests the typed, chunked export of the SQL simulation database
+
+"""
+
+import datetime
+
+import pytest
+
+from optwrf import export
+import optwrf.optimize_wrf_physics as owp
+import optwrf.simplega as sga
+
+
+def _make_db(db_name, n_sims, mp_physics=1):
+    """Writes a simulation database with n_sims completed simulations and one simulation without results."""
+    db_conn = owp.conn_to_db(db_name)
+    for ii in range(n_sims):
+        start_date = (datetime.date(2011, 1, 1) + datetime.timedelta(days=ii)).strftime('%b %d %Y')
+        owp.insert_sim(sga.Chromosome([mp_physics, 7, 3, 1, 1, 10, 1], start_date, None, float(ii),
+                                      1.0, 2.0, '01h 02m 03s', 'complete'), db_conn)
+    owp.insert_sim(sga.Chromosome([mp_physics, 7, 3, 1, 1, 10, 1], 'Jan 01 2012', None), db_conn)
+    owp.close_conn_to_db(db_conn)
+
+
+def test_convert_rows_and_sql_to_csv(tmp_path):
+    """Checks that the rows are converted to typed columns, and that the CSV export streams every row."""
+    db_name = str(tmp_path / 'optwrf_export.db')
+    _make_db(db_name, 25)
+    rows = [row for chunk in export.iter_rows(db_name, chunk_size=10) for row in chunk]
+    assert len(rows) == 26
+    columns = export.convert_rows(rows)
+    assert list(columns.keys()) == export.export_columns
+    assert columns['start_date'][0] == datetime.datetime(2011, 1, 1)
+    assert columns['runtime_seconds'][0] == 3723.0
+    assert columns['runtime_seconds'][-1] is None and columns['fitness'][-1] is None
+    db_conn = owp.conn_to_db(db_name)
+    assert owp.sql_to_csv(str(tmp_path / 'optwrf_export.csv'), db_conn, chunk_size=10) == 26
+    owp.close_conn_to_db(db_conn)
+    with open(str(tmp_path / 'optwrf_export.csv')) as csv_file:
+        assert len(csv_file.readlines()) == 27
+
+
+def test_sql_to_parquet_and_merge_databases(tmp_path):
+    """Checks the Parquet and Arrow exports of one database and the partitioned dataset of several databases."""
+    pytest.importorskip('pyarrow')
+    db_names = [str(tmp_path / 'campaign_a.db'), str(tmp_path / 'campaign_b.db')]
+    _make_db(db_names[0], 25, mp_physics=1)
+    _make_db(db_names[1], 10, mp_physics=2)
+    parquet_file = str(tmp_path / 'campaign_a.parquet')
+    assert export.sql_to_parquet(parquet_file, db_names[0], chunk_size=10) == 26
+    df = export.read_dataset(parquet_file)
+    assert len(df) == 26
+    assert str(df['start_date'].dtype).startswith('datetime64')
+    assert str(df['mp_physics'].dtype) == 'int16'
+    assert df['runtime_seconds'].iloc[0] == 3723.0
+    feather_file = str(tmp_path / 'campaign_a.feather')
+    assert export.sql_to_parquet(feather_file, db_names[0], file_format='feather') == 26
+    assert len(export.read_dataset(feather_file)) == 26
+    with pytest.raises(ValueError):
+        export.sql_to_parquet(parquet_file, db_names[0], file_format='hdf5')
+    out_dir = str(tmp_path / 'campaigns')
+    assert export.merge_databases(db_names, out_dir, chunk_size=10) == 37
+    df = export.read_dataset(out_dir)
+    assert len(df) == 37
+    assert df.groupby('campaign').size().to_dict() == {'campaign_a': 26, 'campaign_b': 11}
+    # Partitions that are filtered out are never read
+    df = export.read_dataset(out_dir, filter=(export.ds.field('campaign') == 'campaign_b')
+                             & (export.ds.field('year') == 2011))
+    assert len(df) == 10 and (df['mp_physics'] == 2).all()
+    # Re-exporting a campaign replaces its partitions and keeps the other campaigns
+    assert export.merge_databases(db_names[0:1], out_dir) == 26
+    assert len(export.read_dataset(out_dir)) == 37
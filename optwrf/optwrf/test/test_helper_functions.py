@@ -5,8 +5,12 @@ Test wrfparams functionality
 
 import datetime
 import os
+import threading
+import time
+
 import pandas as pd
-from optwrf.helper_functions import date2season, daylight_frac, gen_daily_sims_csv
+import optwrf.helper_functions as hf
+from optwrf.helper_functions import date2season, daylight_frac, gen_daily_sims_csv, strfdelta, strpdelta
 
 param_ids1 = [19, 4, 4, 7, 8, 99, 1]  # Best params chosen by optwrf
 csv_filename1 = '19mp4lw4sw7lsm8pbl99cu_2011_sims.csv'
@@ -34,6 +38,12 @@ def test_date2season():
     assert type(season) is str
 
 
+def test_strpdelta():
+    tdelta = datetime.timedelta(hours=5, minutes=12, seconds=33)
+    assert strpdelta(strfdelta(tdelta)) == tdelta
+    assert strpdelta('01d 00h 00m 10s') == datetime.timedelta(days=1, seconds=10)
+
+
 def test_daylight_frac():
     frac = daylight_frac('Jul 1, 2020')
     print(f'The daylight fraction is: {frac}')
@@ -47,3 +57,20 @@ def test_gen_daily_sims_csv():
     gen_daily_sims_csv(param_ids_ncar4, start='Jan 01 2011', end='Jan 01 2012', csv_name=full_path)
 
     assert os.path.exists(csv_path) is True
+
+
+def test_file_lock(tmp_path):
+    """Checks that a lock file can only be held by one thread at a time."""
+    lock_file = str(tmp_path / 'test.lock')
+    held = []
+
+    def hold_lock():
+        with hf.file_lock(lock_file):
+            held.append(len(held))
+            time.sleep(0.2)
+            held.append(len(held))
+
+    threads = [threading.Thread(target=hold_lock) for _ in range(2)]
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+    assert held == [0, 1, 2, 3]
@@ -0,0 +1,46 @@
+"""
+Tests the migration store used by the island-model genetic algorithm
+
+"""
+
+import os
+
+from optwrf.migration import MigrationStore
+from optwrf.optimize_wrf_physics import island_checkpoint_file, read_checkpoint, run_simplega
+from optwrf.simplega import Chromosome
+
+
+def test_migration_store(tmp_path):
+    """Checks that each island immigrates the best individuals that the other islands emigrated most recently."""
+    store = MigrationStore(str(tmp_path), n_keep=2)
+    assert store.immigrate(0, 2) == []
+    for gen in range(0, 4):
+        store.emigrate(0, gen, [Chromosome([1, 1, 1, 1, 1, 1, 1], 'Jan 01 2011', None, 10 - gen)])
+        store.emigrate(1, gen, [Chromosome([2, 3, 3, 2, 2, 2, 2], 'Feb 01 2011', None, 20),
+                                Chromosome([2, 3, 3, 2, 2, 2, 2], 'Mar 01 2011', None, 5)])
+    assert store.islands() == [0, 1]
+    assert len(os.listdir(str(tmp_path))) == 4
+    assert store.latest(0)[0] == 3
+    migrants = store.immigrate(2, 2)
+    assert [migrant.Fitness for migrant in migrants] == [5, 7]
+    assert [migrant.Start_date for migrant in store.immigrate(0, None)] == ['Mar 01 2011', 'Feb 01 2011']
+
+
+def test_run_simplega_islands(tmp_path):
+    """Runs two islands of the genetic algorithm one after the other without running WRF."""
+    store = MigrationStore(str(tmp_path / 'migration'))
+    checkpoint_file = str(tmp_path / 'optwrf_checkpoint.json')
+    for island in [0, 1]:
+        WRFga_winner = run_simplega(pop_size=10, n_generations=2, testing=True, checkpoint_file=checkpoint_file,
+                                    island=island, migration_store=store, migration_interval=1)
+        assert WRFga_winner.Fitness >= 0
+    assert store.islands() == [0, 1]
+    # The second island received the best individuals of the first island
+    best = min([migrant.Fitness for migrant in store.latest(0)[1]])
+    assert min([migrant.Fitness for migrant in store.latest(1)[1]]) <= best
+    # Each island can be resumed from its own checkpoint
+    assert island_checkpoint_file(checkpoint_file, 1).endswith('optwrf_checkpoint_island001.json')
+    assert read_checkpoint(island_checkpoint_file(checkpoint_file, 0))['gen'] == 2
+    WRFga_winner = run_simplega(pop_size=10, n_generations=3, testing=True, checkpoint_file=checkpoint_file,
+                                island=0, migration_store=store, migration_interval=1, resume=True)
+    assert WRFga_winner.Fitness >= 0
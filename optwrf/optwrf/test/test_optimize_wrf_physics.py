@@ -3,13 +3,25 @@ Tests the optimize_wrf_physics functions
 
 """
 
+import concurrent.futures
+import datetime
 import os
+import random
+import sqlite3
+import time
+
+import numpy as np
+
+from optwrf.benchmark import ReplayFitness, VirtualClockBackend
 from optwrf.optimize_wrf_physics \
-    import get_wrf_fitness, run_simplega, conn_to_db, print_database, sql_to_csv, close_conn_to_db
+    import get_wrf_fitness, get_wrf_fitness_batch, run_simplega, conn_to_db, print_database, sql_to_csv, \
+    close_conn_to_db
 from optwrf.helper_functions import determine_computer
+import optwrf.helper_functions as hf
 import optwrf.wrfparams as wp
 import optwrf.simplega as sga
 import optwrf.optimize_wrf_physics as owp
+from optwrf.regridding import read_ncl_hourly_error
 
 param_ids = [8, 7, 3, 1, 1, 10, 1]
 start_date = 'Dec 11  2011'
@@ -56,12 +68,254 @@ def test_get_wrf_fitness():
     assert type(runtime) is str
 
 
+def test_get_wrf_fitness_batch():
+    """Checks that the WRF fitness of a batch of simulations sharing a start date can be calculated,
+    and that identical requests are only simulated once. For this, you must be on Magma, Cheyenne, or AWS."""
+    if [on_aws, on_cheyenne, on_magma].count(True) == 0:
+        print('\n!!!Not running test_get_wrf_fitness_batch -- switch to Magma, Cheyenne, or AWS!!!')
+        return
+    requests = [(param_ids, start_date, end_date), ([10, 4, 4, 2, 2, 7, 2], start_date), (param_ids, start_date)]
+    results = get_wrf_fitness_batch(requests, verbose=True)
+    assert len(results) == 3
+    assert results[0] == results[2]
+    assert all([status in ['complete', 'failed'] for _, _, _, _, status in results])
+
+
+def test_get_wrf_fitness_batch_staging_failed(monkeypatch):
+    """Checks that every simulation on a date whose inputs could not be staged fails without being run."""
+    simulated = []
+
+    def fn_prepare(param_ids, start_date, end_date, **kwargs):
+        return start_date != 'Jan 1 2012'
+
+    def fn_fitness(param_ids, start_date, end_date, **kwargs):
+        simulated.append((tuple(param_ids), start_date))
+        return 1.0, 1.0, 1.0, '00h 01m 00s', 'complete'
+
+    monkeypatch.setattr(owp, 'prepare_wrf_inputs', fn_prepare)
+    monkeypatch.setattr(owp, 'get_wrf_fitness', fn_fitness)
+    requests = [(param_ids, 'Dec 31 2011'), (param_ids, 'Jan 1 2012'), ([10, 4, 4, 2, 2, 7, 2], 'Jan 1 2012')]
+    results = get_wrf_fitness_batch(requests)
+    assert simulated == [(tuple(param_ids), 'Dec 31 2011')]
+    assert results[0][4] == 'complete'
+    assert [status for _, _, _, _, status in results[1:]] == ['failed', 'failed']
+    assert results[1][0] == 6.022 * 10 ** 23
+
+
 def test_run_simplega():
     """Tests the genetic algroithm framework without running WRF."""
     WRFga_winner = run_simplega(pop_size=100, n_generations=1, testing=True)
     assert WRFga_winner.Fitness >= 0
 
 
+def test_run_simplega_steady_state():
+    """Tests the steady-state (asynchronous) genetic algroithm scheduler without running WRF."""
+    WRFga_winner = run_simplega(pop_size=10, n_generations=2, testing=True, scheduler='steady_state', n_slots=4)
+    assert WRFga_winner.Fitness >= 0
+
+
+def test_steady_state_scheduling():
+    """Checks on a virtual clock, with uneven runtimes, that the steady-state scheduler keeps n_slots evaluations
+    in flight, submits a replacement as soon as an evaluation finishes, and idles less than the generational one."""
+    class TracingBackend(VirtualClockBackend):
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            # Virtual time of each submission, and the number of evaluations in flight after it
+            self.submissions = []
+
+        def submit(self, fn, *args, **kwargs):
+            future = super().submit(fn, *args, **kwargs)
+            self.submissions.append((self.clock, len(self._running) + len(self._queued)))
+            return future
+
+    n_slots = 4
+    idle_frac = {}
+    for scheduler in ['generational', 'steady_state']:
+        backend = TracingBackend(max_workers=n_slots)
+        random.seed(0)
+        run_simplega(pop_size=10, n_generations=3, scheduler=scheduler, n_slots=n_slots, backend=backend,
+                     fitness_fn=ReplayFitness(staging_seconds=0), db_name=':memory:', restart_file=False)
+        idle_frac[scheduler] = backend.stats()['idle_frac']
+    clocks = [clock for clock, _ in backend.submissions]
+    in_flight = [n_running for _, n_running in backend.submissions]
+    assert len(backend.submissions) > 2 * n_slots
+    assert in_flight[:n_slots] == list(range(1, n_slots + 1))
+    assert all([n_running == n_slots for n_running in in_flight[n_slots:]])
+    # The k-th replacement is submitted at the moment the k-th evaluation finishes
+    end_times = [end_time for end_time, _ in backend.trace]
+    assert clocks[n_slots:] == end_times[:len(clocks) - n_slots]
+    assert idle_frac['steady_state'] < idle_frac['generational']
+
+
+def test_steady_state_batched_lookup(monkeypatch):
+    """Checks that the steady-state scheduler looks up the initial population and each bred batch at once."""
+    batch_sizes = []
+    resolve = owp.FitnessCache.resolve
+
+    def fn_resolve(self, population, db_conn):
+        batch_sizes.append(len(population))
+        return resolve(self, population, db_conn)
+
+    monkeypatch.setattr(owp.FitnessCache, 'resolve', fn_resolve)
+    run_simplega(pop_size=10, n_generations=2, testing=True, scheduler='steady_state', n_slots=4,
+                 db_name=':memory:', restart_file=False)
+    assert batch_sizes[0] == 10
+    assert all([batch_size == 2 for batch_size in batch_sizes[1:]]) and len(batch_sizes) > 1
+
+
+def test_run_simplega_surrogate():
+    """Tests the surrogate screening of offspring in the genetic algroithm without running WRF."""
+    WRFga_winner = run_simplega(pop_size=10, n_generations=1, testing=True, surrogate=True, screen_frac=0.5)
+    assert WRFga_winner.Fitness >= 0
+
+
+def test_run_simplega_racing():
+    """Tests racing individuals on several dates in the genetic algroithm without running WRF."""
+    WRFga_winner = run_simplega(pop_size=10, n_generations=1, testing=True, race_dates=3)
+    assert WRFga_winner.Fitness >= 0
+
+
+def test_run_simplega_date_policy():
+    """Tests the genetic algorithm with offspring that share a few start dates in each generation."""
+    date_policy = sga.DatePolicy('common', n_common=2)
+    WRFga_winner = run_simplega(pop_size=10, n_generations=2, testing=True, date_policy=date_policy)
+    assert WRFga_winner.Fitness >= 0
+    assert date_policy.gen == 2
+    assert date_policy.stats()['hit_rate'] >= 0.5
+
+
+def test_run_simplega_pareto():
+    """Tests the multi-objective (Pareto) mode of the genetic algorithm without running WRF."""
+    front = run_simplega(pop_size=10, n_generations=2, testing=True, pareto=True)
+    assert len(front) > 0
+    for a in front:
+        assert not any([sga.dominates(sga.objectives(b), sga.objectives(a)) for b in front])
+    for method in ['solar_only', 'wind_only', 'both']:
+        assert owp.choose_from_front(front, method=method) in front
+    # On a fixed front, each weighting picks the member that is better at what it judges
+    ghi_member = sga.Chromosome(param_ids, 'Jun 21 2011', 'Jun 22 2011', ghi_error=100.0, wpd_error=2e6)
+    wpd_member = sga.Chromosome(param_ids, 'Jun 21 2011', 'Jun 22 2011', ghi_error=300.0, wpd_error=1e5)
+    assert owp.choose_from_front([ghi_member, wpd_member], method='solar_only') is ghi_member
+    assert owp.choose_from_front([ghi_member, wpd_member], method='wind_only') is wpd_member
+    # The weighted fitness (both) of the choice is no worse than that of either member, computed by hand
+    daylight = hf.daylight_frac('Jun 21 2011')
+    best = owp.choose_from_front([ghi_member, wpd_member], method='both')
+    assert daylight * best.GHI_error + 0.0004218304553577255 * best.WPD_error \
+        <= min(daylight * 100.0 + 0.0004218304553577255 * 2e6, daylight * 300.0 + 0.0004218304553577255 * 1e5)
+
+
+def test_run_simplega_resume(tmp_path, monkeypatch):
+    """Checks that the genetic algorithm can be resumed from its checkpoint without running WRF."""
+    reports = []
+    monkeypatch.setattr(owp, 'print_stage_timings', reports.append)
+    checkpoint_file = str(tmp_path / 'optwrf_checkpoint.json')
+    run_simplega(pop_size=10, n_generations=1, testing=True, checkpoint_file=checkpoint_file)
+    checkpoint = owp.read_checkpoint(checkpoint_file)
+    assert checkpoint['gen'] == 1
+    assert len(checkpoint['in_flight']) == len(checkpoint['offspring']) - len(checkpoint['elites'])
+    assert all([individual.Fitness is not None for individual in checkpoint['population']])
+    # Pick up where the run stopped, and run one more generation; the resumed generation is reported too
+    reports.clear()
+    WRFga_winner = run_simplega(pop_size=10, n_generations=2, testing=True, checkpoint_file=checkpoint_file,
+                                resume=True)
+    assert WRFga_winner.Fitness >= 0
+    assert len(reports) == 2
+    assert owp.read_checkpoint(checkpoint_file)['gen'] == 2
+    # The steady-state scheduler checkpoints after every evaluation
+    run_simplega(pop_size=10, n_generations=1, testing=True, scheduler='steady_state',
+                 checkpoint_file=checkpoint_file)
+    checkpoint = owp.read_checkpoint(checkpoint_file)
+    assert checkpoint['scheduler'] == 'steady_state'
+    assert checkpoint['n_submitted'] == 19
+    WRFga_winner = run_simplega(pop_size=10, n_generations=2, testing=True, scheduler='steady_state',
+                                checkpoint_file=checkpoint_file, resume=True)
+    assert WRFga_winner.Fitness >= 0
+
+
+def test_get_racing_fitness():
+    """Checks that racing stops once the parameters cannot beat the elites, and that each date is recorded."""
+    dates = ['Jan 05 2011', 'Feb 05 2011', 'Mar 05 2011', 'Apr 05 2011']
+    recorded = []
+
+    def fitness_fn(param_ids, start_date, end_date, **kwargs):
+        return 50 + len(recorded), 1, 2, '01h 00m 00s'
+
+    def record(*date_results):
+        recorded.append(date_results)
+
+    fitness, ghi_error, wpd_error, runtime = owp.get_racing_fitness([8, 4, 4, 2, 2, 6, 2], dates, elite_fitness=10,
+                                                                    fitness_fn=fitness_fn, record=record)
+    assert len(recorded) == 2
+    assert fitness == 50.5
+    assert runtime == '02h 00m 00s'
+    # Previously scored dates are looked up rather than rerun
+    recorded.clear()
+    fitness, _, _, _ = owp.get_racing_fitness([8, 4, 4, 2, 2, 6, 2], dates, fitness_fn=fitness_fn, record=record,
+                                              lookup=lambda param_ids, start_date: (0, 0, 0, '00h 00m 00s'))
+    assert len(recorded) == 0
+    assert fitness == 0
+
+
+def test_core_idle_time():
+    """Checks that idle slot time is computed from the reserved and busy slot time."""
+    idle_seconds = owp.core_idle_time(n_slots=4, wall_seconds=10, busy_seconds=25)
+    assert idle_seconds == 15
+
+
+def test_fitness_cache():
+    """Checks that a population is resolved from the fitness cache and the simulation database."""
+    db_conn = conn_to_db(':memory:')
+    old_sim1 = sga.Chromosome([8, 4, 4, 2, 2, 6, 2], 'Jan 05 2011', 'Jan 06 2011', 10, 1, 2, '01h 00m 00s')
+    old_sim2 = sga.Chromosome([4, 4, 2, 2, 2, 1, 2], 'Feb 05 2011', 'Feb 06 2011', 20, 3, 4, '02h 00m 00s')
+    owp.insert_sim(old_sim1, db_conn)
+    owp.insert_sim(old_sim2, db_conn)
+    # Only the most recent simulation fits in memory
+    fitness_cache = owp.FitnessCache(max_size=1)
+    fitness_cache.warm(db_conn)
+    population = [sga.Chromosome([8, 4, 4, 2, 2, 6, 2], 'Jan 05 2011', 'Jan 06 2011'),
+                  sga.Chromosome([4, 4, 2, 2, 2, 1, 2], 'Feb 05 2011', 'Feb 06 2011'),
+                  sga.Chromosome([4, 4, 2, 2, 2, 1, 2], 'Mar 05 2011', 'Mar 06 2011')]
+    unresolved = fitness_cache.resolve(population, db_conn)
+    close_conn_to_db(db_conn)
+    assert fitness_cache.hits == 1
+    assert fitness_cache.misses == 2
+    assert population[0].Fitness == 10
+    assert population[1].Fitness == 20
+    assert unresolved == [population[2]]
+    assert len(fitness_cache) == 1
+    # Pruned simulations only have a partial fitness, so they are never reused
+    pruned_sim = sga.Chromosome([2, 4, 4, 2, 2, 6, 2], 'Apr 05 2011', 'Apr 06 2011', 5, 1, 1, '00h 30m 00s',
+                                status='pruned')
+    db_conn = conn_to_db(':memory:')
+    owp.insert_sim(pruned_sim, db_conn)
+    fitness_cache = owp.FitnessCache()
+    fitness_cache.put(pruned_sim)
+    fitness_cache.warm(db_conn)
+    assert len(fitness_cache) == 0
+    population = [sga.Chromosome([2, 4, 4, 2, 2, 6, 2], 'Apr 05 2011', 'Apr 06 2011')]
+    assert fitness_cache.resolve(population, db_conn) == population
+    assert population[0].Fitness is None
+    close_conn_to_db(db_conn)
+
+
+def test_single_flight():
+    """Checks that identical individuals share one in-flight fitness evaluation."""
+    single_flight = owp.SingleFlight()
+    creature1 = sga.Chromosome([8, 4, 4, 2, 2, 6, 2], 'Jan 05 2011', 'Jan 06 2011')
+    creature2 = sga.Chromosome([8, 4, 4, 2, 2, 6, 2], 'Jan 05 2011', 'Jan 06 2011')
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        future1, is_new1 = single_flight.submit(creature1, lambda: executor.submit(owp.get_fitness, creature1.Genes))
+        future2, is_new2 = single_flight.submit(creature2, lambda: executor.submit(owp.get_fitness, creature2.Genes))
+        assert future1 is future2
+        assert is_new1 and not is_new2
+        assert single_flight.n_shared == 1
+        future1.result()
+        single_flight.release(creature1)
+        future3, is_new3 = single_flight.submit(creature2, lambda: executor.submit(owp.get_fitness, creature2.Genes))
+        assert is_new3
+        assert future3 is not future1
+
+
 def test_print_database():
     """Checks to see if the contnts of a database can be successfully printed to the screen."""
     db_conn = conn_to_db('optwrf.db')
@@ -87,6 +341,32 @@ def test_update_sim():
     print_database(db_conn)
 
 
+def test_status_column_migration(tmp_path):
+    """Checks that a database created before the status column existed is migrated, and that pruned simulations
+    are stored with their status."""
+    db_name = str(tmp_path / 'optwrf_old.db')
+    old_conn = sqlite3.connect(db_name)
+    with old_conn:
+        old_conn.execute("""CREATE TABLE simulations (start_date DATE, mp_physics INTEGER, ra_lw_physics INTEGER,
+                            ra_sw_physics INTEGER, sf_surface_physics INTEGER, bl_pbl_physics INTEGER,
+                            cu_physics INTEGER, sf_sfclay_physics INTEGER, fitness FLOAT, ghi_error FLOAT,
+                            wpd_error FLOAT, runtime FLOAT)""")
+        old_conn.execute("""INSERT INTO simulations
+                            VALUES ('Jan 05 2011', 8, 4, 4, 2, 2, 6, 2, 10, 1, 2, '01h 00m 00s')""")
+    old_conn.close()
+    db_conn = conn_to_db(db_name)
+    pruned_sim = sga.Chromosome([4, 4, 2, 2, 2, 1, 2], 'Feb 05 2011', 'Feb 06 2011', 20, 3, 4, '00h 30m 00s',
+                                status='pruned')
+    owp.insert_sim(pruned_sim, db_conn)
+    old_sim = owp.get_individual_by_genes(sga.Chromosome([8, 4, 4, 2, 2, 6, 2], 'Jan 05 2011', 'Jan 06 2011'), db_conn)
+    assert old_sim.Fitness == 10
+    assert old_sim.Status is None
+    past_sim = owp.get_individual_by_genes(pruned_sim, db_conn)
+    assert past_sim.Status == 'pruned'
+    assert past_sim.Runtime == '00h 30m 00s'
+    close_conn_to_db(db_conn)
+
+
 def test_sql_to_csv():
     """Checks the function that writes the SQL database to a CSV file."""
     csv_outfile = 'optwrf_database.csv'
@@ -94,3 +374,204 @@ def test_sql_to_csv():
     sql_to_csv(csv_outfile, db_conn)
     close_conn_to_db(db_conn)
     assert os.path.exists(csv_outfile) == 1
+
+
+def test_simulation_database(tmp_path):
+    """Checks that many threads can write to (and read from) the simulation database at once without lock errors,
+    and that simulations can be imported in bulk from a CSV file or another database."""
+    db_name = str(tmp_path / 'optwrf_concurrent.db')
+    n_threads = 8
+    n_inserts = 500
+
+    def fn_evaluator(thread_id):
+        for ii in range(n_inserts):
+            start_date = (datetime.date(2011, 1, 1) + datetime.timedelta(days=ii)).strftime('%b %d %Y')
+            sim_db.insert(sga.Chromosome([thread_id + 1, 7, 3, 1, 1, 10, 1], start_date, None, 1.0,
+                                         1.0, 2.0, '01h 00m 00s', 'complete'))
+            if ii % 100 == 0:
+                sim_db.connection().execute("""SELECT COUNT(*) FROM simulations""").fetchone()
+
+    with owp.SimulationDatabase(db_name) as sim_db:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=n_threads) as executor:
+            list(executor.map(fn_evaluator, range(n_threads)))
+        sim_db.flush()
+        db_conn = sim_db.connection()
+        assert db_conn.execute("""SELECT COUNT(*) FROM simulations""").fetchall()[0][0] == n_threads * n_inserts
+        assert db_conn.execute("""PRAGMA journal_mode""").fetchone()[0] == 'wal'
+        # Writes are grouped into transactions
+        assert sim_db.n_transactions < n_threads * n_inserts / 10
+        # The read-only connections cannot write
+        try:
+            db_conn.execute("""DELETE FROM simulations""")
+            assert False
+        except sqlite3.OperationalError:
+            pass
+        # Bulk imports from a CSV file and from another database
+        csv_file = str(tmp_path / 'optwrf_concurrent.csv')
+        sql_to_csv(csv_file, db_conn)
+        other_name = str(tmp_path / 'optwrf_other.db')
+        other_conn = conn_to_db(other_name)
+        owp.insert_sim(sga.Chromosome([10, 7, 3, 1, 1, 10, 1], 'Feb 05 2011', 'Feb 06 2011', 1.0), other_conn)
+        close_conn_to_db(other_conn)
+        assert sim_db.import_csv(csv_file) == n_threads * n_inserts
+        assert sim_db.import_db(other_name) == 1
+        sim_db.flush()
+        # The simulations in the CSV file are already in the database, so they are updated instead of duplicated
+        assert db_conn.execute("""SELECT COUNT(*) FROM simulations""").fetchall()[0][0] == n_threads * n_inserts + 1
+    # In-memory databases are shared by the writer and the readers
+    with owp.SimulationDatabase(':memory:') as sim_db:
+        sim_db.insert_many([sga.Chromosome([8, 7, 3, 1, 1, 10, 1], f'Jan 0{ii + 1} 2011', None, 1.0)
+                            for ii in range(3)])
+        sim_db.flush()
+        assert sim_db.connection().execute("""SELECT COUNT(*) FROM simulations""").fetchall()[0][0] == 3
+
+
+def test_schema_migration_and_upsert(tmp_path):
+    """Checks that an old database is migrated in place to a unique (start date, genes) key with indexes,
+    that inserting a simulation twice updates it, and that lookups use the indexes."""
+    db_name = str(tmp_path / 'optwrf_unindexed.db')
+    old_conn = sqlite3.connect(db_name)
+    with old_conn:
+        old_conn.execute("""CREATE TABLE simulations (start_date DATE, mp_physics INTEGER, ra_lw_physics INTEGER,
+                            ra_sw_physics INTEGER, sf_surface_physics INTEGER, bl_pbl_physics INTEGER,
+                            cu_physics INTEGER, sf_sfclay_physics INTEGER, fitness FLOAT, ghi_error FLOAT,
+                            wpd_error FLOAT, runtime FLOAT)""")
+        old_conn.executemany("""INSERT INTO simulations VALUES (?, 8, 4, 4, 2, 2, 6, 2, ?, 1, 2, '01h 00m 00s')""",
+                             [('Jan 05 2011', 10), ('Jan 05 2011', 20), ('Jan 06 2011', 30)])
+    old_conn.close()
+    db_conn = conn_to_db(db_name)
+    indexes = [row[1] for row in db_conn.execute("""PRAGMA index_list(simulations)""").fetchall()]
+    assert set(indexes) >= {'simulations_key', 'simulations_genes', 'simulations_date'}
+    # Only the most recent copy of the duplicated simulation was kept
+    assert db_conn.execute("""SELECT COUNT(*) FROM simulations""").fetchall()[0][0] == 2
+    individual = sga.Chromosome([8, 4, 4, 2, 2, 6, 2], 'Jan 05 2011', 'Jan 06 2011')
+    assert owp.get_individual_by_genes(individual, db_conn).Fitness == 20
+    # Inserting the same simulation again updates it, and update_sim only changes the simulation on its date
+    individual.Fitness = 5
+    owp.insert_sim(individual, db_conn)
+    assert owp.get_individual_by_genes(individual, db_conn).Fitness == 5
+    individual.Fitness = 1
+    assert owp.update_sim(individual, db_conn) == 1
+    other_date = sga.Chromosome([8, 4, 4, 2, 2, 6, 2], 'Jan 06 2011', 'Jan 07 2011')
+    assert owp.get_individual_by_genes(other_date, db_conn).Fitness == 30
+    # Lookups by key, by genes only, and by date only are answered from the indexes
+    for where in [' AND '.join([f'{column} = 1' for column in owp.sim_key_columns]),
+                  ' AND '.join([f'{column} = 1' for column in owp.sim_key_columns[1:]]),
+                  "start_date = 'Jan 05 2011'"]:
+        plan = ' '.join([row[-1] for row in db_conn.execute(
+            f"""EXPLAIN QUERY PLAN SELECT fitness FROM simulations WHERE {where}""").fetchall()])
+        assert 'USING' in plan and 'INDEX' in plan
+    close_conn_to_db(db_conn)
+
+
+def test_run_simplega_failed_evaluations(tmp_path):
+    """Checks that evaluations that raise (e.g., a SLURM task that left the queue without a result) fail their
+    individual instead of aborting the genetic algorithm."""
+    def fitness_fn(param_ids, start_date, end_date, **kwargs):
+        if param_ids[0] % 2 == 0:
+            raise RuntimeError('SLURM job 123 ended without writing its result')
+        return float(param_ids[0]), 1.0, 1.0, '01h 00m 00s', 'complete'
+
+    for scheduler in ['generational', 'steady_state']:
+        db_name = str(tmp_path / f'optwrf_{scheduler}.db')
+        run_simplega(pop_size=6, n_generations=1, restart_file=False, scheduler=scheduler, n_slots=3,
+                     fitness_fn=fitness_fn, db_name=db_name)
+        db_conn = conn_to_db(db_name)
+        rows = db_conn.execute("""SELECT mp_physics, fitness, status FROM simulations""").fetchall()
+        close_conn_to_db(db_conn)
+        assert len(rows) > 0
+        for mp_physics, fitness, status in rows:
+            if mp_physics % 2 == 0:
+                assert fitness == 6.022 * 10 ** 23 and status == 'failed'
+            else:
+                assert fitness == mp_physics and status == 'complete'
+
+
+def test_hourly_errors_and_rescore(tmp_path):
+    """Checks that the hourly errors are stored by run_simplega, and that the whole database can be re-scored
+    under a different weighting without regridding."""
+    def fitness_fn(param_ids, start_date, end_date, method='both', return_status=False, return_hourly=False,
+                   **kwargs):
+        hours = np.arange(0, 24, dtype=float)
+        ghi_errors = np.where((hours >= 12) & (hours < 22), float(param_ids[0]), 0.0)
+        wpd_errors = np.full(24, 100.0 * param_ids[1])
+        fitness = owp.calculate_fitness(ghi_errors.sum(), wpd_errors.sum(), start_date, method=method)
+        return fitness, ghi_errors.sum(), wpd_errors.sum(), '01h 00m 00s', 'complete', (hours, ghi_errors, wpd_errors)
+
+    db_name = str(tmp_path / 'optwrf_hourly.db')
+    run_simplega(pop_size=6, n_generations=1, restart_file=False, fitness_fn=fitness_fn, db_name=db_name)
+    db_conn = conn_to_db(db_name)
+    n_sims = db_conn.execute("""SELECT COUNT(*) FROM simulations""").fetchone()[0]
+    assert db_conn.execute("""SELECT COUNT(*) FROM simulation_errors""").fetchone()[0] == n_sims
+    # With the default weighting, the stored fitness is recovered
+    scores = owp.rescore_fitness(db_conn)
+    for start_date, genes, fitness in zip(scores['start_date'], scores['genes'], scores['fitness']):
+        stored = owp.get_individual_by_genes(sga.Chromosome(genes.tolist(), start_date, None), db_conn)
+        assert np.isclose(stored.Fitness, fitness)
+    # Only counting the GHI error between 15 and 21 UTC, without the daylight fraction
+    ghi_hour_weights = [1.0 if 15 <= hour < 21 else 0.0 for hour in range(24)]
+    scores = owp.rescore_fitness(db_conn, method='solar_only', daylight=False, ghi_hour_weights=ghi_hour_weights,
+                                 update=True)
+    assert np.allclose(scores['fitness'], 6 * scores['genes'][:, 0])
+    start_date, genes = scores['start_date'][0], scores['genes'][0].tolist()
+    assert owp.get_individual_by_genes(sga.Chromosome(genes, start_date, None), db_conn).Fitness == 6 * genes[0]
+    # Hourly errors can also be inserted directly, and inserting them again replaces them
+    individual = sga.Chromosome([8, 4, 4, 2, 2, 6, 2], 'Jan 05 2011', 'Jan 06 2011')
+    owp.insert_hourly_errors(individual, ([0, 1], [1, 2], [3, 4]), db_conn)
+    owp.insert_hourly_errors(individual, ([0, 1, 2], [1, 2, 3], [3, 4, 5]), db_conn)
+    hourly = owp.read_hourly_errors(db_conn)
+    assert hourly['ghi_errors'].shape == (n_sims + 1, 24)
+    row = hourly['start_date'].index('Jan 05 2011')
+    assert list(hourly['wpd_errors'][row, 0:3]) == [3, 4, 5] and np.isnan(hourly['wpd_errors'][row, 3:]).all()
+    close_conn_to_db(db_conn)
+    # The hourly errors written by the NCL regridding script
+    error_file = str(tmp_path / 'mae_wrfyera_8mp4lw4sw2lsm2pbl6cu.csv')
+    with open(error_file, 'w') as error_data:
+        error_data.write('"Date/Time", "GHI_MAE_hr", "WPD_MAE_hr"\n2011-01-05_00:00:00,   1.50,  20.00\n'
+                         '2011-01-05_01:00:00,   2.50,  30.00\n"N/A", "GHI_MAE", "WPD_MAE"\n   0.00,   4.00,  50.00\n')
+    times, ghi_errors, wpd_errors = read_ncl_hourly_error(error_file)
+    assert times == [datetime.datetime(2011, 1, 5, 0), datetime.datetime(2011, 1, 5, 1)]
+    assert ghi_errors == [1.5, 2.5] and wpd_errors == [20.0, 30.0]
+
+
+def test_stage_timings_database(tmp_path):
+    """Checks that run_simplega stores the runtime accounting of each simulation in typed columns."""
+    def fitness_fn(param_ids, start_date, end_date, return_status=False, return_hourly=False, return_timings=False,
+                   **kwargs):
+        timings = {f'{stage}_seconds': 60.0 for stage in owp.stages}
+        timings.update({'wrf_seconds': 3600.0, 'wall_seconds': 4200.0, 'mpi_ranks': 8, 'peak_rss_mb': 512.5,
+                        'cache_hit': param_ids[0] % 2 == 0})
+        return float(param_ids[0]), 1.0, 2.0, '01h 00m 00s', 'complete', None, timings
+
+    db_name = str(tmp_path / 'optwrf_timings.db')
+    run_simplega(pop_size=6, n_generations=1, restart_file=False, fitness_fn=fitness_fn, db_name=db_name)
+    db_conn = conn_to_db(db_name)
+    n_sims = db_conn.execute("""SELECT COUNT(*) FROM simulations""").fetchone()[0]
+    assert db_conn.execute("""SELECT COUNT(*) FROM simulation_timings""").fetchone()[0] == n_sims
+    assert db_conn.execute("""SELECT COUNT(*) FROM simulation_errors""").fetchone()[0] == 0
+    assert db_conn.execute("""SELECT typeof(wrf_seconds), typeof(mpi_ranks), typeof(peak_rss_mb), typeof(cache_hit)
+                              FROM simulation_timings""").fetchone() == ('real', 'integer', 'real', 'integer')
+    timings = owp.read_timings(db_conn)
+    assert sum([timing['wrf_seconds'] for timing in timings]) == 3600.0 * n_sims
+    assert all([timing['cache_hit'] == (timing['mp_physics'] % 2 == 0) for timing in timings])
+    owp.print_stage_timings(timings)
+    # Missing values are stored as NULL, and inserting the accounting again replaces it
+    individual = sga.Chromosome([8, 4, 4, 2, 2, 6, 2], 'Jan 05 2011', 'Jan 06 2011')
+    owp.insert_timings(individual, {'wrf_seconds': 10}, db_conn)
+    owp.insert_timings(individual, {'wrf_seconds': 20, 'mpi_ranks': 4}, db_conn)
+    assert db_conn.execute("""SELECT wrf_seconds, mpi_ranks, real_seconds FROM simulation_timings
+                              WHERE start_date = 'Jan 05 2011'""").fetchall() == [(20.0, 4, None)]
+    close_conn_to_db(db_conn)
+
+
+def test_run_simplega_progress(tmp_path, capsys):
+    """Checks that the progress of the running simulations is reported while the genetic algorithm waits."""
+    def fitness_fn(param_ids, start_date, end_date, **kwargs):
+        time.sleep(0.3)
+        return float(param_ids[0]), 1.0, 2.0, '01h 00m 00s', 'complete'
+
+    db_name = str(tmp_path / 'optwrf_progress.db')
+    for scheduler in ['generational', 'steady_state']:
+        run_simplega(pop_size=4, n_generations=1, restart_file=False, fitness_fn=fitness_fn, db_name=db_name,
+                     scheduler=scheduler, n_slots=4, progress_interval=0.1)
+        assert 'WRF has not started integrating' in capsys.readouterr().out
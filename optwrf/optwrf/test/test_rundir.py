@@ -0,0 +1,89 @@
+"""
+Tests the in-process, manifest-driven setup of WRF run directories
+
+"""
+
+import os
+
+import pytest
+
+from optwrf import rundir
+from optwrf.runwrf import WRFModel
+
+param_ids = [10, 1, 1, 2, 2, 3, 2]
+start_date = 'Dec 31, 2011'
+end_date = 'Jan 1, 2012'
+
+
+def _fake_wrf_sim(tmp_path):
+    """Creates a WRFModel whose WRF, WPS, and template directories are small fakes in tmp_path."""
+    wrf_sim = WRFModel(param_ids, start_date, end_date, verbose=False)
+    wrf_sim.DIR_WRF = str(tmp_path / 'WRF') + '/'
+    wrf_sim.DIR_WPS = str(tmp_path / 'WPS') + '/'
+    wrf_sim.DIR_TEMPLATES = str(tmp_path / 'templates') + '/'
+    wrf_sim.DIR_RUNWRF = str(tmp_path / 'optwrf') + '/'
+    wrf_sim.DIR_MET4ENE = str(tmp_path / 'met4ene') + '/'
+    wrf_sim.DIR_WRFOUT = wrf_sim.DIR_MET4ENE + 'wrfout/ARW/2011-12-31_sim/'
+    for directory in [wrf_sim.DIR_WRF + 'run/', wrf_sim.DIR_WPS + 'geogrid/', wrf_sim.DIR_WPS + 'metgrid/',
+                      wrf_sim.DIR_WPS + 'ungrib/Variable_Tables/', wrf_sim.DIR_TEMPLATES, wrf_sim.DIR_RUNWRF]:
+        os.makedirs(directory, exist_ok=True)
+    for file in [wrf_sim.DIR_WRF + 'run/' + name for name in ['RRTM_DATA', 'ozone.formatted', 'wrf.exe',
+                                                              'real.exe', 'README.namelist']] \
+            + [wrf_sim.DIR_WPS + name for name in ['geogrid.exe', 'ungrib.exe', 'metgrid.exe']] \
+            + [wrf_sim.DIR_WPS + 'ungrib/Variable_Tables/Vtable.ERA-interim.pl',
+               wrf_sim.DIR_RUNWRF + 'wrf2era_error.ncl'] \
+            + [wrf_sim.DIR_TEMPLATES + name for name in ['namelist.wps', 'namelist.input', 'template_rungeogrid.csh',
+                                                         'template_runungmetg.csh', 'template_runreal.csh',
+                                                         'template_runwrf.csh']]:
+        with open(file, 'w') as fake_file:
+            fake_file.write(os.path.basename(file) + '\n')
+    return wrf_sim
+
+
+@pytest.mark.parametrize('mode', rundir.modes)
+def test_wrfdir_setup(tmp_path, mode):
+    """Checks that the run directory links to the WRF and WPS files, and has its own copies of the templates."""
+    wrf_sim = _fake_wrf_sim(tmp_path)
+    wrf_sim.rundir_mode = mode
+    assert wrf_sim.wrfdir_setup('ERA-interim.pl')
+    run_dir = wrf_sim.DIR_WRFOUT
+    assert sorted(os.listdir(run_dir)) == sorted(['RRTM_DATA', 'ozone.formatted', 'wrf.exe', 'real.exe', 'geogrid',
+                                                  'geogrid.exe', 'ungrib.exe', 'metgrid', 'metgrid.exe', 'Vtable',
+                                                  'wrf2era_error.ncl', 'namelist.wps', 'namelist.input',
+                                                  'rungeogrid.csh', 'runungmetg.csh', 'runreal.csh', 'runwrf.csh'])
+    assert os.path.islink(run_dir + 'wrf.exe') and os.path.islink(run_dir + 'geogrid')
+    assert os.readlink(run_dir + 'Vtable') == wrf_sim.DIR_WPS + 'ungrib/Variable_Tables/Vtable.ERA-interim.pl'
+    assert wrf_sim.rundir_stats['n_links'] == 11 and wrf_sim.rundir_stats['n_copies'] == 6
+    # The namelists are edited in place, so editing them must not change the templates or the skeleton
+    for namelist in ['namelist.wps', 'namelist.input']:
+        assert not os.path.islink(run_dir + namelist) and os.stat(run_dir + namelist).st_nlink == 1
+        with open(run_dir + namelist, 'w') as namelist_file:
+            namelist_file.write('edited\n')
+        with open(wrf_sim.DIR_TEMPLATES + namelist) as template_file:
+            assert template_file.read() == namelist + '\n'
+    if mode == 'hardlink':
+        assert wrf_sim.rundir_stats['n_hardlinks'] == 15
+        assert os.stat(run_dir + 'runwrf.csh').st_nlink == 2
+    # A second run directory reuses the cached manifest
+    n_hits = rundir._cached_manifest.cache_info().hits
+    wrf_sim.DIR_WRFOUT = wrf_sim.DIR_MET4ENE + 'wrfout/ARW/2011-12-31_sim2/'
+    assert wrf_sim.wrfdir_setup('ERA-interim.pl')
+    assert rundir._cached_manifest.cache_info().hits == n_hits + 1
+    assert len(os.listdir(wrf_sim.DIR_WRFOUT)) == 17
+
+
+def test_force_symlink_and_move_file(tmp_path):
+    """Checks that links are replaced like ln -sf, and that files are moved like mv."""
+    source_dir = tmp_path / 'source'
+    dest_dir = tmp_path / 'dest'
+    source_dir.mkdir()
+    dest_dir.mkdir()
+    (source_dir / 'met_em.d01.nc').write_text('met_em')
+    rundir.force_symlink(str(source_dir / 'met_em.d01.nc'), str(dest_dir) + '/.')
+    assert os.readlink(str(dest_dir / 'met_em.d01.nc')) == str(source_dir / 'met_em.d01.nc')
+    rundir.force_symlink(str(source_dir / 'other.nc'), str(dest_dir / 'met_em.d01.nc'))
+    assert os.readlink(str(dest_dir / 'met_em.d01.nc')) == str(source_dir / 'other.nc')
+    (tmp_path / 'geo_em.d01.nc').write_text('geo_em')
+    assert rundir.move_file(str(tmp_path / 'geo_em.d01.nc'), str(source_dir))
+    assert (source_dir / 'geo_em.d01.nc').read_text() == 'geo_em'
+    assert not rundir.move_file(str(tmp_path / 'missing.nc'), str(source_dir))
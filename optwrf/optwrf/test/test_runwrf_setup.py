@@ -18,8 +18,13 @@ will automatically pass.
 """
 
 import os
+import sys
+import time
 
-from optwrf.runwrf import WRFModel
+import pytest
+
+from optwrf.runwrf import WRFModel, stages, timed_stage
+from optwrf.watcher import CompletionWatcher
 from optwrf.helper_functions import determine_computer
 import optwrf.helper_functions as hf
 
@@ -47,6 +52,16 @@ def test_WRFModel():
     assert wrf_sim.start_date == start_date
 
 
+def test_submit_and_cancel_job():
+    """Checks that a job run as a local process (as on AWS) can be cancelled before it finishes."""
+    wrf_sim = WRFModel(param_ids, start_date, end_date)
+    wrf_sim.on_aws = True
+    job = wrf_sim.submit_job('sleep 60')
+    assert job.poll() is None
+    wrf_sim.cancel_job(job)
+    assert job.wait(timeout=10) != 0
+
+
 def test_get_bc_data(setup_yaml='mac_dirpath.yml'):
     """
     Checks if WRF boundary condition data can be downloaded from the RDA.
@@ -133,3 +148,180 @@ def test_run_wps():
     lastmetfile = f'met_em.d{str(wrf_sim.n_domains).zfill(2)}.{wrf_sim.forecast_end.strftime("%Y-%m-%d")}_00:00:00.nc'
     assert success is True
     assert os.path.exists(wrf_sim.DIR_WRFOUT + lastmetfile)
+
+
+def test_wps_files():
+    """Checks the lists of WPS files that a simulation needs, and that they can be found once archived."""
+    wrf_sim = WRFModel(param_ids, start_date, end_date)
+    assert wrf_sim.geo_em_files() == ['geo_em.d01.nc']
+    met_em_files = wrf_sim.met_em_files()
+    assert len(met_em_files) == 9
+    assert met_em_files[0] == 'met_em.d01.2011-12-31_00:00:00.nc'
+    assert met_em_files[-1] == 'met_em.d01.2012-01-01_00:00:00.nc'
+    assert wrf_sim.vtable_sfx() == 'ERA-interim.pl'
+    if not os.path.exists(wrf_sim.DIR_DATA_ROOT):
+        print('\n!!!Not checking for archived WPS files -- switch to Magma, Cheyenne, or AWS!!!')
+        return
+    assert type(wrf_sim.wps_files_exist()) is bool
+
+
+def test_partial_wrf_era5_diff(tmp_path, monkeypatch):
+    """Checks that partial frames are only scored with a valid regridding method, once WRF has written them,
+    and that their processing is not recorded as a separate stage."""
+    wrf_sim = WRFModel(param_ids, start_date, end_date)
+    wrf_sim.DIR_WRFOUT = str(tmp_path) + '/'
+    with pytest.raises(NameError):
+        wrf_sim.partial_wrf_era5_diff(method='bilinear')
+    for method in ['ncl', 'xesmf', 'pyresample']:
+        assert wrf_sim.partial_wrf_era5_diff(method=method) is None
+    # Partial frames are processed while WRF runs, so their processing is not counted as wrfout processing
+    monkeypatch.setattr(wrf_sim, 'count_wrfout_frames', lambda domain=1: 3)
+    assert wrf_sim.partial_wrf_era5_diff() is None
+    assert wrf_sim.stage_seconds['wrfout_processing'] == 0
+    assert not wrf_sim.process_wrfout_data(domain=1)
+    assert wrf_sim.stage_seconds['wrfout_processing'] > 0
+
+
+def test_stage_timings(tmp_path):
+    """Checks that the wall time of each stage, the MPI ranks, and the peak memory of a simulation are recorded."""
+    wrf_sim = WRFModel(param_ids, start_date, end_date)
+    timed_sleep = timed_stage('real')(lambda sim, seconds: time.sleep(seconds))
+    timed_sleep(wrf_sim, 0.05)
+    timed_sleep(wrf_sim, 0.05)
+    timings = wrf_sim.timings()
+    assert list(timings.keys())[0:len(stages)] == [f'{stage}_seconds' for stage in stages]
+    assert 0.1 <= timings['real_seconds'] < 1 and timings['wrf_seconds'] == 0
+    assert timings['peak_rss_mb'] is None and timings['cache_hit'] is None
+    # Each MPI rank writes its own rsl.out file
+    wrf_sim.DIR_WRFOUT = str(tmp_path) + '/'
+    assert wrf_sim.count_mpi_ranks() is None
+    for rank in range(4):
+        open(wrf_sim.DIR_WRFOUT + f'rsl.out.{rank:04d}', 'w').close()
+    assert wrf_sim.count_mpi_ranks() == 4
+
+
+def test_wait_finish(tmp_path):
+    """Checks that waiting for real.exe ends as soon as its rsl file shows that it completed or failed."""
+    wrf_sim = WRFModel(param_ids, start_date, end_date)
+    wrf_sim.DIR_WRFOUT = str(tmp_path) + '/'
+    with open(wrf_sim.DIR_WRFOUT + 'rsl.out.0000', 'w') as rsl_file:
+        rsl_file.write('Timing for processing\n')
+    assert wrf_sim.runwrf_finish_check('real') == 'running'
+    assert wrf_sim.wait_finish('real', timeout=0.2) == 'timeout'
+    with open(wrf_sim.DIR_WRFOUT + 'rsl.out.0007', 'w') as rsl_file:
+        rsl_file.write('-------------------------------------------\n')
+    assert wrf_sim.runwrf_finish_check('real') == 'failed'
+    assert wrf_sim.wait_finish('real', timeout=1) == 'failed'
+    with open(wrf_sim.DIR_WRFOUT + 'rsl.out.0000', 'a') as rsl_file:
+        rsl_file.write('real_em: SUCCESS COMPLETE REAL_EM INIT\n')
+    assert wrf_sim.runwrf_finish_check('real') == 'complete'
+    assert wrf_sim.wait_finish('real', timeout=1) == 'complete'
+
+
+def test_wait_wrf_stalled(tmp_path):
+    """Checks that a WRF job that stops writing timing lines is cancelled, and that its progress is written."""
+    wrf_sim = WRFModel(param_ids, start_date, end_date)
+    wrf_sim.DIR_WRFOUT = str(tmp_path) + '/'
+    wrf_sim.on_aws = True
+    wrf_sim.CMD_WRF = 'sleep 60'
+    wrf_sim.watcher = CompletionWatcher(poll_interval=0.1, max_poll_interval=0.2)
+    wrf_sim.stall_factor = 1
+    wrf_sim.min_stall_seconds = 0.5
+    wrf_sim.submit_wrf()
+    with open(wrf_sim.DIR_WRFOUT + 'rsl.out.0000', 'w') as rsl_file:
+        for minute in range(1, 4):
+            rsl_file.write(f'Timing for main: time 2011-12-31_00:0{minute}:00 on domain   1:    0.10000 elapsed seconds\n')
+    success, runtime = wrf_sim.wait_wrf(kill_stalled=True, save_wps_files=False)
+    assert not success and wrf_sim.wrf_status == 'stalled'
+    assert wrf_sim.wrf_job.wait(timeout=10) != 0
+    progress = wrf_sim.read_progress()
+    assert progress['status'] == 'stalled' and progress['stalled']
+    assert progress['model_time'] == '2011-12-31T00:03:00'
+    assert progress['seconds_per_model_hour'] == pytest.approx(6.0)
+
+
+def test_reattach_wrf(tmp_path):
+    """Checks that only WRF jobs that are still alive are re-attached to or cancelled, and that dead ones are resubmitted."""
+    wrf_sim = WRFModel(param_ids, start_date, end_date)
+    wrf_sim.DIR_WRFOUT = str(tmp_path) + '/'
+    wrf_sim.on_aws = True
+    wrf_sim.CMD_WRF = 'sleep 60'
+    wrf_sim.submit_wrf()
+    restarted_sim = WRFModel(param_ids, start_date, end_date)
+    restarted_sim.DIR_WRFOUT = wrf_sim.DIR_WRFOUT
+    restarted_sim.on_aws = True
+    assert restarted_sim.reattach_wrf() and restarted_sim.wrf_job == str(wrf_sim.wrf_job.pid)
+    wrf_sim.cancel_job(wrf_sim.wrf_job)
+    wrf_sim.wrf_job.wait(timeout=10)
+    assert not restarted_sim.reattach_wrf()
+    assert not os.path.exists(wrf_sim.DIR_WRFOUT + wrf_sim.FILE_WRF_JOB)
+
+    # A process that reuses the process id of the job started after the job was submitted, so it is left alone
+    job = wrf_sim.submit_job('sleep 60')
+    with open(wrf_sim.DIR_WRFOUT + wrf_sim.FILE_WRF_JOB, 'w') as job_file:
+        job_file.write(f'{job.pid}\n')
+    os.utime(wrf_sim.DIR_WRFOUT + wrf_sim.FILE_WRF_JOB, (time.time() - 3600, time.time() - 3600))
+    assert not restarted_sim.job_alive(str(job.pid))
+    restarted_sim.cancel_job(str(job.pid))
+    assert job.poll() is None
+    wrf_sim.cancel_job(job)
+    job.wait(timeout=10)
+
+
+def test_wait_wrf_start(tmp_path):
+    """Checks that waiting for WRF to start ends when its job dies or the timeout expires."""
+    wrf_sim = WRFModel(param_ids, start_date, end_date)
+    wrf_sim.DIR_WRFOUT = str(tmp_path) + '/'
+    wrf_sim.on_aws = True
+    wrf_sim.watcher = CompletionWatcher(poll_interval=0.1, max_poll_interval=0.2)
+    wrf_sim.job_check_seconds = 0.2
+    wrf_sim.CMD_WRF = 'true'
+    wrf_sim.submit_wrf()
+    success, runtime = wrf_sim.wait_wrf(save_wps_files=False)
+    assert not success and wrf_sim.wrf_status == 'failed'
+    wrf_sim.CMD_WRF = 'sleep 60'
+    wrf_sim.submit_wrf()
+    start_time = time.time()
+    assert wrf_sim.wait_wrf_start(timeout=0.5) == 'timeout'
+    assert time.time() - start_time < 5
+    wrf_sim.cancel_job(wrf_sim.wrf_job)
+    assert wrf_sim.wrf_job.wait(timeout=10) != 0
+
+
+def test_batch_job_alive(tmp_path, monkeypatch):
+    """Checks that batch jobs are looked up with squeue."""
+    squeue = tmp_path / 'squeue'
+    squeue.write_text('#!/bin/sh\n'
+                      'if [ "$3" = "4242" ]; then echo "4242 compute runwrf.csh R"; exit 0; fi\n'
+                      'echo "slurm_load_jobs error: Invalid job id specified" >&2; exit 1\n')
+    squeue.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{tmp_path}{os.pathsep}{os.environ["PATH"]}')
+    wrf_sim = WRFModel(param_ids, start_date, end_date)
+    wrf_sim.on_aws = False
+    wrf_sim.on_cheyenne = False
+    assert wrf_sim.job_alive('4242')
+    assert not wrf_sim.job_alive('17')
+    assert not wrf_sim.job_alive(None)
+
+
+def test_peak_rss_mb(tmp_path, monkeypatch):
+    """Checks that the peak memory of a simulation is that of its own WRF job, not of the supervising process."""
+    wrf_sim = WRFModel(param_ids, start_date, end_date)
+    wrf_sim.on_aws = True
+    wrf_sim.wrf_job = wrf_sim.submit_job(f'{sys.executable} -c "x = b\'1\' * 200 * 2 ** 20"')
+    start_time = time.time()
+    while wrf_sim.peak_rss_mb() is None and time.time() - start_time < 30:
+        time.sleep(0.1)
+    assert 200 <= wrf_sim.peak_rss_mb() < 1000
+    assert wrf_sim.wrf_job.returncode == 0
+    # SLURM jobs are looked up with sacct
+    sacct = tmp_path / 'sacct'
+    sacct.write_text('#!/bin/sh\necho ""\necho 1048576K\necho 512M\n')
+    sacct.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{tmp_path}{os.pathsep}{os.environ["PATH"]}')
+    wrf_sim.on_aws = False
+    wrf_sim.on_cheyenne = False
+    wrf_sim.wrf_job = '4242'
+    assert wrf_sim.peak_rss_mb() == 1024
+    wrf_sim.wrf_job = None
+    assert wrf_sim.peak_rss_mb() is None
@@ -0,0 +1,144 @@
+"""
+Tests the array-backed population and the vectorized genetic algorithm operators in simplega
+
+"""
+
+import time
+
+import numpy as np
+
+import optwrf.helper_functions as hf
+from optwrf import simplega, wrfparams
+from optwrf.simplega import Chromosome, Population
+from optwrf.surrogate import FitnessSurrogate
+
+
+def _is_valid(genes):
+    """Checks that every gene is one of its options and that the parameter dependencies hold."""
+    registry = wrfparams.load_registry()
+    for ii, type_ids in enumerate(registry.ids):
+        assert np.isin(genes[:, ii], type_ids).all()
+    assert (registry.sfclay_lookup[genes[:, 4]] == genes[:, 6]).all()
+    assert np.isin(genes[genes[:, 5] == 7, 4], [2, 9]).all()
+    assert (genes[genes[:, 5] == 11, 4] == 1).all()
+
+
+def test_chromosome_view():
+    """Checks that the Population behaves like a list of Chromosomes."""
+    chromosomes = [Chromosome([1, 1, 1, 1, 1, 1, 1], 'Jan 01 2011', 'Jan 02 2011', 10.0, 1.0, 2.0, '00h 01m 00s'),
+                   Chromosome([2, 3, 3, 2, 2, 2, 2], 'Dec 30 2011', 'Dec 31 2011')]
+    pop = Population.from_chromosomes(chromosomes)
+    assert len(pop) == 2
+    assert pop[0].Genes == [1, 1, 1, 1, 1, 1, 1]
+    assert pop[0].Fitness == 10.0
+    assert pop[1].Fitness is None
+    assert pop[1].Start_date == 'Dec 30 2011'
+    assert pop[-1].End_date == 'Dec 31 2011'
+    pop[1].Fitness = 5.0
+    assert pop.best().Genes == [2, 3, 3, 2, 2, 2, 2]
+    back = pop.to_chromosomes()
+    assert [c.Genes for c in back] == [c.Genes for c in chromosomes]
+    assert back[0].Runtime == '00h 01m 00s'
+    assert back[1].Fitness == 5.0
+
+
+def test_vectorized_operators():
+    """Checks that the vectorized operators keep the population size and produce valid genes."""
+    rng = np.random.default_rng(0)
+    pop = simplega.random_population(1000, rng=rng)
+    _is_valid(pop.genes)
+    pop.fitness[:] = rng.random(len(pop))
+    pop.fitness[0] = -1
+    mating_pop = simplega.tournament_selection(pop, 500, len(pop) * 4, rng)
+    assert len(mating_pop) == 500
+    assert mating_pop[0].Fitness == -1
+    for offspring in [simplega.uniform_crossover(mating_pop, 999, rng=rng),
+                      simplega.one_point_crossover(mating_pop, 999, rng=rng)]:
+        assert offspring.genes.shape == (999, 7)
+        assert np.isnan(offspring.fitness).all()
+        _is_valid(offspring.genes)
+        offspring = simplega.mutate_population(offspring, mutation_rate=0.5, rng=rng)
+        assert len(offspring) == 999
+        _is_valid(offspring.genes)
+    elites = pop.elites(10)
+    assert elites[0].Fitness == -1
+    assert (np.diff(elites.fitness) >= 0).all()
+
+
+def test_evolve_population_with_surrogate():
+    """Checks that a large surrogate-driven search runs quickly and improves the predicted fitness."""
+    surrogate = FitnessSurrogate(min_samples=1)
+    rng = np.random.default_rng(1)
+    training = simplega.random_population(200, rng=rng)
+    surrogate.update([(ind.Genes, ind.Start_date, float(ind.Genes[0])) for ind in training])
+    # The vectorized predictions must match the predictions made one individual at a time
+    assert np.allclose(surrogate.predict(training), surrogate.predict(training.to_chromosomes()))
+    pop = simplega.random_population(100000, rng=rng)
+    start_time = time.time()
+    pop = simplega.evolve_population(pop, surrogate.predict, n_generations=5, rng=rng)
+    assert time.time() - start_time < 60
+    assert len(pop) == 100000
+    assert pop.best().Genes[0] == training.genes[:, 0].min()
+
+
+def test_crossover_and_mutate_are_valid(monkeypatch):
+    """Checks that crossover and mutation only produce valid combinations."""
+    combinations = wrfparams.load_valid_combinations()
+    population = simplega.generate_population(20)
+    for _ in range(50):
+        offspring = simplega.crossover(population)
+        if offspring is not None:
+            assert all(child.Genes in combinations for child in offspring)
+    offspring = simplega.mutate(population, mutation_rate=1)
+    assert all(child.Genes in combinations for child in offspring)
+    # Each core gene is equally likely to be mutated, as in mutate_population
+    mutated_genes = []
+    neighbours = combinations.neighbours
+    monkeypatch.setattr(combinations, 'neighbours',
+                        lambda genes, gene_idx: mutated_genes.append(gene_idx) or neighbours(genes, gene_idx))
+    monkeypatch.setattr(wrfparams, 'load_valid_combinations', lambda: combinations)
+    simplega.mutate(simplega.generate_population(600), mutation_rate=1)
+    assert sorted(set(mutated_genes)) == [0, 1, 2, 3, 4, 5]
+    assert mutated_genes.count(4) < 2 * len(mutated_genes) / 6
+    # The PBL and cumulus schemes can only be exchanged together, so an identical gene is exchanged instead
+    assert simplega.swappable_genes([10, 4, 4, 2, 2, 7, 2], [10, 4, 4, 2, 1, 3, 1]) == [0, 1, 2, 3]
+    assert simplega.swappable_genes([10, 4, 4, 2, 2, 7, 2], [10, 4, 4, 2, 9, 3, 1]) == [4, 5]
+
+
+def test_pareto_ranking():
+    """Checks the non-dominated sorting, crowding distances, and survivors on a hand-made population."""
+    errors = [(1, 9), (2, 5), (5, 2), (9, 1), (3, 6), (6, 6), (10, 10)]
+    population = [Chromosome([1, 1, 1, 1, 1, 1, 1], f'Jan {ii + 1:02d} 2011', None, 0, ghi, wpd)
+                  for ii, (ghi, wpd) in enumerate(errors)]
+    assert simplega.non_dominated_sort(population) == [[0, 1, 2, 3], [4], [5], [6]]
+    distances = simplega.crowding_distance(population, [0, 1, 2, 3])
+    assert distances[0] == distances[3] == float('inf')
+    assert 0 < distances[1] < float('inf')
+    survivors = simplega.pareto_survivors(population, 5)
+    assert [individual.GHI_error for individual in survivors] == [1, 2, 5, 9, 3]
+    front = simplega.pareto_front(population + [population[1]])
+    assert [(individual.GHI_error, individual.WPD_error) for individual in front] == errors[0:4]
+    assert len(simplega.pareto_selection(population, 4)) == 4
+
+
+def test_date_policy():
+    """Checks that the date policies reuse dates, cover the seasons, and count the cache hits."""
+    cached = {'Jul 04 2011', 'Dec 25 2011'}
+    policy = simplega.DatePolicy('common', n_common=3, staging_seconds=60, is_cached=lambda start, end: False)
+    dates = [policy.draw()[0] for _ in range(30)]
+    assert len(set(dates)) <= 3
+    stats = policy.stats()
+    assert stats['n_drawn'] == 30 and stats['n_hits'] == 30 - len(set(dates))
+    assert stats['seconds_saved'] == 60 * stats['n_hits']
+    policy = simplega.DatePolicy('seasonal', n_common=4, is_cached=lambda start, end: False)
+    population = simplega.generate_population(40, date_policy=policy)
+    seasons = set(hf.date2season(hf.format_date(individual.Start_date)) for individual in population)
+    assert seasons == {'winter', 'spring', 'summer', 'fall'}
+    policy = simplega.DatePolicy('cached', explore_frac=0, is_cached=lambda start, end: start in cached)
+    assert set(policy.draw()[0] for _ in range(20)) <= cached
+    assert policy.stats()['hit_rate'] == 1
+    policy.new_generation()
+    assert policy.stats()['n_drawn'] == 0 and policy.stats(0)['n_drawn'] == 20
+    policy = simplega.DatePolicy(is_cached=lambda start, end: False)
+    start_date, end_date = policy.draw()
+    assert (hf.format_date(end_date) - hf.format_date(start_date)).days == 1
@@ -0,0 +1,94 @@
+"""
+Tests the asyncio supervisor of WRF simulations with local jobs that stand in for WPS, real.exe, and wrf.exe
+
+"""
+
+import asyncio
+import os
+import time
+import types
+
+from optwrf import supervisor
+from optwrf.runwrf import WRFModel
+from optwrf.watcher import CompletionWatcher
+
+param_ids = [10, 1, 1, 2, 2, 3, 2]
+start_date = 'Dec 31, 2011'
+end_date = 'Jan 1, 2012'
+
+
+def _local_sim(tmp_path):
+    """Returns a simulation whose jobs run as local processes in tmp_path."""
+    wrf_sim = WRFModel(param_ids, start_date, end_date)
+    wrf_sim.DIR_WRFOUT = str(tmp_path) + '/'
+    wrf_sim.on_aws = True
+    wrf_sim.watcher = CompletionWatcher(poll_interval=0.1, max_poll_interval=0.2)
+    return wrf_sim
+
+
+def test_run_real_and_wrf(tmp_path):
+    """Checks that the async stages submit local jobs, wait for their success markers, and record their wall time."""
+    wrf_sim = _local_sim(tmp_path)
+    rsl_file = wrf_sim.DIR_WRFOUT + 'rsl.out.0000'
+    wrf_sim.CMD_REAL = f'sh -c "sleep 0.2; echo \'d01 real_em: SUCCESS COMPLETE REAL_EM INIT\' > {rsl_file}"'
+    wrf_sim.CMD_WRF = f'sh -c "sleep 0.2; echo \'d01 wrf: SUCCESS COMPLETE WRF\' > {rsl_file}"'
+    assert asyncio.run(supervisor.run_real(wrf_sim))
+    assert not os.path.exists(rsl_file)
+    assert wrf_sim.stage_seconds['real'] > 0
+    success, runtime = asyncio.run(supervisor.run_wrf(wrf_sim, save_wps_files=False))
+    assert success and wrf_sim.wrf_status == 'complete'
+    assert not os.path.exists(wrf_sim.DIR_WRFOUT + wrf_sim.FILE_WRF_JOB)
+    assert wrf_sim.read_progress()['status'] == 'complete'
+
+
+def test_cancel_wrf(tmp_path):
+    """Checks that cancelling the wait for wrf.exe kills the job that runs it."""
+    wrf_sim = _local_sim(tmp_path)
+    wrf_sim.CMD_WRF = 'sleep 60'
+
+    async def fn_main():
+        task = asyncio.ensure_future(supervisor.run_wrf(wrf_sim, save_wps_files=False))
+        await asyncio.sleep(0.5)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return task.cancelled()
+
+    start_time = time.time()
+    assert asyncio.run(fn_main())
+    assert time.time() - start_time < 10
+    assert wrf_sim.wrf_job.returncode is not None and wrf_sim.wrf_job.returncode != 0
+    assert not os.path.exists(wrf_sim.DIR_WRFOUT + wrf_sim.FILE_WRF_JOB)
+
+
+def test_wait_wrf_dead_job(tmp_path):
+    """Checks that the wait for wrf.exe ends as failed when its job exits before writing rsl.out.0000."""
+    wrf_sim = _local_sim(tmp_path)
+    wrf_sim.job_check_seconds = 0.2
+    wrf_sim.CMD_WRF = 'true'
+    start_time = time.time()
+    success, runtime = asyncio.run(supervisor.run_wrf(wrf_sim, save_wps_files=False))
+    assert not success and wrf_sim.wrf_status == 'failed'
+    assert time.time() - start_time < 10
+
+
+def test_run_multiple(tmp_path, monkeypatch):
+    """Checks that run_multiple runs at most max_concurrent simulations at a time and returns their results in order."""
+    running = [0, 0]
+
+    async def fn_run_all(wrf_sim, **kwargs):
+        running[0] += 1
+        running[1] = max(running)
+        await asyncio.sleep(0.05)
+        running[0] -= 1
+        if wrf_sim.sim == 3:
+            raise RuntimeError('boom')
+        return True, f'sim {wrf_sim.sim}'
+
+    monkeypatch.setattr(supervisor, 'run_all', fn_run_all)
+    wrf_sims = [types.SimpleNamespace(sim=ii, DIR_WRFOUT=f'{tmp_path}/sim{ii}/') for ii in range(20)]
+    results = asyncio.run(supervisor.run_multiple(wrf_sims, max_concurrent=4))
+    assert running[1] == 4
+    assert results[0] == (True, 'sim 0') and results[3] == (None, None) and len(results) == 20
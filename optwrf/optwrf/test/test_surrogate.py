@@ -0,0 +1,66 @@
+"""
+Tests the surrogate model used to pre-screen offspring in the genetic algorithm
+
+"""
+
+import random
+
+import optwrf.optimize_wrf_physics as owp
+import optwrf.simplega as sga
+from optwrf.surrogate import FitnessSurrogate, rank_correlation
+
+
+def synthetic_fitness(genes, start_date):
+    """A fitness landscape that depends on the microphysics and PBL schemes and on the season."""
+    winter_penalty = 50 if start_date.startswith(('Dec', 'Jan', 'Feb')) else 0
+    return 10 * genes[0] + 5 * genes[4] + winter_penalty
+
+
+def random_individuals(n_individuals):
+    individuals = []
+    for ii in range(n_individuals):
+        genes = [random.choice([2, 8, 10, 28]), 4, 4, 2, random.choice([1, 2, 5]), 1, 1]
+        start_date, end_date = sga.generate_random_dates()
+        individuals.append(sga.Chromosome(genes, start_date, end_date))
+    return individuals
+
+
+def test_surrogate_ranks_offspring():
+    """Checks that the surrogate learns a simple fitness landscape and ranks new individuals correctly."""
+    surrogate = FitnessSurrogate(ridge=0.1)
+    assert not surrogate.trained
+    training = random_individuals(100)
+    n_added = surrogate.update([(ind.Genes, ind.Start_date, synthetic_fitness(ind.Genes, ind.Start_date))
+                                for ind in training])
+    assert n_added == 100
+    assert surrogate.trained
+    candidates = random_individuals(40)
+    predictions = surrogate.predict(candidates)
+    realised = [synthetic_fitness(ind.Genes, ind.Start_date) for ind in candidates]
+    assert rank_correlation(predictions, realised) > 0.9
+    kept, kept_predictions = surrogate.screen(candidates, 10)
+    assert len(kept) == 10
+    assert max(kept_predictions) <= min(p for ind, p in zip(candidates, predictions) if ind not in kept)
+
+
+def test_surrogate_skips_failed_simulations():
+    """Checks that failed simulations are not used to train the surrogate."""
+    surrogate = FitnessSurrogate()
+    n_added = surrogate.update([([8, 4, 4, 2, 2, 6, 2], 'Jan 05 2011', 6.022 * 10 ** 23),
+                                ([8, 4, 4, 2, 2, 6, 2], 'Jan 06 2011', None),
+                                ([8, 4, 4, 2, 2, 6, 2], 'Jan 07 2011', 100)])
+    assert n_added == 1
+
+
+def test_surrogate_skips_pruned_simulations():
+    """Checks that pruned simulations, whose fitness is only partial, are not used to train the surrogate."""
+    complete_sim = sga.Chromosome([8, 4, 4, 2, 2, 6, 2], 'Jan 05 2011', 'Jan 06 2011', 100, 1, 2, '01h 00m 00s',
+                                  status='complete')
+    pruned_sim = sga.Chromosome([4, 4, 2, 2, 2, 1, 2], 'Feb 05 2011', 'Feb 06 2011', 20, 3, 4, '00h 30m 00s',
+                                status='pruned')
+    assert FitnessSurrogate().update_from_population([complete_sim, pruned_sim]) == 1
+    db_conn = owp.conn_to_db(':memory:')
+    owp.insert_sim(complete_sim, db_conn)
+    owp.insert_sim(pruned_sim, db_conn)
+    assert FitnessSurrogate().train_from_db(db_conn) == 1
+    owp.close_conn_to_db(db_conn)
@@ -0,0 +1,150 @@
+"""
+Tests the event-driven detection of when the WPS and WRF programs finish
+
+"""
+
+import asyncio
+import datetime
+import threading
+import time
+
+import pytest
+
+from optwrf.watcher import CompletionWatcher, LogTail, WRFProgress
+
+
+def _append_later(path, text, delay):
+    """Appends text to a file from another thread after a delay."""
+    def fn_append():
+        time.sleep(delay)
+        with open(path, 'a') as log_file:
+            log_file.write(text)
+    thread = threading.Thread(target=fn_append)
+    thread.start()
+    return thread
+
+
+def test_log_tail(tmp_path):
+    """Checks that only the lines appended since the last read are returned, and that truncated files are re-read."""
+    path = str(tmp_path / 'rsl.out.0000')
+    tail = LogTail(path)
+    assert tail.read() == [] and tail.last_line is None
+    with open(path, 'w') as log_file:
+        log_file.write('line 1\nline 2\nline ')
+    assert tail.read() == ['line 1', 'line 2']
+    assert tail.last_line == 'line '
+    with open(path, 'a') as log_file:
+        log_file.write('3\r\n')
+    assert tail.read() == ['line 3']
+    assert tail.read() == [] and tail.last_line == 'line 3'
+    with open(path, 'w') as log_file:
+        log_file.write('new\n')
+    assert tail.read() == ['new']
+    # Only the end of a large file is read when tail_bytes is given
+    with open(path, 'w') as log_file:
+        log_file.write(''.join(f'line {ii}\n' for ii in range(1000)))
+    assert LogTail(path, tail_bytes=20).read() == ['line 998', 'line 999']
+
+
+@pytest.mark.parametrize('use_inotify', [True, False])
+def test_completion_watcher(tmp_path, use_inotify):
+    """Checks that the waiter wakes up soon after a marker is written, and that it times out otherwise."""
+    path = str(tmp_path / 'rsl.out.0000')
+    checks = {path: [('SUCCESS COMPLETE WRF', 'complete'), ('-' * 43, 'failed')]}
+    # With inotify, the waiter wakes up long before the poll interval expires
+    poll_interval = 5 if use_inotify else 0.05
+    watcher = CompletionWatcher(poll_interval=poll_interval, max_poll_interval=poll_interval, use_inotify=use_inotify)
+    thread = _append_later(path, 'Timing for main\n', 0.2)
+    assert watcher.wait_for_file(path, timeout=10)
+    thread.join()
+    new_lines = []
+    thread = _append_later(path, 'd01 2011-12-31_23:59:60 wrf: SUCCESS COMPLETE WRF\n', 0.3)
+    start_time = time.time()
+    status, msg = watcher.wait(checks, timeout=10, on_lines=lambda log_file, lines: new_lines.extend(lines))
+    thread.join()
+    assert status == 'complete' and 'SUCCESS COMPLETE WRF' in msg
+    assert time.time() - start_time < 3
+    assert new_lines == ['Timing for main', 'd01 2011-12-31_23:59:60 wrf: SUCCESS COMPLETE WRF']
+    # Failure markers are only looked for in the last line
+    with open(path, 'w') as log_file:
+        log_file.write('FATAL CALLED FROM FILE:  <stdin>\n' + '-' * 43 + '\n')
+    assert watcher.wait(checks, timeout=1)[0] == 'failed'
+    with open(path, 'w') as log_file:
+        log_file.write('-' * 43 + '\nstill running\n')
+    start_time = time.time()
+    assert watcher.wait(checks, timeout=0.5) == ('timeout', None)
+    assert 0.4 < time.time() - start_time < 3
+    assert watcher.wait(checks, timeout=10, on_wake=lambda: 'pruned') == ('pruned', None)
+
+
+@pytest.mark.parametrize('use_inotify', [True, False])
+def test_completion_watcher_async(tmp_path, use_inotify):
+    """Checks that the asyncio waits wake up on a marker and that on_wake may return an awaitable status."""
+    path = str(tmp_path / 'metgrid.log')
+    checks = {path: [('Successful completion of program metgrid.exe', 'complete')]}
+    poll_interval = 5 if use_inotify else 0.05
+    watcher = CompletionWatcher(poll_interval=poll_interval, max_poll_interval=poll_interval, use_inotify=use_inotify)
+
+    async def fn_wake():
+        return 'pruned'
+
+    async def fn_main():
+        thread = _append_later(path, 'Processing domain 1 of 1\n', 0.2)
+        assert await watcher.wait_for_file_async(path, timeout=10)
+        thread.join()
+        thread = _append_later(path, '!  Successful completion of program metgrid.exe  !\n', 0.3)
+        start_time = time.time()
+        # Other coroutines keep running while the wait sleeps
+        status, ticks = await asyncio.gather(watcher.wait_async(checks, timeout=10), fn_ticks())
+        thread.join()
+        assert status[0] == 'complete' and time.time() - start_time < 3
+        assert ticks > 1
+        assert await watcher.wait_async({str(tmp_path / 'rsl.out.0000'): []}, timeout=5, on_wake=fn_wake) \
+            == ('pruned', None)
+        assert await watcher.wait_for_file_async(str(tmp_path / 'geogrid.log'), timeout=0.2) is False
+
+    async def fn_ticks():
+        ticks = 0
+        for _ in range(5):
+            await asyncio.sleep(0.02)
+            ticks += 1
+        return ticks
+
+    asyncio.run(fn_main())
+
+
+def test_completion_watcher_backoff():
+    """Checks that invalid poll intervals are rejected."""
+    with pytest.raises(ValueError):
+        CompletionWatcher(poll_interval=10, max_poll_interval=1)
+    with pytest.raises(ValueError):
+        CompletionWatcher(backoff=0.5)
+
+
+def test_wrf_progress():
+    """Checks the progress, seconds per model hour, projected finish time, and stall detection parsed from rsl lines."""
+    progress = WRFProgress(datetime.datetime(2011, 12, 31), datetime.datetime(2012, 1, 1), stall_factor=10,
+                           min_stall_seconds=60)
+    assert progress.fraction() is None and progress.eta() is None and not progress.stalled()
+    lines = ['d01 2011-12-31_00:00:00  Input data is acceptable to use:']
+    # One 90 s time step every 2 wall seconds, and a history file is written every hour
+    for step in range(1, 81):
+        model_time = datetime.datetime(2011, 12, 31) + datetime.timedelta(seconds=90 * step)
+        lines.append(f'Timing for main: time {model_time:%Y-%m-%d_%H:%M:%S} on domain   1:    2.00000 elapsed seconds')
+        lines.append(f'Timing for main: time {model_time:%Y-%m-%d_%H:%M:%S} on domain   2:    1.50000 elapsed seconds')
+        if step % 40 == 0:
+            lines.append(f'Timing for Writing wrfout_d01_{model_time:%Y-%m-%d_%H:%M:%S} for domain        1:'
+                         f'    8.00000 elapsed seconds')
+    progress.update(lines, now=1000.0)
+    assert progress.model_time == datetime.datetime(2011, 12, 31, 2)
+    assert progress.fraction() == 2 / 24
+    # The last 50 steps of 2 s (the first of which only marks the start of the window) and one 8 s history write
+    assert progress.seconds_per_model_hour() == pytest.approx((49 * 2 + 8) / (49 * 90 / 3600))
+    assert progress.eta(now=1000.0) == datetime.datetime.fromtimestamp(
+        1000.0 + 22 * progress.seconds_per_model_hour())
+    assert progress.typical_step_seconds() == 2.0
+    # Stalled once no timing line has appeared for max(10 * 2 s, 60 s)
+    assert not progress.stalled(now=1059.0)
+    assert progress.stalled(now=1061.0)
+    summary = progress.to_dict(now=1061.0)
+    assert summary['model_time'] == '2011-12-31T02:00:00' and summary['stalled']
@@ -3,7 +3,11 @@ Test wrfparams functionality
 
 """
 
-from optwrf.wrfparams import num2name
+import pytest
+
+import numpy as np
+
+from optwrf.wrfparams import flexible_generate, load_registry, load_valid_combinations, name2num, num2name, pbl2sfclay
 
 
 def test_num2name():
@@ -12,3 +16,43 @@ def test_num2name():
     param_names = num2name(param_ids, physics_type, in_yaml='params.yml')
     print(param_names)
     assert type(param_names[0]) is str
+
+
+def test_load_registry():
+    """Checks that the physics registry is read once, is read-only, and agrees with name2num/num2name."""
+    registry = load_registry('params.yml')
+    assert load_registry('params.yml') is registry
+    assert registry.name2id['microphysics']['morrison2mom'] == 10
+    assert registry.id2name['PBL'][2] == 'myj'
+    assert name2num()[0] == 10
+    with pytest.raises(TypeError):
+        registry.name2id['microphysics']['new scheme'] = 99
+    with pytest.raises(ValueError):
+        registry.ids[0][0] = 99
+    assert registry.sfclay_lookup[2] == pbl2sfclay(2)
+
+
+def test_valid_combinations():
+    """Checks the index of valid physics combinations."""
+    combinations = load_valid_combinations()
+    assert load_valid_combinations() is combinations
+    # Combinations that break a dependency are excluded: 8 cumulus options * 11 PBL options are allowed,
+    # plus two for cumulus option 7 (PBL 2 or 9) and one for cumulus option 11 (PBL 1)
+    registry = load_registry()
+    n_other = int(np.prod([len(type_ids) for type_ids in registry.ids[0:4]]))
+    assert len(combinations) == n_other * ((len(registry.ids[5]) - 2) * len(registry.ids[4]) + 3)
+    genes = [10, 4, 4, 2, 2, 7, 2]
+    assert genes in combinations
+    assert [10, 4, 4, 2, 1, 7, 1] not in combinations
+    assert [10, 4, 4, 2, 2, 7, 1] not in combinations
+    dense_id = combinations.dense_id(genes)
+    assert combinations.genes(dense_id) == genes
+    samples = combinations.sample(1000)
+    assert combinations.is_valid(samples).all()
+    assert combinations.sample() in combinations
+    neighbours = combinations.neighbours(genes)
+    assert combinations.is_valid(neighbours).all()
+    assert ((neighbours[:, 0:6] != np.array(genes[0:6])).sum(axis=1) == 1).all()
+    # Only MYJ and CAM UW work with the CAM ZM cumulus scheme
+    assert combinations.neighbours(genes, gene_idx=4)[:, 4].tolist() == [9]
+    assert flexible_generate() in combinations
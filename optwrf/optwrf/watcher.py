@@ -0,0 +1,516 @@
+"""
+Event-driven detection of when the WPS and WRF programs finish (see WRFModel.wait_finish).
+
+Instead of sleeping for a fixed interval and re-reading whole log files (e.g., rsl.out.0000) on every
+poll, the CompletionWatcher sleeps until a log file in the run directory changes, tails only the bytes
+that were appended since it last read each file (LogTail), and returns as soon as a success or failure
+marker appears. On Linux, changes are detected with inotify (through ctypes, so no extra dependency is
+needed). Where inotify is not available, and as a safety net on network file systems (e.g., NFS or
+Lustre), where writes made on other nodes do not raise inotify events, the log files are also polled
+with an interval that backs off while nothing changes and is reset as soon as the logs grow.
+
+The new lines of rsl.out.0000 are also parsed by WRFProgress, which tracks how far wrf.exe has integrated
+from its "Timing for main" lines, estimates when it will finish, and detects when it has stalled
+(see WRFModel.wait_wrf).
+
+Every wait also has an asyncio counterpart (wait_async and wait_for_file_async) that sleeps on the event
+loop instead of blocking a thread, so that one process can supervise many simulations (see supervisor.py).
+
+
+Known Issues/Wishlist:
+- inotify watches are created and removed for each wait; watching every run directory from a single
+inotify instance would be cheaper when one process supervises many simulations.
+
+"""
+
+import asyncio
+import collections
+import ctypes
+import ctypes.util
+import datetime
+import inspect
+import os
+import re
+import select
+import statistics
+import sys
+import time
+
+# inotify event masks (see inotify(7)); directories are watched, so files do not need to exist yet
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+
+class LogTail:
+    """
+    Reads the lines appended to a log file since it was last read, starting from a saved byte offset,
+    so that each poll costs one stat (and a read of the new bytes) no matter how large the file is.
+    If the file is replaced or truncated (e.g., rsl.out.0000 of real.exe is removed before wrf.exe
+    writes its own), it is read again from the start.
+
+    :param path: string
+        path of the log file, which does not need to exist yet.
+    :param tail_bytes: integer (default = None)
+        if given, the first read starts at most this many bytes before the end of the file
+        (e.g., when re-attaching to a long-running job), and the first partial line is skipped.
+
+    """
+    def __init__(self, path, tail_bytes=None):
+        self.path = path
+        self.tail_bytes = tail_bytes
+        self.offset = 0
+        self.inode = None
+        self.partial = ''
+        self.last_complete_line = None
+
+    @property
+    def last_line(self):
+        """
+        Last line read from the file (including a line that is still being written), or None if no line was read.
+        """
+        return self.partial if self.partial != '' else self.last_complete_line
+
+    def read(self):
+        """
+        Reads the complete lines appended to the file since the last read.
+
+        :return lines: list of strings
+            new lines, without their line endings (empty if the file does not exist or has not grown).
+
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return []
+        skip_partial = False
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            # New, replaced, or truncated file
+            skip_partial = self.inode is None and self.tail_bytes is not None and stat.st_size > self.tail_bytes
+            self.offset = stat.st_size - self.tail_bytes if skip_partial else 0
+            self.inode = stat.st_ino
+            self.partial = ''
+            self.last_complete_line = None
+        if stat.st_size == self.offset:
+            return []
+        try:
+            with open(self.path, 'rb') as log_file:
+                log_file.seek(self.offset)
+                data = log_file.read()
+        except OSError:
+            return []
+        self.offset += len(data)
+        lines = (self.partial + data.decode(errors='replace')).split('\n')
+        self.partial = lines.pop()
+        if skip_partial and len(lines) > 0:
+            lines.pop(0)
+        lines = [line.rstrip('\r') for line in lines]
+        if len(lines) > 0:
+            self.last_complete_line = lines[-1]
+        return lines
+
+
+class _Inotify:
+    """
+    Minimal ctypes wrapper around the Linux inotify API that watches directories for changes.
+    If inotify is not available (or a directory cannot be watched), self.fd is None.
+    """
+    _libc = None
+
+    def __init__(self, dirs):
+        self.fd = None
+        if not sys.platform.startswith('linux'):
+            return
+        try:
+            if _Inotify._libc is None:
+                _Inotify._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = _Inotify._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return
+        if fd < 0:
+            return
+        for watch_dir in dirs:
+            if _Inotify._libc.inotify_add_watch(fd, os.fsencode(watch_dir), IN_WATCH_MASK) < 0:
+                os.close(fd)
+                return
+        self.fd = fd
+
+    def wait(self, timeout):
+        """
+        Sleeps until a watched directory changes or the timeout (in seconds) expires.
+
+        :return: boolean (True/False)
+            True if there was a change.
+
+        """
+        readable = select.select([self.fd], [], [], timeout)[0]
+        if not readable:
+            return False
+        self.drain()
+        return True
+
+    def drain(self):
+        """
+        Discards the pending events, which are only used to wake up.
+        """
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class CompletionWatcher:
+    """
+    Waits for log files to show that a program has finished.
+
+    :param poll_interval: float (default = 1.0)
+        seconds between polls of the log files after they change.
+    :param max_poll_interval: float (default = 30.0)
+        maximum seconds between polls while the log files do not change. With inotify, the waiter
+        wakes up as soon as a log file changes, so this only bounds how late a change that inotify
+        does not see (e.g., on a network file system) is noticed; set it lower on such file systems.
+    :param backoff: float (default = 1.5)
+        factor by which the poll interval grows each time the log files have not changed.
+    :param use_inotify: boolean (default = True)
+        use inotify (on Linux) to wake up when a log file changes, instead of only polling.
+
+    """
+    def __init__(self, poll_interval=1.0, max_poll_interval=30.0, backoff=1.5, use_inotify=True):
+        if poll_interval <= 0 or max_poll_interval < poll_interval or backoff < 1:
+            print(f'OptWRFError: invalid poll intervals ({poll_interval}, {max_poll_interval}) or backoff ({backoff}); '
+                  f'0 < poll_interval <= max_poll_interval and backoff >= 1 are required.')
+            raise ValueError
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.backoff = backoff
+        self.use_inotify = use_inotify
+
+    def _inotify(self, paths):
+        if not self.use_inotify:
+            return None
+        inotify = _Inotify(sorted(set(os.path.dirname(os.path.abspath(path)) for path in paths)))
+        return inotify if inotify.fd is not None else None
+
+    def _watch(self, paths, fn_check, timeout):
+        """
+        Calls fn_check each time the directories of paths change (or the poll interval expires)
+        until it returns something other than None, or until the timeout expires.
+        fn_check returns a tuple (result, changed), where changed resets the poll interval.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        interval = self.poll_interval
+        inotify = self._inotify(paths)
+        try:
+            while True:
+                result, changed = fn_check()
+                if result is not None:
+                    return result
+                if changed:
+                    interval = self.poll_interval
+                wait = interval if deadline is None else min(interval, deadline - time.time())
+                if wait <= 0:
+                    return None
+                if inotify is not None and inotify.wait(wait):
+                    # Woken by a change; the poll interval is not backed off
+                    continue
+                if inotify is None:
+                    time.sleep(wait)
+                interval = min(interval * self.backoff, self.max_poll_interval)
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    async def _watch_async(self, paths, fn_check, timeout):
+        """
+        Same as _watch, but sleeps on the running event loop (the inotify file descriptor is watched by
+        the loop), and fn_check is a coroutine function.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else time.time() + timeout
+        interval = self.poll_interval
+        inotify = self._inotify(paths)
+        woken = asyncio.Event()
+        if inotify is not None:
+            def fn_ready():
+                inotify.drain()
+                woken.set()
+            loop.add_reader(inotify.fd, fn_ready)
+        try:
+            while True:
+                result, changed = await fn_check()
+                if result is not None:
+                    return result
+                if changed:
+                    interval = self.poll_interval
+                wait = interval if deadline is None else min(interval, deadline - time.time())
+                if wait <= 0:
+                    return None
+                woken.clear()
+                try:
+                    await asyncio.wait_for(woken.wait(), wait)
+                    # Woken by a change; the poll interval is not backed off
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+                interval = min(interval * self.backoff, self.max_poll_interval)
+        finally:
+            if inotify is not None:
+                loop.remove_reader(inotify.fd)
+                inotify.close()
+
+    def wait_for_file(self, path, timeout=None):
+        """
+        Waits until a file exists.
+
+        :param path: string
+            path of the file, in an existing directory.
+        :param timeout: float (default = None)
+            maximum seconds to wait, or None to wait forever.
+        :return: boolean (True/False)
+            True if the file exists, False if the timeout expired.
+
+        """
+        result = self._watch([path], lambda: (True if os.path.exists(path) else None, False), timeout)
+        return result is True
+
+    def wait(self, checks, timeout=None, on_lines=None, on_wake=None, tail_bytes=None):
+        """
+        Waits until the last line of a log file contains one of its markers.
+
+        :param checks: dictionary
+            mapping the path of each log file to a list of (marker, status) tuples. The files and markers are
+            checked in order, and the status of the first marker found in the last line of its file is returned
+            (in the same way as WRFModel.runwrf_finish_check).
+        :param timeout: float (default = None)
+            maximum seconds to wait, or None to wait forever.
+        :param on_lines: function (default = None)
+            called with the path of a log file and the list of its new lines each time lines are appended to it.
+        :param on_wake: function (default = None)
+            called without arguments each time the waiter wakes up (because a file changed or the poll
+            interval expired) and no marker was found. If it returns a status, the wait ends with that status.
+        :param tail_bytes: integer (default = None)
+            if given, each log file is tailed from at most this many bytes before its current end (see LogTail).
+        :return status: string
+            the status of the marker that was found, the status returned by on_wake, or 'timeout'.
+        :return message: string
+            the line that contained the marker, or None.
+
+        """
+        fn_markers = self._marker_check(checks, on_lines, tail_bytes)
+
+        def fn_check():
+            result, changed = fn_markers()
+            if result is None and on_wake is not None:
+                status = on_wake()
+                if status is not None:
+                    result = (status, None)
+            return result, changed
+
+        result = self._watch(list(checks.keys()), fn_check, timeout)
+        return result if result is not None else ('timeout', None)
+
+    async def wait_for_file_async(self, path, timeout=None):
+        """
+        Same as wait_for_file, but waits without blocking the running event loop.
+        """
+        async def fn_check():
+            return True if os.path.exists(path) else None, False
+
+        result = await self._watch_async([path], fn_check, timeout)
+        return result is True
+
+    async def wait_async(self, checks, timeout=None, on_lines=None, on_wake=None, tail_bytes=None):
+        """
+        Same as wait, but waits without blocking the running event loop. on_wake may also be
+        a coroutine function (or return an awaitable, e.g., a future of work done in an executor).
+
+        """
+        fn_markers = self._marker_check(checks, on_lines, tail_bytes)
+
+        async def fn_check():
+            result, changed = fn_markers()
+            if result is None and on_wake is not None:
+                status = on_wake()
+                if inspect.isawaitable(status):
+                    status = await status
+                if status is not None:
+                    result = (status, None)
+            return result, changed
+
+        result = await self._watch_async(list(checks.keys()), fn_check, timeout)
+        return result if result is not None else ('timeout', None)
+
+    @staticmethod
+    def _marker_check(checks, on_lines, tail_bytes):
+        """
+        Returns a function that tails the log files of checks and returns a tuple (result, changed), where result
+        is a tuple (status, line) if a marker was found (see wait), or None.
+        """
+        tails = {path: LogTail(path, tail_bytes=tail_bytes) for path in checks}
+
+        def fn_markers():
+            changed = False
+            for path, tail in tails.items():
+                offset = tail.offset
+                lines = tail.read()
+                changed = changed or tail.offset != offset
+                if len(lines) > 0 and on_lines is not None:
+                    on_lines(path, lines)
+            for path, tail in tails.items():
+                msg = tail.last_line
+                if msg is None:
+                    continue
+                for marker, status in checks[path]:
+                    if marker in msg:
+                        return (status, msg), changed
+            return None, changed
+
+        return fn_markers
+
+
+class WRFProgress:
+    """
+    Tracks the progress of wrf.exe from the timing lines that it writes to rsl.out.0000, e.g.,
+    "Timing for main: time 2011-12-31_00:01:30 on domain   1:    0.51234 elapsed seconds".
+    The lines are passed to update as they are appended (see CompletionWatcher.wait).
+
+    :param forecast_start: datetime.datetime
+        start of the simulation.
+    :param forecast_end: datetime.datetime
+        end of the simulation.
+    :param domain: integer (default = 1)
+        domain whose time steps are tracked (the outer domain's steps include those of its nests).
+    :param stall_factor: float (default = 20)
+        wrf.exe is stalled when no timing line has appeared for stall_factor times the typical
+        (median) step time, or for min_stall_seconds, whichever is longer.
+    :param min_stall_seconds: float (default = 600)
+        minimum seconds without a timing line before wrf.exe is stalled (e.g., to allow for writing history files).
+    :param window: integer (default = 50)
+        number of recent time steps used to estimate the seconds per model hour and the typical step time.
+
+    """
+    timing_re = re.compile(r'Timing for main: time (\d{4}-\d{2}-\d{2}_\d{2}:\d{2}:\d{2}) '
+                           r'on domain\s+(\d+):\s+([0-9.]+) elapsed seconds')
+    elapsed_re = re.compile(r'Timing for .*:\s+([0-9.]+) elapsed seconds')
+
+    def __init__(self, forecast_start, forecast_end, domain=1, stall_factor=20, min_stall_seconds=600, window=50):
+        self.forecast_start = forecast_start
+        self.forecast_end = forecast_end
+        self.domain = domain
+        self.stall_factor = stall_factor
+        self.min_stall_seconds = min_stall_seconds
+        # Model time and elapsed seconds of the recent steps, and the step time of the recent steps
+        self.steps = collections.deque(maxlen=window)
+        self.step_seconds = collections.deque(maxlen=window)
+        self.model_time = None
+        # Wall clock time at which the last timing line was read
+        self.last_activity = None
+        # Seconds spent since the last step on other work that is timed (e.g., writing history files)
+        self._other_seconds = 0.0
+
+    def update(self, lines, now=None):
+        """
+        Parses new lines of rsl.out.0000.
+
+        :param lines: list of strings
+            lines appended to rsl.out.0000 since the last update.
+        :param now: float (default = None)
+            time (in seconds since the epoch) at which the lines were read; the current time if None.
+
+        """
+        now = time.time() if now is None else now
+        for line in lines:
+            if 'Timing for' not in line:
+                continue
+            self.last_activity = now
+            match = self.timing_re.search(line)
+            if match is None:
+                match = self.elapsed_re.search(line)
+                if match is not None:
+                    self._other_seconds += float(match.group(1))
+                continue
+            if int(match.group(2)) != self.domain:
+                continue
+            self.model_time = datetime.datetime.strptime(match.group(1), '%Y-%m-%d_%H:%M:%S')
+            self.steps.append((self.model_time, float(match.group(3)) + self._other_seconds))
+            self.step_seconds.append(float(match.group(3)))
+            self._other_seconds = 0.0
+
+    def fraction(self):
+        """
+        Returns the fraction (0 - 1) of the simulation that has been integrated, or None before the first step.
+        """
+        if self.model_time is None:
+            return None
+        total = (self.forecast_end - self.forecast_start).total_seconds()
+        done = (self.model_time - self.forecast_start).total_seconds()
+        return min(max(done / total, 0.0), 1.0) if total > 0 else 1.0
+
+    def seconds_per_model_hour(self):
+        """
+        Returns the seconds that wrf.exe recently took to integrate one model hour (including the timed
+        work between steps, such as writing history files), or None if there are too few steps.
+        """
+        if len(self.steps) < 2:
+            return None
+        model_hours = (self.steps[-1][0] - self.steps[0][0]).total_seconds() / 3600
+        if model_hours <= 0:
+            return None
+        return sum(seconds for _, seconds in list(self.steps)[1:]) / model_hours
+
+    def eta(self, now=None):
+        """
+        Returns the projected finish time (a datetime.datetime) of wrf.exe, or None if it cannot be estimated yet.
+        """
+        spmh = self.seconds_per_model_hour()
+        if spmh is None:
+            return None
+        now = time.time() if now is None else now
+        remaining_hours = max((self.forecast_end - self.model_time).total_seconds(), 0) / 3600
+        return datetime.datetime.fromtimestamp(now + remaining_hours * spmh)
+
+    def typical_step_seconds(self):
+        """
+        Returns the median elapsed seconds of the recent time steps, or None before the first step.
+        """
+        if len(self.step_seconds) == 0:
+            return None
+        return statistics.median(self.step_seconds)
+
+    def stalled(self, now=None):
+        """
+        Checks whether wrf.exe has stopped making progress. wrf.exe is never stalled before its first
+        time step, because its initialization time is not known (the stage timeout covers it instead).
+
+        :param now: float (default = None)
+            current time in seconds since the epoch.
+        :return: boolean (True/False)
+
+        """
+        if self.last_activity is None or len(self.step_seconds) == 0:
+            return False
+        now = time.time() if now is None else now
+        limit = max(self.stall_factor * self.typical_step_seconds(), self.min_stall_seconds)
+        return now - self.last_activity > limit
+
+    def to_dict(self, now=None):
+        """
+        Summarizes the progress in a JSON-serializable dictionary with the model_time, fraction,
+        seconds_per_model_hour, eta, stalled, and updated (the current time) keys; times are ISO strings.
+        """
+        now = time.time() if now is None else now
+        eta = self.eta(now)
+        return {'model_time': None if self.model_time is None else self.model_time.isoformat(),
+                'fraction': self.fraction(),
+                'seconds_per_model_hour': self.seconds_per_model_hour(),
+                'eta': None if eta is None else eta.isoformat(timespec='seconds'),
+                'stalled': self.stalled(now),
+                'updated': datetime.datetime.fromtimestamp(now).isoformat(timespec='seconds')}
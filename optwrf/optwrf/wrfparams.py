@@ -4,16 +4,258 @@ and writes the numeric paramter options to a CSV.
 
 
 Known Issues/Wishlist:
-- It would be better if I could read in the parameters from the in_yaml
-file only once, but I'm not sure how variables across different
-functions in the same module work.
 
 """
 
+import collections
+import functools
 import random
+import types
+
+import numpy as np
 import yaml
 from optwrf.data.fetch_data import fetch_yaml
 
+# Parameterization categories in params.yml, in the order of the first six genes
+physics_types = ['microphysics', 'lw radiation', 'sw radiation', 'land surface', 'PBL', 'cumulus']
+
+PhysicsRegistry = collections.namedtuple('PhysicsRegistry', ['name2id', 'id2name', 'names', 'ids', 'sfclay_lookup'])
+PhysicsRegistry.__doc__ = """
+Read-only physics parameterization options loaded from params.yml (see load_registry).
+    name2id: dictionary mapping each physics type to a (read-only) dictionary of name: namelist.input value.
+    id2name: dictionary mapping each physics type to a (read-only) dictionary of namelist.input value: name.
+    names: dictionary mapping each physics type to a tuple of its option names (in the order of params.yml).
+    ids: tuple of read-only numpy arrays of the namelist.input values of each of the six core parameters.
+    sfclay_lookup: read-only numpy array indexed by the PBL scheme, giving the surface layer scheme.
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def load_registry(in_yaml='params.yml'):
+    """
+    Reads the physics parameterization options from the in_yaml file. The file is only read
+    the first time each in_yaml is requested; afterwards the cached registry is returned,
+    so generating genes for a large population does not parse the yaml file over and over.
+
+    :param in_yaml: string
+        specifying the name of the yaml file containing parameter name integer pairs
+        in sections by parameterization option.
+    :return registry: PhysicsRegistry
+        read-only mappings between parameterization names and namelist.input values.
+
+    """
+    params = fetch_yaml(in_yaml)
+    name2id = {}
+    id2name = {}
+    names = {}
+    for physics_type, physics in params.items():
+        name2id[physics_type] = types.MappingProxyType(dict(physics))
+        # Take the first name listed for each value (some schemes have more than one name)
+        type_id2name = {}
+        for name, value in physics.items():
+            type_id2name.setdefault(value, name)
+        id2name[physics_type] = types.MappingProxyType(type_id2name)
+        names[physics_type] = tuple(physics.keys())
+    ids = []
+    for physics_type in physics_types:
+        type_ids = np.array(sorted(set(params.get(physics_type).values())))
+        type_ids.flags.writeable = False
+        ids.append(type_ids)
+    sfclay_lookup = np.array([pbl2sfclay(id_pbl) if id_pbl in ids[4] else 0 for id_pbl in range(ids[4].max() + 1)])
+    sfclay_lookup.flags.writeable = False
+    return PhysicsRegistry(types.MappingProxyType(name2id), types.MappingProxyType(id2name),
+                           types.MappingProxyType(names), tuple(ids), sfclay_lookup)
+
+
+class ValidCombinations:
+    """
+    This class provides an index of every physics parameter combination that can be run, enumerated once
+    from the options in params.yml (see load_valid_combinations). A combination is valid if:
+        - the surface layer scheme is the one that goes with the PBL scheme (see pbl2sfclay), and
+        - it satisfies the parameter dependencies (see apply_dependencies).
+
+    Each combination of the six core parameters is coded as a mixed-radix integer (the digits are the
+    positions of each parameter in its list of options), and the valid codes are stored in a sorted array.
+    A direct-address table maps each code to its position in that array (or -1 if it is invalid),
+    so membership checks, uniform sampling, and conversions between genes and the dense id
+    (0, ..., number of valid combinations - 1, which can be used as a database key) all take O(1) time.
+    """
+    def __init__(self, registry):
+        self.ids = registry.ids
+        self.sfclay_lookup = registry.sfclay_lookup
+        self.radices = np.array([len(type_ids) for type_ids in self.ids])
+        # Code = sum(position of gene i * strides[i]), with the first gene as the most significant digit
+        self.strides = np.append(np.cumprod(self.radices[::-1])[::-1][1:], 1)
+        self.n_total = int(np.prod(self.radices))
+        # Tables mapping each namelist.input value to its position in the list of options (-1 if not an option)
+        self.positions = []
+        for type_ids in self.ids:
+            position = np.full(type_ids.max() + 1, -1)
+            position[type_ids] = np.arange(len(type_ids))
+            self.positions.append(position)
+        all_genes = self.decode(np.arange(self.n_total))
+        self.codes = np.flatnonzero(satisfies_dependencies(all_genes))
+        self.dense_ids = np.full(self.n_total, -1, dtype=np.int32 if self.n_total < 2 ** 31 else np.int64)
+        self.dense_ids[self.codes] = np.arange(len(self.codes))
+        for array in [self.codes, self.dense_ids]:
+            array.flags.writeable = False
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, genes):
+        return self.dense_id(genes) is not None
+
+    def encode(self, genes):
+        """
+        Codes one or more sets of genes as mixed-radix integers.
+
+        :param genes: list or numpy array of integers
+            genes of one individual, or a matrix with the genes of one individual in each row.
+            Only the six core parameters are used.
+        :return codes: integer or numpy array of integers
+            mixed-radix code of each set of genes, or -1 if a gene is not one of its options.
+
+        """
+        genes = np.asarray(genes, dtype=np.int64)
+        single = genes.ndim == 1
+        genes = np.atleast_2d(genes)
+        codes = np.zeros(len(genes), dtype=np.int64)
+        known = np.ones(len(genes), dtype=bool)
+        for ii, position in enumerate(self.positions):
+            in_range = (genes[:, ii] >= 0) & (genes[:, ii] < len(position))
+            gene_position = np.where(in_range, position[np.clip(genes[:, ii], 0, len(position) - 1)], -1)
+            known &= gene_position >= 0
+            codes += gene_position * self.strides[ii]
+        codes[~known] = -1
+        return int(codes[0]) if single else codes
+
+    def decode(self, codes):
+        """
+        Converts mixed-radix codes back to genes (including the surface layer scheme).
+
+        :param codes: integer or numpy array of integers
+        :return genes: list of integers, or numpy array of integers with the genes of one individual in each row.
+
+        """
+        single = np.ndim(codes) == 0
+        codes = np.atleast_1d(np.asarray(codes, dtype=np.int64))
+        genes = np.empty((len(codes), 7), dtype=np.int64)
+        for ii, type_ids in enumerate(self.ids):
+            genes[:, ii] = type_ids[(codes // self.strides[ii]) % self.radices[ii]]
+        genes[:, 6] = self.sfclay_lookup[genes[:, 4]]
+        return [int(gene) for gene in genes[0]] if single else genes
+
+    def is_valid(self, genes):
+        """
+        Checks whether each set of genes is a valid combination.
+
+        :param genes: numpy array of integers
+            with the genes of one individual (7 values) in each row.
+        :return valid: numpy array of booleans
+
+        """
+        genes = np.atleast_2d(np.asarray(genes, dtype=np.int64))
+        codes = self.encode(genes)
+        valid = codes >= 0
+        valid[valid] = self.dense_ids[codes[valid]] >= 0
+        if genes.shape[1] > 6:
+            valid &= self.sfclay_lookup[np.clip(genes[:, 4], 0, len(self.sfclay_lookup) - 1)] == genes[:, 6]
+        return valid
+
+    def dense_id(self, genes):
+        """
+        Returns the dense id (0, ..., len(self) - 1) of a valid combination, or None if it is invalid.
+        """
+        if len(genes) > 6 and not self.is_valid(genes)[0]:
+            return None
+        code = self.encode(genes)
+        if code < 0 or self.dense_ids[code] < 0:
+            return None
+        return int(self.dense_ids[code])
+
+    def genes(self, dense_id):
+        """
+        Returns the genes of the combination with the given dense id(s).
+        """
+        return self.decode(self.codes[dense_id])
+
+    def sample(self, n_individuals=None, rng=None):
+        """
+        Draws valid combinations uniformly at random.
+
+        :param n_individuals: integer (default = None)
+            number of combinations to draw; if None, the genes of one combination are returned as a list.
+        :param rng: numpy.random.Generator (default = None)
+            if None, the random module is used (so that random.seed makes runs repeatable).
+        :return genes: list of integers, or numpy array of integers with the genes of one individual in each row.
+
+        """
+        if n_individuals is None:
+            if rng is None:
+                return self.genes(random.randrange(len(self)))
+            return self.genes(int(rng.integers(len(self))))
+        rng = rng if rng is not None else np.random.default_rng()
+        return self.genes(rng.integers(0, len(self), n_individuals))
+
+    def neighbours(self, genes, gene_idx=None):
+        """
+        Finds the valid combinations that differ from genes in exactly one of the six core parameters.
+        Because the surface layer scheme follows the PBL scheme, changing the PBL scheme (gene 4)
+        may also change the surface layer scheme (gene 6); gene_idx = 6 is treated as gene_idx = 4.
+
+        :param genes: list of integers
+            genes of one individual.
+        :param gene_idx: integer (default = None)
+            if specified, only combinations that differ in this gene are returned.
+        :return neighbours: numpy array of integers
+            with the genes of one neighbouring combination in each row.
+
+        """
+        genes = np.asarray(genes, dtype=np.int64)
+        gene_idxs = range(6) if gene_idx is None else [4 if gene_idx == 6 else gene_idx]
+        candidates = []
+        for ii in gene_idxs:
+            others = self.ids[ii][self.ids[ii] != genes[ii]]
+            candidate = np.tile(genes, (len(others), 1))
+            candidate[:, ii] = others
+            candidates.append(candidate)
+        candidates = np.concatenate(candidates) if len(candidates) > 0 else np.empty((0, len(genes)))
+        candidates[:, 6] = self.sfclay_lookup[candidates[:, 4]]
+        return candidates[self.is_valid(candidates)]
+
+
+@functools.lru_cache(maxsize=None)
+def load_valid_combinations(in_yaml='params.yml'):
+    """
+    Enumerates the valid physics parameter combinations the first time each in_yaml is requested,
+    and returns the cached index afterwards.
+
+    :param in_yaml: string
+        specifying the name of the yaml file containing parameter name integer pairs
+        in sections by parameterization option.
+    :return combinations: ValidCombinations
+
+    """
+    return ValidCombinations(load_registry(in_yaml))
+
+
+def satisfies_dependencies(genes):
+    """
+    Vectorized check of the parameter dependencies applied by apply_dependencies.
+
+    :param genes: numpy array of integers
+        with the genes of one individual in each row.
+    :return valid: numpy array of booleans
+
+    """
+    genes = np.atleast_2d(genes)
+    # CAMZMSCHEME requires MYJPBLSCHEME or CAMUWPBLSCHEME
+    valid = (genes[:, 5] != 7) | np.isin(genes[:, 4], [2, 9])
+    # bl_pbl_physics must be set to 1 for cu_physics = 11
+    valid &= (genes[:, 5] != 11) | (genes[:, 4] == 1)
+    return valid
+
 
 def generate(in_yaml='params.yml'):
     """
@@ -32,20 +274,11 @@ def generate(in_yaml='params.yml'):
         specifying the integer assoicated with each parameter option.
 
     """
-    params = fetch_yaml(in_yaml)
-
-    mp = params.get("microphysics")
-    lw = params.get("lw radiation")
-    sw = params.get("sw radiation")
-    lsm = params.get("land surface")
-    pbl = params.get("PBL")
-    clo = params.get("cumulus")
-
-    param_opts = [mp, lw, sw, lsm, pbl, clo]
+    registry = load_registry(in_yaml)
 
     param_list = []
-    for opt in param_opts:
-        param_choice = random.choice(list(opt.keys()))
+    for physics_type in physics_types:
+        param_choice = random.choice(registry.names[physics_type])
         param_list.append(str(param_choice))
 
     return param_list
@@ -152,11 +385,12 @@ def flexible_generate(generate_params=True, mp=None, lw=None, sw=None,
             param_ids = combine(param_ids, param_ids6)
         param_ids = filldefault(in_yaml, param_ids)
 
-    # Set the sf_sfclay_pysics option based on that selected for PBL
-    id_sfclay = pbl2sfclay(param_ids[4])
-    param_ids.append(id_sfclay)
     # Apply known parameter dependencies
     param_ids = apply_dependencies(param_ids)
+    # Set the sf_sfclay_pysics option based on that selected for PBL (after the dependencies,
+    # which may change the PBL scheme)
+    id_sfclay = pbl2sfclay(param_ids[4])
+    param_ids.append(id_sfclay)
     if verbose:
         print(f'The following parameters were generated: {param_ids}')
     return param_ids
@@ -193,14 +427,7 @@ def name2num(in_yaml='params.yml', use_defaults=True, mp_in="morrison2mom", lw_i
         corresponding to the namelist.input values of each input parameterization.
 
     """
-    params = fetch_yaml(in_yaml)
-
-    mp = params.get("microphysics")
-    lw = params.get("lw radiation")
-    sw = params.get("sw radiation")
-    lsm = params.get("land surface")
-    pbl = params.get("PBL")
-    clo = params.get("cumulus")
+    mp, lw, sw, lsm, pbl, clo = [load_registry(in_yaml).name2id.get(physics_type) for physics_type in physics_types]
 
     if not use_defaults and mp_in == "None":
         id_mp = None
@@ -250,13 +477,8 @@ def num2name(param_ids, physics_type, in_yaml='params.yml'):
         corresponding to the physical parameterization names.
 
     """
-    params = fetch_yaml(in_yaml)
-    physics = params.get(physics_type)
-    # list out keys and values separately
-    key_list = list(physics.keys())
-    val_list = list(physics.values())
-    # get the param names using the list index method
-    param_names = [key_list[val_list.index(param)] for param in param_ids]
+    id2name = load_registry(in_yaml).id2name.get(physics_type)
+    param_names = [id2name[param] for param in param_ids]
 
     return param_names
 
@@ -376,7 +598,8 @@ def apply_dependencies(param_ids):
     """
     Applies depependencies among parameters. Generally,
     these were discovered by attempting to run an incompatible combination
-    of parameters or from the WRF User's Guide.
+    of parameters or from the WRF User's Guide. New dependencies must also be added
+    to satisfies_dependencies, which defines the valid combinations (see ValidCombinations).
 
     :param param_ids: list of integers
         corresponding to the namelist.input values of each input parameterization.